@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+################################################################################
+# Adaptive bitrate check
+# Encodes a live test pattern into a stand-in for a network sink whose
+# bandwidth follows a schedule: an identity element that holds each buffer
+# for size / bandwidth seconds, which blocks the queue in front of it the
+# way a full socket blocks rtspclientsink or rtmpsink. BitrateController
+# (dsutils.abr) watches that queue. For every bandwidth drop the check
+# reports how long the encoder took to get under the new link rate, and for
+# every rise the bitrate it climbed back to. Exits non-zero when a drop is
+# not followed within --max-adapt seconds.
+#
+#   python3 benchmarks/bench_abr.py
+#   python3 benchmarks/bench_abr.py --schedule 6000:10,1500:20,800:15,6000:30
+################################################################################
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst, GLib
+from dsutils.abr import ABR_QUEUE, BitrateController
+from dsutils.encoder_cache import make_h264_encoder
+from dsutils.queues import queue_properties
+
+
+def parse_schedule(text):
+    """KBPS:SECONDS,... -> [(kbps, seconds), ...]"""
+    phases = []
+    for part in text.split(","):
+        kbps, _, seconds = part.partition(":")
+        phases.append((int(kbps), float(seconds)))
+    return phases
+
+
+class ThrottledSink:
+    """identity + fakesink that passes at most ``kbps`` kilobits per second."""
+
+    def __init__(self, pipeline, kbps):
+        self.kbps = kbps
+        self.bytes = 0
+        self.identity = Gst.ElementFactory.make("identity", "throttle")
+        self.identity.set_property("signal-handoffs", True)
+        self.identity.connect("handoff", self._on_handoff)
+        self.sink = Gst.ElementFactory.make("fakesink", "network-sink")
+        self.sink.set_property("sync", False)
+        pipeline.add(self.identity)
+        pipeline.add(self.sink)
+        self.identity.link(self.sink)
+
+    def _on_handoff(self, identity, buf):
+        size = buf.get_size()
+        self.bytes += size
+        time.sleep(size * 8 / (self.kbps * 1000))
+
+
+def build(args, max_kbps):
+    pipeline = Gst.Pipeline()
+    src = Gst.ElementFactory.make("videotestsrc", "src")
+    src.set_property("is-live", True)
+    # Noise cannot be compressed, so the encoder always uses its full bitrate
+    Gst.util_set_object_arg(src, "pattern", "snow")
+    caps = Gst.ElementFactory.make("capsfilter", "src-caps")
+    caps.set_property("caps", Gst.Caps.from_string(
+        f"video/x-raw,width={args.width},height={args.height},framerate={args.fps}/1"))
+    encoder = make_h264_encoder("encoder", max_kbps)
+    if not encoder:
+        return None
+    if encoder.get_factory().get_name().startswith("nv"):
+        conv = Gst.ElementFactory.make("nvvideoconvert", "conv")
+    else:
+        conv = Gst.ElementFactory.make("videoconvert", "conv")
+    parser = Gst.ElementFactory.make("h264parse", "parser")
+    queue = Gst.ElementFactory.make("queue", "sink-queue")
+    for key, value in queue_properties(ABR_QUEUE).items():
+        Gst.util_set_object_arg(queue, key, str(value))
+    for element in (src, caps, conv, encoder, parser, queue):
+        pipeline.add(element)
+    src.link(caps)
+    caps.link(conv)
+    conv.link(encoder)
+    encoder.link(parser)
+    parser.link(queue)
+    sink = ThrottledSink(pipeline, args.schedule[0][0])
+    queue.link(sink.identity)
+    return pipeline, encoder, queue, sink
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Adaptive bitrate against a throttled sink")
+    parser.add_argument("--schedule", type=parse_schedule, default=parse_schedule("6000:10,1500:20,6000:30"),
+                        help="Link bandwidth phases as KBPS:SECONDS,...")
+    parser.add_argument("--min-kbps", type=int, default=300)
+    parser.add_argument("--max-kbps", type=int, default=None, help="Default: the highest scheduled bandwidth")
+    parser.add_argument("--max-adapt", type=float, default=10.0,
+                        help="Fail when the bitrate is not under a lowered link rate within this many seconds")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=int, default=30)
+    args = parser.parse_args()
+    max_kbps = args.max_kbps or max(kbps for kbps, _ in args.schedule)
+
+    Gst.init(None)
+    built = build(args, max_kbps)
+    if not built:
+        sys.stderr.write("no H264 encoder available\n")
+        return 2
+    pipeline, encoder, queue, sink = built
+    controller = BitrateController(encoder, queue, args.min_kbps, max_kbps)
+    print(f"encoder: {encoder.get_factory().get_name()}, bounds {args.min_kbps}-{max_kbps} kbps")
+
+    loop = GLib.MainLoop()
+    phases = []  # per phase: link kbps, start, first time under the link, bitrate at the end
+
+    def on_message(bus, message):
+        if message.type == Gst.MessageType.ERROR:
+            print(f"error: {message.parse_error()[0].message}")
+            loop.quit()
+        return True
+
+    def enter_phase(index):
+        if index >= len(args.schedule):
+            loop.quit()
+            return False
+        kbps, seconds = args.schedule[index]
+        sink.kbps = kbps
+        phases.append({"link": kbps, "start": time.monotonic(), "adapted": None, "end_kbps": None})
+        print(f"link now {kbps} kbps for {seconds:.0f}s")
+        GLib.timeout_add(int(seconds * 1000), leave_phase, index)
+        return False
+
+    def leave_phase(index):
+        phases[index]["end_kbps"] = controller.kbps
+        return enter_phase(index + 1)
+
+    def watch():
+        if phases and phases[-1]["adapted"] is None and controller.kbps <= phases[-1]["link"] * 0.9:
+            phases[-1]["adapted"] = time.monotonic() - phases[-1]["start"]
+        return True
+
+    bus = pipeline.get_bus()
+    bus.add_signal_watch()
+    bus.connect("message", on_message)
+    pipeline.set_state(Gst.State.PLAYING)
+    controller.start()
+    GLib.timeout_add(200, watch)
+    enter_phase(0)
+    loop.run()
+    controller.stop()
+    pipeline.set_state(Gst.State.NULL)
+
+    failed = False
+    previous = None
+    for phase in phases:
+        line = f"link {phase['link']:6d} kbps: ended at {phase['end_kbps'] or controller.kbps:.0f} kbps"
+        if previous is not None and phase["link"] < previous:
+            if phase["adapted"] is None or phase["adapted"] > args.max_adapt:
+                line += "  FAILED: bitrate did not drop under the link rate"
+                failed = True
+            else:
+                line += f", under the link after {phase['adapted']:.1f} s"
+        print(line)
+        previous = phase["link"]
+    print(f"bitrate changes: {len(controller.changes)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
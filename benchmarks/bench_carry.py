@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+################################################################################
+# Detection carry-forward check
+# Feeds rtsp_ai_to_rtsp.py's probe body (batch read, label table, counting)
+# batches in which only one in --interval + 1 was inferred, as nvinfer's
+# interval produces them, with objects moving at a constant speed. Runs
+# without carry-forward and with each DetectionCarry mode (fake pyds, no
+# DeepStream or GPU needed) and reports the probe cost per frame, the share
+# of skipped frames whose object count matched the scene, and how far the
+# carried boxes were from where the objects really were. Exits non-zero when
+# a mode leaves skipped frames empty.
+#
+#   python3 benchmarks/bench_carry.py --sources 4 --objects 30 --interval 3
+################################################################################
+
+import os
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dsutils import fake_pyds
+from dsutils.batch_meta import BatchMetaReader
+from dsutils.carry_forward import CARRY_MODES, DetectionCarry
+from dsutils.counting import ObjectCounter
+from dsutils.osd import LabelTable
+
+CLASS_NAMES = ("Vehicle", "TwoWheeler", "Person", "RoadSign")
+WIDTH, HEIGHT = 1920, 1080
+
+
+def make_scene(args, seed=0):
+    """Per source: class ids, boxes at frame 0 and per-frame motion."""
+    rng = random.Random(seed)
+    scene = []
+    for _ in range(args.sources):
+        class_id = np.array([rng.randrange(len(CLASS_NAMES)) for _ in range(args.objects)])
+        size = np.array([[rng.uniform(32, 200), rng.uniform(32, 200)] for _ in range(args.objects)])
+        origin = np.array([[rng.uniform(0, WIDTH / 2), rng.uniform(0, HEIGHT / 2)] for _ in range(args.objects)])
+        speed = np.array([[rng.uniform(-args.speed, args.speed), rng.uniform(-args.speed, args.speed)]
+                          for _ in range(args.objects)])
+        scene.append((class_id, origin, size, speed))
+    return scene
+
+
+def truth(scene, source_id, frame):
+    class_id, origin, size, speed = scene[source_id]
+    # Objects leaving the frame come back in on the other side
+    position = (origin + speed * frame) % (np.array([WIDTH, HEIGHT]) - size)
+    return class_id, np.hstack([position, size])
+
+
+def make_batch(scene, frame, inferred):
+    frames = []
+    for source_id in range(len(scene)):
+        frame_meta = fake_pyds.NvDsFrameMeta()
+        frame_meta.batch_id = frame_meta.pad_index = frame_meta.source_id = source_id
+        frame_meta.frame_num = frame
+        frame_meta.bInferDone = inferred
+        objs = []
+        if inferred:
+            class_id, bbox = truth(scene, source_id, frame)
+            for cls, (left, top, width, height) in zip(class_id.tolist(), bbox.tolist()):
+                obj_meta = fake_pyds.NvDsObjectMeta()
+                obj_meta.class_id = cls
+                obj_meta.confidence = 0.9
+                obj_meta.rect_params = fake_pyds.NvOSD_RectParams(left, top, width, height)
+                fake_pyds._attach_nvinfer_text(obj_meta)
+                objs.append(obj_meta)
+        frame_meta.num_obj_meta = len(objs)
+        frame_meta.obj_meta_list = fake_pyds._link(objs)
+        frames.append(frame_meta)
+    batch_meta = fake_pyds.NvDsBatchMeta()
+    batch_meta.num_frames_in_batch = batch_meta.max_frames_in_batch = len(frames)
+    batch_meta.frame_meta_list = fake_pyds._link(frames)
+    return batch_meta
+
+
+def run(args, scene, mode):
+    batches = [make_batch(scene, frame, frame % (args.interval + 1) == 0) for frame in range(args.frames)]
+    reader = BatchMetaReader(fake_pyds)
+    table = LabelTable(CLASS_NAMES)
+    counter = ObjectCounter(args.sources, len(CLASS_NAMES))
+    carry = DetectionCarry(fake_pyds, max_age=args.interval + 1, mode=mode) if mode else None
+    skipped = filled = 0
+    errors = []
+    start = time.perf_counter()
+    for batch_meta in batches:
+        detections = reader.read(batch_meta)
+        if carry and carry.fill(batch_meta, detections):
+            detections = reader.read(batch_meta)
+        table.apply(detections)
+        counter.update(detections)
+        for i in np.flatnonzero(~detections.frame_infer_done).tolist():
+            skipped += 1
+            source_id, frame = int(detections.frame_source_id[i]), int(detections.frame_number[i])
+            start_obj, end_obj = detections.frame_obj_start[i], detections.frame_obj_start[i + 1]
+            if end_obj - start_obj != args.objects:
+                continue
+            filled += 1
+            # Carried objects keep the order of the inferred frame they come from
+            _, expected = truth(scene, source_id, frame)
+            offset = detections.bbox[start_obj:end_obj, :2] - expected[:, :2]
+            errors.append(float(np.linalg.norm(offset, axis=1).mean()))
+    seconds = time.perf_counter() - start
+    return seconds / (args.frames * args.sources), skipped, filled, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detection carry-forward check (fake pyds)")
+    parser.add_argument("--sources", type=int, default=4)
+    parser.add_argument("--objects", type=int, default=30)
+    parser.add_argument("--interval", type=int, default=3, help="Batches skipped between inferred ones")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--speed", type=float, default=4.0, help="Maximum object speed, pixels per frame")
+    args = parser.parse_args()
+
+    scene = make_scene(args)
+    failed = False
+    print(f"{args.sources} source(s) x {args.objects} object(s), interval {args.interval}, "
+          f"{args.frames} frames")
+    for mode in (None,) + CARRY_MODES:
+        per_frame, skipped, filled, errors = run(args, scene, mode)
+        line = f"  {mode or 'no carry':<12} {per_frame * 1e6:8.1f} us/frame  " \
+               f"skipped frames with every object: {filled}/{skipped}"
+        if errors:
+            line += f"  mean box offset {np.mean(errors):6.1f} px"
+        print(line)
+        if mode and filled < skipped:
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+################################################################################
+# Detection ring check
+# Writes fake pyds batches (no DeepStream or GPU needed) through
+# BatchMetaReader into a dsutils.detection_ring ring, as the probe in
+# rtsp_ai_to_rtsp.py does with --detection-ring, while a second process
+# polls the ring. Reports the write cost per batch and per record and how
+# many records the reader got or lost, and exits non-zero when the reader
+# saw a torn or out-of-order record or received + lost != written.
+#
+# Use a --capacity smaller than the run to also check wrap-around and the
+# lost-record accounting of a reader that falls behind. Finally a new writer
+# replaces the ring, and a reader of the old one must carry on with it.
+#
+#   python3 benchmarks/bench_detection_ring.py --sources 4 --objects 30 --batches 2000
+################################################################################
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dsutils import fake_pyds
+from dsutils.batch_meta import BatchMetaReader
+from dsutils.detection_ring import DetectionRingReader, DetectionRingWriter
+
+NTP_BASE = 1700000000000000000
+FRAME_NS = 33333333
+
+
+def read_ring(path, expected, poll_interval, ready, result):
+    reader = DetectionRingReader(path, start="latest")
+    ready.set()
+    received = 0
+    errors = 0
+    last_frame = {}
+    deadline = time.monotonic() + 60
+    while received + reader.lost < expected and time.monotonic() < deadline:
+        records = reader.read()
+        received += len(records)
+        # Every record of a batch carries that batch's frame number and timestamp
+        errors += int(np.count_nonzero(records["timestamp_ns"] != NTP_BASE + records["frame"] * FRAME_NS))
+        for source in np.unique(records["source"]).tolist():
+            frames = records["frame"][records["source"] == source]
+            errors += int(np.count_nonzero(np.diff(frames) < 0))
+            if source in last_frame and frames[0] < last_frame[source]:
+                errors += 1
+            last_frame[source] = int(frames[-1])
+        time.sleep(poll_interval)
+    reader.close()
+    result.put((received, reader.lost, errors))
+
+
+def fill(batch_meta, frame):
+    # Keep frame numbers rising so the reader can check the order
+    l_frame = batch_meta.frame_meta_list
+    while l_frame is not None:
+        l_frame.data.frame_num = frame
+        l_frame.data.ntp_timestamp = NTP_BASE + frame * FRAME_NS
+        l_frame = l_frame.next
+    return batch_meta
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detection ring buffer check (fake pyds)")
+    parser.add_argument("--sources", type=int, default=4)
+    parser.add_argument("--objects", type=int, default=30, help="Objects per frame")
+    parser.add_argument("--batches", type=int, default=2000)
+    parser.add_argument("--capacity", type=int, default=1 << 16, help="Ring capacity in records")
+    parser.add_argument("--poll", type=float, default=0.01, help="Reader poll interval in seconds")
+    args = parser.parse_args()
+
+    batches = [fake_pyds.make_batch_meta(args.sources, args.objects, frame_num=i, seed=i) for i in range(64)]
+    reader = BatchMetaReader(fake_pyds)
+    directory = tempfile.mkdtemp(prefix="bench-ring-")
+    path = os.path.join(directory, "detections.ring")
+    writer = DetectionRingWriter(path, args.capacity)
+
+    expected = args.batches * args.sources * args.objects
+    context = multiprocessing.get_context("spawn")
+    ready, result = context.Event(), context.Queue()
+    child = context.Process(target=read_ring, args=(path, expected, args.poll, ready, result))
+    child.start()
+    ready.wait()
+
+    elapsed = 0.0
+    for i in range(args.batches):
+        detections = reader.read(fill(batches[i % len(batches)], i))
+        start = time.perf_counter()
+        writer.write(detections)
+        elapsed += time.perf_counter() - start
+
+    received, lost, errors = result.get()
+    child.join()
+    writer.close()
+
+    # Restart the writer under a reader that has read all of the old ring
+    follower = DetectionRingReader(path, start="latest")
+    restarted = DetectionRingWriter(path, args.capacity)
+    for i in range(10):
+        restarted.write(reader.read(fill(batches[i], i)))
+    followed = sum(len(chunk) for chunk in follower.poll())
+    follower.close()
+    restarted.close()
+    os.remove(path)
+    os.rmdir(directory)
+
+    print(f"{args.batches} batches, {writer.written} records into a {args.capacity}-record ring")
+    print(f"  write: {elapsed * 1e6 / args.batches:.1f} us/batch, "
+          f"{elapsed * 1e9 / max(1, writer.written):.0f} ns/record")
+    print(f"  reader: {received} received, {lost} lost, {errors} bad records")
+    print(f"  after a writer restart: {followed} of {restarted.written} records, "
+          f"{follower.restarts} restart(s) seen")
+    failed = False
+    if errors:
+        print(f"FAILED: the reader saw {errors} torn or out-of-order records")
+        failed = True
+    if received + lost != writer.written:
+        print(f"FAILED: received + lost = {received + lost}, written {writer.written}")
+        failed = True
+    if followed != restarted.written or follower.restarts != 1:
+        print("FAILED: the reader did not carry on with the restarted writer's ring")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+################################################################################
+# Fleet supervisor check
+# Runs dsutils.fleet with N stand-in cameras (rtsp_fanout.py workers reading
+# videotestsrc:// and recording to a temporary directory), kills one worker
+# with SIGKILL and stops another with SIGSTOP to simulate a crash and a hang,
+# and checks that both are restarted and deliver frames again. Prints the
+# CPU placement, the time each fault took to recover and the aggregate
+# output fps the box sustained.
+#
+#   python3 benchmarks/bench_fleet.py --workers 4 --seconds 60
+################################################################################
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dsutils.fleet import Fleet, format_status, load_config
+
+OUTPUT_FPS_METRIC = "ds_source_output_fps"
+
+
+def write_config(path, args, workdir):
+    cameras = []
+    for i in range(args.workers):
+        cameras.append({
+            "name": f"cam{i}",
+            "script": "rtsp_fanout.py",
+            "args": ["--rtsp-url", f"videotestsrc://ball?width={args.width}&height={args.height}&fps={args.fps}",
+                     "--width", str(args.width), "--height", str(args.height),
+                     "--output", f"file:{os.path.join(workdir, f'cam{i}.mkv')}", "--no-reconnect"],
+        })
+    config = {"cores_per_worker": args.cores, "metrics_port": args.port, "poll_interval": 1.0,
+              "heartbeat_timeout": args.heartbeat_timeout, "startup_grace": 60.0,
+              "initial_backoff": 1.0, "max_backoff": 8.0, "cameras": cameras}
+    with open(path, "w") as f:
+        json.dump(config, f, indent=2)
+
+
+def output_fps(worker):
+    total = 0.0
+    for line in worker.scrape.splitlines():
+        if line.startswith(OUTPUT_FPS_METRIC + "{"):
+            total += float(line.rsplit(" ", 1)[1])
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fleet supervisor crash/hang recovery check")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--cores", type=int, default=1, help="CPUs per worker")
+    parser.add_argument("--seconds", type=float, default=60.0, help="Total run time")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--port", type=int, default=9300)
+    parser.add_argument("--heartbeat-timeout", type=float, default=5.0)
+    args = parser.parse_args()
+    if args.workers < 2:
+        parser.error("--workers must be at least 2 (one is crashed, one is hung)")
+
+    workdir = tempfile.mkdtemp(prefix="ds-fleet-")
+    config_path = os.path.join(workdir, "fleet.json")
+    write_config(config_path, args, workdir)
+    fleet = Fleet(load_config(config_path))
+    for worker in fleet.workers:
+        print(f"{worker.name}: node {worker.node} CPUs {worker.cpus}")
+
+    crashed, hung = fleet.workers[0], fleet.workers[1]
+    faults = {}  # worker name -> (fault time, restarts before)
+    recovered = {}
+    fps_samples = []
+    fleet.start()
+    fleet.serve(args.port)
+    start = time.monotonic()
+    try:
+        while time.monotonic() - start < args.seconds:
+            time.sleep(1.0)
+            fleet.tick()
+            now = time.monotonic()
+            status = fleet.status()
+            if all(s["up"] for s in status.values()):
+                fps_samples.append(sum(output_fps(w) for w in fleet.workers))
+                if not faults and now - start > args.seconds / 4:
+                    print("crashing cam0 (SIGKILL) and hanging cam1 (SIGSTOP)")
+                    faults[crashed.name] = (now, crashed.restarts)
+                    faults[hung.name] = (now, hung.restarts)
+                    os.kill(crashed.process.pid, signal.SIGKILL)
+                    os.kill(hung.process.pid, signal.SIGSTOP)
+            for name, (fault_at, restarts) in faults.items():
+                s = status[name]
+                if name not in recovered and s["up"] and s["restarts"] > restarts:
+                    recovered[name] = now - fault_at
+    finally:
+        print(format_status(fleet.status()))
+        fleet.stop()
+
+    failed = False
+    for name in faults:
+        if name in recovered:
+            print(f"{name}: recovered after {recovered[name]:.1f} s")
+        else:
+            print(f"FAILED: {name} did not recover")
+            failed = True
+    if not faults:
+        print("FAILED: workers never all came up; no fault was injected")
+        failed = True
+    if fps_samples:
+        print(f"aggregate output: {max(fps_samples):.1f} fps peak, "
+              f"{sum(fps_samples) / len(fps_samples):.1f} fps mean over {args.workers} workers "
+              f"on {os.cpu_count()} CPUs")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+################################################################################
+# RTSP ingest profile benchmark
+# Serves a live H.264 test stream from an in-process RTSP server and receives
+# it through uridecodebin once per ingest profile (dsutils.ingest), measuring
+# per frame:
+#
+#   network  payloader output on the server to depayloader input on the
+#            client (transport plus the rtspsrc jitterbuffer)
+#   decoded  payloader output to decoder output
+#
+# Frames are matched by RTP timestamp, so both clocks are this process's.
+# It also counts frames the server sent that were never decoded, which is
+# what drop-on-latency trades for latency.
+#
+#   python3 benchmarks/bench_ingest.py
+#   python3 benchmarks/bench_ingest.py --profiles lan wan --seconds 30
+#
+# With --uri a real camera is received instead; without server-side send
+# times only IngestMeter's RTCP/NTP based numbers are available.
+################################################################################
+
+import os
+import sys
+import time
+import argparse
+import collections
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import gi
+gi.require_version("Gst", "1.0")
+gi.require_version("GstRtp", "1.0")
+gi.require_version("GstRtspServer", "1.0")
+from gi.repository import Gst, GstRtp, GstRtspServer, GLib
+from dsutils.ingest import PROFILES, IngestMeter, configure_uridecodebin
+
+WARMUP_SECONDS = 2.0
+
+
+def rtp_timestamp(buf):
+    ok, rtp = GstRtp.RTPBuffer.map(buf, Gst.MapFlags.READ)
+    if not ok:
+        return None
+    try:
+        return rtp.get_timestamp()
+    finally:
+        rtp.unmap()
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return None, None
+    pick = lambda q: values[min(len(values) - 1, round(q / 100 * (len(values) - 1)))]
+    return pick(50) * 1000, pick(95) * 1000
+
+
+class TestServer:
+    """RTSP server streaming videotestsrc; remembers when each RTP timestamp left the payloader."""
+
+    def __init__(self, port, width, height, fps, bitrate):
+        self.sent = collections.OrderedDict()  # rtp timestamp -> perf_counter
+        self.count = 0
+        self.server = GstRtspServer.RTSPServer()
+        self.server.set_service(str(port))
+        self.factory = factory = GstRtspServer.RTSPMediaFactory()
+        factory.set_launch(
+            f"( videotestsrc is-live=true pattern=ball ! "
+            f"video/x-raw,width={width},height={height},framerate={fps}/1 ! "
+            f"x264enc tune=zerolatency speed-preset=ultrafast bframes=0 key-int-max={fps} "
+            f"bitrate={bitrate} ! rtph264pay name=pay0 pt=96 config-interval=1 )")
+        factory.set_shared(True)
+        factory.connect("media-configure", self._on_media)
+        self.server.get_mount_points().add_factory("/bench", factory)
+        self.server.attach(None)
+        self.uri = f"rtsp://127.0.0.1:{port}/bench"
+
+    def _on_media(self, factory, media):
+        pay = media.get_element().get_by_name("pay0")
+        pay.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, self._on_sent)
+
+    def _on_sent(self, pad, info):
+        ts = rtp_timestamp(info.get_buffer())
+        if ts is not None and ts not in self.sent:
+            self.sent[ts] = time.perf_counter()
+            self.count += 1
+            while len(self.sent) > 4096:
+                self.sent.popitem(last=False)
+        return Gst.PadProbeReturn.OK
+
+
+class Receiver:
+    """uridecodebin with one ingest profile, probing its depayloader and decoder."""
+
+    def __init__(self, uri, profile, server=None):
+        self.server = server
+        self.pipeline = Gst.Pipeline()
+        self.meter = IngestMeter(self.pipeline)
+        decode = Gst.ElementFactory.make("uridecodebin", "uri-decode-bin")
+        decode.set_property("uri", uri)
+        configure_uridecodebin(decode, profile)
+        sink = Gst.ElementFactory.make("fakesink", "sink")
+        sink.set_property("sync", False)
+        self.pipeline.add(decode)
+        self.pipeline.add(sink)
+        decode.connect("pad-added", lambda bin, pad: pad.link(sink.get_static_pad("sink")))
+        self.pipeline.connect("deep-element-added", self._on_element_added)
+        self.arrived = collections.OrderedDict()  # rtp timestamp -> perf_counter
+        self.last_rtp = None
+        self.pts_rtp = {}    # depayloaded pts -> rtp timestamp
+        self.network = []
+        self.decoded = []
+        self.frames = 0
+        self.measuring = False
+
+    def _on_element_added(self, bin, sub_bin, element):
+        factory = element.get_factory()
+        klass = factory.get_metadata("klass") if factory else ""
+        if "Depayloader" in klass:
+            element.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, self._on_rtp)
+            element.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, self._on_depayed)
+        elif "Decoder/Video" in klass:
+            element.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, self._on_decoded)
+
+    def _on_rtp(self, pad, info):
+        ts = rtp_timestamp(info.get_buffer())
+        if ts is not None:
+            self.last_rtp = ts
+            if ts not in self.arrived:
+                self.arrived[ts] = time.perf_counter()
+                while len(self.arrived) > 4096:  # frames lost before decoding
+                    self.arrived.popitem(last=False)
+        return Gst.PadProbeReturn.OK
+
+    def _on_depayed(self, pad, info):
+        # The access unit is pushed when its last packet arrives
+        self.pts_rtp[info.get_buffer().pts] = self.last_rtp
+        return Gst.PadProbeReturn.OK
+
+    def _on_decoded(self, pad, info):
+        now = time.perf_counter()
+        ts = self.pts_rtp.pop(info.get_buffer().pts, None)
+        if not self.measuring or ts is None:
+            return Gst.PadProbeReturn.OK
+        self.frames += 1
+        sent = self.server.sent.get(ts) if self.server else None
+        arrived = self.arrived.pop(ts, None)
+        if sent is not None:
+            self.decoded.append(now - sent)
+            if arrived is not None:
+                self.network.append(arrived - sent)
+        return Gst.PadProbeReturn.OK
+
+
+def run_profile(profile, args, server):
+    uri = args.uri or server.uri
+    receiver = Receiver(uri, profile, server)
+    loop = GLib.MainLoop()
+    receiver.pipeline.set_state(Gst.State.PLAYING)
+    sent_before = {}
+
+    def start_measuring():
+        receiver.measuring = True
+        if server:
+            sent_before["count"] = server.count
+        return False
+
+    GLib.timeout_add(int(WARMUP_SECONDS * 1000), start_measuring)
+    GLib.timeout_add(int((WARMUP_SECONDS + args.seconds) * 1000), lambda: loop.quit() or False)
+    loop.run()
+    meter_report = receiver.meter.format_report()
+    receiver.pipeline.set_state(Gst.State.NULL)
+
+    result = {"profile": profile, "frames": receiver.frames}
+    result["network_p50_ms"], result["network_p95_ms"] = percentiles(receiver.network)
+    result["decoded_p50_ms"], result["decoded_p95_ms"] = percentiles(receiver.decoded)
+    if server and "count" in sent_before:
+        result["sent"] = server.count - sent_before["count"]
+    result["meter"] = meter_report
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare RTSP ingest profiles")
+    parser.add_argument("--profiles", nargs="+", choices=list(PROFILES), default=list(PROFILES))
+    parser.add_argument("--seconds", type=float, default=15.0, help="Measured seconds per profile")
+    parser.add_argument("--uri", help="Receive this RTSP URI instead of the built-in test server")
+    parser.add_argument("--port", type=int, default=8554)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--bitrate", type=int, default=4000, help="Test stream bitrate in kbps")
+    args = parser.parse_args()
+
+    Gst.init(None)
+    server = None if args.uri else TestServer(args.port, args.width, args.height, args.fps, args.bitrate)
+
+    fmt = lambda value: "   n/a" if value is None else f"{value:6.1f}"
+    for profile in args.profiles:
+        result = run_profile(profile, args, server)
+        dropped = ""
+        if result.get("sent"):
+            dropped = f"  dropped {max(0, result['sent'] - result['frames'])}/{result['sent']}"
+        print(f"{profile:18s} network p50/p95 {fmt(result['network_p50_ms'])}/{fmt(result['network_p95_ms'])} ms  "
+              f"decoded p50/p95 {fmt(result['decoded_p50_ms'])}/{fmt(result['decoded_p95_ms'])} ms  "
+              f"frames {result['frames']}{dropped}")
+        if args.uri:
+            print(result["meter"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
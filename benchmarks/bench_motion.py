@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+################################################################################
+# Motion gate check
+# Runs dsutils.motion.MotionDetector (the CPU part of --motion-gate) over
+# synthetic 1080p RGBA frames: a static scene with sensor noise, then an
+# object crossing it, then the static scene again. Reports the time per
+# frame, how many frames the gate would have sent to the detector in each
+# phase, and exits non-zero when a frame with the object in a new place
+# since the last inference was gated, or when most static frames were not.
+#
+#   python3 benchmarks/bench_motion.py --static 300 --moving 90
+################################################################################
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dsutils.motion import DEFAULT_THRESHOLD, MotionDetector
+
+WIDTH, HEIGHT = 1920, 1080
+
+
+def make_frames(args):
+    rng = np.random.default_rng(0)
+    background = rng.integers(40, 200, size=(HEIGHT, WIDTH, 4), dtype=np.uint8)
+    # A few noise patterns cycled through, so the run is not dominated by generating frames
+    noisy = [np.clip(background.astype(np.int16) + rng.integers(-args.noise, args.noise + 1,
+                                                                size=background.shape), 0, 255).astype(np.uint8)
+             for _ in range(4)]
+    phases = [("static", args.static), ("moving", args.moving), ("static", args.static)]
+    frame = 0
+    for phase, count in phases:
+        for i in range(count):
+            image = noisy[frame % len(noisy)]
+            position = None
+            if phase == "moving":
+                image = image.copy()
+                left = int(i * (WIDTH - args.size) / max(1, count - 1))
+                top = HEIGHT // 2 - args.size // 2
+                image[top:top + args.size, left:left + args.size] = 255
+                position = left
+            yield phase, position, image
+            frame += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Motion gate check (NumPy only)")
+    parser.add_argument("--static", type=int, default=300, help="Static frames before and after the object")
+    parser.add_argument("--moving", type=int, default=90, help="Frames the object takes to cross")
+    parser.add_argument("--size", type=int, default=120, help="Object size in pixels")
+    parser.add_argument("--noise", type=int, default=8, help="Sensor noise amplitude in 8-bit levels")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    detector = MotionDetector(args.threshold)
+    sent = {"static": 0, "moving": 0}
+    seen = {"static": 0, "moving": 0}
+    missed = 0
+    last_position = None
+    elapsed = 0.0
+    for phase, position, image in make_frames(args):
+        start = time.perf_counter()
+        infer, reduced = detector.decide([(0, image)])
+        elapsed += time.perf_counter() - start
+        detector.commit(reduced, infer)
+        seen[phase] += 1
+        sent[phase] += infer
+        if phase == "moving":
+            # Gating is only wrong when the object moved since the detector last saw it
+            if not infer and position != last_position:
+                moved = abs(position - last_position) if last_position is not None else args.size
+                missed += moved >= args.size // 4
+            if infer:
+                last_position = position
+    frames = sum(seen.values())
+    print(f"{frames} frames, {elapsed * 1e6 / frames:.1f} us/frame in the gate")
+    for phase in ("static", "moving"):
+        print(f"  {phase:<7} {sent[phase]:4d} of {seen[phase]:4d} frames sent to the detector")
+    print(f"  decisions: {dict(detector.decisions[0])}")
+    failed = False
+    if missed:
+        print(f"FAILED: {missed} frames with the object moved were gated")
+        failed = True
+    if sent["static"] > seen["static"] * 0.1:
+        print("FAILED: the gate let more than 10% of static frames through")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+
+################################################################################
+# Headless pipeline benchmark
+# Rebuilds the topology of every script with synthetic inputs and discarding
+# sinks, and measures sustained fps, per-frame latency percentiles, CPU and
+# RSS:
+#
+#   usb_to_rtsp / usb_to_rtmp / usb_to_screen
+#       videotestsrc producing the camera's raw format (YUY2 by default)
+#   rtsp_to_rtsp / rtsp_to_rtmp / rtsp_to_screen / rtsp_ai_to_rtsp
+#       filesrc reading an H.264 MP4 generated once with videotestsrc, which
+#       stands in for the depayloaded RTSP stream
+#
+# Network and display sinks become fakesink, or filesink with --output-dir.
+# When NVIDIA elements are missing their software counterparts are used
+# (videoconvert, avdec_h264, x264enc) and NVIDIA-only stages without one
+# (nvstreammux, nvmultistreamtiler, nvinfer, nvdsosd) are dropped; the JSON
+# lists every substitution so runs on different hosts are not compared blindly.
+#
+# --threading inserts queues at the stage boundaries of a dsutils.queues
+# profile, as the scripts' --threading option does; bench_threading.py runs
+# every profile and compares them.
+#
+# Each topology runs in its own process so CPU and RSS are not mixed up.
+# With --baseline the results are compared to an earlier --json file and the
+# script exits non-zero when fps drops, or p95 latency, CPU per frame or RSS
+# grow, by more than --tolerance.
+#
+#   python3 benchmarks/bench_pipelines.py --json results.json
+#   python3 benchmarks/bench_pipelines.py --baseline results.json --tolerance 0.15
+################################################################################
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst, GLib
+from dsutils.queues import PROFILES, queue_description, stage_plan
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DEFAULT_PGIE_CONFIG = os.path.join(REPO_DIR, "dstest1_pgie_config.txt")
+MUXER_BATCH_TIMEOUT_USEC = 33000
+WARMUP_FRAMES = 30
+
+TOPOLOGIES = ("usb_to_rtsp", "usb_to_rtmp", "usb_to_screen",
+              "rtsp_to_rtsp", "rtsp_to_rtmp", "rtsp_to_screen", "rtsp_ai_to_rtsp")
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def rss_mb():
+    """Current and peak resident set size of this process, in MB."""
+    current = peak = 0.0
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                current = int(line.split()[1]) / 1024
+            elif line.startswith("VmHWM:"):
+                peak = int(line.split()[1]) / 1024
+    return current, peak
+
+
+class Stages:
+    """Element descriptions for one host, with software fallbacks."""
+
+    def __init__(self, args):
+        self.args = args
+        self.substitutions = []
+        self.nvidia = self.has("nvvideoconvert")
+        self.plan = stage_plan(args.threading)
+
+    def boundary(self, stage):
+        """Queue in front of ``stage`` when the threading profile has one."""
+        spec = self.plan.get(stage)
+        return queue_description(stage, spec) if spec else None
+
+    @staticmethod
+    def has(name):
+        return Gst.ElementFactory.find(name) is not None
+
+    def pick(self, element, fallback):
+        if self.has(element.split()[0]):
+            return element
+        self.substitutions.append(f"{element.split()[0]} -> {fallback or 'dropped'}")
+        return fallback
+
+    def convert(self, name):
+        return self.pick(f"nvvideoconvert name={name}", f"videoconvert name={name}")
+
+    def encoder(self):
+        name = "x264enc"
+        if self.nvidia:
+            from dsutils.encoder_cache import load_capabilities
+            name = load_capabilities().get("choice") or "x264enc"
+        elif self.has("nvv4l2h264enc") or self.has("nvh264enc"):
+            self.substitutions.append("hardware encoder -> x264enc (no nvvideoconvert)")
+        return f"{name} name=encoder"
+
+    def decoder(self):
+        return self.pick("nvv4l2decoder name=decoder", "avdec_h264 name=decoder")
+
+    def mux(self):
+        a = self.args
+        return self.pick(
+            f"nvstreammux name=mux batch-size=1 width={a.width} height={a.height} "
+            f"batched-push-timeout={MUXER_BATCH_TIMEOUT_USEC}", None)
+
+    def usb_capture(self):
+        """Camera caps, plus videoconvert when nvvideoconvert cannot take them."""
+        a = self.args
+        caps = f"video/x-raw,format={a.usb_format},width={a.width},height={a.height},framerate={a.fps}/1"
+        steps = [f"videotestsrc name=src is-live={str(a.live).lower()} num-buffers={a.frames} pattern=ball",
+                 f"capsfilter name=bench-in caps=\"{caps}\""]
+        accepted = ()
+        if self.nvidia:
+            from dsutils.capture import nvvideoconvert_formats
+            accepted = nvvideoconvert_formats()
+        if a.usb_format not in accepted:
+            steps.append("videoconvert name=convertor_src1")
+        return steps
+
+    def file_input(self):
+        steps = [f"filesrc location={self.args.input}", "qtdemux", "h264parse name=bench-in"]
+        if self.args.live:
+            steps.append("identity sync=true")
+        return steps
+
+    def sink(self, topology, suffix):
+        out = self.args.output_dir
+        if out:
+            path = os.path.join(out, f"{topology}.{suffix}")
+            return f"filesink name=bench-out location={path} sync=false async=false"
+        return "fakesink name=bench-out sync=false async=false"
+
+
+def build_description(topology, stages):
+    args = stages.args
+    if topology.startswith("usb_"):
+        steps = stages.usb_capture() + [stages.boundary("convert"), stages.convert("nvvidconv")]
+    else:
+        steps = stages.file_input() + [stages.decoder(), stages.mux()]
+        if topology == "rtsp_ai_to_rtsp":
+            steps += [
+                stages.boundary("infer"),
+                stages.pick(f"nvinfer name=primary-inference config-file-path={args.pgie_config} "
+                            f"batch-size=1", "identity name=primary-inference"),
+                stages.boundary("post-infer"),
+                stages.pick(f"nvmultistreamtiler rows=1 columns=1 width={args.width} "
+                            f"height={args.height}", None),
+            ]
+        steps += [stages.boundary("convert"), stages.convert("convertor")]
+        if topology == "rtsp_ai_to_rtsp":
+            steps += [stages.boundary("osd"),
+                      stages.pick("nvdsosd", "identity name=onscreendisplay"),
+                      stages.convert("convertor-postosd")]
+
+    if topology.endswith("_screen"):
+        if topology.startswith("usb_"):
+            # usb_to_screen.py encodes, then decodes again for display
+            steps += [stages.boundary("encoder"), stages.encoder(), "h264parse",
+                      stages.decoder(), "videoconvert"]
+        steps.append(stages.sink(topology, "yuv"))
+    elif topology.endswith("_rtmp"):
+        steps += [stages.boundary("encoder"), stages.encoder(), "h264parse",
+                  stages.boundary("sink"), "flvmux streamable=true", stages.sink(topology, "flv")]
+    else:
+        steps += [stages.boundary("encoder"), stages.encoder(), "h264parse",
+                  stages.boundary("sink"), stages.sink(topology, "h264")]
+    return " ! ".join(step for step in steps if step)
+
+
+def generate_input(path, args):
+    """Encode the synthetic stream that replaces the RTSP source."""
+    encoder = "x264enc tune=zerolatency speed-preset=superfast key-int-max=30"
+    description = (
+        f"videotestsrc num-buffers={args.frames} pattern=ball ! "
+        f"video/x-raw,format=I420,width={args.width},height={args.height},framerate={args.fps}/1 ! "
+        f"{encoder} bitrate={args.bitrate} ! h264parse ! mp4mux ! filesink location={path}")
+    pipeline = Gst.parse_launch(description)
+    pipeline.set_state(Gst.State.PLAYING)
+    msg = pipeline.get_bus().timed_pop_filtered(
+        Gst.CLOCK_TIME_NONE, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+    pipeline.set_state(Gst.State.NULL)
+    if msg.type == Gst.MessageType.ERROR:
+        err, _ = msg.parse_error()
+        raise RuntimeError(f"Unable to generate {path}: {err.message}")
+
+
+def run_topology(topology, args):
+    """Run one topology to EOS in this process and return its measurements."""
+    stages = Stages(args)
+    description = build_description(topology, stages)
+    try:
+        pipeline = Gst.parse_launch(description)
+    except GLib.Error as e:
+        return {"topology": topology, "error": str(e), "pipeline": description}
+    encoder = pipeline.get_by_name("encoder")
+    if encoder is not None:
+        from dsutils.encoder_cache import configure_encoder
+        configure_encoder(encoder, args.bitrate)
+
+    # Latency: time each frame entering the first stage and leaving the last,
+    # matched by PTS rounded to the millisecond (flvmux keeps millisecond PTS)
+    entered = {}
+    latencies = []
+    sink_times = []
+
+    def on_in(pad, info):
+        buf = info.get_buffer()
+        if buf.pts != Gst.CLOCK_TIME_NONE:
+            entered[buf.pts // Gst.MSECOND] = time.perf_counter()
+        return Gst.PadProbeReturn.OK
+
+    def on_out(pad, info):
+        now = time.perf_counter()
+        buf = info.get_buffer()
+        start = entered.pop(buf.pts // Gst.MSECOND, None) if buf.pts != Gst.CLOCK_TIME_NONE else None
+        if start is not None:
+            sink_times.append(now)
+            latencies.append(now - start)
+        return Gst.PadProbeReturn.OK
+
+    pipeline.get_by_name("bench-in").get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, on_in)
+    pipeline.get_by_name("bench-out").get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, on_out)
+
+    loop = GLib.MainLoop()
+    result = {"topology": topology, "threading": args.threading, "pipeline": description,
+              "substitutions": stages.substitutions}
+
+    def on_message(bus, message):
+        if message.type == Gst.MessageType.EOS:
+            loop.quit()
+        elif message.type == Gst.MessageType.ERROR:
+            err, _ = message.parse_error()
+            result["error"] = err.message
+            loop.quit()
+        return True
+
+    def on_timeout():
+        result["error"] = f"timed out after {args.timeout}s"
+        loop.quit()
+        return False
+
+    bus = pipeline.get_bus()
+    bus.add_signal_watch()
+    bus.connect("message", on_message)
+    GLib.timeout_add(int(args.timeout * 1000), on_timeout)
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    pipeline.set_state(Gst.State.PLAYING)
+    loop.run()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    pipeline.set_state(Gst.State.NULL)
+    current_rss, peak_rss = rss_mb()
+
+    frames = len(sink_times)
+    if frames > WARMUP_FRAMES + 1:
+        steady = sink_times[WARMUP_FRAMES:]
+        fps = (len(steady) - 1) / (steady[-1] - steady[0]) if steady[-1] > steady[0] else 0.0
+    else:
+        fps = frames / wall if wall > 0 else 0.0
+    latencies_ms = sorted(l * 1000 for l in latencies[WARMUP_FRAMES:] or latencies)
+    result.update({
+        "frames": frames,
+        "fps": fps,
+        "latency_p50_ms": percentile(latencies_ms, 50),
+        "latency_p95_ms": percentile(latencies_ms, 95),
+        "latency_p99_ms": percentile(latencies_ms, 99),
+        "cpu_percent": cpu / wall * 100 if wall > 0 else 0.0,
+        "cpu_ms_per_frame": cpu / frames * 1000 if frames else None,
+        "rss_mb": current_rss,
+        "peak_rss_mb": peak_rss,
+    })
+    # Leaky queues drop frames by design; report them instead of failing
+    leaky = any(spec.leaky != "no" for spec in stages.plan.values())
+    result["dropped"] = max(0, args.frames - frames)
+    if not result.get("error") and not leaky and frames < args.frames * 0.9:
+        result["error"] = f"only {frames} of {args.frames} frames reached the sink"
+    return result
+
+
+# metric -> +1 when larger is better, -1 when smaller is better
+REGRESSION_METRICS = {"fps": 1, "latency_p95_ms": -1, "cpu_ms_per_frame": -1, "peak_rss_mb": -1}
+
+
+def compare(results, baseline, tolerance):
+    """Return regression messages against a baseline results list."""
+    previous = {r["topology"]: r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        old = previous.get(result["topology"])
+        if old is None or old.get("error") or result.get("error"):
+            continue
+        for metric, direction in REGRESSION_METRICS.items():
+            before, after = old.get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if change * direction < -tolerance:
+                regressions.append(f"{result['topology']}: {metric} {before:.2f} -> {after:.2f} "
+                                   f"({change * 100:+.1f}%)")
+    return regressions
+
+
+def print_result(result):
+    if result.get("error"):
+        print(f"{result['topology']:16s} FAILED: {result['error']}")
+        return
+    print(f"{result['topology']:16s} {result['fps']:8.1f} fps  "
+          f"latency p50/p95/p99 {result['latency_p50_ms']:.1f}/{result['latency_p95_ms']:.1f}/"
+          f"{result['latency_p99_ms']:.1f} ms  CPU {result['cpu_percent']:.0f}% "
+          f"({result['cpu_ms_per_frame']:.2f} ms/frame)  RSS {result['peak_rss_mb']:.0f} MB")
+    for substitution in result["substitutions"]:
+        print(f"{'':16s} fallback: {substitution}")
+
+
+def child_args(args, topology):
+    argv = [sys.executable, os.path.abspath(__file__), "--child", topology,
+            "--frames", str(args.frames), "--width", str(args.width), "--height", str(args.height),
+            "--fps", str(args.fps), "--bitrate", str(args.bitrate), "--usb-format", args.usb_format,
+            "--input", args.input, "--pgie-config", args.pgie_config, "--timeout", str(args.timeout),
+            "--threading", args.threading]
+    if args.live:
+        argv.append("--live")
+    if args.output_dir:
+        argv += ["--output-dir", args.output_dir]
+    return argv
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless benchmark of every script's topology")
+    parser.add_argument("--topology", nargs="+", choices=TOPOLOGIES, default=list(TOPOLOGIES))
+    parser.add_argument("--frames", type=int, default=600, help="Frames per run")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--bitrate", type=int, default=4000, help="Encoder bitrate in kbps")
+    parser.add_argument("--usb-format", default="YUY2", help="Raw format the USB camera delivers")
+    parser.add_argument("--input", help="H.264 MP4 standing in for the RTSP stream "
+                                        "(generated when omitted)")
+    parser.add_argument("--pgie-config", default=DEFAULT_PGIE_CONFIG)
+    parser.add_argument("--live", action="store_true",
+                        help="Deliver frames at --fps instead of as fast as possible")
+    parser.add_argument("--output-dir", help="Write encoded output here instead of discarding it")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds per topology")
+    parser.add_argument("--threading", choices=sorted(PROFILES), default="none",
+                        help="Queue placement profile from dsutils.queues, default none")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--baseline", help="Fail on regressions against this results file")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Allowed relative regression, default 0.1")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    Gst.init(None)
+    if args.child:
+        print(json.dumps(run_topology(args.child, args)))
+        return 0
+
+    workdir = tempfile.mkdtemp(prefix="ds-bench-")
+    if not args.input:
+        args.input = os.path.join(workdir, "input.mp4")
+        generate_input(args.input, args)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    results = []
+    for topology in args.topology:
+        proc = subprocess.run(child_args(args, topology), stdout=subprocess.PIPE, text=True)
+        lines = proc.stdout.strip().splitlines()
+        try:
+            result = json.loads(lines[-1])
+        except (IndexError, ValueError):
+            result = {"topology": topology, "error": f"benchmark process exited with {proc.returncode}"}
+        results.append(result)
+        print_result(result)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "gstreamer": Gst.version_string(),
+        "settings": {"frames": args.frames, "width": args.width, "height": args.height,
+                     "fps": args.fps, "bitrate": args.bitrate, "live": args.live,
+                     "threading": args.threading},
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failed = [r["topology"] for r in results if r.get("error")]
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    return 1 if failed or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
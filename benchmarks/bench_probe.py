@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+################################################################################
+# pgie probe microbenchmark
+# Times the per-batch work of rtsp_ai_to_rtsp.py's pgie_src_pad_buffer_probe
+# against the fake pyds backend, so it runs without DeepStream or a GPU.
+#
+# The "labels" rows do the same work as the legacy probe and are the fair
+# comparison. The gain is modest: about 1.1-1.5x with boxes read and
+# 1.2-2x without, because the batch read costs most of what precomputed
+# label text saves. The current probe (no boxes, plus object counting the
+# legacy probe never did) lands at about 1.1-1.35x. Runs vary by tens of
+# percent, so use --iterations 10000 and compare several runs.
+#
+#   python3 benchmarks/bench_probe.py --sources 4 --objects 30
+################################################################################
+
+import os
+import sys
+import argparse
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dsutils import fake_pyds
+from dsutils.batch_meta import BatchMetaReader
+from dsutils.counting import ObjectCounter
+from dsutils.osd import LabelTable
+
+PGIE_CLASS_ID_VEHICLE = 0
+PGIE_CLASS_ID_BICYCLE = 1
+PGIE_CLASS_ID_PERSON = 2
+PGIE_CLASS_ID_ROADSIGN = 3
+CLASS_NAMES = ("Vehicle", "TwoWheeler", "Person", "RoadSign")
+
+
+def legacy_probe(batch_meta, pyds=fake_pyds):
+    """The original node-by-node probe body, kept as the baseline."""
+    l_frame = batch_meta.frame_meta_list
+    while l_frame is not None:
+        try:
+            frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
+        except StopIteration:
+            break
+
+        num_detected_objects = 0
+        l_obj = frame_meta.obj_meta_list
+        while l_obj is not None:
+            try:
+                obj_meta = pyds.NvDsObjectMeta.cast(l_obj.data)
+            except StopIteration:
+                break
+
+            obj_counter = {
+                PGIE_CLASS_ID_VEHICLE: 0,
+                PGIE_CLASS_ID_PERSON: 0,
+                PGIE_CLASS_ID_BICYCLE: 0,
+                PGIE_CLASS_ID_ROADSIGN: 0
+            }
+            obj_counter[obj_meta.class_id] += 1
+            num_detected_objects += 1
+
+            if obj_meta.class_id == PGIE_CLASS_ID_VEHICLE:
+                obj_meta.text_params.display_text = "Vehicle {:.2f}".format(obj_meta.confidence)
+            elif obj_meta.class_id == PGIE_CLASS_ID_PERSON:
+                obj_meta.text_params.display_text = "Person {:.2f}".format(obj_meta.confidence)
+            elif obj_meta.class_id == PGIE_CLASS_ID_BICYCLE:
+                obj_meta.text_params.display_text = "TwoWheeler {:.2f}".format(obj_meta.confidence)
+            elif obj_meta.class_id == PGIE_CLASS_ID_ROADSIGN:
+                obj_meta.text_params.display_text = "RoadSign {:.2f}".format(obj_meta.confidence)
+
+            obj_meta.text_params.font_params.font_name = "Arial"
+            obj_meta.text_params.font_params.font_size = 14
+            obj_meta.text_params.font_params.font_color.set(1.0, 1.0, 0.0, 1.0)
+            obj_meta.text_params.set_bg_clr = 1
+            obj_meta.text_params.text_bg_clr.set(0.0, 0.0, 0.0, 0.5)
+
+            try:
+                l_obj = l_obj.next
+            except StopIteration:
+                break
+
+        try:
+            l_frame = l_frame.next
+        except StopIteration:
+            break
+
+
+def make_label_probe(read_bbox):
+    """Batch read and label table only, the same work as the legacy probe."""
+    reader = BatchMetaReader(fake_pyds, read_bbox=read_bbox)
+    table = LabelTable(CLASS_NAMES)
+
+    def probe(batch_meta):
+        table.apply(reader.read(batch_meta))
+    return probe
+
+
+def make_table_probe(num_sources):
+    """The current probe body: batch read without boxes, label table and object counting."""
+    reader = BatchMetaReader(fake_pyds, read_bbox=False)
+    table = LabelTable(CLASS_NAMES)
+    counter = ObjectCounter(num_sources, len(CLASS_NAMES))
+
+    def probe(batch_meta):
+        detections = reader.read(batch_meta)
+        table.apply(detections)
+        counter.update(detections)
+    return probe
+
+
+def make_read_only():
+    reader = BatchMetaReader(fake_pyds)
+    return reader.read
+
+
+def bench(fn, batches, iterations):
+    # One warm-up pass so buffer growth and first-call costs are excluded
+    for batch_meta in batches:
+        fn(batch_meta)
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(batches[i % len(batches)])
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pgie probe microbenchmark (fake pyds)")
+    parser.add_argument("--sources", type=int, default=4, help="Frames per batch")
+    parser.add_argument("--objects", type=int, default=30, help="Objects per frame")
+    parser.add_argument("--iterations", type=int, default=2000, help="Batches to time")
+    args = parser.parse_args()
+
+    batches = [fake_pyds.make_batch_meta(args.sources, args.objects, frame_num=i, seed=i)
+               for i in range(16)]
+    results = [
+        ("legacy probe", bench(legacy_probe, batches, args.iterations)),
+        ("batch read only", bench(make_read_only(), batches, args.iterations)),
+        ("labels, with boxes", bench(make_label_probe(True), batches, args.iterations)),
+        ("labels, no boxes", bench(make_label_probe(False), batches, args.iterations)),
+        ("current probe", bench(make_table_probe(args.sources), batches, args.iterations)),
+    ]
+
+    n_objs = args.sources * args.objects
+    baseline = results[0][1]
+    print(f"{args.sources} frame(s) x {args.objects} object(s) per batch, "
+          f"{args.iterations} batches")
+    for name, seconds in results:
+        print(f"  {name:<20} {seconds * 1e6 / args.sources:8.1f} us/frame  "
+              f"{seconds * 1e9 / n_objs:7.0f} ns/object  {baseline / seconds:5.2f}x")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+################################################################################
+# RTSP reconnection check
+# Streams from a local RTSP test server into nvstreammux through a
+# SourceManager watched by dsutils.supervisor, then takes the server down and
+# brings it back up several times while the pipeline stays in PLAYING.
+# Reports, per outage, how long the source took to come back, and the longest
+# gap in muxer output, which shows whether the placeholder kept the rest of
+# the pipeline fed. Exits non-zero when a reconnect does not happen, the
+# main loop would have ended, or the output stalls.
+#
+#   python3 benchmarks/bench_reconnect.py --cycles 3 --down 3
+################################################################################
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import gi
+gi.require_version("Gst", "1.0")
+gi.require_version("GstRtspServer", "1.0")
+from gi.repository import Gst, GstRtspServer, GLib
+from bench_ingest import TestServer
+from dsutils.source_manager import SourceManager
+from dsutils.supervisor import SourceSupervisor
+
+MUXER_BATCH_TIMEOUT_USEC = 40000
+MOUNT = "/bench"
+
+
+class FlakyServer(TestServer):
+    """TestServer whose stream can be withdrawn and restored."""
+
+    def down(self):
+        self.server.get_mount_points().remove_factory(MOUNT)
+        self.server.client_filter(lambda server, client: GstRtspServer.RTSPFilterResult.REMOVE)
+
+    def up(self):
+        self.server.get_mount_points().add_factory(MOUNT, self.factory)
+
+
+def create_source_bin(index, uri):
+    """uridecodebin converted to NVMM NV12, as nvstreammux expects."""
+    nbin = Gst.Bin.new("source-bin-%02d" % index)
+    decode = Gst.ElementFactory.make("uridecodebin", "uri-decode-bin")
+    conv = Gst.ElementFactory.make("nvvideoconvert", "source-conv")
+    caps = Gst.ElementFactory.make("capsfilter", "source-caps")
+    decode.set_property("uri", uri)
+    caps.set_property("caps", Gst.Caps.from_string("video/x-raw(memory:NVMM),format=NV12"))
+    for element in (decode, conv, caps):
+        nbin.add(element)
+    conv.link(caps)
+    decode.connect("pad-added", lambda bin, pad: pad.link(conv.get_static_pad("sink")))
+    nbin.add_pad(Gst.GhostPad.new("src", caps.get_static_pad("src")))
+    return nbin
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RTSP source reconnection check")
+    parser.add_argument("--cycles", type=int, default=3, help="Server outages")
+    parser.add_argument("--up", type=float, default=5.0, help="Seconds the server stays up")
+    parser.add_argument("--down", type=float, default=3.0, help="Seconds each outage lasts")
+    parser.add_argument("--port", type=int, default=8555)
+    parser.add_argument("--stall-timeout", type=float, default=2.0)
+    parser.add_argument("--max-backoff", type=float, default=4.0)
+    parser.add_argument("--max-gap-ms", type=float, default=None,
+                        help="Fail when muxer output stalls longer than this "
+                             "(default: stall timeout + 1s)")
+    args = parser.parse_args()
+    max_gap_ms = args.max_gap_ms or (args.stall_timeout + 1.0) * 1000
+
+    Gst.init(None)
+    server = FlakyServer(args.port, 640, 480, 30, 2000)
+
+    pipeline = Gst.Pipeline()
+    streammux = Gst.ElementFactory.make("nvstreammux", "stream-muxer")
+    sink = Gst.ElementFactory.make("fakesink", "sink")
+    if not streammux or not sink:
+        sys.stderr.write("nvstreammux is required for this check\n")
+        return 2
+    streammux.set_property("width", 640)
+    streammux.set_property("height", 480)
+    streammux.set_property("batch-size", 1)
+    streammux.set_property("batched-push-timeout", MUXER_BATCH_TIMEOUT_USEC)
+    streammux.set_property("live-source", 1)
+    sink.set_property("sync", False)
+    pipeline.add(streammux)
+    pipeline.add(sink)
+    streammux.link(sink)
+
+    manager = SourceManager(pipeline, streammux, create_source_bin, max_sources=1)
+    manager.link_source(0, server.uri)
+    supervisor = SourceSupervisor(manager, initial_backoff=0.5, max_backoff=args.max_backoff,
+                                  stall_timeout=args.stall_timeout)
+
+    stats = {"last": None, "max_gap": 0.0, "batches": 0}
+
+    def on_batch(pad, info):
+        now = time.monotonic()
+        if stats["last"] is not None:
+            stats["max_gap"] = max(stats["max_gap"], now - stats["last"])
+        stats["last"] = now
+        stats["batches"] += 1
+        return Gst.PadProbeReturn.OK
+
+    streammux.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, on_batch)
+
+    loop = GLib.MainLoop()
+    failures = []
+
+    def on_message(bus, message):
+        if message.type == Gst.MessageType.ERROR:
+            err, _ = message.parse_error()
+            failures.append(f"error reached the application: {err.message}")
+            loop.quit()
+        return True
+
+    bus = pipeline.get_bus()
+    bus.add_signal_watch()
+    bus.connect("message", supervisor.bus_filter(on_message))
+
+    def outage(cycle):
+        print(f"cycle {cycle + 1}: server down for {args.down:.1f}s")
+        server.down()
+        GLib.timeout_add(int(args.down * 1000), restore, cycle)
+        return False
+
+    def restore(cycle):
+        server.up()
+        # Allow the longest backoff plus connection setup before judging
+        GLib.timeout_add(int((args.max_backoff + args.up) * 1000), check, cycle)
+        return False
+
+    def check(cycle):
+        health = supervisor.stats()[0]
+        if health["reconnects"] < cycle + 1:
+            failures.append(f"cycle {cycle + 1}: source did not reconnect ({health['state']}, "
+                            f"last error: {health['last_error']})")
+            loop.quit()
+        elif cycle + 1 >= args.cycles:
+            loop.quit()
+        else:
+            outage(cycle + 1)
+        return False
+
+    def begin():
+        stats["max_gap"] = 0.0
+        outage(0)
+        return False
+
+    supervisor.start()
+    pipeline.set_state(Gst.State.PLAYING)
+    GLib.timeout_add(int(args.up * 1000), begin)
+    loop.run()
+    supervisor.stop()
+    pipeline.set_state(Gst.State.NULL)
+
+    health = supervisor.stats()[0]
+    print(f"batches: {stats['batches']}, longest output gap: {stats['max_gap'] * 1000:.1f} ms")
+    print(f"failures detected: {health['failures']}, reconnects: {health['reconnects']}")
+    if health["max_recovery_s"] is not None:
+        print(f"recovery: last {health['last_recovery_s']:.2f} s, max {health['max_recovery_s']:.2f} s "
+              f"(outages last {args.down:.1f} s)")
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    if failures or stats["max_gap"] * 1000 > max_gap_ms:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
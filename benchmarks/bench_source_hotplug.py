@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+################################################################################
+# Source hotplug check
+# Runs videotestsrc sources into nvstreammux, then repeatedly attaches and
+# detaches an extra source through dsutils.source_manager while the pipeline
+# stays in PLAYING. Reports how long each change took and the longest gap in
+# muxer output, which shows whether the sources left alone were disturbed.
+# Exits non-zero when a change fails or the output stalls.
+#
+#   python3 benchmarks/bench_source_hotplug.py --cycles 5
+################################################################################
+
+import os
+import sys
+import argparse
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst, GLib
+from dsutils.source_manager import SourceManager
+from dsutils.test_source import create_test_source_bin
+
+MUXER_BATCH_TIMEOUT_USEC = 40000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runtime source add/remove check")
+    parser.add_argument("--cycles", type=int, default=5, help="Add/remove cycles")
+    parser.add_argument("--hold", type=float, default=1.0, help="Seconds each extra source plays")
+    parser.add_argument("--max-gap-ms", type=float, default=250.0,
+                        help="Fail when muxer output stalls longer than this")
+    args = parser.parse_args()
+
+    Gst.init(None)
+    pipeline = Gst.Pipeline()
+    streammux = Gst.ElementFactory.make("nvstreammux", "stream-muxer")
+    sink = Gst.ElementFactory.make("fakesink", "sink")
+    if not streammux or not sink:
+        sys.stderr.write("nvstreammux is required for this check\n")
+        return 2
+    streammux.set_property("width", 1280)
+    streammux.set_property("height", 720)
+    streammux.set_property("batch-size", 2)
+    streammux.set_property("batched-push-timeout", MUXER_BATCH_TIMEOUT_USEC)
+    streammux.set_property("live-source", 1)
+    sink.set_property("sync", False)
+    pipeline.add(streammux)
+    pipeline.add(sink)
+    streammux.link(sink)
+
+    manager = SourceManager(pipeline, streammux, create_test_source_bin, max_sources=2)
+    manager.link_source(0, "videotestsrc://ball")
+
+    # Longest interval between muxer output batches, outside of startup
+    stats = {"last": None, "max_gap": 0.0, "batches": 0}
+
+    def on_batch(pad, info):
+        now = time.monotonic()
+        if stats["last"] is not None:
+            stats["max_gap"] = max(stats["max_gap"], now - stats["last"])
+        stats["last"] = now
+        stats["batches"] += 1
+        return Gst.PadProbeReturn.OK
+
+    streammux.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, on_batch)
+
+    loop = GLib.MainLoop()
+    add_ms = []
+    remove_ms = []
+    failures = []
+
+    def step(cycle, adding):
+        try:
+            if adding:
+                manager.add_source("videotestsrc://snow")
+                add_ms.append(manager.last_change_ms)
+            else:
+                manager.remove_source(1)
+                remove_ms.append(manager.last_change_ms)
+        except RuntimeError as e:
+            failures.append(str(e))
+            loop.quit()
+            return False
+        if not adding and cycle + 1 >= args.cycles:
+            loop.quit()
+        else:
+            next_cycle = cycle + (0 if adding else 1)
+            GLib.timeout_add(int(args.hold * 1000), step, next_cycle, not adding)
+        return False
+
+    def begin():
+        # Measure gaps only once the pipeline is streaming
+        stats["max_gap"] = 0.0
+        step(0, True)
+        return False
+
+    pipeline.set_state(Gst.State.PLAYING)
+    GLib.timeout_add(1000, begin)
+    loop.run()
+    pipeline.set_state(Gst.State.NULL)
+
+    print(f"batches: {stats['batches']}, longest output gap: {stats['max_gap'] * 1000:.1f} ms")
+    if add_ms:
+        print(f"add:    mean {sum(add_ms) / len(add_ms):.1f} ms, max {max(add_ms):.1f} ms")
+    if remove_ms:
+        print(f"remove: mean {sum(remove_ms) / len(remove_ms):.1f} ms, max {max(remove_ms):.1f} ms")
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    if failures or stats["max_gap"] * 1000 > args.max_gap_ms:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+################################################################################
+# Threading profile comparison
+# Runs bench_pipelines.py once per queue placement profile (dsutils.queues)
+# on the same synthetic input (the generated stream is deterministic, or pass
+# --input) and prints, per topology, fps, p95 latency and CPU of every
+# profile next to the fps gain over "none". Other options are passed through
+# to bench_pipelines.py:
+#
+#   python3 benchmarks/bench_threading.py
+#   python3 benchmarks/bench_threading.py --topology rtsp_ai_to_rtsp --frames 1200
+#
+# Queues only pay off when stages can run on different cores, so the host's
+# core count is printed with the results. Without --live the sources push
+# frames as fast as the pipeline takes them, which is what shows the
+# throughput difference; with --live all profiles should hold --fps and the
+# interesting column is latency.
+################################################################################
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dsutils.queues import PROFILES
+
+BENCH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_pipelines.py")
+PROFILE_ORDER = ("none", "latency", "balanced", "throughput")
+
+
+def run_profile(profile, passthrough, workdir):
+    path = os.path.join(workdir, f"{profile}.json")
+    subprocess.run([sys.executable, BENCH, "--threading", profile, "--json", path] + passthrough,
+                   stdout=subprocess.DEVNULL)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {r["topology"]: r for r in json.load(f)["results"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare queue placement profiles")
+    parser.add_argument("--profiles", nargs="+", choices=sorted(PROFILES),
+                        default=[p for p in PROFILE_ORDER if p in PROFILES])
+    parser.add_argument("--json", help="Write all results to this file")
+    args, passthrough = parser.parse_known_args()
+
+    workdir = tempfile.mkdtemp(prefix="ds-threading-")
+    results = {profile: run_profile(profile, passthrough, workdir) for profile in args.profiles}
+
+    print(f"CPU cores: {os.cpu_count()}")
+    topologies = sorted({t for by_topology in results.values() for t in by_topology})
+    for topology in topologies:
+        print(f"\n{topology}")
+        base = results.get("none", {}).get(topology)
+        for profile in args.profiles:
+            result = results[profile].get(topology)
+            if not result:
+                print(f"  {profile:11s} no result")
+                continue
+            if result.get("error"):
+                print(f"  {profile:11s} FAILED: {result['error']}")
+                continue
+            gain = ""
+            if base and not base.get("error") and base["fps"]:
+                gain = f" ({(result['fps'] / base['fps'] - 1) * 100:+.1f}%)"
+            print(f"  {profile:11s} {result['fps']:8.1f} fps{gain:10s} p95 {result['latency_p95_ms']:7.1f} ms  "
+                  f"CPU {result['cpu_percent']:4.0f}%  dropped {result.get('dropped', 0)}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"cpu_count": os.cpu_count(), "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
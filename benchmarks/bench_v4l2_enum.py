@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+################################################################################
+# V4L2 enumeration check
+# Runs dsutils.v4l2 against the fake ioctl layer: enumerates two fake cameras,
+# checks the structured results, checks that a second lookup is served from
+# the cache, and plugs/unplugs a camera to check that the hotplug watcher
+# invalidates the cache. With --real it also times enumeration of the real
+# /dev/video* nodes against running v4l2-ctl. Exits non-zero on failure.
+#
+#   python3 benchmarks/bench_v4l2_enum.py [--real]
+################################################################################
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dsutils import v4l2
+from dsutils.fake_v4l2 import FakeIoctl, UVC_WEBCAM, UVC_METADATA
+
+
+def check(failures, condition, message):
+    if not condition:
+        failures.append(message)
+
+
+def check_fake(failures):
+    io = FakeIoctl({"/dev/video0": UVC_WEBCAM, "/dev/video1": UVC_METADATA,
+                    "/dev/video2": dict(UVC_WEBCAM, card="Second Camera")})
+    cache = v4l2.DeviceCache(io)
+
+    start = time.perf_counter()
+    devices = cache.devices()
+    cold_ms = (time.perf_counter() - start) * 1000
+    cold_calls = io.calls
+    check(failures, [d.path for d in devices] == ["/dev/video0", "/dev/video2"],
+          f"expected capture nodes video0 and video2, got {[d.path for d in devices]}")
+
+    cam = devices[0]
+    fourccs = [fmt.fourcc for fmt in cam.formats]
+    check(failures, fourccs == ["MJPG", "YUYV"], f"unexpected formats {fourccs}")
+    mjpg = cam.formats[0]
+    check(failures, mjpg.compressed, "MJPG not flagged as compressed")
+    check(failures, (mjpg.sizes[0].width, mjpg.sizes[0].height, mjpg.sizes[0].fps)
+          == (1920, 1080, (30.0, 15.0)), f"unexpected first MJPG size {mjpg.sizes[0]}")
+
+    start = time.perf_counter()
+    cache.devices()
+    warm_ms = (time.perf_counter() - start) * 1000
+    check(failures, io.calls == cold_calls, "second enumeration issued ioctls")
+    print(f"fake: cold {cold_ms:.2f} ms ({cold_calls} ioctls), cached {warm_ms:.3f} ms")
+
+    changed = threading.Event()
+    watcher = v4l2.HotplugWatcher(cache, on_change=lambda paths: changed.set(), interval=0.05)
+    watcher.start()
+    try:
+        io.plug("/dev/video4", dict(UVC_WEBCAM, card="Hotplugged Camera"))
+        check(failures, changed.wait(2.0), "watcher missed the plugged camera")
+        cards = [d.card for d in cache.devices()]
+        check(failures, "Hotplugged Camera" in cards, f"plugged camera not listed: {cards}")
+
+        changed.clear()
+        io.unplug("/dev/video0")
+        check(failures, changed.wait(2.0), "watcher missed the unplugged camera")
+        paths = [d.path for d in cache.devices()]
+        check(failures, "/dev/video0" not in paths, f"unplugged camera still listed: {paths}")
+    finally:
+        watcher.stop()
+
+
+def time_real():
+    cache = v4l2.DeviceCache()
+    start = time.perf_counter()
+    devices = cache.devices()
+    ioctl_ms = (time.perf_counter() - start) * 1000
+    print(f"ioctl: {len(devices)} capture device(s) in {ioctl_ms:.1f} ms")
+    for info in devices:
+        print(v4l2.format_device(info))
+
+    try:
+        start = time.perf_counter()
+        subprocess.run(["v4l2-ctl", "--list-devices"], capture_output=True)
+        for info in devices:
+            subprocess.run(["v4l2-ctl", "--device", info.path, "--list-formats-ext"],
+                           capture_output=True)
+        print(f"v4l2-ctl: {(time.perf_counter() - start) * 1000:.1f} ms")
+    except FileNotFoundError:
+        print("v4l2-ctl: not installed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="V4L2 enumeration check")
+    parser.add_argument("--real", action="store_true", help="Also time the real /dev/video* nodes")
+    args = parser.parse_args()
+
+    failures = []
+    check_fake(failures)
+    if args.real:
+        time_real()
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
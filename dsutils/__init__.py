@@ -0,0 +1 @@
+"""Shared helpers for the DeepStream example scripts in this directory."""
@@ -0,0 +1,214 @@
+################################################################################
+# Adaptive bitrate for RTSP/RTMP push outputs
+# With a fixed --bitrate a congested uplink fills the socket behind
+# rtspclientsink/rtmpsink, the sink blocks, and the whole pipeline stalls or
+# drops frames. BitrateController watches the sink side once per interval:
+#
+#   fill     how full the queue in front of the sink is (the "sink" stage
+#            queue, which scripts add when --adaptive-bitrate is given)
+#   delay    how long buffers wait in that queue, p95 over the interval
+#   loss     RTCP receiver report fraction lost, for RTSP outputs whose
+#            server sends receiver reports
+#
+# and moves the encoder bitrate within [min_kbps, max_kbps]:
+#
+#   congested (fill >= high_fill, delay >= max_delay or loss >= max_loss)
+#       multiply by decrease (default 0.7) right away, then wait ``settle``
+#       intervals for the backlog queued at the old rate to drain
+#   clear (fill <= low_fill, delay <= max_delay / 4, loss < max_loss / 5)
+#       for ``hold`` intervals in a row: add ``step`` of max_kbps
+#
+# Only the encoder's bitrate property changes; caps and the stream stay as
+# they are, so receivers see no renegotiation.
+#
+# The bitrate is read back from the encoder before every step, so a change
+# made by someone else is stepped from rather than overwritten with a stale
+# value. A live set_bitrate goes through retarget(): the requested rate
+# becomes the new ceiling and the controller keeps adapting below it.
+################################################################################
+
+import time
+import threading
+import collections
+
+import numpy as np
+
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst, GLib
+
+from dsutils.encoder_cache import get_encoder_bitrate, set_encoder_bitrate
+from dsutils.queues import QueueSpec
+
+ABR_QUEUE = QueueSpec(30, "no")
+
+
+def bitrate_bounds(text):
+    """Parse MIN:MAX (kbps); usable as an argparse type."""
+    low, _, high = text.partition(":")
+    low, high = int(low), int(high)
+    if low <= 0 or high < low:
+        raise ValueError(text)
+    return low, high
+
+
+def ensure_sink_queue(overrides):
+    """Add a sink stage queue to --queue overrides unless one is planned already."""
+    if not any(stage == "sink" for stage, _ in overrides):
+        overrides.append(("sink", ABR_QUEUE))
+    return overrides
+
+
+class BitrateController:
+    """Steps ``encoder``'s bitrate from backpressure measured at ``queue``.
+
+    ``queue`` is the queue element feeding the network sink; the sink itself
+    is searched for RTCP statistics. Runs on the GLib main loop.
+    """
+
+    def __init__(self, encoder, queue, min_kbps, max_kbps, interval=1.0, high_fill=0.5,
+                 low_fill=0.1, max_delay=0.5, max_loss=0.05, decrease=0.7, step=0.05, hold=5,
+                 settle=2):
+        self.encoder = encoder
+        self.queue = queue
+        self.min_kbps = min_kbps
+        self.max_kbps = max_kbps
+        self.interval = interval
+        self.high_fill = high_fill
+        self.low_fill = low_fill
+        self.max_delay = max_delay
+        self.max_loss = max_loss
+        self.decrease = decrease
+        self.step = step
+        self.hold = hold
+        self.settle = settle
+        self.kbps = min(max(get_encoder_bitrate(encoder), min_kbps), max_kbps)
+        self.changes = []  # (monotonic time, old kbps, new kbps, reason)
+        self.last = {}
+        self._clear = 0
+        self._settling = 0
+        self._entered = collections.deque()
+        self._delays = []
+        self._lock = threading.Lock()
+        self._timer = None
+        queue.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, self._on_enter)
+        queue.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, self._on_leave)
+
+    def _on_enter(self, pad, info):
+        with self._lock:
+            self._entered.append(time.monotonic())
+        return Gst.PadProbeReturn.OK
+
+    def _on_leave(self, pad, info):
+        now = time.monotonic()
+        with self._lock:
+            if self._entered:
+                self._delays.append(now - self._entered.popleft())
+        return Gst.PadProbeReturn.OK
+
+    def start(self):
+        if self.kbps != get_encoder_bitrate(self.encoder):
+            set_encoder_bitrate(self.encoder, self.kbps)
+        self._timer = GLib.timeout_add(int(self.interval * 1000), self._tick)
+
+    def stop(self):
+        if self._timer is not None:
+            GLib.source_remove(self._timer)
+            self._timer = None
+        if self.changes:
+            print(f"ABR {self.encoder.get_name()}: {len(self.changes)} bitrate changes, "
+                  f"ended at {self.kbps:.0f} kbps")
+
+    # -- measurement -------------------------------------------------------
+
+    def _fill(self):
+        limit = self.queue.get_property("max-size-buffers")
+        level = self.queue.get_property("current-level-buffers")
+        return level / limit if limit else 0.0
+
+    def _delay(self):
+        with self._lock:
+            delays, self._delays = self._delays, []
+            # Buffers still waiting count with their age so far
+            now = time.monotonic()
+            delays += [now - entered for entered in self._entered]
+        return float(np.percentile(delays, 95)) if delays else 0.0
+
+    def _loss(self):
+        """Highest RTCP fraction lost reported for the sink's RTP sessions, or None."""
+        loss = None
+        peer = self.queue.get_static_pad("src").get_peer()
+        sink = peer.get_parent_element() if peer else None
+        if not isinstance(sink, Gst.Bin):
+            return None  # rtmpsink and file sinks have no RTP sessions
+        iterator = sink.iterate_recurse()
+        while True:
+            result, element = iterator.next()
+            if result != Gst.IteratorResult.OK:
+                break
+            factory = element.get_factory()
+            if factory is None or factory.get_name() != "rtpsession":
+                continue
+            session = element.get_property("internal-session")
+            for source in session.get_property("sources") if session else ():
+                stats = source.get_property("stats")
+                if stats is None or not stats.has_field("rb-fractionlost"):
+                    continue
+                fraction = stats.get_value("rb-fractionlost") / 256.0
+                loss = fraction if loss is None else max(loss, fraction)
+        return loss
+
+    # -- control -----------------------------------------------------------
+
+    def retarget(self, kbps):
+        """Make ``kbps`` the new ceiling and switch to it; returns the encoder's bitrate."""
+        self.max_kbps = kbps
+        self.min_kbps = min(self.min_kbps, kbps)
+        self._clear = 0
+        self._settling = 0
+        self.kbps = get_encoder_bitrate(self.encoder)
+        self._apply(kbps, "set_bitrate")
+        return get_encoder_bitrate(self.encoder)
+
+    def _tick(self):
+        # Step from what the encoder runs at, not from our last write
+        self.kbps = get_encoder_bitrate(self.encoder)
+        fill, delay, loss = self._fill(), self._delay(), self._loss()
+        self.last = {"fill": fill, "delay_ms": delay * 1000, "loss": loss, "kbps": self.kbps}
+        congested = (fill >= self.high_fill or delay >= self.max_delay
+                     or (loss is not None and loss >= self.max_loss))
+        clear = (fill <= self.low_fill and delay <= self.max_delay / 4
+                 and (loss is None or loss < self.max_loss / 5))
+        if self._settling:
+            self._settling -= 1
+            self._clear = 0
+        elif congested:
+            self._clear = 0
+            self._settling = self.settle
+            reason = f"fill {fill:.0%}, delay {delay * 1000:.0f} ms" + (
+                f", loss {loss:.1%}" if loss is not None else "")
+            self._apply(max(self.min_kbps, self.kbps * self.decrease), reason)
+        elif clear:
+            self._clear += 1
+            if self._clear >= self.hold:
+                self._clear = 0
+                self._apply(min(self.max_kbps, self.kbps + self.step * self.max_kbps), "uplink clear")
+        else:
+            self._clear = 0
+        return True
+
+    def _apply(self, kbps, reason):
+        kbps = round(kbps)
+        if kbps == round(self.kbps):
+            return
+        # Set directly rather than waiting for an idle pad: while congested the
+        # encoder is blocked pushing into the full queue. The encoders take
+        # bitrate changes while playing and apply them from the next frame.
+        set_encoder_bitrate(self.encoder, kbps)
+        self.changes.append((time.monotonic(), self.kbps, kbps, reason))
+        print(f"ABR {self.encoder.get_name()}: {self.kbps:.0f} -> {kbps} kbps ({reason})")
+        self.kbps = kbps
+
+    def stats(self):
+        return dict(self.last, kbps=self.kbps, min_kbps=self.min_kbps, max_kbps=self.max_kbps,
+                    changes=len(self.changes))
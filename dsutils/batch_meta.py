@@ -0,0 +1,163 @@
+################################################################################
+# Batch metadata reader
+# Pulls every frame and detection of an NvDsBatchMeta into NumPy arrays in a
+# single pass, so pad probes can work on whole batches instead of walking the
+# frame/object lists node by node.
+################################################################################
+
+import numpy as np
+
+# Column order of BatchDetections.bbox
+BBOX_LEFT = 0
+BBOX_TOP = 1
+BBOX_WIDTH = 2
+BBOX_HEIGHT = 3
+
+
+class BatchDetections:
+    """Array view of one batch.
+
+    Per-object arrays have ``num_objects`` rows, per-frame arrays have
+    ``num_frames`` rows. All arrays are views into buffers owned by the
+    reader and are overwritten by the next ``read()`` call; copy them if they
+    must outlive the probe.
+    """
+
+    __slots__ = (
+        "num_frames", "num_objects",
+        # per frame
+        "frame_metas", "frame_source_id", "frame_number", "frame_ntp_timestamp",
+        "frame_buf_pts", "frame_num_objects", "frame_infer_done", "frame_obj_start",
+        # per object
+        "obj_metas", "obj_frame_index", "source_id", "frame_num", "class_id",
+        "confidence", "bbox",
+    )
+
+
+class BatchMetaReader:
+    """Reads NvDsBatchMeta into preallocated NumPy arrays.
+
+    ``pyds_module`` is the pyds binding to use. Passing
+    ``dsutils.fake_pyds`` lets the reader (and anything built on it) run
+    without DeepStream or a GPU.
+
+    With ``read_bbox`` false the walk skips the four rect_params reads per
+    object and ``bbox`` is None; labelling and counting do not need boxes.
+    """
+
+    def __init__(self, pyds_module, max_objects=256, max_frames=32, read_bbox=True):
+        self.read_bbox = read_bbox
+        self._cast_frame = pyds_module.NvDsFrameMeta.cast
+        self._cast_obj = pyds_module.NvDsObjectMeta.cast
+        self._frame_metas = []
+        self._obj_metas = []
+        # Reusable Python lists the walk appends to, see read()
+        self._frame_cols = tuple([] for _ in range(6))
+        self._obj_cols = tuple([] for _ in range(3))
+        self._alloc_frames(max_frames)
+        self._alloc_objects(max_objects)
+
+    def _alloc_frames(self, capacity):
+        self._frame_capacity = capacity
+        self._frame_index = np.arange(capacity, dtype=np.int32)
+        self._frame_source_id = np.zeros(capacity, dtype=np.uint32)
+        self._frame_number = np.zeros(capacity, dtype=np.int64)
+        self._frame_ntp_timestamp = np.zeros(capacity, dtype=np.uint64)
+        self._frame_buf_pts = np.zeros(capacity, dtype=np.uint64)
+        self._frame_num_objects = np.zeros(capacity, dtype=np.int32)
+        self._frame_infer_done = np.zeros(capacity, dtype=bool)
+        self._frame_obj_start = np.zeros(capacity + 1, dtype=np.int64)
+
+    def _alloc_objects(self, capacity):
+        self._obj_capacity = capacity
+        self._obj_frame_index = np.zeros(capacity, dtype=np.int32)
+        self._class_id = np.zeros(capacity, dtype=np.int32)
+        self._confidence = np.zeros(capacity, dtype=np.float32)
+        self._bbox = np.zeros((capacity, 4), dtype=np.float32)
+
+    def read(self, batch_meta):
+        """Read every frame and object of ``batch_meta`` in one pass."""
+        cast_frame = self._cast_frame
+        cast_obj = self._cast_obj
+        frame_metas = self._frame_metas
+        obj_metas = self._obj_metas
+        frame_metas.clear()
+        obj_metas.clear()
+        for col in self._frame_cols:
+            col.clear()
+        for col in self._obj_cols:
+            col.clear()
+        source_ids, frame_nums, ntp_timestamps, buf_pts, infer_done, obj_counts = self._frame_cols
+        class_ids, confidences, bboxes = self._obj_cols
+        read_bbox = self.read_bbox
+
+        # The walk only appends attribute values to reusable lists. A NumPy
+        # scalar store costs several times more than a list append, so the
+        # columns are copied into the arrays in bulk once the walk is done.
+        l_frame = batch_meta.frame_meta_list
+        while l_frame is not None:
+            frame_meta = cast_frame(l_frame.data)
+            frame_metas.append(frame_meta)
+            source_ids.append(frame_meta.source_id)
+            frame_nums.append(frame_meta.frame_num)
+            ntp_timestamps.append(frame_meta.ntp_timestamp)
+            buf_pts.append(frame_meta.buf_pts)
+            infer_done.append(frame_meta.bInferDone)
+            n_before = len(obj_metas)
+            l_obj = frame_meta.obj_meta_list
+            while l_obj is not None:
+                obj_meta = cast_obj(l_obj.data)
+                obj_metas.append(obj_meta)
+                class_ids.append(obj_meta.class_id)
+                confidences.append(obj_meta.confidence)
+                if read_bbox:
+                    rect = obj_meta.rect_params
+                    bboxes += (rect.left, rect.top, rect.width, rect.height)
+                l_obj = l_obj.next
+            obj_counts.append(len(obj_metas) - n_before)
+            l_frame = l_frame.next
+
+        n_frames = len(frame_metas)
+        n_objs = len(obj_metas)
+        if n_frames > self._frame_capacity:
+            self._alloc_frames(max(n_frames, self._frame_capacity * 2))
+        if n_objs > self._obj_capacity:
+            self._alloc_objects(max(n_objs, self._obj_capacity * 2))
+
+        self._frame_source_id[:n_frames] = source_ids
+        self._frame_number[:n_frames] = frame_nums
+        self._frame_ntp_timestamp[:n_frames] = ntp_timestamps
+        self._frame_buf_pts[:n_frames] = buf_pts
+        self._frame_infer_done[:n_frames] = infer_done
+        self._frame_num_objects[:n_frames] = obj_counts
+        np.cumsum(self._frame_num_objects[:n_frames], out=self._frame_obj_start[1:n_frames + 1])
+        self._class_id[:n_objs] = class_ids
+        self._confidence[:n_objs] = confidences
+        if read_bbox:
+            self._bbox[:n_objs].reshape(-1)[:] = bboxes
+        self._obj_frame_index[:n_objs] = np.repeat(
+            self._frame_index[:n_frames], self._frame_num_objects[:n_frames])
+        return self._view(n_frames, n_objs, read_bbox)
+
+    def _view(self, n_frames, n_objs, read_bbox):
+        det = BatchDetections()
+        det.num_frames = n_frames
+        det.num_objects = n_objs
+        det.frame_metas = self._frame_metas
+        det.frame_source_id = self._frame_source_id[:n_frames]
+        det.frame_number = self._frame_number[:n_frames]
+        det.frame_ntp_timestamp = self._frame_ntp_timestamp[:n_frames]
+        det.frame_buf_pts = self._frame_buf_pts[:n_frames]
+        det.frame_num_objects = self._frame_num_objects[:n_frames]
+        det.frame_infer_done = self._frame_infer_done[:n_frames]
+        det.frame_obj_start = self._frame_obj_start[:n_frames + 1]
+        det.obj_metas = self._obj_metas
+        det.obj_frame_index = self._obj_frame_index[:n_objs]
+        # Per-object source id / frame number are gathered from the frame
+        # columns with one fancy-index each instead of per-object stores.
+        det.source_id = det.frame_source_id[det.obj_frame_index]
+        det.frame_num = det.frame_number[det.obj_frame_index]
+        det.class_id = self._class_id[:n_objs]
+        det.confidence = self._confidence[:n_objs]
+        det.bbox = self._bbox[:n_objs] if read_bbox else None
+        return det
@@ -0,0 +1,300 @@
+################################################################################
+# USB capture mode selection
+# Picks how v4l2src frames reach nvvideoconvert from the formats the camera
+# enumerates, so the CPU videoconvert stage is only used when nothing better
+# exists. In order of preference:
+#
+#   raw       a raw format nvvideoconvert accepts directly (no CPU work)
+#   mjpeg-hw  MJPEG decoded by nvjpegdec or nvv4l2decoder
+#   mjpeg-sw  MJPEG decoded by avdec_mjpeg with one thread per core
+#   convert   a raw format that needs videoconvert first (the old path)
+#   mjpeg-cpu MJPEG decoded by single-threaded jpegdec
+#
+# A mode has to deliver the requested size at no less than the requested
+# frame rate; if no size matches exactly the closest one that does is used.
+# CpuPerFrame reports the process CPU time spent per captured frame.
+# DeviceReconnector (--hotplug) stops the pipeline while the camera is
+# unplugged and starts it again when the node comes back.
+################################################################################
+
+import os
+import re
+import sys
+import time
+import collections
+
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst, GLib
+
+from dsutils import v4l2
+
+# V4L2 fourcc -> GStreamer raw format
+RAW_FORMATS = {
+    "YUYV": "YUY2",
+    "UYVY": "UYVY",
+    "YVYU": "YVYU",
+    "NV12": "NV12",
+    "NV21": "NV21",
+    "YU12": "I420",
+    "YV12": "YV12",
+    "GREY": "GRAY8",
+    "RGB3": "RGB",
+    "BGR3": "BGR",
+}
+
+# Formats nvvideoconvert takes in system memory on every platform; used when
+# its pad template cannot be read
+NVVIDEOCONVERT_FALLBACK_FORMATS = frozenset({"NV12", "I420", "RGBA", "BGRx", "GRAY8"})
+
+# Software JPEG decoders output planar YUV in the camera's subsampling,
+# 4:2:2 for nearly every UVC camera
+SOFTWARE_JPEG_OUTPUT = "Y42B"
+
+MODE_RANK = {"raw": 0, "mjpeg-hw": 1, "mjpeg-sw": 2, "convert": 3, "mjpeg-cpu": 4, "legacy": 5}
+
+CaptureMode = collections.namedtuple(
+    "CaptureMode", ["kind", "fourcc", "width", "height", "fps", "caps", "decoder", "convert"])
+CaptureMode.__doc__ = """How to capture from a camera.
+
+``caps`` is the v4l2src caps string, ``decoder`` the JPEG decoder factory
+name or None, and ``convert`` whether a CPU videoconvert is needed before
+nvvideoconvert.
+"""
+
+
+def nvvideoconvert_formats():
+    """Raw system-memory formats on nvvideoconvert's sink pad template."""
+    factory = Gst.ElementFactory.find("nvvideoconvert")
+    if factory is None:
+        return NVVIDEOCONVERT_FALLBACK_FORMATS
+    formats = set()
+    for template in factory.get_static_pad_templates():
+        if template.direction != Gst.PadDirection.SINK:
+            continue
+        caps = template.get_caps()
+        for i in range(caps.get_size()):
+            features = caps.get_features(i)
+            if features and features.contains("memory:NVMM"):
+                continue
+            text = caps.get_structure(i).to_string()
+            match = re.search(r"format=\(string\)\{([^}]*)\}", text)
+            if match:
+                formats.update(f.strip() for f in match.group(1).split(","))
+            else:
+                match = re.search(r"format=\(string\)(\w+)", text)
+                if match:
+                    formats.add(match.group(1))
+    return frozenset(formats) or NVVIDEOCONVERT_FALLBACK_FORMATS
+
+
+def available_elements(names):
+    return {name for name in names if Gst.ElementFactory.find(name) is not None}
+
+
+def _mjpeg_decoder(elements, accepted):
+    """(kind, decoder, convert) for the best MJPEG decoder present."""
+    for name in ("nvjpegdec", "nvv4l2decoder"):
+        if name in elements:
+            return "mjpeg-hw", name, False
+    convert = SOFTWARE_JPEG_OUTPUT not in accepted
+    if "avdec_mjpeg" in elements:
+        return "mjpeg-sw", "avdec_mjpeg", convert
+    if "jpegdec" in elements:
+        return "mjpeg-cpu", "jpegdec", convert
+    return None
+
+
+def legacy_mode(width, height, fps):
+    """The fixed caps plus videoconvert the scripts used before."""
+    return CaptureMode("legacy", None, width, height, fps,
+                       f"video/x-raw,width={width},height={height},framerate={fps}/1",
+                       None, True)
+
+
+def candidate_modes(info, fps, elements, accepted):
+    """Every usable (mode, size distance) for a device at ``fps`` or more."""
+    modes = []
+    for fmt in info.formats:
+        if fmt.fourcc == "MJPG":
+            choice = _mjpeg_decoder(elements, accepted)
+            if choice is None:
+                continue
+            kind, decoder, convert = choice
+            media = "image/jpeg"
+        elif fmt.fourcc in RAW_FORMATS:
+            gst_format = RAW_FORMATS[fmt.fourcc]
+            kind = "raw" if gst_format in accepted else "convert"
+            decoder, convert = None, kind == "convert"
+            media = f"video/x-raw,format={gst_format}"
+        else:
+            continue
+        for size in fmt.sizes:
+            if not size.fps or size.fps[0] + 0.5 < fps:
+                continue
+            rate = min((r for r in size.fps if r + 0.5 >= fps), default=size.fps[0])
+            caps = f"{media},width={size.width},height={size.height},framerate={round(rate)}/1"
+            modes.append(CaptureMode(kind, fmt.fourcc, size.width, size.height,
+                                     round(rate), caps, decoder, convert))
+    return modes
+
+
+def select_capture_mode(info, width, height, fps, elements=None, accepted=None):
+    """Best CaptureMode for ``info`` (a dsutils.v4l2.DeviceInfo).
+
+    The requested size is preferred over a better mode at another size.
+    Returns the legacy mode when the device offers nothing usable.
+    """
+    if elements is None:
+        elements = available_elements(["nvjpegdec", "nvv4l2decoder", "avdec_mjpeg", "jpegdec"])
+    if accepted is None:
+        accepted = nvvideoconvert_formats()
+    modes = candidate_modes(info, fps, elements, accepted)
+    if not modes:
+        return legacy_mode(width, height, fps)
+    return min(modes, key=lambda m: (abs(m.width * m.height - width * height),
+                                     MODE_RANK[m.kind], m.fps))
+
+
+def select_device_mode(device, width, height, fps, cache=None):
+    """select_capture_mode() for a device path; legacy mode if it cannot be queried."""
+    cache = cache or v4l2.default_cache()
+    try:
+        info = cache.device(device)
+    except OSError as e:
+        sys.stderr.write(f"Unable to query {device}: {e}\n")
+        return legacy_mode(width, height, fps)
+    return select_capture_mode(info, width, height, fps)
+
+
+def describe_mode(mode):
+    steps = ["v4l2src", mode.caps]
+    if mode.decoder:
+        steps.append(mode.decoder)
+    if mode.convert:
+        steps.append("videoconvert")
+    steps.append("nvvideoconvert")
+    return f"{mode.kind}: " + " ! ".join(steps)
+
+
+def make_capture_elements(mode):
+    """Elements to link between v4l2src and nvvideoconvert for ``mode``.
+
+    Returns None if one of them cannot be created.
+    """
+    caps = Gst.ElementFactory.make("capsfilter", "capsfilter1")
+    if not caps:
+        return None
+    caps.set_property("caps", Gst.Caps.from_string(mode.caps))
+    elements = [caps]
+    if mode.decoder:
+        if mode.decoder == "nvv4l2decoder":
+            parser = Gst.ElementFactory.make("jpegparse", "jpeg-parser")
+            if parser:
+                elements.append(parser)
+        decoder = Gst.ElementFactory.make(mode.decoder, "jpeg-decoder")
+        if not decoder:
+            return None
+        if mode.decoder == "nvv4l2decoder" and decoder.find_property("mjpeg"):
+            decoder.set_property("mjpeg", True)
+        elif mode.decoder == "avdec_mjpeg":
+            decoder.set_property("max-threads", 0)  # one per core
+        elements.append(decoder)
+    if mode.convert:
+        convert = Gst.ElementFactory.make("videoconvert", "convertor_src1")
+        if not convert:
+            return None
+        elements.append(convert)
+    return elements
+
+
+class CpuPerFrame:
+    """Prints the process CPU time per frame passing ``pad``.
+
+    CPU time covers every thread of the process, so it includes capture,
+    decode, conversion and encoding.
+    """
+
+    def __init__(self, pad, interval=5.0, label="capture"):
+        self.pad = pad
+        self.interval = interval
+        self.label = label
+        self._frames = 0
+        self._timer = None
+        self._last = None
+        self._total = None
+
+    def start(self):
+        self.pad.add_probe(Gst.PadProbeType.BUFFER, self._on_buffer)
+        self._last = self._total = (time.process_time(), time.monotonic(), 0)
+        self._timer = GLib.timeout_add(int(self.interval * 1000), self._report)
+
+    def _on_buffer(self, pad, info):
+        self._frames += 1
+        return Gst.PadProbeReturn.OK
+
+    @staticmethod
+    def _format(start, end):
+        cpu = end[0] - start[0]
+        wall = end[1] - start[1]
+        frames = end[2] - start[2]
+        per_frame = cpu / frames * 1000 if frames else 0.0
+        load = cpu / wall * 100 if wall > 0 else 0.0
+        fps = frames / wall if wall > 0 else 0.0
+        return f"{fps:.1f} fps, CPU {per_frame:.2f} ms/frame ({load:.0f}% of a core)"
+
+    def _report(self):
+        now = (time.process_time(), time.monotonic(), self._frames)
+        print(f"{self.label}: {self._format(self._last, now)}")
+        self._last = now
+        return True
+
+    def stop(self):
+        if self._timer is not None:
+            GLib.source_remove(self._timer)
+            self._timer = None
+            now = (time.process_time(), time.monotonic(), self._frames)
+            print(f"{self.label} overall: {self._format(self._total, now)}")
+
+
+class DeviceReconnector:
+    """Stops ``pipeline`` while ``device`` is unplugged and restarts it when it is back.
+
+    A dsutils.v4l2.HotplugWatcher reports /dev/video* changes from its
+    thread; the pipeline state is changed on the GLib main loop.
+    """
+
+    def __init__(self, pipeline, device, cache=None, interval=1.0):
+        self.pipeline = pipeline
+        self.device = device
+        self.present = True
+        self.reconnects = 0
+        self.watcher = v4l2.HotplugWatcher(cache or v4l2.default_cache(), self._on_change, interval)
+
+    def start(self):
+        self.watcher.start()
+
+    def stop(self):
+        self.watcher.stop()
+
+    def _on_change(self, paths):
+        # ``device`` may be a /dev/v4l/by-id link, so check it whatever node changed
+        GLib.idle_add(self._check)
+
+    def _check(self):
+        present = os.path.exists(self.device)
+        if present == self.present:
+            return False
+        if not present:
+            print(f"{self.device} unplugged; waiting for it to come back")
+            self.pipeline.set_state(Gst.State.NULL)
+            self.present = False
+        elif self.pipeline.set_state(Gst.State.PLAYING) != Gst.StateChangeReturn.FAILURE:
+            self.present = True
+            self.reconnects += 1
+            print(f"{self.device} is back; capture restarted")
+        else:
+            # Not accessible yet (udev still setting permissions); the
+            # attribute change that follows brings us back here
+            self.pipeline.set_state(Gst.State.NULL)
+        return False
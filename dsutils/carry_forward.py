@@ -0,0 +1,150 @@
+################################################################################
+# Detection carry-forward
+# Frames the detector did not run on (nvinfer ``interval`` skips, gated
+# frames) reach the OSD with no objects, so boxes blink and per-frame counts
+# drop to zero. DetectionCarry keeps the last inferred detections of every
+# source and attaches copies of them to its skipped frames:
+#
+#   hold         the boxes stay where they were last detected
+#   extrapolate  every box moves on with the velocity it had between the two
+#                latest inferred frames (matched by class and nearest centre);
+#                boxes without a match stay in place
+#
+# Carried objects are regular NvDsObjectMeta, so label text, OSD and
+# counting work on them unchanged. Nothing is carried further than
+# ``max_age`` frames past the last inferred frame of a source.
+################################################################################
+
+import numpy as np
+
+from dsutils.batch_meta import BBOX_LEFT, BBOX_TOP, BBOX_WIDTH, BBOX_HEIGHT
+
+CARRY_MODES = ("hold", "extrapolate")
+UNTRACKED_OBJECT_ID = 0xFFFFFFFFFFFFFFFF
+
+# Box and text params as nvinfer attaches them to the objects it creates;
+# dsutils.osd only rewrites the fields that differ from these
+NVINFER_BORDER_WIDTH = 3
+NVINFER_BORDER_COLOR = (1.0, 0.0, 0.0, 1.0)
+NVINFER_FONT = ("Serif", 11, (1.0, 1.0, 1.0, 1.0))
+NVINFER_TEXT_BG_COLOR = (0.0, 0.0, 0.0, 1.0)
+
+
+class _SourceDetections:
+    """The latest inferred detections of one source."""
+
+    __slots__ = ("frame", "class_id", "confidence", "bbox", "velocity")
+
+    def __init__(self, frame, class_id, confidence, bbox):
+        self.frame = frame
+        self.class_id = class_id
+        self.confidence = confidence
+        self.bbox = bbox
+        self.velocity = np.zeros_like(bbox)
+
+
+def _centres(bbox):
+    return bbox[:, [BBOX_LEFT, BBOX_TOP]] + bbox[:, [BBOX_WIDTH, BBOX_HEIGHT]] / 2
+
+
+def match_velocity(previous, current, frames):
+    """Per-frame box velocity of each ``current`` object from its match in ``previous``.
+
+    Objects are matched to the nearest previous object of the same class
+    whose centre lies within the larger side of the new box; unmatched
+    objects get zero velocity.
+    """
+    velocity = np.zeros_like(current.bbox)
+    if frames <= 0 or not len(previous.class_id) or not len(current.class_id):
+        return velocity
+    distance = np.linalg.norm(_centres(current.bbox)[:, None, :] - _centres(previous.bbox)[None, :, :], axis=2)
+    distance[current.class_id[:, None] != previous.class_id[None, :]] = np.inf
+    nearest = np.argmin(distance, axis=1)
+    gate = current.bbox[:, [BBOX_WIDTH, BBOX_HEIGHT]].max(axis=1)
+    matched = distance[np.arange(len(nearest)), nearest] <= gate
+    velocity[matched] = (current.bbox[matched] - previous.bbox[nearest[matched]]) / frames
+    return velocity
+
+
+class DetectionCarry:
+    """Copies each source's last inferred detections onto its skipped frames.
+
+    ``pyds_module`` is the pyds binding (or ``dsutils.fake_pyds``).
+    ``unique_component_id`` is stamped on carried objects so they look like
+    the detector's own.
+    """
+
+    def __init__(self, pyds_module, max_age, mode="hold", unique_component_id=1):
+        if mode not in CARRY_MODES:
+            raise ValueError(f"unknown carry mode {mode!r}")
+        self._acquire = pyds_module.nvds_acquire_obj_meta_from_pool
+        self._add = pyds_module.nvds_add_obj_meta_to_frame
+        self.max_age = max_age
+        self.mode = mode
+        self.unique_component_id = unique_component_id
+        self.carried = {}  # source -> objects attached to skipped frames
+        self._last = {}
+
+    def fill(self, batch_meta, detections, skip=None):
+        """Remember inferred frames and fill skipped ones; returns the objects added.
+
+        ``detections`` is the BatchMetaReader view of ``batch_meta``. A frame
+        counts as skipped when nvinfer did not run on it (bInferDone unset)
+        or, if given, where the boolean array ``skip`` is set. The view is
+        stale once objects were added; read the batch again to see them.
+        """
+        skipped = ~detections.frame_infer_done
+        if skip is not None:
+            skipped = skipped | skip
+        starts = detections.frame_obj_start
+        added = 0
+        for i, (source_id, frame, is_skipped) in enumerate(zip(
+                detections.frame_source_id.tolist(), detections.frame_number.tolist(), skipped.tolist())):
+            if is_skipped:
+                n = self._attach(batch_meta, detections.frame_metas[i], source_id, frame)
+                if n:
+                    self.carried[source_id] = self.carried.get(source_id, 0) + n
+                    added += n
+                continue
+            start, end = starts[i], starts[i + 1]
+            current = _SourceDetections(frame, detections.class_id[start:end].copy(),
+                                        detections.confidence[start:end].copy(),
+                                        detections.bbox[start:end].copy())
+            previous = self._last.get(source_id)
+            if self.mode == "extrapolate" and previous is not None:
+                current.velocity = match_velocity(previous, current, frame - previous.frame)
+            self._last[source_id] = current
+        return added
+
+    def _attach(self, batch_meta, frame_meta, source_id, frame):
+        last = self._last.get(source_id)
+        if last is None or not len(last.class_id):
+            return 0
+        age = frame - last.frame
+        if age <= 0 or age > self.max_age:
+            return 0  # source restarted, or no inference for too long
+        bbox = last.bbox + last.velocity * age if self.mode == "extrapolate" else last.bbox
+        font_name, font_size, font_color = NVINFER_FONT
+        for class_id, confidence, (left, top, width, height) in zip(
+                last.class_id.tolist(), last.confidence.tolist(), bbox.tolist()):
+            obj_meta = self._acquire(batch_meta)
+            obj_meta.class_id = class_id
+            obj_meta.confidence = confidence
+            obj_meta.object_id = UNTRACKED_OBJECT_ID
+            obj_meta.unique_component_id = self.unique_component_id
+            rect = obj_meta.rect_params
+            rect.left = max(left, 0.0)
+            rect.top = max(top, 0.0)
+            rect.width = width
+            rect.height = height
+            rect.border_width = NVINFER_BORDER_WIDTH
+            rect.border_color.set(*NVINFER_BORDER_COLOR)
+            text_params = obj_meta.text_params
+            text_params.display_text = str(class_id)
+            text_params.font_params.font_name = font_name
+            text_params.font_params.font_size = font_size
+            text_params.font_params.font_color.set(*font_color)
+            text_params.set_bg_clr = 1
+            text_params.text_bg_clr.set(*NVINFER_TEXT_BG_COLOR)
+            self._add(frame_meta, obj_meta, None)
+        return len(last.class_id)
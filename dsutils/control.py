@@ -0,0 +1,201 @@
+################################################################################
+# Pipeline control socket
+# A Unix-socket server that accepts one JSON command per line, runs it on the
+# GLib main loop and answers with one JSON line:
+#
+#   -> {"cmd": "add_source", "uri": "rtsp://..."}
+#   <- {"ok": true, "result": 2}
+#
+# Commands run on the main loop so handlers can change the pipeline safely;
+# the socket thread only parses, waits and replies. A handler whose work
+# ends later (e.g. in a pad probe) returns a Deferred instead of blocking
+# the main loop; the socket thread waits for it and replies once it settles.
+#
+# Command line client:
+#   python3 -m dsutils.control /tmp/ds.sock add_source uri=rtsp://...
+################################################################################
+
+import os
+import sys
+import json
+import time
+import socket
+import threading
+import socketserver
+
+from gi.repository import GLib
+
+DEFAULT_TIMEOUT = 10.0  # seconds to wait for the main loop to run a command
+
+
+class Deferred:
+    """Result of a command that completes after its handler has returned.
+
+    resolve() and reject() may be called from any thread; the first call
+    wins and later ones return False.
+    """
+
+    def __init__(self):
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def settled(self):
+        return self._done.is_set()
+
+    def resolve(self, result=None):
+        return self._settle(result, None)
+
+    def reject(self, error):
+        return self._settle(None, error)
+
+    def _settle(self, result, error):
+        with self._lock:
+            if self._done.is_set():
+                return False
+            self.result, self.error = result, error
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+        return True
+
+    def add_done_callback(self, callback):
+        """Call ``callback(deferred)`` once settled, right away if it already is."""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+
+class _CommandHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+                cmd = request.pop("cmd")
+            except (ValueError, KeyError, AttributeError):
+                reply = {"ok": False, "error": "expected a JSON object with a 'cmd' field"}
+            else:
+                reply = self.server.control.dispatch(cmd, request)
+            self.wfile.write((json.dumps(reply) + "\n").encode())
+            self.wfile.flush()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ControlServer:
+    """Serves registered commands on a Unix socket.
+
+    Handlers are called on the GLib main loop with the request's remaining
+    fields as keyword arguments. Their return value is sent back as
+    ``result``; an exception is sent back as ``error``.
+    """
+
+    def __init__(self, socket_path, timeout=DEFAULT_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._handlers = {}
+        self._server = None
+        self.register("help", lambda: sorted(self._handlers))
+
+    def register(self, cmd, handler):
+        self._handlers[cmd] = handler
+
+    def dispatch(self, cmd, params):
+        """Run ``cmd`` on the main loop and wait for its result."""
+        handler = self._handlers.get(cmd)
+        if handler is None:
+            return {"ok": False, "error": f"unknown command {cmd!r}"}
+
+        done = threading.Event()
+        reply = {}
+
+        def run():
+            try:
+                reply["result"] = handler(**params)
+                reply["ok"] = True
+            except Exception as e:
+                reply["ok"] = False
+                reply["error"] = str(e)
+            done.set()
+            return False  # one-shot idle source
+
+        deadline = time.monotonic() + self.timeout
+        GLib.idle_add(run)
+        if not done.wait(self.timeout):
+            return {"ok": False, "error": f"{cmd} timed out after {self.timeout}s"}
+        deferred = reply.get("result")
+        if isinstance(deferred, Deferred):
+            if not deferred.wait(max(0.0, deadline - time.monotonic())):
+                return {"ok": False, "error": f"{cmd} timed out after {self.timeout}s"}
+            if deferred.error is not None:
+                return {"ok": False, "error": str(deferred.error)}
+            reply["result"] = deferred.result
+        return reply
+
+    def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = _UnixServer(self.socket_path, _CommandHandler)
+        self._server.control = self
+        thread = threading.Thread(target=self._server.serve_forever,
+                                  name="control-socket", daemon=True)
+        thread.start()
+        print(f"Control socket listening on {self.socket_path}")
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+def send_command(socket_path, cmd, timeout=DEFAULT_TIMEOUT + 5, **params):
+    """Send one command to a ControlServer and return its decoded reply."""
+    request = dict(params, cmd=cmd)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall((json.dumps(request) + "\n").encode())
+        with sock.makefile("rb") as f:
+            return json.loads(f.readline())
+
+
+def _parse_value(value):
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def main(argv):
+    if len(argv) < 3:
+        print("usage: python3 -m dsutils.control SOCKET CMD [key=value ...]")
+        return 2
+    params = {}
+    for arg in argv[3:]:
+        key, _, value = arg.partition("=")
+        params[key.replace("-", "_")] = _parse_value(value)
+    reply = send_command(argv[1], argv[2], **params)
+    print(json.dumps(reply, indent=2))
+    return 0 if reply.get("ok") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,183 @@
+################################################################################
+# Object counting
+# Per-frame and rolling-window object counts per source and class, updated
+# from the arrays of dsutils.batch_meta.BatchMetaReader. All storage is
+# preallocated; update() does a fixed amount of array work per batch and no
+# per-object Python work at all.
+################################################################################
+
+import time
+import threading
+
+import numpy as np
+
+DEFAULT_WINDOWS = (1, 10, 60)  # seconds
+
+
+class ObjectCounter:
+    """Counts detections per source and class.
+
+    Rolling windows are kept in a ring of ``bucket_seconds`` wide buckets
+    long enough for the largest window, so any window up to that length can
+    be queried. Queries return copies and may be called from any thread.
+    """
+
+    def __init__(self, max_sources, num_classes, windows=DEFAULT_WINDOWS,
+                 bucket_seconds=0.1, clock=time.monotonic):
+        self.max_sources = max_sources
+        self.num_classes = num_classes
+        self.windows = tuple(windows)
+        self.bucket_seconds = bucket_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self._num_buckets = int(round(max(self.windows) / bucket_seconds))
+        # Latest frame of each source: object count per class
+        self._frame_counts = np.zeros((max_sources, num_classes), dtype=np.int64)
+        self._frame_number = np.full(max_sources, -1, dtype=np.int64)
+        self._totals = np.zeros((max_sources, num_classes), dtype=np.int64)
+        self._total_frames = np.zeros(max_sources, dtype=np.int64)
+        # Ring buckets: objects per source/class and frames per source
+        self._ring = np.zeros((self._num_buckets, max_sources, num_classes), dtype=np.int64)
+        self._ring_frames = np.zeros((self._num_buckets, max_sources), dtype=np.int64)
+        self._bucket = None  # absolute index of the newest bucket
+        # Scratch space for update(); flat (source, class) histogram
+        self._scratch = np.zeros(max_sources * num_classes, dtype=np.int64)
+        self._frame_scratch = np.zeros(max_sources, dtype=np.int64)
+
+    def _advance(self, bucket):
+        """Move the ring forward to absolute bucket ``bucket``, clearing skipped buckets."""
+        if self._bucket is None:
+            self._bucket = bucket
+            return
+        steps = bucket - self._bucket
+        if steps <= 0:
+            return
+        if steps >= self._num_buckets:
+            self._ring[:] = 0
+            self._ring_frames[:] = 0
+        else:
+            first = (self._bucket + 1) % self._num_buckets
+            last = first + steps
+            if last <= self._num_buckets:
+                self._ring[first:last] = 0
+                self._ring_frames[first:last] = 0
+            else:
+                self._ring[first:] = 0
+                self._ring_frames[first:] = 0
+                self._ring[:last - self._num_buckets] = 0
+                self._ring_frames[:last - self._num_buckets] = 0
+        self._bucket = bucket
+
+    def update(self, detections, now=None):
+        """Add one batch of detections."""
+        if now is None:
+            now = self._clock()
+        frame_sources = detections.frame_source_id
+        frame_valid = frame_sources < self.max_sources
+        source_id = detections.source_id
+        class_id = detections.class_id
+        valid = (source_id < self.max_sources) & (class_id >= 0) & (class_id < self.num_classes)
+
+        # One histogram over flattened (source, class) pairs for the batch
+        scratch = self._scratch
+        scratch[:] = 0
+        flat = source_id[valid].astype(np.intp) * self.num_classes + class_id[valid]
+        np.add.at(scratch, flat, 1)
+        counts = scratch.reshape(self.max_sources, self.num_classes)
+        frame_scratch = self._frame_scratch
+        frame_scratch[:] = 0
+        np.add.at(frame_scratch, frame_sources[frame_valid].astype(np.intp), 1)
+        sources = frame_sources[frame_valid]
+
+        with self._lock:
+            self._advance(int(now / self.bucket_seconds))
+            slot = self._bucket % self._num_buckets
+            self._frame_counts[sources] = counts[sources]
+            self._frame_number[sources] = detections.frame_number[frame_valid]
+            self._totals += counts
+            self._total_frames += frame_scratch
+            self._ring[slot] += counts
+            self._ring_frames[slot] += frame_scratch
+
+    def _window_slots(self, seconds, now):
+        n = int(round(seconds / self.bucket_seconds))
+        if n > self._num_buckets:
+            raise ValueError(f"Window of {seconds}s exceeds the {max(self.windows)}s history")
+        if self._bucket is None:
+            return None
+        newest = int(now / self.bucket_seconds)
+        # Buckets newer than the last update are empty; skip them
+        n -= newest - self._bucket
+        if n <= 0:
+            return None
+        return (self._bucket - np.arange(n)) % self._num_buckets
+
+    def frame_counts(self, source_id=None):
+        """Per-class counts of the latest frame, for one source or all sources."""
+        with self._lock:
+            if source_id is None:
+                return self._frame_counts.copy()
+            return self._frame_counts[source_id].copy()
+
+    def frame_number(self, source_id):
+        """Frame number the latest frame_counts() of ``source_id`` belong to, -1 if none."""
+        with self._lock:
+            return int(self._frame_number[source_id])
+
+    def totals(self, source_id=None):
+        """Per-class counts since start."""
+        with self._lock:
+            if source_id is None:
+                return self._totals.copy()
+            return self._totals[source_id].copy()
+
+    def window_counts(self, seconds, source_id=None, now=None):
+        """Per-class detections over the last ``seconds``."""
+        if now is None:
+            now = self._clock()
+        with self._lock:
+            slots = self._window_slots(seconds, now)
+            if slots is None:
+                counts = np.zeros((self.max_sources, self.num_classes), dtype=np.int64)
+            else:
+                counts = self._ring[slots].sum(axis=0)
+        return counts if source_id is None else counts[source_id]
+
+    def window_frames(self, seconds, source_id=None, now=None):
+        """Frames seen over the last ``seconds``."""
+        if now is None:
+            now = self._clock()
+        with self._lock:
+            slots = self._window_slots(seconds, now)
+            if slots is None:
+                frames = np.zeros(self.max_sources, dtype=np.int64)
+            else:
+                frames = self._ring_frames[slots].sum(axis=0)
+        return frames if source_id is None else frames[source_id]
+
+    def window_average(self, seconds, source_id=None, now=None):
+        """Mean objects per frame and class over the last ``seconds``."""
+        if now is None:
+            now = self._clock()
+        counts = self.window_counts(seconds, source_id, now)
+        frames = self.window_frames(seconds, source_id, now)
+        return counts / np.maximum(frames, 1)[..., np.newaxis]
+
+    def snapshot(self, class_names=None, now=None):
+        """All counts as plain Python data, keyed by source and class name."""
+        if now is None:
+            now = self._clock()
+        names = class_names or [str(i) for i in range(self.num_classes)]
+        frame_counts = self.frame_counts()
+        totals = self.totals()
+        windows = {seconds: self.window_counts(seconds, now=now) for seconds in self.windows}
+        result = {}
+        for source_id in np.flatnonzero(self._total_frames).tolist():
+            result[source_id] = {
+                "frame": dict(zip(names, frame_counts[source_id].tolist())),
+                "total": dict(zip(names, totals[source_id].tolist())),
+                "windows": {f"{seconds}s": dict(zip(names, counts[source_id].tolist()))
+                            for seconds, counts in windows.items()},
+            }
+        return result
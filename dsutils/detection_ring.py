@@ -0,0 +1,393 @@
+################################################################################
+# Detection export through a memory-mapped ring buffer
+# DetectionRingWriter appends one fixed-width record per detected object to
+# a file mapped into memory (by default in /dev/shm):
+#
+#   timestamp_ns  frame NTP/system timestamp     source   source id
+#   frame         frame number                   class_id detector class
+#   confidence    detector confidence            left, top, width, height
+#   flags         FLAG_CARRIED when the object was carried onto a frame the
+#                 detector skipped (dsutils.carry_forward)
+#
+# Writing is a vectorised copy into the mapping; there is no lock, system
+# call or allocation on the streaming thread once the writer exists. The
+# 64-byte header holds the record size, the capacity and two counters:
+# ``claimed`` (records the writer is about to write) and ``committed``
+# (records completely written). Readers in other processes map the same
+# file read-only and get NumPy structured arrays that are views of it:
+# nothing is copied until the caller does. A reader that falls more than
+# ``capacity`` records behind loses the oldest ones and is told how many.
+#
+# A new writer never truncates a ring readers may have mapped (they would get
+# SIGBUS): it builds a new file next to it and renames it over the path.
+# Readers notice the new file (or a new ``epoch`` in the header) once they
+# have read everything of the old one, switch to it and count whatever the
+# new writer already overwrote as lost.
+#
+# ParquetRollover is such a reader on its own thread: it collects records
+# and writes a Parquet (or Arrow IPC) file every ``rows`` records or
+# ``seconds``, for offline analytics. It needs pyarrow.
+#
+#   python3 -m dsutils.detection_ring tail /dev/shm/ds-detections.ring
+#   python3 -m dsutils.detection_ring export /dev/shm/ds-detections.ring /data/detections
+################################################################################
+
+import os
+import sys
+import mmap
+import time
+import argparse
+import threading
+
+import numpy as np
+
+DEFAULT_PATH = "/dev/shm/ds-detections.ring"
+DEFAULT_CAPACITY = 1 << 20  # records, 48 MiB
+MAGIC = b"DSDETRNG"
+VERSION = 1
+HEADER_SIZE = 64
+FLAG_CARRIED = 1
+
+RECORD_DTYPE = np.dtype([
+    ("timestamp_ns", "<u8"),
+    ("frame", "<i8"),
+    ("source", "<u4"),
+    ("class_id", "<i4"),
+    ("confidence", "<f4"),
+    ("left", "<f4"),
+    ("top", "<f4"),
+    ("width", "<f4"),
+    ("height", "<f4"),
+    ("flags", "<u4"),
+])
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("version", "<u4"),
+    ("record_size", "<u4"),
+    ("capacity", "<u8"),
+    ("claimed", "<u8"),
+    ("committed", "<u8"),
+    ("epoch", "<u8"),  # creation time of the ring, ns
+    ("reserved", "V16"),
+])
+assert HEADER_DTYPE.itemsize == HEADER_SIZE
+
+
+def _map(path, capacity=None):
+    """Map ``path``; creates it with ``capacity`` records when given.
+
+    Returns (mmap, header, records, inode). The arrays keep the mapping
+    alive; it is unmapped when the last of them is gone.
+    """
+    if capacity is not None:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, HEADER_SIZE + capacity * RECORD_DTYPE.itemsize)
+            buf = mmap.mmap(fd, 0)
+            inode = os.fstat(fd).st_ino
+        finally:
+            os.close(fd)
+    else:
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            inode = os.fstat(f.fileno()).st_ino
+    header = np.ndarray((), HEADER_DTYPE, buffer=buf)
+    if capacity is None:
+        if header["magic"] != MAGIC or header["version"] != VERSION:
+            raise ValueError(f"{path} is not a detection ring")
+        if header["record_size"] != RECORD_DTYPE.itemsize:
+            raise ValueError(f"{path} has {header['record_size']}-byte records, "
+                             f"expected {RECORD_DTYPE.itemsize}")
+        capacity = int(header["capacity"])
+    records = np.ndarray((capacity,), RECORD_DTYPE, buffer=buf, offset=HEADER_SIZE)
+    return buf, header, records, inode
+
+
+class DetectionRingWriter:
+    """Appends the objects of each batch to a new ring at ``path``, replacing any old one."""
+
+    def __init__(self, path=DEFAULT_PATH, capacity=DEFAULT_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        staging_path = f"{path}.{os.getpid()}.new"
+        self._buf, self._header, self._records, _ = _map(staging_path, capacity)
+        try:
+            # Touch every page now so the streaming thread never faults one in
+            self._records[:] = np.zeros(1, RECORD_DTYPE)
+            self._header["version"] = VERSION
+            self._header["record_size"] = RECORD_DTYPE.itemsize
+            self._header["capacity"] = capacity
+            self._header["epoch"] = time.time_ns()
+            self._header["magic"] = MAGIC
+            # Readers of an old ring keep their (now unlinked) file
+            os.rename(staging_path, path)
+        except BaseException:
+            os.remove(staging_path)
+            raise
+        self.epoch = int(self._header["epoch"])
+        self._count = 0
+        self._staging = np.zeros(256, RECORD_DTYPE)
+
+    def write(self, detections):
+        """Append every object of a dsutils.batch_meta.BatchDetections."""
+        n = detections.num_objects
+        if not n:
+            return
+        if n > len(self._staging):
+            self._staging = np.zeros(max(n, len(self._staging) * 2), RECORD_DTYPE)
+        staging = self._staging[:n]
+        frame_index = detections.obj_frame_index
+        staging["timestamp_ns"] = detections.frame_ntp_timestamp[frame_index]
+        staging["frame"] = detections.frame_num
+        staging["source"] = detections.source_id
+        staging["class_id"] = detections.class_id
+        staging["confidence"] = detections.confidence
+        bbox = detections.bbox
+        staging["left"] = bbox[:, 0]
+        staging["top"] = bbox[:, 1]
+        staging["width"] = bbox[:, 2]
+        staging["height"] = bbox[:, 3]
+        staging["flags"] = np.where(detections.frame_infer_done[frame_index], 0, FLAG_CARRIED)
+        if n > self.capacity:
+            staging = staging[-self.capacity:]
+            n = self.capacity
+        start = self._count % self.capacity
+        first = min(n, self.capacity - start)
+        # Readers treat records between committed and claimed as being overwritten
+        self._header["claimed"] = self._count + n
+        self._records[start:start + first] = staging[:first]
+        self._records[:n - first] = staging[first:]
+        self._count += n
+        self._header["committed"] = self._count
+
+    @property
+    def written(self):
+        return self._count
+
+    def close(self):
+        self._buf.close()
+
+
+class DetectionRingReader:
+    """Polls a ring written by another thread or process.
+
+    ``start`` is "latest" (only records written from now on) or "oldest"
+    (everything still in the ring). When a new writer replaces the ring,
+    reading continues with the oldest record of the new one; ``restarts``
+    counts how often that happened.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, start="latest"):
+        self.path = path
+        self._open()
+        committed = int(self._header["committed"])
+        self.position = committed if start == "latest" else max(0, committed - self.capacity)
+        self.lost = 0
+        self.restarts = 0
+        self._polled = self.position
+
+    def _open(self):
+        self._buf, self._header, self._records, self._inode = _map(self.path)
+        self.capacity = len(self._records)
+        self.epoch = int(self._header["epoch"])
+
+    def _replaced(self):
+        try:
+            return os.stat(self.path).st_ino != self._inode
+        except FileNotFoundError:
+            return False
+
+    def _resync(self):
+        """Start over at the oldest record of a ring that has a new writer."""
+        self.restarts += 1
+        self.epoch = int(self._header["epoch"])
+        self.position = max(0, int(self._header["claimed"]) - self.capacity)
+        self.lost += self.position
+
+    def poll(self, max_records=None):
+        """Records committed since the last poll, oldest first.
+
+        Returns up to two views into the mapping (split where the ring
+        wraps). They stay valid until the writer comes around again; call
+        valid() after using them, or copy them.
+        """
+        committed = int(self._header["committed"])
+        if committed < self.position or int(self._header["epoch"]) != self.epoch:
+            # Restarted in place (by a writer that does not replace the file)
+            self._resync()
+        elif committed == self.position and self._replaced():
+            # Everything of the old ring is read; its writer has been replaced
+            try:
+                self._open()
+            except (OSError, ValueError):
+                pass  # the path changed again meanwhile; try at the next poll
+            else:
+                self._resync()
+            committed = int(self._header["committed"])
+        oldest = int(self._header["claimed"]) - self.capacity
+        if self.position < oldest:
+            self.lost += oldest - self.position
+            self.position = oldest
+        end = committed if max_records is None else min(committed, self.position + max_records)
+        self._polled = self.position
+        chunks = []
+        while self.position < end:
+            start = self.position % self.capacity
+            stop = min(start + end - self.position, self.capacity)
+            chunks.append(self._records[start:stop])
+            self.position += stop - start
+        return chunks
+
+    def valid(self):
+        """False when the writer has started overwriting records of the last poll."""
+        return int(self._header["claimed"]) - self.capacity <= self._polled
+
+    def read(self, max_records=None):
+        """Like poll(), but one copied array that cannot be overwritten.
+
+        Records overwritten while copying are dropped and counted as lost.
+        """
+        chunks = self.poll(max_records)
+        records = np.concatenate(chunks) if chunks else np.zeros(0, RECORD_DTYPE)
+        # Records past this poll that are already overwritten are lost at the next one
+        overwritten = min(int(self._header["claimed"]) - self.capacity - self._polled, len(records))
+        if overwritten > 0:
+            self.lost += overwritten
+            records = records[overwritten:]
+        return records
+
+    def close(self):
+        # Views handed out by poll() keep the mapping alive; it goes with the last one
+        self._buf = self._header = self._records = None
+
+
+class ParquetRollover:
+    """Writes the ring's records to Parquet or Arrow IPC files from a background thread."""
+
+    def __init__(self, ring_path, directory, rows=1_000_000, seconds=60.0, file_format="parquet",
+                 poll_interval=0.2):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("detection export needs pyarrow (pip3 install pyarrow)")
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        if file_format not in ("parquet", "arrow"):
+            raise ValueError(f"unknown export format {file_format!r}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.rows = rows
+        self.seconds = seconds
+        self.file_format = file_format
+        self.poll_interval = poll_interval
+        self.files = []
+        self.rows_written = 0
+        self._reader = DetectionRingReader(ring_path, start="latest")
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="detection-export", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self._reader.close()
+        if self.files:
+            print(f"Detection export: {self.rows_written} records in {len(self.files)} files, "
+                  f"{self._reader.lost} lost")
+
+    def _run(self):
+        pending = []
+        size = 0
+        opened = time.monotonic()
+        while True:
+            stopping = self._stop.wait(self.poll_interval)
+            records = self._reader.read()
+            if len(records):
+                pending.append(records)
+                size += len(records)
+            due = size >= self.rows or (size and time.monotonic() - opened >= self.seconds)
+            if due or (stopping and size):
+                self._flush(np.concatenate(pending))
+                pending, size, opened = [], 0, time.monotonic()
+            if stopping:
+                return
+
+    def _flush(self, records):
+        table = self._pa.table({name: records[name] for name in RECORD_DTYPE.names})
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.directory, f"detections-{stamp}-{len(self.files):04d}.{self.file_format}")
+        if self.file_format == "parquet":
+            self._pq.write_table(table, path)
+        else:
+            with self._pa.OSFile(path, "wb") as sink, self._pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        self.files.append(path)
+        self.rows_written += len(records)
+
+
+def _tail(args):
+    reader = DetectionRingReader(args.ring, start=args.start)
+    try:
+        while True:
+            for chunk in reader.poll():
+                for record in chunk:
+                    print(f"{record['timestamp_ns']} source {record['source']} frame {record['frame']} "
+                          f"class {record['class_id']} {record['confidence']:.2f} "
+                          f"[{record['left']:.0f},{record['top']:.0f},{record['width']:.0f},{record['height']:.0f}]"
+                          + (" carried" if record["flags"] & FLAG_CARRIED else ""))
+            if not reader.valid():
+                print("(reader fell behind; some printed records were overwritten)")
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"lost {reader.lost} records")
+        reader.close()
+
+
+def _export(args):
+    rollover = ParquetRollover(args.ring, args.directory, args.rows, args.seconds, args.format)
+    rollover.start()
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        rollover.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read a detection ring buffer")
+    commands = parser.add_subparsers(dest="command", required=True)
+    tail = commands.add_parser("tail", help="Print records as they are written")
+    tail.add_argument("ring", nargs="?", default=DEFAULT_PATH)
+    tail.add_argument("--start", choices=("latest", "oldest"), default="latest")
+    tail.add_argument("--interval", type=float, default=0.2)
+    export = commands.add_parser("export", help="Write records to Parquet/Arrow files")
+    export.add_argument("ring")
+    export.add_argument("directory")
+    export.add_argument("--rows", type=int, default=1_000_000, help="Records per file")
+    export.add_argument("--seconds", type=float, default=60.0, help="Longest time covered by one file")
+    export.add_argument("--format", choices=("parquet", "arrow"), default="parquet")
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "tail":
+            _tail(args)
+        else:
+            _export(args)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(e)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+################################################################################
+# H.264 encoder capability cache
+# The scripts try nvv4l2h264enc, nvh264enc and x264enc in that order. Probing
+# that chain means creating each candidate element, which opens the encoder
+# device on Jetson and loads CUDA on dGPU. This module probes once, records
+# which encoders could be created and which properties they expose, and
+# stores the result on disk keyed by the GStreamer registry state. Later
+# launches create only the cached choice.
+#
+# The cache is re-probed when the GStreamer version, plugin path variables or
+# registry file change, or when the cached encoder can no longer be created.
+#
+#   python3 -m dsutils.encoder_cache            # show the cached probe
+#   python3 -m dsutils.encoder_cache --refresh  # probe again
+################################################################################
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+H264_ENCODERS = ("nvv4l2h264enc", "nvh264enc", "x264enc")
+
+# Per encoder: multiplier from kbps to the unit of its "bitrate" property and
+# the properties set on every instance. Properties an encoder does not expose
+# in this GStreamer build are skipped.
+ENCODER_SETTINGS = {
+    # Jetson V4L2 encoder, bitrate in bits/sec
+    "nvv4l2h264enc": {"bitrate_scale": 1000, "properties": {}},
+    # Its H.265 sibling, used by rtsp_ai_to_rtsp.py --codec H265
+    "nvv4l2h265enc": {"bitrate_scale": 1000, "properties": {}},
+    # dGPU NVENC encoder, bitrate in Kbits/sec; preset 1=medium, rc-mode 1=cbr
+    "nvh264enc": {"bitrate_scale": 1, "properties": {"preset": 1, "rc-mode": 1}},
+    # Software encoder, bitrate in Kbits/sec
+    "x264enc": {"bitrate_scale": 1, "properties": {"speed-preset": "medium",
+                                                   "tune": "zerolatency"}},
+}
+
+CACHE_VERSION = 1
+CACHE_ENV = "DS_ENCODER_CACHE"
+
+
+def cache_path():
+    """Cache file location; ``$DS_ENCODER_CACHE`` overrides it."""
+    path = os.environ.get(CACHE_ENV)
+    if path:
+        return path
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "deepstream_python_example", "encoders.json")
+
+
+def _registry_files():
+    path = os.environ.get("GST_REGISTRY_1_0") or os.environ.get("GST_REGISTRY")
+    if path:
+        return [path]
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return sorted(glob.glob(os.path.join(base, "gstreamer-1.0", "registry.*.bin")))
+
+
+def registry_key():
+    """Describe the registry state that decides which encoders exist."""
+    files = {}
+    for path in _registry_files():
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        files[path] = [st.st_mtime_ns, st.st_size]
+    return {
+        "gst_version": Gst.version_string(),
+        "plugin_path": os.environ.get("GST_PLUGIN_PATH", ""),
+        "plugin_system_path": os.environ.get("GST_PLUGIN_SYSTEM_PATH", ""),
+        "registry": files,
+    }
+
+
+def probe_encoders(candidates=H264_ENCODERS):
+    """Try to create each candidate and record its properties.
+
+    Returns the cache record: per-encoder availability and property names,
+    the first available encoder as ``choice``, and the probe time.
+    """
+    start = time.monotonic()
+    encoders = {}
+    choice = None
+    for name in candidates:
+        element = Gst.ElementFactory.make(name, None)
+        if element is None:
+            encoders[name] = {"available": False, "properties": []}
+            continue
+        encoders[name] = {
+            "available": True,
+            "properties": sorted(spec.name for spec in element.list_properties()),
+        }
+        if choice is None:
+            choice = name
+    return {
+        "version": CACHE_VERSION,
+        "key": registry_key(),
+        "candidates": list(candidates),
+        "encoders": encoders,
+        "choice": choice,
+        "probe_ms": (time.monotonic() - start) * 1000,
+    }
+
+
+def _read_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(path, record):
+    # Write then rename so workers starting together never read a partial file
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(record, f, indent=2)
+        os.replace(tmp, path)
+    except OSError as e:
+        sys.stderr.write(f"Unable to write encoder cache {path}: {e}\n")
+
+
+def load_capabilities(candidates=H264_ENCODERS, refresh=False):
+    """Return the cached probe record, probing and saving it when stale."""
+    path = cache_path()
+    record = None if refresh else _read_cache(path)
+    if (record is None
+            or record.get("version") != CACHE_VERSION
+            or record.get("candidates") != list(candidates)
+            or record.get("key") != registry_key()):
+        record = probe_encoders(candidates)
+        _write_cache(path, record)
+    return record
+
+
+def configure_encoder(encoder, bitrate, properties=None):
+    """Apply the bitrate (kbps) and the encoder's standard settings.
+
+    ``properties`` is the list of property names from the probe record;
+    settings the encoder does not expose are skipped.
+    """
+    name = encoder.get_factory().get_name()
+    settings = ENCODER_SETTINGS.get(name, {"bitrate_scale": 1, "properties": {}})
+    if properties is None:
+        properties = [spec.name for spec in encoder.list_properties()]
+    if bitrate is not None:
+        set_encoder_bitrate(encoder, bitrate)
+    for prop, value in settings["properties"].items():
+        if prop not in properties:
+            continue
+        if isinstance(value, str):
+            Gst.util_set_object_arg(encoder, prop, value)
+        else:
+            encoder.set_property(prop, value)
+
+
+def set_encoder_bitrate(encoder, bitrate):
+    """Set ``bitrate`` in kbps, converting to the encoder's own unit."""
+    name = encoder.get_factory().get_name()
+    scale = ENCODER_SETTINGS.get(name, {"bitrate_scale": 1})["bitrate_scale"]
+    encoder.set_property("bitrate", int(bitrate * scale))
+
+
+def get_encoder_bitrate(encoder):
+    """Current bitrate of ``encoder`` in kbps."""
+    name = encoder.get_factory().get_name()
+    scale = ENCODER_SETTINGS.get(name, {"bitrate_scale": 1})["bitrate_scale"]
+    return encoder.get_property("bitrate") / scale
+
+
+def make_h264_encoder(name="encoder", bitrate=None, candidates=H264_ENCODERS):
+    """Create and configure the best available H.264 encoder.
+
+    Uses the cached choice when the registry is unchanged; if that encoder
+    can no longer be created the chain is probed again. Returns None when no
+    candidate can be created.
+    """
+    record = load_capabilities(candidates)
+    choice = record.get("choice")
+    encoder = Gst.ElementFactory.make(choice, name) if choice else None
+    if encoder is None:
+        record = load_capabilities(candidates, refresh=True)
+        choice = record.get("choice")
+        if choice is None:
+            return None
+        encoder = Gst.ElementFactory.make(choice, name)
+        if encoder is None:
+            return None
+    configure_encoder(encoder, bitrate, record["encoders"][choice]["properties"])
+    return encoder
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show or refresh the H.264 encoder cache")
+    parser.add_argument("--refresh", action="store_true", help="Probe the encoders again")
+    args = parser.parse_args(argv)
+
+    Gst.init(None)
+    record = load_capabilities(refresh=args.refresh)
+    print(f"cache: {cache_path()}")
+    print(f"probe took {record['probe_ms']:.1f} ms")
+    for name in record["candidates"]:
+        info = record["encoders"][name]
+        state = "available" if info["available"] else "missing"
+        marker = "*" if name == record["choice"] else " "
+        print(f"{marker} {name}: {state}, {len(info['properties'])} properties")
+    return 0 if record["choice"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
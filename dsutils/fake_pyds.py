@@ -0,0 +1,200 @@
+################################################################################
+# Fake pyds backend
+# A pure-Python stand-in for the subset of the pyds bindings used by the probes
+# in this directory. It lets probe code be exercised and benchmarked on
+# machines without DeepStream or a GPU.
+################################################################################
+
+import random
+
+
+class GList:
+    __slots__ = ("data", "next")
+
+    def __init__(self, data, next=None):
+        self.data = data
+        self.next = next
+
+
+class NvOSD_ColorParams:
+    __slots__ = ("red", "green", "blue", "alpha")
+
+    def __init__(self):
+        self.red = self.green = self.blue = self.alpha = 0.0
+
+    def set(self, red, green, blue, alpha):
+        self.red = red
+        self.green = green
+        self.blue = blue
+        self.alpha = alpha
+
+
+class NvOSD_FontParams:
+    __slots__ = ("font_name", "font_size", "font_color")
+
+    def __init__(self):
+        self.font_name = "Serif"
+        self.font_size = 10
+        self.font_color = NvOSD_ColorParams()
+
+
+class NvOSD_TextParams:
+    __slots__ = ("display_text", "x_offset", "y_offset", "font_params",
+                 "set_bg_clr", "text_bg_clr")
+
+    def __init__(self):
+        self.display_text = ""
+        self.x_offset = 0
+        self.y_offset = 0
+        self.font_params = NvOSD_FontParams()
+        self.set_bg_clr = 0
+        self.text_bg_clr = NvOSD_ColorParams()
+
+
+class NvOSD_RectParams:
+    __slots__ = ("left", "top", "width", "height", "border_width",
+                 "border_color")
+
+    def __init__(self, left=0.0, top=0.0, width=0.0, height=0.0):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self.border_width = 0
+        self.border_color = NvOSD_ColorParams()
+
+
+class NvDsObjectMeta:
+    __slots__ = ("class_id", "confidence", "object_id", "unique_component_id",
+                 "rect_params", "text_params", "obj_label")
+
+    def __init__(self):
+        self.class_id = 0
+        self.confidence = 0.0
+        self.object_id = 0xFFFFFFFFFFFFFFFF
+        self.unique_component_id = 1
+        self.rect_params = NvOSD_RectParams()
+        self.text_params = NvOSD_TextParams()
+        self.obj_label = ""
+
+    @staticmethod
+    def cast(data):
+        return data
+
+
+class NvDsFrameMeta:
+    __slots__ = ("batch_id", "pad_index", "source_id", "frame_num",
+                 "buf_pts", "ntp_timestamp", "num_obj_meta", "bInferDone",
+                 "obj_meta_list", "source_frame_width", "source_frame_height")
+
+    def __init__(self):
+        self.batch_id = 0
+        self.pad_index = 0
+        self.source_id = 0
+        self.frame_num = 0
+        self.buf_pts = 0
+        self.ntp_timestamp = 0
+        self.num_obj_meta = 0
+        self.bInferDone = False
+        self.obj_meta_list = None
+        self.source_frame_width = 1920
+        self.source_frame_height = 1080
+
+    @staticmethod
+    def cast(data):
+        return data
+
+
+class NvDsBatchMeta:
+    __slots__ = ("num_frames_in_batch", "max_frames_in_batch",
+                 "frame_meta_list")
+
+    def __init__(self):
+        self.num_frames_in_batch = 0
+        self.max_frames_in_batch = 0
+        self.frame_meta_list = None
+
+
+_buffers = {}
+
+
+def gst_buffer_get_nvds_batch_meta(buffer_hash):
+    return _buffers.get(buffer_hash)
+
+
+def attach_batch_meta(buffer_hash, batch_meta):
+    """Register ``batch_meta`` so gst_buffer_get_nvds_batch_meta finds it."""
+    _buffers[buffer_hash] = batch_meta
+
+
+def nvds_acquire_obj_meta_from_pool(batch_meta):
+    return NvDsObjectMeta()
+
+
+def nvds_add_obj_meta_to_frame(frame_meta, obj_meta, obj_parent):
+    # Appended, like the DeepStream function
+    node = GList(obj_meta)
+    if frame_meta.obj_meta_list is None:
+        frame_meta.obj_meta_list = node
+    else:
+        tail = frame_meta.obj_meta_list
+        while tail.next is not None:
+            tail = tail.next
+        tail.next = node
+    frame_meta.num_obj_meta += 1
+
+
+def _link(items):
+    head = None
+    for item in reversed(items):
+        head = GList(item, head)
+    return head
+
+
+def _attach_nvinfer_text(obj_meta):
+    # Same text params nvinfer fills in when it attaches a detection
+    text_params = obj_meta.text_params
+    text_params.display_text = str(obj_meta.class_id)
+    text_params.font_params.font_name = "Serif"
+    text_params.font_params.font_size = 11
+    text_params.font_params.font_color.set(1.0, 1.0, 1.0, 1.0)
+    text_params.set_bg_clr = 1
+    text_params.text_bg_clr.set(0.0, 0.0, 0.0, 1.0)
+
+
+def make_batch_meta(num_sources=1, objects_per_frame=30, num_classes=4,
+                    frame_num=0, width=1920, height=1080, seed=None):
+    """Build a batch with ``num_sources`` frames of random detections."""
+    rng = random.Random(seed)
+    frames = []
+    for source_id in range(num_sources):
+        frame_meta = NvDsFrameMeta()
+        frame_meta.batch_id = source_id
+        frame_meta.pad_index = source_id
+        frame_meta.source_id = source_id
+        frame_meta.frame_num = frame_num
+        frame_meta.buf_pts = frame_num * 33333333
+        frame_meta.ntp_timestamp = 1700000000000000000 + frame_meta.buf_pts
+        frame_meta.bInferDone = True
+        frame_meta.source_frame_width = width
+        frame_meta.source_frame_height = height
+        objs = []
+        for _ in range(objects_per_frame):
+            obj_meta = NvDsObjectMeta()
+            obj_meta.class_id = rng.randrange(num_classes)
+            obj_meta.confidence = rng.uniform(0.2, 1.0)
+            w = rng.uniform(16, width / 4)
+            h = rng.uniform(16, height / 4)
+            obj_meta.rect_params = NvOSD_RectParams(
+                rng.uniform(0, width - w), rng.uniform(0, height - h), w, h)
+            _attach_nvinfer_text(obj_meta)
+            objs.append(obj_meta)
+        frame_meta.num_obj_meta = len(objs)
+        frame_meta.obj_meta_list = _link(objs)
+        frames.append(frame_meta)
+
+    batch_meta = NvDsBatchMeta()
+    batch_meta.num_frames_in_batch = num_sources
+    batch_meta.max_frames_in_batch = num_sources
+    batch_meta.frame_meta_list = _link(frames)
+    return batch_meta
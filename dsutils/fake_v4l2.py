@@ -0,0 +1,128 @@
+################################################################################
+# Fake V4L2 ioctl layer
+# A pure-Python stand-in for dsutils.v4l2.SystemIoctl. It answers the four
+# enumeration ioctls from a table of fake cameras, so enumeration, caching and
+# hotplug handling can be exercised without devices.
+################################################################################
+
+import errno
+import itertools
+
+from dsutils import v4l2
+
+# A typical UVC webcam: MJPEG up to 1080p30, YUYV limited by USB bandwidth
+UVC_WEBCAM = {
+    "driver": "uvcvideo",
+    "card": "Fake UVC Camera",
+    "formats": [
+        ("MJPG", "Motion-JPEG", {(1920, 1080): (30, 15), (1280, 720): (60, 30), (640, 480): (30,)}),
+        ("YUYV", "YUYV 4:2:2", {(1920, 1080): (5,), (1280, 720): (10,), (640, 480): (30, 15)}),
+    ],
+}
+
+# The metadata node a UVC camera exposes next to its capture node
+UVC_METADATA = {"driver": "uvcvideo", "card": "Fake UVC Camera", "metadata": True, "formats": []}
+
+
+class FakeIoctl:
+    """Serves fake devices keyed by path.
+
+    Each device is a dict like UVC_WEBCAM: ``formats`` is a list of
+    (fourcc, description, {(width, height): fps tuple}). ``plug`` and
+    ``unplug`` change the node list at runtime; ``calls`` counts ioctls.
+    """
+
+    def __init__(self, devices=None):
+        self.devices = dict(devices or {})
+        self._signatures = {}
+        self._counter = itertools.count(1)
+        for path in self.devices:
+            self._signatures[path] = next(self._counter)
+        self._open = {}
+        self._fds = itertools.count(100)
+        self.calls = 0
+
+    def plug(self, path, device):
+        self.devices[path] = device
+        self._signatures[path] = next(self._counter)
+
+    def unplug(self, path):
+        self.devices.pop(path, None)
+        self._signatures.pop(path, None)
+
+    def list_nodes(self):
+        return sorted(self.devices, key=v4l2._node_number)
+
+    def signature(self, path):
+        if path not in self.devices:
+            raise FileNotFoundError(errno.ENOENT, "No such device", path)
+        return self._signatures[path]
+
+    def open(self, path):
+        if path not in self.devices:
+            raise FileNotFoundError(errno.ENOENT, "No such device", path)
+        fd = next(self._fds)
+        self._open[fd] = self.devices[path]
+        return fd
+
+    def close(self, fd):
+        del self._open[fd]
+
+    def ioctl(self, fd, request, arg):
+        self.calls += 1
+        device = self._open[fd]
+        if request == v4l2.VIDIOC_QUERYCAP:
+            self._querycap(device, arg)
+        elif request == v4l2.VIDIOC_ENUM_FMT:
+            self._enum_fmt(device, arg)
+        elif request == v4l2.VIDIOC_ENUM_FRAMESIZES:
+            self._enum_framesizes(device, arg)
+        elif request == v4l2.VIDIOC_ENUM_FRAMEINTERVALS:
+            self._enum_frameintervals(device, arg)
+        else:
+            raise OSError(errno.ENOTTY, "Inappropriate ioctl for device")
+
+    @staticmethod
+    def _einval():
+        return OSError(errno.EINVAL, "Invalid argument")
+
+    def _querycap(self, device, cap):
+        cap.driver = device["driver"].encode()
+        cap.card = device["card"].encode()
+        cap.bus_info = device.get("bus_info", "usb-fake-1").encode()
+        cap.version = 0x060800
+        device_caps = v4l2.V4L2_CAP_STREAMING
+        if not device.get("metadata"):
+            device_caps |= v4l2.V4L2_CAP_VIDEO_CAPTURE
+        cap.device_caps = device_caps
+        cap.capabilities = (device_caps | v4l2.V4L2_CAP_VIDEO_CAPTURE
+                            | v4l2.V4L2_CAP_DEVICE_CAPS)
+
+    def _format(self, device, pixelformat):
+        for fourcc, description, sizes in device["formats"]:
+            if v4l2.str_to_fourcc(fourcc) == pixelformat:
+                return sizes
+        raise self._einval()
+
+    def _enum_fmt(self, device, fmt):
+        if fmt.type != v4l2.V4L2_BUF_TYPE_VIDEO_CAPTURE or fmt.index >= len(device["formats"]):
+            raise self._einval()
+        fourcc, description, _ = device["formats"][fmt.index]
+        fmt.pixelformat = v4l2.str_to_fourcc(fourcc)
+        fmt.description = description.encode()
+        fmt.flags = v4l2.V4L2_FMT_FLAG_COMPRESSED if fourcc in ("MJPG", "H264") else 0
+
+    def _enum_framesizes(self, device, size):
+        sizes = list(self._format(device, size.pixel_format))
+        if size.index >= len(sizes):
+            raise self._einval()
+        size.type = v4l2.V4L2_FRMSIZE_TYPE_DISCRETE
+        size.discrete.width, size.discrete.height = sizes[size.index]
+
+    def _enum_frameintervals(self, device, ival):
+        rates = self._format(device, ival.pixel_format).get((ival.width, ival.height))
+        if rates is None or ival.index >= len(rates):
+            raise self._einval()
+        ival.type = v4l2.V4L2_FRMIVAL_TYPE_DISCRETE
+        ival.discrete.numerator = 1
+        ival.discrete.denominator = rates[ival.index]
@@ -0,0 +1,223 @@
+################################################################################
+# Single-ingest fan-out
+# Decodes a stream once and feeds any mix of outputs from it. Every video
+# variant (the decoded "raw" frames, and "infer" frames with nvinfer boxes
+# drawn by nvdsosd) ends in a tee; outputs attach to the tee of the variant
+# they ask for:
+#
+#   rtsp://host:port/path    RTSP push (rtspclientsink)
+#   rtmp://host/app/key      RTMP push (flvmux + rtmpsink)
+#   file:PATH                recording; .mkv, .flv and .ts pick their muxer,
+#                            anything else is fragmented MP4 so the file stays
+#                            playable when the program is stopped
+#   display                  local window
+#
+# Prefix an output with "infer:" to take the annotated variant, e.g.
+# infer:rtsp://127.0.0.1:8554/ai.
+#
+# Encoded outputs of one variant share one encoder: the variant's tee feeds a
+# single nvvideoconvert -> H.264 encoder -> h264parse chain that ends in a
+# second tee, and the RTSP, RTMP and file outputs hang off that. (The
+# encoder chain in dsutils.encoder_cache is H.264 only and FLV cannot carry
+# anything else, so a variant has exactly one codec.)
+#
+# Every branch starts with its own leaky queue that drops the oldest buffer
+# when full, so a sink that stalls (a slow RTMP server, a blocked display)
+# loses frames itself instead of back-pressuring the tee and every other
+# output. Dropped encoded frames show as artifacts on that output until the
+# next key frame. Drops are counted per branch, see report().
+#
+# The "infer" variant is built by the caller from a branch of the raw tee.
+# nvdsosd draws in place, so that branch must convert into a new RGBA
+# surface before the OSD: with matching caps nvvideoconvert passes the
+# buffer through and the boxes would land on the frames the raw outputs are
+# encoding at the same time.
+################################################################################
+
+import os
+import collections
+
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+from dsutils.encoder_cache import make_h264_encoder
+from dsutils.queues import QueueSpec, queue_properties
+
+OUTPUT_QUEUE_BUFFERS = 8
+STREAMS = ("raw", "infer")
+DISPLAY_SINKS = ("nveglglessink", "autovideosink")
+JETSON_DISPLAY_SINKS = ("nv3dsink", "nveglglessink", "autovideosink")
+RECORD_MUXERS = {".mkv": "matroskamux", ".flv": "flvmux", ".ts": "mpegtsmux"}
+
+OutputSpec = collections.namedtuple("OutputSpec", "kind target stream")
+
+
+def parse_output(text):
+    """Parse an --output value into an OutputSpec; usable as an argparse type."""
+    stream = "raw"
+    if text.startswith("infer:"):
+        stream, text = "infer", text[len("infer:"):]
+    if text.startswith(("rtsp://", "rtsps://")):
+        return OutputSpec("rtsp", text, stream)
+    if text.startswith(("rtmp://", "rtmps://")):
+        return OutputSpec("rtmp", text, stream)
+    if text == "display":
+        return OutputSpec("display", None, stream)
+    if text.startswith("file:") and len(text) > len("file:"):
+        return OutputSpec("file", text[len("file:"):], stream)
+    raise ValueError(text)
+
+
+def describe_output(spec):
+    target = spec.kind if spec.target is None else spec.target
+    return target if spec.stream == "raw" else f"{target} (infer)"
+
+
+def _make(factory, name):
+    element = Gst.ElementFactory.make(factory, name)
+    if not element:
+        raise RuntimeError(f"unable to create {factory}")
+    return element
+
+
+class FanOut:
+    """Tees, shared encoders and per-output leaky queues for one pipeline.
+
+    Raises RuntimeError when a required element cannot be created.
+    """
+
+    def __init__(self, pipeline, bitrate, max_buffers=OUTPUT_QUEUE_BUFFERS, integrated_gpu=False):
+        self.pipeline = pipeline
+        self.bitrate = bitrate  # kbps
+        self.spec = QueueSpec(max_buffers, "downstream")
+        self.integrated_gpu = integrated_gpu
+        self.encoders = {}       # stream -> encoder element
+        self.scalers = {}        # stream -> capsfilter in front of the encoder
+        self._tees = {}          # stream -> tee of decoded frames
+        self._encoded_tees = {}  # stream -> tee after the shared encoder
+        self._drops = collections.OrderedDict()  # branch queue name -> dropped buffers
+        self._count = 0
+
+    def _add(self, *elements):
+        for element in elements:
+            self.pipeline.add(element)
+
+    def add_stream(self, stream, upstream):
+        """Split the output of ``upstream`` as video variant ``stream``."""
+        tee = _make("tee", f"tee-{stream}")
+        tee.set_property("allow-not-linked", True)
+        self._add(tee)
+        if not upstream.link(tee):
+            raise RuntimeError(f"unable to link {upstream.get_name()} to {tee.get_name()}")
+        self._tees[stream] = tee
+        return tee
+
+    def has_stream(self, stream):
+        return stream in self._tees
+
+    def branch(self, tee, name):
+        """A new leaky queue fed by ``tee``."""
+        queue = _make("queue", f"{name}-queue")
+        for key, value in queue_properties(self.spec).items():
+            Gst.util_set_object_arg(queue, key, str(value))
+        self._drops[queue.get_name()] = 0
+        # A full leaky queue reports overrun and then drops its oldest buffer
+        queue.connect("overrun", self._on_overrun)
+        self._add(queue)
+        if not tee.link(queue):
+            raise RuntimeError(f"unable to link {tee.get_name()} to {queue.get_name()}")
+        return queue
+
+    def stream_branch(self, stream, name):
+        """A leaky queue fed by the decoded frames of ``stream``."""
+        return self.branch(self._tees[stream], name)
+
+    def _on_overrun(self, queue):
+        self._drops[queue.get_name()] += 1
+
+    def _encoded(self, stream):
+        """The tee after the encoder shared by ``stream``'s encoded outputs."""
+        tee = self._encoded_tees.get(stream)
+        if tee is not None:
+            return tee
+        queue = self.stream_branch(stream, f"encode-{stream}")
+        conv = _make("nvvideoconvert", f"encode-convert-{stream}")
+        caps = _make("capsfilter", f"encode-caps-{stream}")
+        caps.set_property("caps", Gst.Caps.from_string("video/x-raw(memory:NVMM), format=I420"))
+        encoder = make_h264_encoder(f"encoder-{stream}", self.bitrate)
+        if not encoder:
+            raise RuntimeError("unable to create any H264 encoder")
+        if self.integrated_gpu and encoder.find_property("insert-sps-pps"):
+            encoder.set_property("insert-sps-pps", 1)
+        parser = _make("h264parse", f"h264parser-{stream}")
+        # SPS/PPS before every key frame so late RTSP/RTMP clients can start
+        parser.set_property("config-interval", -1)
+        tee = _make("tee", f"tee-{stream}-h264")
+        tee.set_property("allow-not-linked", True)
+        self._add(conv, caps, encoder, parser, tee)
+        if not (queue.link(conv) and conv.link(caps) and caps.link(encoder)
+                and encoder.link(parser) and parser.link(tee)):
+            raise RuntimeError(f"unable to link the {stream} encoder")
+        self.encoders[stream] = encoder
+        self.scalers[stream] = caps
+        self._encoded_tees[stream] = tee
+        return tee
+
+    def add_output(self, spec):
+        """Attach one output; returns the leaky queue that feeds it."""
+        if spec.stream not in self._tees:
+            raise RuntimeError(f"no {spec.stream} stream in this pipeline")
+        index = self._count
+        self._count += 1
+        name = f"output-{index}"
+        if spec.kind == "display":
+            queue = self.stream_branch(spec.stream, name)
+            conv = _make("nvvideoconvert", f"{name}-convert")
+            sink = self._display_sink(f"{name}-sink")
+            self._add(conv, sink)
+            linked = queue.link(conv) and conv.link(sink)
+        else:
+            queue = self.branch(self._encoded(spec.stream), name)
+            elements = self._encoded_sink(spec, name)
+            self._add(*elements)
+            linked = queue.link(elements[0])
+            for upstream, downstream in zip(elements, elements[1:]):
+                linked = linked and upstream.link(downstream)
+        if not linked:
+            raise RuntimeError(f"unable to link output {describe_output(spec)}")
+        return queue
+
+    def _display_sink(self, name):
+        for factory in JETSON_DISPLAY_SINKS if self.integrated_gpu else DISPLAY_SINKS:
+            sink = Gst.ElementFactory.make(factory, name)
+            if sink:
+                # A slow window must not hold buffers back to the clock
+                sink.set_property("sync", False)
+                return sink
+        raise RuntimeError("unable to create a display sink")
+
+    def _encoded_sink(self, spec, name):
+        """Elements after the output queue, in link order."""
+        if spec.kind == "rtsp":
+            sink = _make("rtspclientsink", f"{name}-sink")
+            sink.set_property("location", spec.target)
+            return [sink]
+        if spec.kind == "rtmp":
+            mux = _make("flvmux", f"{name}-mux")
+            mux.set_property("streamable", True)
+            sink = _make("rtmpsink", f"{name}-sink")
+            sink.set_property("location", spec.target)
+            return [mux, sink]
+        extension = os.path.splitext(spec.target)[1].lower()
+        mux = _make(RECORD_MUXERS.get(extension, "mp4mux"), f"{name}-mux")
+        if mux.find_property("fragment-duration") is not None:
+            mux.set_property("fragment-duration", 1000)  # ms
+        sink = _make("filesink", f"{name}-sink")
+        sink.set_property("location", spec.target)
+        return [mux, sink]
+
+    def report(self):
+        """Buffers each branch dropped because its consumer fell behind."""
+        lines = [f"{name}: dropped {count}" for name, count in self._drops.items()]
+        return "\n".join(lines)
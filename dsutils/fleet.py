@@ -0,0 +1,465 @@
+################################################################################
+# Multi-process camera fleet
+# Runs one script process ("worker") per camera from a JSON fleet config:
+#
+#   {
+#     "cores_per_worker": 2,
+#     "reserved_cores": [0],
+#     "metrics_port": 9100,
+#     "cameras": [
+#       {"name": "gate", "script": "rtsp_to_rtsp.py",
+#        "args": ["--rtsp-url", "rtsp://10.0.0.5/stream",
+#                 "--rtsp-url-o", "rtsp://127.0.0.1:8554/gate"]},
+#       {"name": "lobby-ai", "script": "rtsp_ai_to_rtsp.py", "cores": 4,
+#        "args": ["--input-rtsp", "videotestsrc://ball?width=1280&height=720",
+#                 "--output-rtsp", "rtsp://127.0.0.1:8554/lobby"]}
+#     ]
+#   }
+#
+# Placement: each worker is pinned to ``cores`` CPUs of one NUMA node,
+# picking the least loaded node and its least loaded CPUs, so a worker's
+# threads share caches and its memory is allocated on that node (first
+# touch). More workers than cores share CPUs evenly instead of failing.
+# The child is pinned with sched_setaffinity(pid) as soon as Popen returns
+# (preexec_fn is unsafe while the supervisor's HTTP thread runs). Threads
+# inherit the mask when they are created, so this relies on the script
+# starting no threads during its first moments of interpreter startup and
+# imports; the scripts here start GStreamer, and with it their threads,
+# well after that.
+#
+# Health: every worker gets its own DS_METRICS_PORT (metrics_port + 1 + i),
+# so only scripts that serve it (METRICS_SCRIPTS) can be fleet workers.
+# The supervisor scrapes it every poll interval; a worker is healthy while
+# its ds_source_frames_out_total keeps growing. A worker that exits, or makes
+# no progress for heartbeat_timeout seconds (startup_grace after a start), is
+# stopped with SIGINT (SIGKILL after stop_timeout) and started again after a
+# backoff that doubles from initial_backoff up to max_backoff and resets once
+# a worker has run longer than max_backoff.
+#
+# Metrics: the supervisor serves its own /metrics on metrics_port with every
+# worker's last scrape, labelled camera="<name>", plus
+#
+#   ds_fleet_worker_up{camera}                1 while healthy
+#   ds_fleet_worker_restarts_total{camera}
+#   ds_fleet_worker_heartbeat_age_seconds{camera}
+#   ds_fleet_worker_cpus{camera}              number of pinned CPUs
+#
+#   python3 -m dsutils.fleet fleet.json
+#   python3 -m dsutils.fleet fleet.json --dry-run   # show placement only
+#
+# Camera URIs may be videotestsrc://... to run workers without cameras.
+################################################################################
+
+import os
+import re
+import sys
+import glob
+import json
+import time
+import signal
+import argparse
+import threading
+import subprocess
+import collections
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+HEARTBEAT_METRIC = "ds_source_frames_out_total"
+# Scripts that serve DS_METRICS_PORT; any other worker would never report a
+# heartbeat and be restarted every startup_grace
+METRICS_SCRIPTS = ("rtsp_ai_to_rtsp.py", "rtsp_fanout.py", "rtsp_to_rtmp.py", "rtsp_to_rtsp.py",
+                   "rtsp_to_screen_rtspsrc.py", "rtsp_to_screen_uridecodebin.py",
+                   "usb_to_rtmp.py", "usb_to_rtsp.py")
+
+DEFAULTS = {
+    "cores_per_worker": 1,
+    "reserved_cores": [],
+    "metrics_port": 9100,
+    "poll_interval": 2.0,
+    "heartbeat_timeout": 15.0,
+    "startup_grace": 60.0,
+    "initial_backoff": 1.0,
+    "max_backoff": 60.0,
+    "stop_timeout": 10.0,
+}
+
+_SAMPLE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(.*)\})?\s+(\S+)")
+
+
+def load_config(path):
+    """Read a fleet config and fill in defaults; raises ValueError when invalid."""
+    with open(path) as f:
+        config = json.load(f)
+    for key, value in DEFAULTS.items():
+        config.setdefault(key, value)
+    cameras = config.get("cameras")
+    if not cameras:
+        raise ValueError("fleet config lists no cameras")
+    names = set()
+    for camera in cameras:
+        name, script = camera.get("name"), camera.get("script")
+        if not name or name in names:
+            raise ValueError(f"camera names must be given and unique: {name!r}")
+        names.add(name)
+        if not script or not os.path.isfile(os.path.join(REPO_DIR, script)):
+            raise ValueError(f"{name}: unknown script {script!r}")
+        if os.path.basename(script) not in METRICS_SCRIPTS:
+            raise ValueError(f"{name}: {script} does not serve DS_METRICS_PORT, so its health "
+                             f"cannot be checked; use one of {', '.join(METRICS_SCRIPTS)}")
+        camera.setdefault("args", [])
+        camera.setdefault("env", {})
+        camera.setdefault("cores", config["cores_per_worker"])
+    return config
+
+
+# -- placement -------------------------------------------------------------
+
+def _parse_cpulist(text):
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def numa_nodes(reserved=()):
+    """{node: [cpu, ...]} of the CPUs this process may use, minus ``reserved``."""
+    allowed = set(os.sched_getaffinity(0)) - set(reserved)
+    nodes = {}
+    for path in sorted(glob.glob("/sys/devices/system/node/node[0-9]*/cpulist")):
+        node = int(os.path.basename(os.path.dirname(path))[len("node"):])
+        with open(path) as f:
+            cpus = [cpu for cpu in _parse_cpulist(f.read()) if cpu in allowed]
+        if cpus:
+            nodes[node] = cpus
+    if not nodes:  # no NUMA information exported
+        nodes[0] = sorted(allowed)
+    return nodes
+
+
+def plan_placement(cameras, nodes):
+    """{camera name: (node, [cpu, ...])}, spreading load over nodes and CPUs."""
+    load = {cpu: 0 for cpus in nodes.values() for cpu in cpus}
+    placement = {}
+    for camera in cameras:
+        # Least loaded node per CPU, then that node's least loaded CPUs
+        node = min(nodes, key=lambda n: (sum(load[c] for c in nodes[n]) / len(nodes[n]), n))
+        count = max(1, min(int(camera["cores"]), len(nodes[node])))
+        cpus = sorted(sorted(nodes[node], key=lambda c: (load[c], c))[:count])
+        for cpu in cpus:
+            load[cpu] += 1
+        placement[camera["name"]] = (node, cpus)
+    return placement
+
+
+# -- metrics text ----------------------------------------------------------
+
+def heartbeat_value(text):
+    """Sum of HEARTBEAT_METRIC over all sources in a scrape, or None."""
+    total = None
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if match and match.group(1) == HEARTBEAT_METRIC:
+            total = (total or 0) + float(match.group(4))
+    return total
+
+
+def merge_scrapes(scrapes):
+    """Merge {camera: metrics text} into one exposition with a camera label."""
+    families = collections.OrderedDict()  # name -> [help, type, samples]
+    for camera, text in scrapes.items():
+        for line in text.splitlines():
+            if line.startswith("# HELP ") or line.startswith("# TYPE "):
+                parts = line.split(None, 3)
+                if len(parts) < 3:
+                    continue
+                kind, name = parts[1], parts[2]
+                rest = parts[3] if len(parts) > 3 else ""
+                family = families.setdefault(name, [None, None, []])
+                family[0 if kind == "HELP" else 1] = family[0 if kind == "HELP" else 1] or rest
+                continue
+            match = _SAMPLE.match(line)
+            if not match:
+                continue
+            name, labels, value = match.group(1), match.group(3), match.group(4)
+            label_text = f'camera="{camera}"' + (f",{labels}" if labels else "")
+            family = families.setdefault(name, [None, None, []])
+            family[2].append(f"{name}{{{label_text}}} {value}")
+    lines = []
+    for name, (help_text, kind, samples) in families.items():
+        if help_text:
+            lines.append(f"# HELP {name} {help_text}")
+        if kind:
+            lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples)
+    return lines
+
+
+# -- workers ---------------------------------------------------------------
+
+class Worker:
+    """One camera's script process and its health state."""
+
+    def __init__(self, camera, node, cpus, port):
+        self.camera = camera
+        self.name = camera["name"]
+        self.node = node
+        self.cpus = cpus
+        self.port = port
+        self.process = None
+        self.started_at = None
+        self.last_progress = None
+        self.heartbeat = None
+        self.scrape = ""
+        self.restarts = 0
+        self.backoff = None
+        self.restart_at = None
+        self.kill_at = None
+        self.last_failure = None
+
+    def command(self):
+        return [sys.executable, os.path.join(REPO_DIR, self.camera["script"])] + list(self.camera["args"])
+
+    def start(self):
+        env = dict(os.environ)
+        env.update({key: str(value) for key, value in self.camera["env"].items()})
+        env["DS_METRICS_PORT"] = str(self.port)
+        cpus = self.cpus
+        # Pinned from here rather than in preexec_fn, which is not safe with
+        # the fleet's HTTP thread running; the script starts its own threads
+        # well after this and they inherit the mask
+        self.process = subprocess.Popen(self.command(), cwd=REPO_DIR, env=env)
+        try:
+            os.sched_setaffinity(self.process.pid, cpus)
+        except OSError:
+            pass  # exited already; the next tick sees it
+        self.started_at = time.monotonic()
+        self.last_progress = None
+        self.heartbeat = None
+        self.scrape = ""
+        self.restart_at = None
+        print(f"[fleet] {self.name}: started pid {self.process.pid} on node {self.node} CPUs {cpus}")
+
+    def begin_stop(self, timeout):
+        """Ask the process to exit; reap() kills it if it is still there after ``timeout``."""
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.send_signal(signal.SIGINT)  # the scripts clean up on KeyboardInterrupt
+        self.kill_at = time.monotonic() + timeout
+
+    def reap(self, now):
+        """True once the process is gone, killing it when its stop deadline passed."""
+        if self.process is None or self.process.poll() is not None:
+            self.kill_at = None
+            return True
+        if self.kill_at is not None and now >= self.kill_at:
+            self.process.kill()
+            self.process.wait()
+            self.kill_at = None
+            return True
+        return False
+
+    def stop(self, timeout):
+        """begin_stop() and wait for the process; for shutting the fleet down."""
+        self.begin_stop(timeout)
+        if self.process is None:
+            return
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.kill_at = None
+
+    def poll_metrics(self, timeout=1.0):
+        """Scrape the worker; record progress when the heartbeat counter grew."""
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{self.port}/metrics", timeout=timeout) as reply:
+                text = reply.read().decode()
+        except OSError:
+            return
+        self.scrape = text
+        value = heartbeat_value(text)
+        if value is not None and (self.heartbeat is None or value > self.heartbeat):
+            self.heartbeat = value
+            self.last_progress = time.monotonic()
+
+    def healthy(self, now, timeout):
+        return self.last_progress is not None and now - self.last_progress <= timeout
+
+
+class Fleet:
+    """Starts, watches and restarts the workers of a fleet config."""
+
+    def __init__(self, config):
+        self.config = config
+        self.nodes = numa_nodes(config["reserved_cores"])
+        placement = plan_placement(config["cameras"], self.nodes)
+        self.workers = []
+        for i, camera in enumerate(config["cameras"]):
+            node, cpus = placement[camera["name"]]
+            self.workers.append(Worker(camera, node, cpus, config["metrics_port"] + 1 + i))
+        self._server = None
+
+    def start(self):
+        for worker in self.workers:
+            worker.backoff = self.config["initial_backoff"]
+            worker.start()
+
+    def tick(self):
+        """One supervision pass; call every poll_interval."""
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.restart_at is not None:
+                # Restart once the old process is gone and the backoff has passed
+                if worker.reap(now) and now >= worker.restart_at:
+                    worker.restarts += 1
+                    worker.start()
+                continue
+            if worker.process.poll() is not None:
+                self._fail(worker, f"exited with status {worker.process.returncode}", now)
+                continue
+            worker.poll_metrics()
+            if worker.last_progress is None:
+                if now - worker.started_at > self.config["startup_grace"]:
+                    self._fail(worker, f"no frames within {self.config['startup_grace']:.0f}s", now)
+            elif not worker.healthy(now, self.config["heartbeat_timeout"]):
+                self._fail(worker, f"no frames for {self.config['heartbeat_timeout']:.0f}s", now)
+
+    def _fail(self, worker, reason, now):
+        # Without waiting: the process is reaped (or killed) by later ticks
+        worker.begin_stop(self.config["stop_timeout"])
+        if now - worker.started_at > self.config["max_backoff"]:
+            worker.backoff = self.config["initial_backoff"]  # it had been running fine
+        worker.last_failure = reason
+        worker.restart_at = now + worker.backoff
+        print(f"[fleet] {worker.name}: {reason}; restarting in {worker.backoff:.0f}s")
+        worker.backoff = min(worker.backoff * 2, self.config["max_backoff"])
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop(self.config["stop_timeout"])
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def status(self):
+        """{camera: {...}} health summary."""
+        now = time.monotonic()
+        result = {}
+        for worker in self.workers:
+            age = None if worker.last_progress is None else now - worker.last_progress
+            result[worker.name] = {
+                "pid": worker.process.pid if worker.process else None,
+                "node": worker.node,
+                "cpus": worker.cpus,
+                "up": worker.restart_at is None and worker.healthy(now, self.config["heartbeat_timeout"]),
+                "restarts": worker.restarts,
+                "heartbeat_age_s": age,
+                "frames_out": worker.heartbeat,
+                "last_failure": worker.last_failure,
+            }
+        return result
+
+    def render(self):
+        """Fleet metrics and every worker's last scrape, in Prometheus text format."""
+        status = self.status()
+        lines = merge_scrapes({worker.name: worker.scrape for worker in self.workers})
+
+        def family(name, kind, help_text, values):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for camera, value in values:
+                lines.append(f'{name}{{camera="{camera}"}} {value}')
+
+        family("ds_fleet_worker_up", "gauge", "1 while the worker delivers frames.",
+               [(c, int(s["up"])) for c, s in status.items()])
+        family("ds_fleet_worker_restarts_total", "counter", "Worker restarts.",
+               [(c, s["restarts"]) for c, s in status.items()])
+        family("ds_fleet_worker_heartbeat_age_seconds", "gauge", "Time since the worker last made progress.",
+               [(c, s["heartbeat_age_s"]) for c, s in status.items() if s["heartbeat_age_s"] is not None])
+        family("ds_fleet_worker_cpus", "gauge", "CPUs the worker is pinned to.",
+               [(c, len(s["cpus"])) for c, s in status.items()])
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        fleet = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = fleet.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fleet-http", daemon=True).start()
+        print(f"[fleet] metrics at http://{host}:{port}/metrics")
+
+    def run(self, status_interval=30.0):
+        """Supervise until interrupted."""
+        self.start()
+        if self.config["metrics_port"]:
+            self.serve(self.config["metrics_port"])
+        last_status = time.monotonic()
+        try:
+            while True:
+                time.sleep(self.config["poll_interval"])
+                self.tick()
+                if time.monotonic() - last_status >= status_interval:
+                    last_status = time.monotonic()
+                    print(format_status(self.status()))
+                    sys.stdout.flush()
+        except KeyboardInterrupt:
+            print("[fleet] stopping workers")
+        finally:
+            self.stop()
+
+
+def format_status(status):
+    lines = []
+    for camera, s in status.items():
+        age = "n/a" if s["heartbeat_age_s"] is None else f"{s['heartbeat_age_s']:.1f}s"
+        lines.append(f"[fleet] {camera}: {'up' if s['up'] else 'down'}, restarts {s['restarts']}, "
+                     f"heartbeat {age}, node {s['node']} CPUs {s['cpus']}"
+                     + (f", last failure: {s['last_failure']}" if s["last_failure"] else ""))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run one pipeline process per camera")
+    parser.add_argument("config", help="Fleet config (JSON)")
+    parser.add_argument("--dry-run", action="store_true", help="Print the CPU placement and commands, then exit")
+    args = parser.parse_args(argv)
+    try:
+        config = load_config(args.config)
+    except (OSError, ValueError) as e:
+        print(f"Invalid fleet config: {e}")
+        return 2
+    fleet = Fleet(config)
+    print(f"[fleet] NUMA nodes: {', '.join(f'{n}: {len(c)} CPUs' for n, c in sorted(fleet.nodes.items()))}")
+    if args.dry_run:
+        for worker in fleet.workers:
+            print(f"{worker.name}: node {worker.node} CPUs {worker.cpus} metrics :{worker.port}\n  "
+                  + " ".join(worker.command()))
+        return 0
+    fleet.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+################################################################################
+# nvinfer config helpers
+# Read the [property] group of a gst-nvinfer config file (such as
+# dstest1_pgie_config.txt) and the label file it points to.
+################################################################################
+
+import os
+import configparser
+
+
+def read_infer_config(config_path):
+    """Return the [property] group of an nvinfer config file as a dict.
+
+    Relative paths inside the file are resolved the way nvinfer does it,
+    against the directory of the config file; see resolve_config_path().
+    """
+    parser = configparser.ConfigParser(interpolation=None, strict=False)
+    with open(config_path) as f:
+        parser.read_file(f)
+    if not parser.has_section("property"):
+        return {}
+    return dict(parser.items("property"))
+
+
+def resolve_config_path(config_path, value):
+    """Resolve a path value from an nvinfer config file."""
+    if os.path.isabs(value):
+        return value
+    return os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(config_path)), value))
+
+
+def load_labels(label_path):
+    """Read an nvinfer label file.
+
+    Detector label files list one class per line; classifier label files put
+    the labels of an attribute on one line separated by ``;``. Both layouts
+    are accepted here and flattened into a single list.
+    """
+    labels = []
+    with open(label_path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            labels.extend(label.strip() for label in line.split(";") if label.strip())
+    return labels
+
+
+def load_config_labels(config_path, fallback=None):
+    """Load the class names referenced by ``labelfile-path`` in the config.
+
+    Returns ``fallback`` when the config has no label file or it cannot be
+    read, for example when the models are not installed next to the config.
+    """
+    try:
+        props = read_infer_config(config_path)
+        label_file = props.get("labelfile-path")
+        if not label_file:
+            return fallback
+        return load_labels(resolve_config_path(config_path, label_file))
+    except (OSError, configparser.Error) as e:
+        print(f"Unable to load labels from {config_path}: {e}")
+        return fallback
@@ -0,0 +1,249 @@
+################################################################################
+# Load-adaptive inference interval
+# nvinfer runs the model on every batch unless its ``interval`` property
+# skips some. InferenceScheduler measures the inference stage once per tick:
+#
+#   latency  p95 time from entering the "infer" stage queue (or nvinfer when
+#            there is none) to leaving nvinfer, over the tick
+#   fill     how full that stage queue is
+#   busy     mean time nvinfer spends on a batch it runs the model on
+#
+# and moves the interval within [min_interval, max_interval]:
+#
+#   overloaded (latency >= target or fill >= high_fill)
+#       skip one more batch right away, then wait ``settle`` ticks for the
+#       backlog to drain
+#   clear (latency <= target / 2, fill <= low_fill, and running the model on
+#         one more batch would keep nvinfer below max_duty of the time)
+#       for ``hold`` ticks in a row: skip one batch fewer
+#
+# nvinfer skips whole batches, so every source in the batch gets the same
+# interval. Frames of a skipped batch get the last detections of their
+# source through dsutils.carry_forward (in the script's probe), and the
+# inference rate each source actually gets is reported per source. With a
+# dsutils.motion_gate.MotionGate in front, the interval is handed to the
+# gate, which applies it to the batches that have motion.
+################################################################################
+
+import time
+import threading
+import collections
+
+import numpy as np
+
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst, GLib
+
+from dsutils.queues import QueueSpec
+
+INFER_QUEUE = QueueSpec(8, "no")
+DEFAULT_TARGET_MS = 100
+
+
+def interval_option(text):
+    """Parse MAX_INTERVAL[:TARGET_MS]; usable as an argparse type."""
+    max_interval, _, target_ms = text.partition(":")
+    max_interval = int(max_interval)
+    target_ms = float(target_ms) if target_ms else DEFAULT_TARGET_MS
+    if max_interval <= 0 or target_ms <= 0:
+        raise ValueError(text)
+    return max_interval, target_ms
+
+
+def skip_all_interval(pgie):
+    """An ``interval`` at which nvinfer in practice skips every batch."""
+    spec = pgie.find_property("interval")
+    # nvinfer divides by interval + 1, so stay clear of the type's limit
+    return min(spec.maximum, 2 ** 31 - 1) - 1
+
+
+def ensure_infer_queue(overrides):
+    """Add an infer stage queue to --queue overrides unless one is planned already."""
+    if not any(stage == "infer" for stage, _ in overrides):
+        overrides.append(("infer", INFER_QUEUE))
+    return overrides
+
+
+class InferenceScheduler:
+    """Steps ``pgie``'s interval from the load measured around it.
+
+    ``queue`` is the stage queue in front of ``pgie``, or None; ``gate`` a
+    MotionGate that owns nvinfer's interval property, or None. The pgie src
+    pad probe must pass every batch to ``record()``. Ticks run on the GLib
+    main loop.
+    """
+
+    def __init__(self, pgie, max_interval, target_ms=DEFAULT_TARGET_MS, queue=None, gate=None,
+                 min_interval=0, interval=1.0, high_fill=0.5, low_fill=0.1, max_duty=0.8,
+                 hold=5, settle=2):
+        self.pgie = pgie
+        self.queue = queue
+        self.gate = gate
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target = target_ms / 1000
+        self.interval = interval
+        self.high_fill = high_fill
+        self.low_fill = low_fill
+        self.max_duty = max_duty
+        self.hold = hold
+        self.settle = settle
+        self.skip = min(max(self._interval(), min_interval), max_interval)
+        self.enabled = True
+        self.changes = []  # (monotonic time, old interval, new interval, reason)
+        self.last = {}
+        self.inference_fps = {}
+        self.frame_fps = {}
+        self._clear = 0
+        self._settling = 0
+        self._entered = collections.deque()
+        self._started = collections.deque()
+        self._delays = []
+        self._busy = []
+        self._batches = 0
+        self._frames = collections.Counter()
+        self._inferred = collections.Counter()
+        self._previous = (time.monotonic(), collections.Counter(), collections.Counter())
+        self._lock = threading.Lock()
+        self._timer = None
+        entry = queue if queue is not None else pgie
+        entry.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, self._on_enter, self._entered)
+        pgie.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, self._on_enter, self._started)
+
+    def _on_enter(self, pad, info, entered):
+        with self._lock:
+            entered.append(time.monotonic())
+        return Gst.PadProbeReturn.OK
+
+    def record(self, detections):
+        """Account one batch leaving nvinfer (the BatchMetaReader view of it)."""
+        now = time.monotonic()
+        infer_done = detections.frame_infer_done
+        with self._lock:
+            if self._entered:
+                self._delays.append(now - self._entered.popleft())
+            if self._started:
+                started = self._started.popleft()
+                if infer_done.any():
+                    self._busy.append(now - started)
+            self._batches += 1
+            for source_id, inferred in zip(detections.frame_source_id.tolist(), infer_done.tolist()):
+                self._frames[source_id] += 1
+                if inferred:
+                    self._inferred[source_id] += 1
+
+    def _interval(self):
+        return self.gate.interval if self.gate else self.pgie.get_property("interval")
+
+    def _set_interval(self, skip):
+        if self.gate:
+            self.gate.interval = skip
+        elif self.enabled:
+            self.pgie.set_property("interval", skip)
+
+    def set_enabled(self, enabled):
+        """Skip every batch (inference off) or go back to the scheduled interval."""
+        self.enabled = enabled
+        if self.gate:
+            self.gate.set_enabled(enabled)
+        else:
+            self.pgie.set_property("interval", self.skip if enabled else skip_all_interval(self.pgie))
+
+    def inference_enabled(self):
+        if self.gate:
+            return self.gate.inference_enabled()
+        return self.pgie.get_property("interval") == self.skip
+
+    def start(self):
+        if self.skip != self._interval():
+            self._set_interval(self.skip)
+        self._timer = GLib.timeout_add(int(self.interval * 1000), self._tick)
+
+    def stop(self):
+        if self._timer is not None:
+            GLib.source_remove(self._timer)
+            self._timer = None
+        if self.changes:
+            print(f"Inference interval: {len(self.changes)} changes, ended at {self.skip}")
+
+    # -- measurement -------------------------------------------------------
+
+    def _fill(self):
+        if self.queue is None:
+            return 0.0
+        limit = self.queue.get_property("max-size-buffers")
+        level = self.queue.get_property("current-level-buffers")
+        return level / limit if limit else 0.0
+
+    def _measure(self):
+        now = time.monotonic()
+        with self._lock:
+            delays, self._delays = self._delays, []
+            # Batches still waiting count with their age so far
+            delays += [now - entered for entered in self._entered]
+            busy, self._busy = self._busy, []
+            batches, self._batches = self._batches, 0
+            frames, inferred = self._frames.copy(), self._inferred.copy()
+        then, old_frames, old_inferred = self._previous
+        self._previous = (now, frames, inferred)
+        elapsed = now - then
+        if elapsed > 0:
+            self.frame_fps = {source: (count - old_frames[source]) / elapsed
+                              for source, count in sorted(frames.items())}
+            self.inference_fps = {source: (count - old_inferred[source]) / elapsed
+                                  for source, count in sorted(inferred.items())}
+        latency = float(np.percentile(delays, 95)) if delays else 0.0
+        busy = float(np.mean(busy)) if busy else None
+        return latency, busy, batches / elapsed if elapsed > 0 else 0.0
+
+    # -- control -----------------------------------------------------------
+
+    def _tick(self):
+        latency, busy, batch_rate = self._measure()
+        if not self.enabled:
+            # Nothing to schedule while inference is switched off
+            self._clear = self._settling = 0
+            return True
+        fill = self._fill()
+        # Share of the time nvinfer would spend in the model at one skipped
+        # batch fewer: one batch in ``skip`` instead of one in ``skip + 1``
+        duty = busy * batch_rate / self.skip if busy is not None and self.skip else None
+        self.last = {"latency_ms": latency * 1000, "fill": fill,
+                     "busy_ms": busy * 1000 if busy is not None else None, "interval": self.skip}
+        overloaded = latency >= self.target or fill >= self.high_fill
+        clear = (latency <= self.target / 2 and fill <= self.low_fill
+                 and duty is not None and duty <= self.max_duty)
+        if self._settling:
+            self._settling -= 1
+            self._clear = 0
+        elif overloaded:
+            self._clear = 0
+            self._settling = self.settle
+            self._apply(min(self.max_interval, self.skip + 1),
+                        f"latency {latency * 1000:.0f} ms, queue {fill:.0%}")
+        elif clear:
+            self._clear += 1
+            if self._clear >= self.hold:
+                self._clear = 0
+                self._apply(max(self.min_interval, self.skip - 1), f"predicted duty {duty:.0%}")
+        else:
+            self._clear = 0
+        return True
+
+    def _apply(self, skip, reason):
+        if skip == self.skip:
+            return
+        # nvinfer reads the interval for every batch, so the next batch
+        # already follows the new value
+        self._set_interval(skip)
+        self.changes.append((time.monotonic(), self.skip, skip, reason))
+        print(f"Inference interval: {self.skip} -> {skip} ({reason})")
+        self.skip = skip
+
+    def stats(self):
+        return dict(self.last, interval=self.skip, enabled=self.enabled, min_interval=self.min_interval,
+                    max_interval=self.max_interval, target_ms=self.target * 1000,
+                    changes=len(self.changes),
+                    sources={source: {"frame_fps": fps, "inference_fps": self.inference_fps.get(source, 0.0)}
+                             for source, fps in self.frame_fps.items()})
@@ -0,0 +1,240 @@
+################################################################################
+# RTSP ingest profiles
+# Named settings for the rtspsrc that uridecodebin creates for rtsp:// URIs,
+# for uridecodebin's own buffering and for the video decoder:
+#
+#   legacy             what the scripts always did: uridecodebin
+#                      buffer-size=4096 and buffer-duration=500ms, rtspsrc
+#                      and decoder left at their defaults
+#   ultra-low-latency  no jitterbuffer latency, late packets dropped, UDP,
+#                      decoder low-latency mode without a DPB (cameras that
+#                      send B-frames need "lan" instead)
+#   lan                100ms jitterbuffer, late packets dropped, UDP with TCP
+#                      fallback
+#   wan                500ms jitterbuffer that never drops, TCP (interleaved)
+#                      so lossy links and NAT do not break the stream
+#
+# Decoder properties are only set on decoders that have them (nvv4l2decoder
+# on dGPU has low-latency-mode, on Jetson disable-dpb).
+#
+# IngestMeter measures what a profile achieves per source:
+#
+#   network  capture-to-depayload time, from the RTCP sender report NTP time
+#            rtspsrc attaches to each buffer (needs GStreamer 1.22 and a
+#            camera whose clock is NTP-synced with this host)
+#   decode   depayloader output to decoder output
+#   configured  the latency the pipeline reports for the live sources
+#
+# Scripts pick a profile with --ingest-profile, or DS_INGEST_PROFILE for the
+# ones without command line options.
+################################################################################
+
+import os
+import sys
+import time
+import threading
+import collections
+
+import numpy as np
+
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst, GLib
+
+INGEST_PROFILE_ENV = "DS_INGEST_PROFILE"
+NTP_EPOCH_OFFSET = 2208988800  # seconds from 1900-01-01 to 1970-01-01
+NTP_CAPS = "timestamp/x-ntp"
+
+IngestProfile = collections.namedtuple(
+    "IngestProfile",
+    "latency_ms drop_on_latency protocols buffer_mode buffer_size buffer_duration_ms decoder")
+
+# None leaves the element's own default
+PROFILES = {
+    "legacy": IngestProfile(None, None, None, None, 4096, 500, {}),
+    "ultra-low-latency": IngestProfile(0, True, "udp", "none", None, None,
+                                       {"low-latency-mode": True, "disable-dpb": True}),
+    "lan": IngestProfile(100, True, "udp+tcp", "auto", None, None, {}),
+    "wan": IngestProfile(500, False, "tcp", "auto", 4096, 500, {}),
+}
+
+
+def ingest_profile(value=None):
+    """The --ingest-profile value, else $DS_INGEST_PROFILE, else "legacy"."""
+    name = value or os.environ.get(INGEST_PROFILE_ENV) or "legacy"
+    if name not in PROFILES:
+        raise ValueError(f"unknown ingest profile {name!r}, expected one of {', '.join(PROFILES)}")
+    return name
+
+
+def _set(element, name, value):
+    """Set a property if the element has it; values go through the property's own parser."""
+    if value is None or element.find_property(name) is None:
+        return
+    if isinstance(value, str):
+        Gst.util_set_object_arg(element, name, value)
+    else:
+        element.set_property(name, value)
+
+
+def configure_rtspsrc(src, name):
+    profile = PROFILES[name]
+    _set(src, "latency", profile.latency_ms)
+    _set(src, "drop-on-latency", profile.drop_on_latency)
+    _set(src, "protocols", profile.protocols)
+    _set(src, "buffer-mode", profile.buffer_mode)
+
+
+def configure_decoder(decoder, name):
+    for key, value in PROFILES[name].decoder.items():
+        _set(decoder, key, value)
+
+
+def _is_decoder(element):
+    factory = element.get_factory()
+    return factory is not None and "Decoder/Video" in (factory.get_metadata("klass") or "")
+
+
+def configure_uridecodebin(uri_decode_bin, name):
+    """Apply profile ``name`` to a uridecodebin and the elements it creates."""
+    profile = PROFILES[name]
+    _set(uri_decode_bin, "buffer-size", profile.buffer_size)
+    if profile.buffer_duration_ms is not None:
+        _set(uri_decode_bin, "buffer-duration", profile.buffer_duration_ms * Gst.MSECOND)
+
+    def on_source_setup(bin, source):
+        if source.get_factory() and source.get_factory().get_name() == "rtspsrc":
+            configure_rtspsrc(source, name)
+
+    def on_element_added(bin, sub_bin, element):
+        if _is_decoder(element):
+            configure_decoder(element, name)
+
+    uri_decode_bin.connect("source-setup", on_source_setup)
+    if profile.decoder:
+        uri_decode_bin.connect("deep-element-added", on_element_added)
+
+
+class IngestMeter:
+    """Per-source network and decode latency of the RTSP sources in ``pipeline``.
+
+    Sources are told apart by the ``source-bin-NN`` bin they live in; elements
+    outside one count as source 0. Must be created before the pipeline starts
+    so rtspsrc can be asked for reference timestamps.
+    """
+
+    def __init__(self, pipeline, window=512):
+        self.pipeline = pipeline
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}  # (source, stage) -> deque of seconds
+        self._depayed = {}  # source -> OrderedDict pts -> perf_counter
+        self._ntp_caps = Gst.Caps.from_string(NTP_CAPS)
+        self._timer = None
+        pipeline.connect("deep-element-added", self._on_element_added)
+
+    @staticmethod
+    def _source_id(element):
+        parent = element.get_parent()
+        while parent is not None:
+            name = parent.get_name()
+            if name.startswith("source-bin-"):
+                return int(name.rsplit("-", 1)[1])
+            parent = parent.get_parent()
+        return 0
+
+    def _on_element_added(self, bin, sub_bin, element):
+        factory = element.get_factory()
+        if factory is None:
+            return
+        klass = factory.get_metadata("klass") or ""
+        if factory.get_name() == "rtspsrc":
+            _set(element, "add-reference-timestamp-meta", True)
+        elif "Depayloader" in klass:
+            element.get_static_pad("src").add_probe(
+                Gst.PadProbeType.BUFFER, self._on_depayed, self._source_id(element))
+        elif "Decoder/Video" in klass:
+            element.get_static_pad("src").add_probe(
+                Gst.PadProbeType.BUFFER, self._on_decoded, self._source_id(element))
+
+    def _on_depayed(self, pad, info, source_id):
+        buf = info.get_buffer()
+        now = time.perf_counter()
+        with self._lock:
+            pending = self._depayed.setdefault(source_id, collections.OrderedDict())
+            pending[buf.pts] = now
+            while len(pending) > 256:
+                pending.popitem(last=False)
+        meta = buf.get_reference_timestamp_meta(self._ntp_caps)
+        if meta is not None:
+            now_ntp = time.time() + NTP_EPOCH_OFFSET
+            self._record(source_id, "network", now_ntp - meta.timestamp / Gst.SECOND)
+        return Gst.PadProbeReturn.OK
+
+    def _on_decoded(self, pad, info, source_id):
+        buf = info.get_buffer()
+        now = time.perf_counter()
+        with self._lock:
+            depayed = self._depayed.get(source_id, {}).pop(buf.pts, None)
+        if depayed is not None:
+            self._record(source_id, "decode", now - depayed)
+        return Gst.PadProbeReturn.OK
+
+    def _record(self, source_id, stage, seconds):
+        with self._lock:
+            samples = self._samples.get((source_id, stage))
+            if samples is None:
+                samples = self._samples[(source_id, stage)] = collections.deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def configured_latency(self):
+        """(min, max) latency in ms the running pipeline reports, or None."""
+        query = Gst.Query.new_latency()
+        if not self.pipeline.query(query):
+            return None
+        live, min_latency, max_latency = query.parse_latency()
+        if not live:
+            return None
+        maximum = None if max_latency == Gst.CLOCK_TIME_NONE else max_latency / Gst.MSECOND
+        return min_latency / Gst.MSECOND, maximum
+
+    def snapshot(self):
+        """{source_id: {stage: {"count", "p50_ms", "p95_ms"}}} over the window."""
+        with self._lock:
+            copies = {key: np.array(samples) for key, samples in self._samples.items()}
+        result = {}
+        for (source_id, stage), values in sorted(copies.items()):
+            if not len(values):
+                continue
+            p50, p95 = np.percentile(values, (50, 95)) * 1000
+            result.setdefault(source_id, {})[stage] = {
+                "count": int(len(values)), "p50_ms": float(p50), "p95_ms": float(p95)}
+        return result
+
+    def format_report(self):
+        lines = []
+        configured = self.configured_latency()
+        if configured is not None:
+            maximum = "unbounded" if configured[1] is None else f"{configured[1]:.0f} ms"
+            lines.append(f"ingest: configured pipeline latency {configured[0]:.0f} ms (max {maximum})")
+        for source_id, stages in self.snapshot().items():
+            parts = [f"{stage} p50 {stats['p50_ms']:.1f} / p95 {stats['p95_ms']:.1f} ms"
+                     for stage, stats in stages.items()]
+            if "network" not in stages:
+                parts.append("network n/a (no RTCP NTP timestamps)")
+            lines.append(f"ingest: source {source_id}: " + ", ".join(parts))
+        return "\n".join(lines) if lines else "ingest: no samples yet"
+
+    def start(self, interval=10.0):
+        self._timer = GLib.timeout_add(int(interval * 1000), self._print_live)
+
+    def stop(self):
+        if self._timer is not None:
+            GLib.source_remove(self._timer)
+            self._timer = None
+        print(self.format_report())
+
+    def _print_live(self):
+        print(self.format_report())
+        sys.stdout.flush()
+        return True
@@ -0,0 +1,221 @@
+################################################################################
+# Per-stage latency tracer
+# Stamps every frame when it leaves its source (the buffer arriving on an
+# nvstreammux sink pad, or any pad given explicitly) and measures it again on
+# the src pad of every element downstream, ending at the sink's input. For
+# each source it keeps rolling samples of
+#
+#   <element>     time since the previous measured point
+#   end-to-end    time from the source pad to the sink
+#
+# and reports p50/p95/p99 on demand (snapshot()/format_report()), every
+# ``interval`` seconds while the pipeline runs, and once at shutdown.
+#
+# Frames are identified by (source_id, PTS). Batched buffers are split into
+# their frames through NvDsBatchMeta; buffers that lost the batch meta (the
+# encoder output) are mapped back through the last batch seen with that PTS.
+################################################################################
+
+import sys
+import json
+import time
+import threading
+import collections
+
+import numpy as np
+
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst, GLib
+
+END_TO_END = "end-to-end"
+PERCENTILES = (50, 95, 99)
+
+
+class _BoundedDict(collections.OrderedDict):
+    """Insertion-ordered dict that drops its oldest entries past ``limit``."""
+
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        while len(self) > self.limit:
+            self.popitem(last=False)
+
+
+class LatencyTracer:
+    """Per-source, per-stage latency histograms for a pipeline.
+
+    ``pyds_module`` is used to split batched buffers into frames; without it
+    every buffer is attributed to source 0 by PTS, which is exact for the
+    single-source scripts. ``window`` is the number of recent samples kept
+    per source and stage.
+    """
+
+    def __init__(self, pipeline, pyds_module=None, window=2048, interval=None,
+                 max_in_flight=4096):
+        self.pipeline = pipeline
+        self.pyds = pyds_module
+        self.window = window
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stamps = _BoundedDict(max_in_flight)     # (source, pts) -> source time
+        self._last_seen = _BoundedDict(max_in_flight)  # (source, pts) -> time at previous point
+        self._batches = _BoundedDict(256)               # batch pts -> [(source, pts)]
+        self._samples = {}  # (source, stage) -> deque of seconds
+        self._stages = []   # stage names in pipeline order
+        self._probed = set()    # element names
+        self._mux_pads = set()  # streammux sink pad names
+        self._timer = None
+
+    # -- setup -------------------------------------------------------------
+
+    def add_source_pad(self, source_id, pad):
+        """Stamp buffers passing ``pad`` as frames of ``source_id``."""
+        pad.add_probe(Gst.PadProbeType.BUFFER, self._on_source, source_id)
+
+    def trace_streammux(self, streammux):
+        """Stamp at every streammux sink pad, including ones requested later."""
+        for pad in streammux.iterate_sink_pads():
+            self._on_mux_pad(streammux, pad)
+        streammux.connect("pad-added", self._on_mux_pad)
+        streammux.connect("pad-removed", self._on_mux_pad_removed)
+        self.trace_from(streammux)
+
+    def _on_mux_pad(self, streammux, pad):
+        name = pad.get_name()
+        if pad.get_direction() != Gst.PadDirection.SINK or name in self._mux_pads:
+            return
+        self._mux_pads.add(name)
+        self.add_source_pad(int(name.rsplit("_", 1)[1]), pad)
+
+    def _on_mux_pad_removed(self, streammux, pad):
+        # A source that is re-added (or reconnected) gets a new sink_N pad
+        self._mux_pads.discard(pad.get_name())
+
+    def trace_from(self, element):
+        """Measure on ``element`` and every element downstream of it."""
+        queue = [element]
+        while queue:
+            element = queue.pop(0)
+            if element.get_name() in self._probed:
+                continue
+            self._probed.add(element.get_name())
+            src_pads = list(element.iterate_src_pads())
+            if not src_pads:
+                # A sink: its input is the end of the path
+                for pad in element.iterate_sink_pads():
+                    pad.add_probe(Gst.PadProbeType.BUFFER, self._on_stage,
+                                  (element.get_name(), True))
+                self._stages.append(element.get_name())
+                continue
+            self._stages.append(element.get_name())
+            for pad in src_pads:
+                pad.add_probe(Gst.PadProbeType.BUFFER, self._on_stage,
+                              (element.get_name(), False))
+                # Bins such as rtspclientsink are measured as one element
+                peer = pad.get_peer()
+                if peer is not None and peer.get_parent_element() is not None:
+                    queue.append(peer.get_parent_element())
+
+    def start(self):
+        if self.interval:
+            self._timer = GLib.timeout_add(int(self.interval * 1000), self._print_live)
+
+    def stop(self, report_path=None):
+        """Stop periodic output, print the final report and optionally save it as JSON."""
+        if self._timer is not None:
+            GLib.source_remove(self._timer)
+            self._timer = None
+        print(self.format_report())
+        if report_path:
+            with open(report_path, "w") as f:
+                json.dump(self.snapshot(), f, indent=2)
+
+    # -- probes ------------------------------------------------------------
+
+    def _frame_keys(self, buf):
+        """(source_id, pts) of every frame in ``buf``, and whether batch meta was found."""
+        if self.pyds is not None:
+            batch_meta = self.pyds.gst_buffer_get_nvds_batch_meta(hash(buf))
+            if batch_meta is not None:
+                keys = []
+                l_frame = batch_meta.frame_meta_list
+                while l_frame is not None:
+                    frame_meta = self.pyds.NvDsFrameMeta.cast(l_frame.data)
+                    keys.append((frame_meta.source_id, frame_meta.buf_pts))
+                    l_frame = l_frame.next
+                return keys, True
+        keys = self._batches.get(buf.pts)
+        if keys is not None:
+            return keys, False
+        return [(0, buf.pts)], False
+
+    def _on_source(self, pad, info, source_id):
+        buf = info.get_buffer()
+        now = time.perf_counter()
+        key = (source_id, buf.pts)
+        with self._lock:
+            self._stamps[key] = now
+            self._last_seen[key] = now
+        return Gst.PadProbeReturn.OK
+
+    def _on_stage(self, pad, info, data):
+        stage, final = data
+        buf = info.get_buffer()
+        now = time.perf_counter()
+        keys, batched = self._frame_keys(buf)
+        with self._lock:
+            if batched and keys:
+                self._batches[buf.pts] = keys
+            for key in keys:
+                previous = self._last_seen.get(key)
+                if previous is None:
+                    continue
+                self._record(key[0], stage, now - previous)
+                self._last_seen[key] = now
+                if final:
+                    start = self._stamps.get(key)
+                    if start is not None:
+                        self._record(key[0], END_TO_END, now - start)
+        return Gst.PadProbeReturn.OK
+
+    def _record(self, source_id, stage, seconds):
+        samples = self._samples.get((source_id, stage))
+        if samples is None:
+            samples = self._samples[(source_id, stage)] = collections.deque(maxlen=self.window)
+        samples.append(seconds)
+
+    # -- reporting ---------------------------------------------------------
+
+    def snapshot(self):
+        """{source_id: {stage: {"count", "p50_ms", "p95_ms", "p99_ms"}}} over the window."""
+        with self._lock:
+            copies = {key: np.fromiter(samples, dtype=np.float64, count=len(samples))
+                      for key, samples in self._samples.items()}
+        order = {stage: i for i, stage in enumerate(self._stages + [END_TO_END])}
+        result = {}
+        for (source_id, stage), values in sorted(
+                copies.items(), key=lambda item: (item[0][0], order.get(item[0][1], len(order)))):
+            if not len(values):
+                continue
+            p50, p95, p99 = np.percentile(values, PERCENTILES) * 1000
+            result.setdefault(source_id, {})[stage] = {
+                "count": int(len(values)), "p50_ms": float(p50),
+                "p95_ms": float(p95), "p99_ms": float(p99)}
+        return result
+
+    def format_report(self):
+        lines = ["latency (ms)        stage                      p50      p95      p99"]
+        for source_id, stages in self.snapshot().items():
+            for stage, stats in stages.items():
+                lines.append(f"source {source_id:<12} {stage:<24} {stats['p50_ms']:8.2f} "
+                             f"{stats['p95_ms']:8.2f} {stats['p99_ms']:8.2f}")
+        return "\n".join(lines)
+
+    def _print_live(self):
+        print(self.format_report())
+        sys.stdout.flush()
+        return True
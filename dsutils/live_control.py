@@ -0,0 +1,317 @@
+################################################################################
+# Live pipeline settings
+# Control socket commands that change a running pipeline without a restart:
+#
+#   set_bitrate kbps=3000               every registered encoder; with a
+#                                       BitrateController, its new ceiling
+#   set_resolution width=1280 height=720
+#   set_osd enabled=false               boxes and labels off/on
+#   set_inference enabled=false         skip every batch in nvinfer / resume
+#   settings                            current values
+#
+# Every change is made at a safe point: from an IDLE probe on the sink pad of
+# the element it touches, i.e. between two buffers, never while the element
+# is processing one. Handlers run on the main loop and must not block it, so
+# they return a dsutils.control.Deferred: the probe applies the change in
+# the streaming thread, the values are read back from the elements on the
+# main loop once every probe has run (for set_resolution, once the encoder
+# has received caps with the new size, polled from a main loop timer), and
+# only then does the caller get its reply, or an error.
+#
+# Inference is switched off through nvinfer's ``interval`` property, the
+# knob nvinfer actually reads for every batch: at its maximum no batch
+# reaches the model and buffers pass through with their metadata. When a
+# MotionGate or InferenceScheduler owns that property, the switch goes
+# through it so it does not write the old interval back.
+#
+# An encoder with a dsutils.abr.BitrateController gets its bitrate through
+# the controller's retarget(), right away rather than at a safe point (the
+# encoder may be blocked on a congested sink), so the next ABR step does not
+# undo the change.
+#
+# The output resolution is changed by the scaling capsfilter in front of each
+# encoder; the converter before it scales and the encoder renegotiates. The
+# muxer resolution stays as configured: nvstreammux cannot change its output
+# size while playing, and inference runs on that size.
+#
+#   python3 -m dsutils.control /tmp/ds.sock set_bitrate kbps=3000
+################################################################################
+
+import threading
+
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst, GLib
+
+from dsutils.control import Deferred
+from dsutils.encoder_cache import get_encoder_bitrate, set_encoder_bitrate
+from dsutils.infer_scheduler import skip_all_interval
+
+SAFE_POINT_TIMEOUT = 2.0   # seconds to wait for a pad to go idle
+NEGOTIATE_TIMEOUT = 5.0    # seconds to wait for new caps to reach an encoder
+NEGOTIATE_POLL_MS = 50
+OSD_PROPERTIES = ("display-bbox", "display-text", "display-mask")
+
+
+def at_safe_point(pad, apply, timeout=SAFE_POINT_TIMEOUT):
+    """Run ``apply()`` while no buffer is passing ``pad``; returns a Deferred of its result.
+
+    The IDLE probe runs right away when the pad is idle, otherwise in the
+    streaming thread as soon as the current buffer has been pushed. Nobody
+    waits for it: when the pad has not gone idle within ``timeout``, a main
+    loop timer removes the probe and rejects the Deferred.
+    """
+    deferred = Deferred()
+    lock = threading.Lock()
+
+    def on_idle(pad, info):
+        with lock:
+            if not deferred.settled:
+                try:
+                    deferred.resolve(apply())
+                except Exception as e:
+                    deferred.reject(e)
+        return Gst.PadProbeReturn.REMOVE
+
+    probe = pad.add_probe(Gst.PadProbeType.IDLE, on_idle)
+
+    def on_timeout():
+        with lock:
+            if deferred.reject(RuntimeError(f"{pad.get_parent_element().get_name()} did not reach "
+                                            f"a safe point within {timeout:.0f}s")):
+                pad.remove_probe(probe)
+        return False
+
+    if not deferred.settled:
+        GLib.timeout_add(int(timeout * 1000), on_timeout)
+    return deferred
+
+
+def when_all(deferreds, finish):
+    """A Deferred of ``finish()``, run on the main loop once all ``deferreds`` succeeded.
+
+    It is rejected with the first error instead; changes the other steps
+    already made stay in place.
+    """
+    result = Deferred()
+    pending = [len(deferreds)]
+    lock = threading.Lock()
+
+    def run_finish():
+        try:
+            result.resolve(finish())
+        except Exception as e:
+            result.reject(e)
+        return False
+
+    def on_done(deferred):
+        if deferred.error is not None:
+            result.reject(deferred.error)
+            return
+        with lock:
+            pending[0] -= 1
+            last = pending[0] == 0
+        if last:
+            GLib.idle_add(run_finish)
+
+    if not deferreds:
+        GLib.idle_add(run_finish)
+    for deferred in deferreds:
+        deferred.add_done_callback(on_done)
+    return result
+
+
+def _mutable_in_playing(element, name):
+    spec = element.find_property(name)
+    return spec is not None and bool(spec.flags & Gst.PARAM_MUTABLE_PLAYING)
+
+
+class LiveControl:
+    """The encoders, scalers, OSDs and inference elements a control socket may change."""
+
+    def __init__(self, timeout=SAFE_POINT_TIMEOUT):
+        self.timeout = timeout
+        self._encoders = []   # (encoder, capsfilter or None, [caps structure, ...])
+        self._osds = []       # (osd, {property: value when enabled})
+        self._inference = []  # (nvinfer, interval owner or None, interval when enabled)
+        self._bitrate_owners = {}  # encoder name -> BitrateController
+        self.osd_enabled = True
+        self.inference_enabled = True
+        self.resolution = None
+
+    def add_encoder(self, encoder, capsfilter=None, caps=("video/x-raw(memory:NVMM)",)):
+        """Register ``encoder``; ``capsfilter`` in front of it is used for resolution changes.
+
+        ``caps`` are the caps structures the capsfilter must keep (memory
+        type, format); width and height are added to each.
+        """
+        self._encoders.append((encoder, capsfilter, list(caps)))
+
+    def add_bitrate_controller(self, controller):
+        """Route set_bitrate for ``controller.encoder`` through the controller."""
+        self._bitrate_owners[controller.encoder.get_name()] = controller
+
+    def add_osd(self, osd):
+        enabled = {name: osd.get_property(name) for name in OSD_PROPERTIES
+                   if osd.find_property(name) is not None}
+        self._osds.append((osd, enabled))
+
+    def add_inference(self, element, owner=None):
+        """Register nvinfer/nvinferserver ``element``.
+
+        ``owner`` is the MotionGate or InferenceScheduler that sets the
+        element's interval, if any; inference is then switched through its
+        set_enabled().
+        """
+        self._inference.append([element, owner, element.get_property("interval")])
+
+    def register(self, control_server):
+        control_server.register("set_bitrate", self.set_bitrate)
+        control_server.register("set_resolution", self.set_resolution)
+        control_server.register("set_osd", self.set_osd)
+        control_server.register("set_inference", self.set_inference)
+        control_server.register("settings", self.settings)
+
+    # -- commands ----------------------------------------------------------
+
+    def set_bitrate(self, kbps):
+        if not self._encoders:
+            raise RuntimeError("this pipeline has no encoder")
+        kbps = int(kbps)
+        if kbps <= 0:
+            raise ValueError("kbps must be positive")
+        for encoder, _, _ in self._encoders:
+            if not _mutable_in_playing(encoder, "bitrate"):
+                raise RuntimeError(f"{encoder.get_factory().get_name()} cannot change bitrate while playing")
+        steps = []
+        for encoder, _, _ in self._encoders:
+            owner = self._bitrate_owners.get(encoder.get_name())
+            if owner is not None:
+                owner.retarget(kbps)
+                continue
+            steps.append(at_safe_point(encoder.get_static_pad("sink"),
+                                       lambda encoder=encoder: set_encoder_bitrate(encoder, kbps), self.timeout))
+        return when_all(steps, lambda: {encoder.get_name(): get_encoder_bitrate(encoder)
+                                        for encoder, _, _ in self._encoders})
+
+    def set_resolution(self, width, height):
+        scalers = [(encoder, capsfilter, caps) for encoder, capsfilter, caps in self._encoders if capsfilter]
+        if not scalers:
+            raise RuntimeError("this pipeline has no scaler in front of its encoders")
+        width, height = int(width), int(height)
+        if width <= 0 or height <= 0 or width % 2 or height % 2:
+            raise ValueError("width and height must be positive and even")
+        negotiated = {}
+        steps = []
+        for encoder, capsfilter, caps in scalers:
+            negotiated[encoder.get_name()] = self._expect_caps(encoder.get_static_pad("sink"), width, height)
+            new_caps = Gst.Caps.from_string(
+                "; ".join(f"{structure}, width=(int){width}, height=(int){height}" for structure in caps))
+            steps.append(at_safe_point(capsfilter.get_static_pad("sink"),
+                                       lambda capsfilter=capsfilter, new_caps=new_caps:
+                                       capsfilter.set_property("caps", new_caps), self.timeout))
+        result = Deferred()
+
+        def on_applied(applied):
+            if applied.error is not None:
+                for pad, probe, seen in negotiated.values():
+                    if not seen.is_set():
+                        pad.remove_probe(probe)
+                result.reject(applied.error)
+                return
+            self.resolution = (width, height)
+            # Confirm once the encoders have renegotiated; False means the new
+            # size is set but no frame has carried it to the encoder yet
+            GLib.timeout_add(NEGOTIATE_POLL_MS, poll, GLib.get_monotonic_time() + int(NEGOTIATE_TIMEOUT * 1e6))
+
+        def poll(deadline):
+            done = all(seen.is_set() for _, _, seen in negotiated.values())
+            if not done and GLib.get_monotonic_time() < deadline:
+                return True
+            for pad, probe, seen in negotiated.values():
+                if not seen.is_set():
+                    pad.remove_probe(probe)
+            result.resolve({name: {"width": width, "height": height, "negotiated": seen.is_set()}
+                            for name, (_, _, seen) in negotiated.items()})
+            return False
+
+        when_all(steps, lambda: None).add_done_callback(on_applied)
+        return result
+
+    def _expect_caps(self, pad, width, height):
+        """(pad, probe id, Event set when a caps event with ``width``x``height`` passes ``pad``)."""
+        seen = threading.Event()
+
+        def on_event(pad, info):
+            event = info.get_event()
+            if event.type == Gst.EventType.CAPS:
+                structure = event.parse_caps().get_structure(0)
+                if structure.get_value("width") == width and structure.get_value("height") == height:
+                    seen.set()
+                    return Gst.PadProbeReturn.REMOVE
+            return Gst.PadProbeReturn.OK
+
+        return pad, pad.add_probe(Gst.PadProbeType.EVENT_DOWNSTREAM, on_event), seen
+
+    def set_osd(self, enabled):
+        if not self._osds:
+            raise RuntimeError("this pipeline has no OSD")
+        enabled = bool(enabled)
+        steps = []
+        for osd, on_values in self._osds:
+            def apply(osd=osd, on_values=on_values):
+                for name, value in on_values.items():
+                    osd.set_property(name, value if enabled else False)
+            steps.append(at_safe_point(osd.get_static_pad("sink"), apply, self.timeout))
+
+        def finish():
+            self.osd_enabled = enabled
+            return {osd.get_name(): {name: osd.get_property(name) for name in on_values}
+                    for osd, on_values in self._osds}
+        return when_all(steps, finish)
+
+    def set_inference(self, enabled):
+        if not self._inference:
+            raise RuntimeError("this pipeline has no inference element")
+        enabled = bool(enabled)
+        for element, _, _ in self._inference:
+            if element.find_property("input-tensor-meta") and element.get_property("input-tensor-meta"):
+                raise RuntimeError(f"{element.get_name()} infers on preprocessed tensors and ignores "
+                                   "its interval; inference cannot be switched off")
+        steps = []
+        for entry in self._inference:
+            element, owner, _ = entry
+            if owner is not None:
+                # The owner writes the interval itself, from the next batch on
+                owner.set_enabled(enabled)
+                continue
+
+            def apply(entry=entry):
+                element, _, interval = entry
+                off = skip_all_interval(element)
+                if not enabled and element.get_property("interval") < off:
+                    # Resume at the interval it had when it was switched off
+                    entry[2] = element.get_property("interval")
+                element.set_property("interval", interval if enabled else skip_all_interval(element))
+            steps.append(at_safe_point(element.get_static_pad("sink"), apply, self.timeout))
+
+        def finish():
+            self.inference_enabled = enabled
+            return {element.get_name(): self._inference_state(element, owner)
+                    for element, owner, _ in self._inference}
+        return when_all(steps, finish)
+
+    @staticmethod
+    def _inference_state(element, owner):
+        if owner is not None:
+            return owner.inference_enabled()
+        return element.get_property("interval") < skip_all_interval(element)
+
+    def settings(self):
+        return {
+            "bitrate_kbps": {encoder.get_name(): get_encoder_bitrate(encoder) for encoder, _, _ in self._encoders},
+            "resolution": list(self.resolution) if self.resolution else None,
+            "osd": self.osd_enabled if self._osds else None,
+            "inference": ({element.get_name(): self._inference_state(element, owner)
+                           for element, owner, _ in self._inference} if self._inference else None),
+        }
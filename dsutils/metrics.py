@@ -0,0 +1,433 @@
+################################################################################
+# Prometheus metrics endpoint
+# Serves GET /metrics in the Prometheus text format from a daemon thread:
+#
+#   ds_source_frames_in_total{source}      frames entering the pipeline
+#   ds_source_frames_out_total{source}     frames reaching the output stage
+#   ds_source_frames_dropped_total{source} frames missing from the PTS sequence
+#   ds_source_frames_late_total{source}    frames arriving more than
+#                                          late_threshold behind their PTS
+#   ds_source_input_fps / output_fps / detections_per_second {source}
+#   ds_source_detections_total{source}
+#   ds_encoder_bytes_total{encoder} and ds_encoder_bitrate_kbps{encoder}
+#   ds_queue_level_buffers{queue}
+#   ds_pipeline_state, ds_pipeline_state_transitions_total{from,to}
+#   ds_bus_messages_total{type}            errors, warnings and QoS reports
+#   ds_source_up / reconnects_total / last_recovery_seconds {source}
+#                                          with a SourceSupervisor
+#   ds_inference_interval, ds_source_inference_fps{source}
+#                                          with an InferenceScheduler
+#   ds_source_carried_objects_total{source} with a DetectionCarry
+#   ds_motion_gate_batches_total{decision}, ds_motion_gate_frames_total
+#   {source,decision}, ds_motion_gate_saved_seconds_total with a MotionGate
+#   ds_source_objects{source,class,window}, ds_source_objects_by_class_total
+#   {source,class}                         with an ObjectCounter
+#
+# Pad probes only add to per-thread counter shards; nothing on the streaming
+# path takes a lock that the scraper holds. Rates are computed by a sampler
+# thread over a sliding window.
+#
+# Scripts enable it with --metrics-port, or DS_METRICS_PORT for the ones
+# without command line options.
+################################################################################
+
+import os
+import time
+import threading
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+METRICS_PORT_ENV = "DS_METRICS_PORT"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LAG_BASELINE_CREEP = 1e-4  # seconds per frame
+
+
+def metrics_port(value=None):
+    """The --metrics-port value, else $DS_METRICS_PORT, else None (disabled)."""
+    if value:
+        return value
+    env = os.environ.get(METRICS_PORT_ENV)
+    return int(env) if env else None
+
+
+class ShardedCounter:
+    """Counter keyed by a label tuple, written without locks.
+
+    Each writing thread gets its own dict; ``inc`` touches only that dict.
+    The lock is taken once per thread to register its shard and when a
+    reader copies the shard list.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, key, amount=1):
+        shard = self._shard()
+        shard[key] = shard.get(key, 0) + amount
+
+    def values(self):
+        """Sum over all shards."""
+        with self._lock:
+            shards = list(self._shards)
+        totals = collections.defaultdict(int)
+        for shard in shards:
+            for key, value in list(shard.items()):
+                totals[key] += value
+        return dict(totals)
+
+
+class _SourceTiming:
+    __slots__ = ("last_pts", "interval", "baseline_lag")
+
+    def __init__(self):
+        self.last_pts = None
+        self.interval = None  # EWMA of PTS steps, ns
+        self.baseline_lag = None  # smallest arrival-minus-PTS seen, seconds
+
+
+class PipelineMetrics:
+    """Collects the metrics above for one pipeline and serves them."""
+
+    def __init__(self, pipeline, pyds_module=None, window=10.0, late_threshold=0.2):
+        self.pipeline = pipeline
+        self.pyds = pyds_module
+        self.window = window
+        self.late_threshold = late_threshold
+        self.frames_in = ShardedCounter()
+        self.frames_out = ShardedCounter()
+        self.dropped = ShardedCounter()
+        self.late = ShardedCounter()
+        self.detections = ShardedCounter()
+        self.encoder_bytes = ShardedCounter()
+        self.bus_messages = ShardedCounter()
+        self.transitions = ShardedCounter()
+        self.state = Gst.State.NULL
+        self._timing = {}  # source -> _SourceTiming, only touched by that source's thread
+        self._queues = []
+        self._history = collections.deque()  # (time, {metric: {key: value}})
+        self._server = None
+        self._sampler = None
+        self._stop = threading.Event()
+        self._probed = set()
+        self._supervisor = None
+        self._scheduler = None
+        self._carry = None
+        self._gate = None
+        self._counter = None
+        self._class_names = None
+
+    # -- probes ------------------------------------------------------------
+
+    def watch_input(self, pad, source_id):
+        """Count frames of ``source_id`` passing ``pad`` as pipeline input."""
+        pad.add_probe(Gst.PadProbeType.BUFFER, self._on_input, source_id)
+
+    def watch_streammux(self, streammux):
+        """Count input on every streammux sink pad, including later ones."""
+        for pad in streammux.iterate_sink_pads():
+            self._on_mux_pad(streammux, pad)
+        streammux.connect("pad-added", self._on_mux_pad)
+        streammux.connect("pad-removed", self._on_mux_pad_removed)
+
+    def _on_mux_pad(self, streammux, pad):
+        name = pad.get_name()
+        if pad.get_direction() != Gst.PadDirection.SINK or name in self._probed:
+            return
+        self._probed.add(name)
+        self.watch_input(pad, int(name.rsplit("_", 1)[1]))
+
+    def _on_mux_pad_removed(self, streammux, pad):
+        # A source that is re-added (or reconnected) gets a new sink_N pad
+        self._probed.discard(pad.get_name())
+
+    def watch_output(self, pad, source_id=None):
+        """Count frames passing ``pad`` as output.
+
+        Batched buffers are split per source through NvDsBatchMeta when pyds
+        was given and ``source_id`` is None.
+        """
+        pad.add_probe(Gst.PadProbeType.BUFFER, self._on_output, source_id)
+
+    def watch_encoder(self, encoder):
+        """Count the bytes ``encoder`` produces."""
+        encoder.get_static_pad("src").add_probe(
+            Gst.PadProbeType.BUFFER, self._on_encoded, encoder.get_name())
+
+    def watch_queues(self):
+        """Export the fill level of every queue element in the pipeline."""
+        iterator = self.pipeline.iterate_recurse()
+        while True:
+            result, element = iterator.next()
+            if result != Gst.IteratorResult.OK:
+                break
+            factory = element.get_factory()
+            if factory is not None and factory.get_name() == "queue":
+                self._queues.append(element)
+
+    def watch_supervisor(self, supervisor):
+        """Export reconnection state from a dsutils.supervisor.SourceSupervisor."""
+        self._supervisor = supervisor
+
+    def watch_inference_scheduler(self, scheduler):
+        """Export the interval and inference rates of a dsutils.infer_scheduler.InferenceScheduler."""
+        self._scheduler = scheduler
+
+    def watch_detection_carry(self, carry):
+        """Export the objects a dsutils.carry_forward.DetectionCarry attached."""
+        self._carry = carry
+
+    def watch_motion_gate(self, gate):
+        """Export the decisions of a dsutils.motion_gate.MotionGate."""
+        self._gate = gate
+
+    def watch_object_counter(self, counter, class_names=None):
+        """Export the per-class counts of a dsutils.counting.ObjectCounter."""
+        self._counter = counter
+        self._class_names = class_names
+
+    def add_detections(self, detections):
+        """Count the objects of a dsutils.batch_meta.BatchDetections."""
+        if not detections.num_objects:
+            return
+        counts = np.bincount(detections.source_id)
+        for source_id in np.flatnonzero(counts):
+            self.detections.inc(int(source_id), int(counts[source_id]))
+
+    def _on_input(self, pad, info, source_id):
+        buf = info.get_buffer()
+        self.frames_in.inc(source_id)
+        pts = buf.pts
+        if pts == Gst.CLOCK_TIME_NONE:
+            return Gst.PadProbeReturn.OK
+        timing = self._timing.get(source_id)
+        if timing is None:
+            timing = self._timing[source_id] = _SourceTiming()
+        if timing.last_pts is not None:
+            step = pts - timing.last_pts
+            if step <= 0:
+                # Timestamps restarted (reconnect, seek): start over
+                timing.interval = None
+                timing.baseline_lag = None
+            elif timing.interval is None:
+                timing.interval = step
+            else:
+                missing = round(step / timing.interval) - 1
+                if missing > 0:
+                    self.dropped.inc(source_id, missing)
+                else:
+                    timing.interval += (step - timing.interval) / 16
+        timing.last_pts = pts
+
+        # Lateness is measured against the smallest lag seen; the baseline
+        # creeps up slowly so clock drift and lasting delay changes are absorbed
+        lag = time.monotonic() - pts / Gst.SECOND
+        if timing.baseline_lag is None or lag < timing.baseline_lag:
+            timing.baseline_lag = lag
+        else:
+            timing.baseline_lag += LAG_BASELINE_CREEP
+            if lag - timing.baseline_lag > self.late_threshold:
+                self.late.inc(source_id)
+        return Gst.PadProbeReturn.OK
+
+    def _on_output(self, pad, info, source_id):
+        if source_id is not None or self.pyds is None:
+            self.frames_out.inc(source_id or 0)
+            return Gst.PadProbeReturn.OK
+        batch_meta = self.pyds.gst_buffer_get_nvds_batch_meta(hash(info.get_buffer()))
+        if batch_meta is None:
+            self.frames_out.inc(0)
+            return Gst.PadProbeReturn.OK
+        l_frame = batch_meta.frame_meta_list
+        while l_frame is not None:
+            self.frames_out.inc(self.pyds.NvDsFrameMeta.cast(l_frame.data).source_id)
+            l_frame = l_frame.next
+        return Gst.PadProbeReturn.OK
+
+    def _on_encoded(self, pad, info, name):
+        self.encoder_bytes.inc(name, info.get_buffer().get_size())
+        return Gst.PadProbeReturn.OK
+
+    def on_bus_message(self, bus, message):
+        """Bus "message" handler; connect it next to the script's bus_call."""
+        t = message.type
+        if t == Gst.MessageType.STATE_CHANGED and message.src == self.pipeline:
+            old, new, _ = message.parse_state_changed()
+            self.state = new
+            self.transitions.inc((old.value_nick, new.value_nick))
+        elif t == Gst.MessageType.ERROR:
+            self.bus_messages.inc("error")
+        elif t == Gst.MessageType.WARNING:
+            self.bus_messages.inc("warning")
+        elif t == Gst.MessageType.QOS:
+            self.bus_messages.inc("qos")
+        elif t == Gst.MessageType.EOS:
+            self.bus_messages.inc("eos")
+        return True
+
+    # -- exposition --------------------------------------------------------
+
+    def _totals(self):
+        return {
+            "in": self.frames_in.values(),
+            "out": self.frames_out.values(),
+            "detections": self.detections.values(),
+            "bytes": self.encoder_bytes.values(),
+        }
+
+    def _sample(self):
+        while not self._stop.wait(1.0):
+            now = time.monotonic()
+            self._history.append((now, self._totals()))
+            while self._history and now - self._history[0][0] > self.window:
+                self._history.popleft()
+
+    def _rates(self, current, now):
+        if not self._history:
+            return {}
+        then, old = self._history[0]
+        elapsed = now - then
+        if elapsed <= 0:
+            return {}
+        return {name: {key: (value - old[name].get(key, 0)) / elapsed
+                       for key, value in values.items()}
+                for name, values in current.items()}
+
+    def render(self):
+        """The metrics in Prometheus text format."""
+        now = time.monotonic()
+        totals = self._totals()
+        rates = self._rates(totals, now)
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        def per_source(values):
+            return [((("source", key),), value) for key, value in sorted(values.items())]
+
+        family("ds_source_frames_in_total", "counter", "Frames entering the pipeline.",
+               per_source(totals["in"]))
+        family("ds_source_frames_out_total", "counter", "Frames reaching the output stage.",
+               per_source(totals["out"]))
+        family("ds_source_frames_dropped_total", "counter",
+               "Frames missing from the input PTS sequence.", per_source(self.dropped.values()))
+        family("ds_source_frames_late_total", "counter",
+               "Frames arriving late relative to their PTS.", per_source(self.late.values()))
+        family("ds_source_detections_total", "counter", "Objects detected.",
+               per_source(totals["detections"]))
+        family("ds_source_input_fps", "gauge", "Input frame rate over the sampling window.",
+               per_source(rates.get("in", {})))
+        family("ds_source_output_fps", "gauge", "Output frame rate over the sampling window.",
+               per_source(rates.get("out", {})))
+        family("ds_source_detections_per_second", "gauge", "Detection rate over the sampling window.",
+               per_source(rates.get("detections", {})))
+        family("ds_encoder_bytes_total", "counter", "Encoded bytes produced.",
+               [((("encoder", k),), v) for k, v in sorted(totals["bytes"].items())])
+        family("ds_encoder_bitrate_kbps", "gauge", "Encoder output bitrate over the sampling window.",
+               [((("encoder", k),), v * 8 / 1000) for k, v in sorted(rates.get("bytes", {}).items())])
+        family("ds_queue_level_buffers", "gauge", "Buffers waiting in each queue.",
+               [((("queue", q.get_name()),), q.get_property("current-level-buffers"))
+                for q in self._queues])
+        family("ds_pipeline_state", "gauge", "Current pipeline state (1=NULL .. 4=PLAYING).",
+               [((), int(self.state))])
+        family("ds_pipeline_state_transitions_total", "counter", "Pipeline state changes.",
+               [((("from", old), ("to", new)), v)
+                for (old, new), v in sorted(self.transitions.values().items())])
+        family("ds_bus_messages_total", "counter", "Bus messages by type.",
+               [((("type", k),), v) for k, v in sorted(self.bus_messages.values().items())])
+        if self._supervisor is not None:
+            health = self._supervisor.stats()
+            family("ds_source_up", "gauge", "1 while the source delivers its own frames.",
+                   [((("source", i),), int(h["state"] == "up")) for i, h in health.items()])
+            family("ds_source_reconnects_total", "counter", "Successful source reconnections.",
+                   [((("source", i),), h["reconnects"]) for i, h in health.items()])
+            family("ds_source_last_recovery_seconds", "gauge",
+                   "Time from the last source failure to its first frame after reconnecting.",
+                   [((("source", i),), h["last_recovery_s"]) for i, h in health.items()
+                    if h["last_recovery_s"] is not None])
+        if self._scheduler is not None:
+            scheduler = self._scheduler
+            family("ds_inference_interval", "gauge", "Batches nvinfer skips between inferred batches.",
+                   [((), scheduler.skip)])
+            family("ds_source_inference_fps", "gauge", "Frames per second the detector ran on.",
+                   per_source(scheduler.inference_fps))
+        if self._carry is not None:
+            family("ds_source_carried_objects_total", "counter",
+                   "Objects carried forward onto frames the detector skipped.",
+                   per_source(dict(self._carry.carried)))
+        if self._gate is not None:
+            gate = self._gate
+            family("ds_motion_gate_batches_total", "counter", "Batches the motion gate let through or skipped.",
+                   [((("decision", k),), v) for k, v in sorted(dict(gate.batches).items())])
+            family("ds_motion_gate_frames_total", "counter", "Motion gate decisions per frame.",
+                   [((("source", source), ("decision", decision)), count)
+                    for source, counts in sorted(gate.detector.decisions.items())
+                    for decision, count in sorted(counts.items())])
+            family("ds_motion_gate_saved_seconds_total", "counter",
+                   "Estimated nvinfer time saved by skipped batches.", [((), gate.saved_seconds())])
+        if self._counter is not None:
+            counts = self._counter.snapshot(self._class_names)
+            family("ds_source_objects", "gauge", "Objects detected per class over each rolling window.",
+                   [((("source", source), ("class", name), ("window", window)), value)
+                    for source, c in sorted(counts.items())
+                    for window, per_class in c["windows"].items()
+                    for name, value in per_class.items()])
+            family("ds_source_objects_by_class_total", "counter", "Objects detected per class.",
+                   [((("source", source), ("class", name)), value)
+                    for source, c in sorted(counts.items())
+                    for name, value in c["total"].items()])
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """Start the HTTP endpoint and the rate sampler."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-http",
+                         daemon=True).start()
+        self._sampler = threading.Thread(target=self._sample, name="metrics-sampler", daemon=True)
+        self._sampler.start()
+        print(f"Metrics at http://{host}:{port}/metrics")
+
+    def stop(self):
+        self._stop.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
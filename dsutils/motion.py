@@ -0,0 +1,91 @@
+################################################################################
+# Frame differencing for motion-gated inference
+# MotionDetector works on the CPU with NumPy only. Each frame is reduced to
+# one channel sampled every ``step`` pixels (about ``width`` columns wide, a
+# strided view, so only the sampled pixels are read) and compared with the
+# reduced frame the detector last ran on for the same source:
+#
+#   changed = share of sampled pixels that moved by more than pixel_threshold
+#
+# A batch needs inference when any of its frames is
+#
+#   new      no reference yet for the source
+#   refresh  ``refresh`` frames have passed since the last inference
+#   motion   changed >= threshold
+#
+# and is static otherwise. References only move when the detector actually
+# ran (commit()), so a slow change accumulates until it crosses the
+# threshold instead of slipping through frame by frame.
+################################################################################
+
+import collections
+
+import numpy as np
+
+DECISIONS = ("new", "refresh", "motion", "static")
+GATE_WIDTH = 160          # columns of the reduced frame
+PIXEL_THRESHOLD = 20      # 8-bit levels a sampled pixel must change by
+DEFAULT_THRESHOLD = 0.002 # share of changed pixels that counts as motion
+REFRESH_FRAMES = 300
+
+
+class MotionDetector:
+    """Per-source reference frames and gate decisions."""
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, pixel_threshold=PIXEL_THRESHOLD,
+                 width=GATE_WIDTH, refresh=REFRESH_FRAMES, channel=1):
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.width = width
+        self.refresh = refresh
+        self.channel = channel
+        self.decisions = collections.defaultdict(collections.Counter)  # source -> decision -> frames
+        self.changed = {}  # source -> changed share of its latest frame
+        self._reference = {}
+        self._since = {}
+
+    def reduce(self, image):
+        """One channel of ``image`` (H x W x C) sampled down to about ``width`` columns."""
+        step = max(1, image.shape[1] // self.width)
+        return image[::step, ::step, self.channel].astype(np.int16)
+
+    def _decide(self, source_id, small):
+        reference = self._reference.get(source_id)
+        if reference is None or reference.shape != small.shape:
+            return "new"
+        changed = np.count_nonzero(np.abs(small - reference) > self.pixel_threshold) / small.size
+        self.changed[source_id] = changed
+        if changed >= self.threshold:
+            return "motion"
+        if self._since.get(source_id, 0) >= self.refresh:
+            return "refresh"
+        return "static"
+
+    def decide(self, frames):
+        """Gate one batch of ``(source_id, image)``.
+
+        Returns whether the batch needs inference and the reduced frames to
+        hand to commit() once it is known whether the detector ran.
+        """
+        reduced = []
+        infer = False
+        for source_id, image in frames:
+            small = self.reduce(image)
+            decision = self._decide(source_id, small)
+            self.decisions[source_id][decision] += 1
+            infer = infer or decision != "static"
+            reduced.append((source_id, small))
+        return infer, reduced
+
+    def commit(self, reduced, inferred):
+        """Record whether the detector ran on the frames decide() returned."""
+        for source_id, small in reduced:
+            if inferred:
+                self._reference[source_id] = small
+                self._since[source_id] = 0
+            else:
+                self._since[source_id] = self._since.get(source_id, 0) + 1
+
+    def stats(self):
+        return {source: dict(counts, changed=self.changed.get(source))
+                for source, counts in sorted(self.decisions.items())}
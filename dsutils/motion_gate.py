@@ -0,0 +1,153 @@
+################################################################################
+# Motion-gated primary inference
+# Cameras watching an empty scene still cost one model run per frame.
+# MotionGate looks at every batch on its way into nvinfer: each frame is
+# mapped to the CPU (get_nvds_buf_surface, which needs RGBA surfaces in
+# CUDA unified memory on dGPU; see create_gate_converter) and checked by a
+# dsutils.motion.MotionDetector. When no frame of the batch changed, nvinfer
+# is told to skip it: its ``interval`` is raised to the maximum for that one
+# batch, which makes nvinfer pass the batch on without running the model,
+# in order and with bInferDone unset. Batches with motion run under the
+# normal interval (``interval``, which an InferenceScheduler may move).
+#
+# Skipped frames reuse the previous results through dsutils.carry_forward;
+# for an empty scene that is no objects at all. The gate counts its
+# decisions per source and estimates the GPU time saved as skipped batches
+# times the mean time nvinfer took on the batches it did run. With
+# set_enabled(False) (the control socket's set_inference) every batch is
+# skipped without looking at it.
+################################################################################
+
+import time
+import threading
+import collections
+
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+from dsutils.infer_scheduler import skip_all_interval
+from dsutils.motion import MotionDetector
+
+# NVBUF_MEM_CUDA_UNIFIED: surfaces the CPU can map on dGPU
+CUDA_UNIFIED_MEMORY = 3
+GATE_CAPS = "video/x-raw(memory:NVMM), format=RGBA"
+
+
+def create_gate_converter(integrated_gpu=False):
+    """nvvideoconvert + capsfilter giving nvinfer RGBA batches the CPU can read."""
+    converter = Gst.ElementFactory.make("nvvideoconvert", "gate-convert")
+    capsfilter = Gst.ElementFactory.make("capsfilter", "gate-caps")
+    if not converter or not capsfilter:
+        return None
+    if not integrated_gpu:
+        converter.set_property("nvbuf-memory-type", CUDA_UNIFIED_MEMORY)
+    capsfilter.set_property("caps", Gst.Caps.from_string(GATE_CAPS))
+    return converter, capsfilter
+
+
+class MotionGate:
+    """Skips nvinfer on batches in which nothing moved.
+
+    The pgie src pad probe must pass every batch to ``record()`` so the
+    gate learns which batches nvinfer actually ran on.
+    """
+
+    def __init__(self, pgie, pyds_module, detector=None, integrated_gpu=False):
+        self.pgie = pgie
+        self.pyds = pyds_module
+        self.detector = detector or MotionDetector()
+        self.integrated_gpu = integrated_gpu
+        self.interval = pgie.get_property("interval")
+        self.enabled = True
+        self._skip_interval = skip_all_interval(pgie)
+        self._current = self.interval
+        self.batches = collections.Counter()  # "infer" / "skip" as decided by the gate, "off"
+        self.inferred = 0
+        self.busy = 0.0
+        self._pending = collections.deque()
+        self._lock = threading.Lock()
+        pgie.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER, self._on_batch)
+
+    def _on_batch(self, pad, info):
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            return Gst.PadProbeReturn.OK
+        if not self.enabled:
+            # Inference switched off: skip without looking at the frames
+            self._apply(self._skip_interval)
+            with self._lock:
+                self.batches["off"] += 1
+                self._pending.append((time.monotonic(), None))
+            return Gst.PadProbeReturn.OK
+        pyds = self.pyds
+        batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
+        frames = []
+        batch_ids = []
+        l_frame = batch_meta.frame_meta_list
+        while l_frame is not None:
+            frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
+            frames.append((frame_meta.source_id, pyds.get_nvds_buf_surface(hash(gst_buffer), frame_meta.batch_id)))
+            batch_ids.append(frame_meta.batch_id)
+            l_frame = l_frame.next
+        # decide() copies the sampled pixels, so the mappings can go right after
+        infer, reduced = self.detector.decide(frames)
+        if self.integrated_gpu:
+            for batch_id in batch_ids:
+                pyds.unmap_nvds_buf_surface(hash(gst_buffer), batch_id)
+        self._apply(self.interval if infer else self._skip_interval)
+        with self._lock:
+            self.batches["infer" if infer else "skip"] += 1
+            self._pending.append((time.monotonic(), reduced))
+        return Gst.PadProbeReturn.OK
+
+    def _apply(self, interval):
+        # nvinfer reads the interval while taking this buffer, in this thread
+        if interval != self._current:
+            self.pgie.set_property("interval", interval)
+            self._current = interval
+
+    def set_enabled(self, enabled):
+        """Skip every batch (inference off) or gate on motion again, from the next batch on."""
+        self.enabled = enabled
+
+    def inference_enabled(self):
+        return self.enabled
+
+    def record(self, detections):
+        """Account one batch leaving nvinfer (the BatchMetaReader view of it)."""
+        now = time.monotonic()
+        with self._lock:
+            if not self._pending:
+                return
+            started, reduced = self._pending.popleft()
+            inferred = bool(detections.frame_infer_done.any())
+            if inferred:
+                self.inferred += 1
+                self.busy += now - started
+        if reduced is not None:
+            self.detector.commit(reduced, inferred)
+
+    def stop(self):
+        with self._lock:
+            skipped, total = self.batches["skip"], sum(self.batches.values())
+        if total:
+            print(f"Motion gate: skipped {skipped} of {total} batches, "
+                  f"about {self.saved_seconds():.1f} s of inference saved")
+
+    def saved_seconds(self):
+        """Skipped batches times the mean time of a batch nvinfer ran on."""
+        with self._lock:
+            if not self.inferred:
+                return 0.0
+            return self.batches["skip"] * self.busy / self.inferred
+
+    def stats(self):
+        with self._lock:
+            batches = dict(self.batches)
+        total = sum(batches.values())
+        return {"batches": batches,
+                "skipped_share": batches.get("skip", 0) / total if total else 0.0,
+                "gpu_seconds_saved": self.saved_seconds(),
+                "threshold": self.detector.threshold,
+                "sources": self.detector.stats()}
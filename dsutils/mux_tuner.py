@@ -0,0 +1,178 @@
+################################################################################
+# Adaptive nvstreammux batched-push-timeout
+# Measures buffer inter-arrival times on every streammux sink pad and retunes
+# batched-push-timeout so a batch waits about one frame interval of the
+# slowest source, and no longer. Also reports batch fill ratio and the
+# latency the muxer adds.
+################################################################################
+
+import time
+import threading
+
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst, GLib
+
+MIN_TIMEOUT_USEC = 4000
+MAX_TIMEOUT_USEC = 200000
+EWMA_ALPHA = 0.1
+
+
+class _PadStats:
+    __slots__ = ("last_arrival", "interval", "frames")
+
+    def __init__(self):
+        self.last_arrival = None
+        self.interval = None  # EWMA of inter-arrival time, seconds
+        self.frames = 0
+
+
+class BatchTimeoutTuner:
+    """Tunes ``batched-push-timeout`` of an nvstreammux from observed frame rates.
+
+    Every ``period`` seconds the timeout is set to ``margin`` times the
+    longest smoothed inter-arrival time across active sink pads, clamped to
+    [MIN_TIMEOUT_USEC, MAX_TIMEOUT_USEC]. It is only changed when it moves by
+    more than ``hysteresis`` to avoid flapping. Pads that stopped delivering
+    for ``stale_after`` seconds are ignored.
+    """
+
+    def __init__(self, streammux, period=5.0, margin=1.2, hysteresis=0.1,
+                 stale_after=5.0):
+        self.streammux = streammux
+        self.period = period
+        self.margin = margin
+        self.hysteresis = hysteresis
+        self.stale_after = stale_after
+        self._pads = {}  # pad name -> _PadStats
+        self._lock = threading.Lock()
+        self._probed = set()
+        self._pending_since = None  # arrival of the oldest frame not yet batched
+        self._pending_frames = 0
+        self._batches = 0
+        self._batched_frames = 0
+        self._latency_sum = 0.0
+        self._latency_max = 0.0
+        self.adjustments = []  # (monotonic time, old usec, new usec)
+        self.last_report = None
+        self._timer = None
+
+    def start(self):
+        """Attach probes to the current streammux pads and start tuning."""
+        self._attach_pads()
+        self.streammux.connect("pad-added", lambda mux, pad: self._attach_pad(pad))
+        self.streammux.connect("pad-removed", lambda mux, pad: self._detach_pad(pad))
+        self.streammux.get_static_pad("src").add_probe(
+            Gst.PadProbeType.BUFFER, self._on_batch)
+        self._timer = GLib.timeout_add(int(self.period * 1000), self._tune)
+
+    def stop(self):
+        """Stop tuning and print the final batch report."""
+        if self._timer is not None:
+            GLib.source_remove(self._timer)
+            self._timer = None
+        report = self._collect()
+        print(f"streammux: {len(self.adjustments)} timeout adjustment(s), final "
+              f"{report['timeout_usec']} usec, fill {report['fill_ratio']:.2f}, "
+              f"added latency avg {report['latency_avg_ms']:.1f} ms / "
+              f"max {report['latency_max_ms']:.1f} ms")
+
+    def _attach_pads(self):
+        for pad in self.streammux.iterate_sink_pads():
+            self._attach_pad(pad)
+
+    def _attach_pad(self, pad):
+        if pad.get_direction() != Gst.PadDirection.SINK or pad.get_name() in self._probed:
+            return
+        self._probed.add(pad.get_name())
+        pad.add_probe(Gst.PadProbeType.BUFFER, self._on_frame, pad.get_name())
+
+    def _detach_pad(self, pad):
+        # SourceManager and the supervisor release and re-request sink_N; the
+        # new pad gets probed again and starts with fresh stats, so the gap
+        # while the source was away does not count as a frame interval
+        name = pad.get_name()
+        self._probed.discard(name)
+        with self._lock:
+            self._pads.pop(name, None)
+
+    def _on_frame(self, pad, info, name):
+        now = time.monotonic()
+        with self._lock:
+            stats = self._pads.get(name)
+            if stats is None:
+                stats = self._pads[name] = _PadStats()
+            if stats.last_arrival is not None:
+                delta = now - stats.last_arrival
+                if stats.interval is None:
+                    stats.interval = delta
+                else:
+                    stats.interval += EWMA_ALPHA * (delta - stats.interval)
+            stats.last_arrival = now
+            stats.frames += 1
+            if self._pending_since is None:
+                self._pending_since = now
+            self._pending_frames += 1
+        return Gst.PadProbeReturn.OK
+
+    def _on_batch(self, pad, info):
+        now = time.monotonic()
+        with self._lock:
+            if self._pending_since is not None:
+                latency = now - self._pending_since
+                self._latency_sum += latency
+                self._latency_max = max(self._latency_max, latency)
+            self._batches += 1
+            self._batched_frames += self._pending_frames
+            self._pending_since = None
+            self._pending_frames = 0
+        return Gst.PadProbeReturn.OK
+
+    def _target_timeout(self, now):
+        intervals = [stats.interval for stats in self._pads.values()
+                     if stats.interval is not None
+                     and now - stats.last_arrival < self.stale_after]
+        if not intervals:
+            return None
+        usec = int(max(intervals) * self.margin * 1e6)
+        return min(max(usec, MIN_TIMEOUT_USEC), MAX_TIMEOUT_USEC)
+
+    def _tune(self):
+        now = time.monotonic()
+        with self._lock:
+            target = self._target_timeout(now)
+        report = self.last_report = self._collect()
+        current = self.streammux.get_property("batched-push-timeout")
+        if target is not None and abs(target - current) > current * self.hysteresis:
+            self.streammux.set_property("batched-push-timeout", target)
+            self.adjustments.append((now, current, target))
+            print(f"streammux batched-push-timeout {current} -> {target} usec "
+                  f"(fill {report['fill_ratio']:.2f}, "
+                  f"added latency avg {report['latency_avg_ms']:.1f} ms)")
+        return True
+
+    def report(self):
+        """Batch fill ratio, muxer latency and per-pad frame intervals of the last period."""
+        return self.last_report
+
+    def _collect(self):
+        batch_size = self.streammux.get_property("batch-size")
+        with self._lock:
+            batches = self._batches
+            fill = self._batched_frames / (batches * batch_size) if batches else 0.0
+            latency_avg = self._latency_sum / batches if batches else 0.0
+            result = {
+                "batches": batches,
+                "fill_ratio": fill,
+                "latency_avg_ms": latency_avg * 1000,
+                "latency_max_ms": self._latency_max * 1000,
+                "frame_interval_ms": {name: stats.interval * 1000
+                                      for name, stats in self._pads.items()
+                                      if stats.interval is not None},
+                "timeout_usec": self.streammux.get_property("batched-push-timeout"),
+            }
+            self._batches = 0
+            self._batched_frames = 0
+            self._latency_sum = 0.0
+            self._latency_max = 0.0
+        return result
@@ -0,0 +1,126 @@
+################################################################################
+# OSD annotation helpers
+# Write detection labels and text style onto object metadata for nvdsosd,
+# working from the arrays produced by dsutils.batch_meta.BatchMetaReader.
+################################################################################
+
+from collections import namedtuple
+
+import numpy as np
+
+LabelStyle = namedtuple("LabelStyle", ["font_name", "font_size", "font_color",
+                                       "set_bg_clr", "text_bg_color"])
+
+DEFAULT_STYLE = LabelStyle(font_name="Arial", font_size=14,
+                           font_color=(1.0, 1.0, 0.0, 1.0), set_bg_clr=1,
+                           text_bg_color=(0.0, 0.0, 0.0, 0.5))
+
+# Text params as nvinfer attaches them to every object it creates. Object
+# metadata is fresh on every batch, so a style field only needs writing when
+# it differs from these.
+NVINFER_TEXT_DEFAULTS = LabelStyle(font_name="Serif", font_size=11,
+                                   font_color=(1.0, 1.0, 1.0, 1.0), set_bg_clr=1,
+                                   text_bg_color=(0.0, 0.0, 0.0, 1.0))
+
+
+class _StyleWrites:
+    """The fields of a style that differ from ``base`` and therefore need writing."""
+
+    __slots__ = ("font_name", "font_size", "font_color", "set_bg_clr", "text_bg_color",
+                 "write_font_name", "write_font_size", "write_font_color",
+                 "write_set_bg_clr", "write_text_bg_color")
+
+    def __init__(self, style, base=NVINFER_TEXT_DEFAULTS):
+        self.font_name = style.font_name
+        self.font_size = style.font_size
+        self.font_color = tuple(style.font_color)
+        self.set_bg_clr = style.set_bg_clr
+        self.text_bg_color = tuple(style.text_bg_color)
+        self.write_font_name = style.font_name != base.font_name
+        self.write_font_size = style.font_size != base.font_size
+        self.write_font_color = self.font_color != tuple(base.font_color)
+        self.write_set_bg_clr = style.set_bg_clr != base.set_bg_clr
+        self.write_text_bg_color = self.text_bg_color != tuple(base.text_bg_color)
+
+    def apply(self, obj_metas, texts):
+        """Write label text and style to ``obj_metas``; None texts are skipped."""
+        font_name = self.font_name
+        font_size = self.font_size
+        fr, fg, fb, fa = self.font_color
+        set_bg_clr = self.set_bg_clr
+        br, bg, bb, ba = self.text_bg_color
+        write_font_name = self.write_font_name
+        write_font_size = self.write_font_size
+        write_font_color = self.write_font_color
+        write_set_bg_clr = self.write_set_bg_clr
+        write_text_bg_color = self.write_text_bg_color
+        write_font = write_font_name or write_font_size or write_font_color
+        for obj_meta, text in zip(obj_metas, texts):
+            if text is None:
+                continue
+            text_params = obj_meta.text_params
+            text_params.display_text = text
+            if write_font:
+                font_params = text_params.font_params
+                if write_font_name:
+                    font_params.font_name = font_name
+                if write_font_size:
+                    font_params.font_size = font_size
+                if write_font_color:
+                    font_params.font_color.set(fr, fg, fb, fa)
+            if write_set_bg_clr:
+                text_params.set_bg_clr = set_bg_clr
+            if write_text_bg_color:
+                text_params.text_bg_clr.set(br, bg, bb, ba)
+
+
+class LabelTable:
+    """Class names, styles and label text precomputed for a detector.
+
+    Label text is looked up from a table indexed by (class_id, quantized
+    confidence) that is filled once at construction, so the probe never
+    formats strings. Class ids outside ``class_names`` keep the text nvinfer
+    attached.
+    """
+
+    def __init__(self, class_names, style=DEFAULT_STYLE, class_styles=None,
+                 confidence_steps=100):
+        self.class_names = list(class_names)
+        self.confidence_steps = confidence_steps
+        num_classes = len(self.class_names)
+        class_styles = class_styles or {}
+
+        # The extra last row catches unknown class ids.
+        self._texts = np.full((num_classes + 1, confidence_steps + 1), None, dtype=object)
+        for class_id, name in enumerate(self.class_names):
+            for step in range(confidence_steps + 1):
+                self._texts[class_id, step] = "{} {:.2f}".format(name, step / confidence_steps)
+
+        # Per-class style writes; the common single-style case gets one
+        # shared instance so apply() can run a single loop over the batch.
+        self._style_writes = [_StyleWrites(class_styles.get(class_id, style))
+                              for class_id in range(num_classes)]
+        self._uniform_style = None if class_styles else _StyleWrites(style)
+
+    def texts(self, detections):
+        """Label text for every object of ``detections``, None for unknown classes."""
+        unknown = len(self.class_names)
+        class_idx = np.minimum(detections.class_id, unknown)
+        steps = np.rint(detections.confidence * self.confidence_steps)
+        steps = np.clip(steps, 0, self.confidence_steps).astype(np.intp)
+        return self._texts[class_idx, steps]
+
+    def apply(self, detections):
+        """Set display text and font style on every object of the batch."""
+        if not detections.num_objects:
+            return
+        texts = self.texts(detections)
+        if self._uniform_style is not None:
+            self._uniform_style.apply(detections.obj_metas, texts.tolist())
+            return
+        obj_metas = detections.obj_metas
+        class_id = detections.class_id
+        for cls, style_writes in enumerate(self._style_writes):
+            idx = np.flatnonzero(class_id == cls).tolist()
+            if idx:
+                style_writes.apply([obj_metas[i] for i in idx], texts[idx].tolist())
@@ -0,0 +1,190 @@
+################################################################################
+# Zero-transcode passthrough
+# When the camera already sends a codec the output can carry, the relays do
+# not need to decode to NVMM and encode again. A passthrough source is
+#
+#   rtspsrc -> rtph264depay / rtph265depay -> h264parse / h265parse
+#
+# in a bin whose src pad feeds rtspclientsink or flvmux directly; no decoder,
+# nvstreammux, converter or encoder runs, so the per-stream cost is the
+# network and parsing work only. Resolution and bitrate are the camera's.
+#
+# probe_video_codec() connects once and reads the video stream's caps from
+# the SDP (the encoding-name of rtspsrc's video pad) so a script can fall back
+# to transcoding when the codec does not fit, e.g. H.265 or MJPEG for RTMP.
+#
+# Without nvstreammux there is no placeholder to keep feeding, so
+# PipelineRestarter replaces SourceSupervisor here: a source error or EOS
+# restarts the whole (single-source) pipeline after a backoff.
+################################################################################
+
+import time
+
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst, GLib
+
+from dsutils.ingest import configure_rtspsrc
+
+# encoding-name in the SDP -> (depayloader, parser)
+CODECS = {
+    "H264": ("rtph264depay", "h264parse"),
+    "H265": ("rtph265depay", "h265parse"),
+}
+PROBE_TIMEOUT = 10.0  # seconds
+
+
+def probe_video_codec(uri, ingest="legacy", timeout=PROBE_TIMEOUT):
+    """(encoding-name, caps string) of the first video stream ``uri`` offers.
+
+    Returns (None, reason) when the stream cannot be described in time.
+    Requires Gst.init().
+    """
+    if not uri.startswith(("rtsp://", "rtsps://")):
+        return None, "not an RTSP source"
+    pipeline = Gst.Pipeline.new("passthrough-probe")
+    src = Gst.ElementFactory.make("rtspsrc", "probe-src")
+    if not src:
+        return None, "rtspsrc is not available"
+    src.set_property("location", uri)
+    configure_rtspsrc(src, ingest)
+    found = {}
+
+    def on_pad_added(src, pad):
+        caps = pad.get_current_caps() or pad.query_caps(None)
+        structure = caps.get_structure(0)
+        if structure.get_string("media") == "video" and "caps" not in found:
+            found["encoding"] = (structure.get_string("encoding-name") or "").upper()
+            found["caps"] = caps.to_string()
+
+    src.connect("pad-added", on_pad_added)
+    pipeline.add(src)
+    pipeline.set_state(Gst.State.PLAYING)
+    bus = pipeline.get_bus()
+    reason = f"no video stream within {timeout:.0f}s"
+    deadline = time.monotonic() + timeout
+    while "caps" not in found and time.monotonic() < deadline:
+        message = bus.timed_pop_filtered(100 * Gst.MSECOND, Gst.MessageType.ERROR | Gst.MessageType.EOS)
+        if message is None:
+            continue
+        if message.type == Gst.MessageType.ERROR:
+            reason = message.parse_error()[0].message
+        else:
+            reason = "end of stream"
+        break
+    pipeline.set_state(Gst.State.NULL)
+    if "caps" in found:
+        return found["encoding"], found["caps"]
+    return None, reason
+
+
+def create_passthrough_bin(uri, codec, ingest="legacy"):
+    """rtspsrc -> depayloader -> parser in a bin with a static "src" pad."""
+    depay_name, parse_name = CODECS[codec]
+    nbin = Gst.Bin.new("passthrough-bin")
+    src = Gst.ElementFactory.make("rtspsrc", "rtsp-source")
+    depay = Gst.ElementFactory.make(depay_name, "depay")
+    parser = Gst.ElementFactory.make(parse_name, "passthrough-parser")
+    if not src or not depay or not parser:
+        return None
+    src.set_property("location", uri)
+    configure_rtspsrc(src, ingest)
+    # Repeat SPS/PPS (and VPS) before every key frame for late joiners and
+    # for flvmux, which needs the codec data up front
+    parser.set_property("config-interval", -1)
+    for element in (src, depay, parser):
+        nbin.add(element)
+    depay.link(parser)
+
+    def on_pad_added(src, pad):
+        caps = pad.get_current_caps() or pad.query_caps(None)
+        structure = caps.get_structure(0)
+        sink_pad = depay.get_static_pad("sink")
+        if structure.get_string("media") == "video" and not sink_pad.is_linked():
+            pad.link(sink_pad)
+
+    src.connect("pad-added", on_pad_added)
+    nbin.add_pad(Gst.GhostPad.new("src", parser.get_static_pad("src")))
+    return nbin
+
+
+class PipelineRestarter:
+    """Restarts a single-source pipeline after a source error or EOS.
+
+    The delay starts at ``initial_backoff`` seconds and doubles up to
+    ``max_backoff``; it resets once a buffer reaches a sink again. Reaching
+    PLAYING is not enough: rtspsrc connects asynchronously, so a camera that
+    never answers still gets there.
+    """
+
+    def __init__(self, pipeline, initial_backoff=1.0, max_backoff=30.0):
+        self.pipeline = pipeline
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.backoff = initial_backoff
+        self.restarts = 0
+        self._timer = None
+        self._data_probes = []  # (pad, probe id) waiting for the first buffer
+
+    def bus_filter(self, handler):
+        """Wrap a bus handler so errors and EOS restart the pipeline instead."""
+        def on_message(bus, message, *user_data):
+            if message.type in (Gst.MessageType.ERROR, Gst.MessageType.EOS):
+                if message.type == Gst.MessageType.ERROR:
+                    reason = message.parse_error()[0].message
+                else:
+                    reason = "end of stream"
+                self._schedule(reason)
+                return True
+            if message.type == Gst.MessageType.STATE_CHANGED and message.src is self.pipeline:
+                if message.parse_state_changed()[1] == Gst.State.PLAYING:
+                    self._await_data()
+            return handler(bus, message, *user_data)
+        return on_message
+
+    def _await_data(self):
+        if self._data_probes:
+            return
+        iterator = self.pipeline.iterate_sinks()
+        while True:
+            result, sink = iterator.next()
+            if result != Gst.IteratorResult.OK:
+                break
+            for pad in sink.iterate_sink_pads():
+                self._data_probes.append((pad, pad.add_probe(Gst.PadProbeType.BUFFER, self._on_data)))
+
+    def _on_data(self, pad, info):
+        GLib.idle_add(self._data_arrived)
+        return Gst.PadProbeReturn.OK
+
+    def _data_arrived(self):
+        if self._data_probes:
+            self._remove_data_probes()
+            self.backoff = self.initial_backoff
+        return False
+
+    def _remove_data_probes(self):
+        for pad, probe in self._data_probes:
+            pad.remove_probe(probe)
+        self._data_probes = []
+
+    def _schedule(self, reason):
+        if self._timer is not None:
+            return  # a restart is already pending
+        self._remove_data_probes()
+        print(f"Passthrough source failed ({reason}); restarting in {self.backoff:.0f}s")
+        self.pipeline.set_state(Gst.State.NULL)
+        self._timer = GLib.timeout_add(int(self.backoff * 1000), self._restart)
+        self.backoff = min(self.backoff * 2, self.max_backoff)
+
+    def _restart(self):
+        self._timer = None
+        self.restarts += 1
+        self.pipeline.set_state(Gst.State.PLAYING)
+        return False
+
+    def stop(self):
+        self._remove_data_probes()
+        if self._timer is not None:
+            GLib.source_remove(self._timer)
+            self._timer = None
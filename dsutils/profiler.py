@@ -0,0 +1,237 @@
+################################################################################
+# Per-element profiler
+# Probes the sink and src pads of every element in a pipeline (including ones
+# created later inside uridecodebin or rtspclientsink) and measures, per
+# element:
+#
+#   buffers in / out and output rate
+#   residence time: from a buffer arriving on a sink pad to the element
+#     pushing a buffer on its src pad, matched first-in first-out. For
+#     elements that process in the streaming thread this is their processing
+#     time; for queues and elements with their own output thread it includes
+#     the time buffers wait inside
+#   buffers in flight: arrived but not yet pushed on
+#
+# Elements are keyed by their path in the pipeline, so the same child name
+# in every source bin is measured once per bin, and a bin rebuilt under the
+# same name (reconnects) continues the figures of the one it replaces.
+# Elements with request sink or src pads (nvstreammux, nvstreamdemux, tee,
+# muxers) do not pass buffers on one for one, so FIFO matching means
+# nothing for them: only their buffer counts and rates are reported.
+#
+# report() gives a text table sorted by mean residence time and dot() a
+# Graphviz graph with every node annotated and shaded by its cost; stop()
+# prints the table and writes both to ``<prefix>.txt`` / ``<prefix>.dot``.
+################################################################################
+
+import time
+import threading
+import collections
+
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+PROBE_TYPES = Gst.PadProbeType.BUFFER | Gst.PadProbeType.BUFFER_LIST
+MAX_PENDING = 1024  # entry stamps kept per element before resynchronising
+
+
+class _ElementStats:
+    __slots__ = ("name", "factory", "element", "one_to_one", "pending", "buffers_in", "buffers_out",
+                 "total", "max", "matched", "max_in_flight", "links")
+
+    def __init__(self, name, factory, element, one_to_one):
+        self.name = name
+        self.factory = factory
+        self.element = element  # the element currently probed under this path
+        self.one_to_one = one_to_one
+        self.pending = collections.deque()
+        self.buffers_in = 0
+        self.buffers_out = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.matched = 0
+        self.max_in_flight = 0
+        self.links = set()  # names of downstream elements
+
+
+def _one_to_one(element):
+    """False for elements that merge or split streams through request pads."""
+    return not any(template.presence == Gst.PadPresence.REQUEST
+                   for template in element.get_pad_template_list())
+
+
+def _path(element):
+    """``element``'s path below the pipeline, e.g. source-bin-00/test-src."""
+    return element.get_path_string().lstrip("/").partition("/")[2] or element.get_name()
+
+
+def _count(info):
+    if info.type & Gst.PadProbeType.BUFFER_LIST:
+        buffer_list = info.get_buffer_list()
+        return buffer_list.length() if buffer_list else 0
+    return 1
+
+
+class ElementProfiler:
+    """Profiles every element of ``pipeline``; bins are not measured themselves."""
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._started = None
+        self._stopped = None
+
+    def start(self):
+        """Attach to the current elements and to elements added later."""
+        self._started = time.monotonic()
+        iterator = self.pipeline.iterate_recurse()
+        while True:
+            result, element = iterator.next()
+            if result != Gst.IteratorResult.OK:
+                break
+            self._attach(element)
+        self.pipeline.connect("deep-element-added", lambda bin, sub_bin, element: self._attach(element))
+
+    def stop(self, prefix=None):
+        """Freeze the measurement window, print the report and optionally write it out."""
+        self._stopped = time.monotonic()
+        print(self.report())
+        if prefix:
+            dot_path, txt_path = self.write(prefix)
+            print(f"Profile written to {txt_path} and {dot_path}")
+
+    def _attach(self, element):
+        if isinstance(element, Gst.Bin):
+            return
+        path = _path(element)
+        with self._lock:
+            stats = self._stats.get(path)
+            if stats is None:
+                factory = element.get_factory()
+                stats = self._stats[path] = _ElementStats(
+                    path, factory.get_name() if factory else "?", element, _one_to_one(element))
+            elif stats.element is element:
+                return
+            else:
+                # Rebuilt under the same path; stamps of the old element never leave
+                stats.element = element
+                stats.pending.clear()
+        for pad in element.iterate_pads():
+            self._attach_pad(element, pad, stats)
+        element.connect("pad-added", lambda el, pad: self._attach_pad(el, pad, stats))
+
+    def _attach_pad(self, element, pad, stats):
+        if pad.get_direction() == Gst.PadDirection.SINK:
+            pad.add_probe(PROBE_TYPES, self._on_sink, stats)
+        else:
+            pad.add_probe(PROBE_TYPES, self._on_src, stats)
+
+    def _on_sink(self, pad, info, stats):
+        now = time.perf_counter()
+        stats.buffers_in += _count(info)
+        if not stats.one_to_one:
+            return Gst.PadProbeReturn.OK
+        pending = stats.pending
+        if len(pending) >= MAX_PENDING:
+            # The element consumes without producing 1:1 (muxers, sinks)
+            pending.clear()
+        pending.append(now)
+        if len(pending) > stats.max_in_flight:
+            stats.max_in_flight = len(pending)
+        return Gst.PadProbeReturn.OK
+
+    def _on_src(self, pad, info, stats):
+        now = time.perf_counter()
+        stats.buffers_out += _count(info)
+        try:
+            entered = stats.pending.popleft() if stats.one_to_one else None
+        except IndexError:
+            entered = None
+        if entered is not None:
+            elapsed = now - entered
+            stats.total += elapsed
+            stats.matched += 1
+            if elapsed > stats.max:
+                stats.max = elapsed
+        peer = pad.get_peer()
+        if peer is not None:
+            parent = peer.get_parent_element()
+            if parent is not None and len(stats.links) < 16:
+                stats.links.add(_path(parent))
+        return Gst.PadProbeReturn.OK
+
+    # -- reporting ---------------------------------------------------------
+
+    def results(self):
+        """Per-element dicts sorted by mean residence time, slowest first."""
+        elapsed = (self._stopped or time.monotonic()) - (self._started or time.monotonic())
+        rows = []
+        with self._lock:
+            stats_list = list(self._stats.values())
+        for stats in stats_list:
+            mean = stats.total / stats.matched if stats.matched else 0.0
+            rows.append({
+                "one_to_one": stats.one_to_one,
+                "element": stats.name,
+                "factory": stats.factory,
+                "buffers_in": stats.buffers_in,
+                "buffers_out": stats.buffers_out,
+                "out_per_s": stats.buffers_out / elapsed if elapsed > 0 else 0.0,
+                "mean_ms": mean * 1000,
+                "max_ms": stats.max * 1000,
+                "busy_percent": stats.total / elapsed * 100 if elapsed > 0 else 0.0,
+                "in_flight": len(stats.pending),
+                "max_in_flight": stats.max_in_flight,
+                "links": sorted(stats.links),
+            })
+        rows.sort(key=lambda row: row["mean_ms"], reverse=True)
+        return rows
+
+    def report(self):
+        lines = [f"{'element':28s} {'factory':22s} {'out/s':>8s} {'mean ms':>8s} "
+                 f"{'max ms':>8s} {'busy %':>7s} {'in flight':>9s}"]
+        for row in self.results():
+            if not row["one_to_one"]:
+                # Merges or splits streams: buffers are not matched in to out
+                lines.append(f"{row['element'][-28:]:28s} {row['factory'][:22]:22s} "
+                             f"{row['out_per_s']:8.1f} {'-':>8s} {'-':>8s} {'-':>7s} {'-':>9s}")
+                continue
+            lines.append(f"{row['element'][-28:]:28s} {row['factory'][:22]:22s} "
+                         f"{row['out_per_s']:8.1f} {row['mean_ms']:8.2f} {row['max_ms']:8.2f} "
+                         f"{row['busy_percent']:7.1f} {row['in_flight']:4d}/{row['max_in_flight']:<4d}")
+        return "\n".join(lines)
+
+    def dot(self):
+        """Graphviz source of the pipeline, nodes shaded by mean residence time."""
+        rows = self.results()
+        worst = max((row["mean_ms"] for row in rows), default=0.0) or 1.0
+        lines = ["digraph pipeline {", "  rankdir=LR;",
+                 '  node [shape=box, style="rounded,filled", fontname="Helvetica"];']
+        for row in rows:
+            # White for the cheapest element, red for the most expensive
+            heat = row["mean_ms"] / worst
+            shade = int(255 * (1 - heat))
+            color = f"#ff{shade:02x}{shade:02x}"
+            if row["one_to_one"]:
+                label = (f"{row['element']}\\n{row['factory']}\\n"
+                         f"{row['out_per_s']:.1f} buf/s  {row['mean_ms']:.2f} ms\\n"
+                         f"busy {row['busy_percent']:.0f}%  in flight {row['max_in_flight']}")
+            else:
+                label = f"{row['element']}\\n{row['factory']}\\n{row['out_per_s']:.1f} buf/s"
+            lines.append(f'  "{row["element"]}" [label="{label}", fillcolor="{color}"];')
+        for row in rows:
+            for downstream in row["links"]:
+                lines.append(f'  "{row["element"]}" -> "{downstream}";')
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, prefix):
+        """Write ``<prefix>.dot`` and ``<prefix>.txt``; returns their paths."""
+        dot_path, txt_path = prefix + ".dot", prefix + ".txt"
+        with open(dot_path, "w") as f:
+            f.write(self.dot())
+        with open(txt_path, "w") as f:
+            f.write(self.report() + "\n")
+        return dot_path, txt_path
@@ -0,0 +1,107 @@
+################################################################################
+# Stage queues
+# Without queues every element from the muxer (or camera) to the sink runs in
+# one streaming thread, so inference, conversion, OSD and encoding of
+# consecutive frames never overlap. A queue at a stage boundary starts a new
+# thread there. Boundaries are named after the stage the queue feeds:
+#
+#   infer        streammux -> nvinfer
+#   post-infer   nvinfer -> nvmultistreamtiler / nvstreamdemux
+#   convert      streammux or camera -> nvvideoconvert
+#   osd          nvvideoconvert -> nvdsosd
+#   encoder      -> H264/H265 encoder
+#   sink         parser -> muxer / network sink
+#
+# Threading profiles pick the boundaries:
+#
+#   none         no extra queues (the original pipelines)
+#   latency      the encoder gets its own thread behind a one-buffer queue
+#                that drops the oldest frame instead of adding delay
+#   balanced     inference and encoding each get a thread, 4 buffers deep
+#   throughput   every boundary gets a thread, 16 buffers deep
+#
+# and STAGE[:BUFFERS[:LEAKY]] options add boundaries or override a profile's.
+################################################################################
+
+import collections
+
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+STAGES = ("infer", "post-infer", "convert", "osd", "encoder", "sink")
+LEAKY = ("no", "upstream", "downstream")
+
+QueueSpec = collections.namedtuple("QueueSpec", "max_buffers leaky")
+QueueSpec.__new__.__defaults__ = (4, "no")
+
+PROFILES = {
+    "none": {},
+    "latency": {"encoder": QueueSpec(1, "downstream")},
+    "balanced": {"infer": QueueSpec(4), "encoder": QueueSpec(4)},
+    "throughput": {stage: QueueSpec(16) for stage in STAGES},
+}
+
+
+def queue_option(text):
+    """Parse STAGE[:BUFFERS[:LEAKY]] into (stage, QueueSpec); usable as an argparse type."""
+    parts = text.split(":")
+    stage = parts[0]
+    if stage not in STAGES or len(parts) > 3:
+        raise ValueError(text)
+    max_buffers = int(parts[1]) if len(parts) > 1 and parts[1] else QueueSpec().max_buffers
+    leaky = parts[2] if len(parts) > 2 else "no"
+    if max_buffers < 0 or leaky not in LEAKY:
+        raise ValueError(text)
+    return stage, QueueSpec(max_buffers, leaky)
+
+
+def stage_plan(profile="none", overrides=()):
+    """{stage: QueueSpec} for a profile with (stage, QueueSpec) overrides applied."""
+    plan = dict(PROFILES[profile])
+    plan.update(overrides or ())
+    return plan
+
+
+def describe_plan(plan):
+    if not plan:
+        return "none"
+    return ", ".join(f"{stage}({spec.max_buffers}{'' if spec.leaky == 'no' else ', leaky ' + spec.leaky})"
+                     for stage, spec in sorted(plan.items(), key=lambda item: STAGES.index(item[0])))
+
+
+def queue_properties(spec):
+    """Queue properties for a spec; only the buffer count limits the queue."""
+    return {"max-size-buffers": spec.max_buffers, "max-size-bytes": 0,
+            "max-size-time": 0, "leaky": spec.leaky}
+
+
+def queue_description(stage, spec, suffix=""):
+    """gst-launch description of the queue for ``stage``."""
+    properties = " ".join(f"{key}={value}" for key, value in queue_properties(spec).items())
+    return f"queue name={stage}-queue{suffix} {properties}"
+
+
+class StageQueues:
+    """Links pipeline elements, putting a queue at every planned boundary.
+
+    ``suffix`` keeps queue names unique when the same stages repeat, e.g. one
+    output branch per stream.
+    """
+
+    def __init__(self, pipeline, plan, suffix=""):
+        self.pipeline = pipeline
+        self.plan = plan
+        self.suffix = suffix
+
+    def link(self, upstream, downstream, stage):
+        spec = self.plan.get(stage)
+        if spec is None:
+            return upstream.link(downstream)
+        queue = Gst.ElementFactory.make("queue", f"{stage}-queue{self.suffix}")
+        if not queue:
+            return False
+        for key, value in queue_properties(spec).items():
+            Gst.util_set_object_arg(queue, key, str(value))
+        self.pipeline.add(queue)
+        return upstream.link(queue) and queue.link(downstream)
@@ -0,0 +1,143 @@
+################################################################################
+# Per-source regions of interest for primary inference
+# nvinfer scales the whole muxer frame (1920x1080) down to the network input
+# (infer-dims, e.g. 960x544). For a fixed camera where only a band of the
+# image matters, most of those input pixels are wasted. With ROIs, an
+# nvdspreprocess element in front of nvinfer crops every region out of the
+# batch and scales just that region to the network input; nvinfer, with
+# input-tensor-meta set, runs on those tensors instead of the full frames
+# and attaches its detections to the frame in full-frame coordinates
+# (offset by the ROI origin and scaled back), so OSD, counting and every
+# other probe see the same coordinates as before.
+#
+# The preprocess config is generated from the nvinfer config (input size,
+# scale factor, offsets, color format, input layer name), so the two always
+# agree. Sources without a --roi are inferred on the full frame.
+#
+# In this mode nvinfer ignores its ``interval``, so nothing that skips
+# inference through it (--adaptive-interval, --motion-gate, set_inference)
+# can be combined with ROIs.
+#
+#   --roi 0:0,540,1920,400 --roi 1:400,200,960,544
+################################################################################
+
+import os
+import atexit
+import tempfile
+import collections
+
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+from dsutils.infer_config import read_infer_config
+
+PREPROCESS_LIB = "/opt/nvidia/deepstream/deepstream/lib/gst-plugins/libcustom2d_preprocess.so"
+PREPROCESS_UNIQUE_ID = 15
+DEFAULT_TENSOR_NAME = "input_1"
+
+Roi = collections.namedtuple("Roi", "left top width height")
+
+
+def roi_option(text):
+    """Parse SOURCE:LEFT,TOP,WIDTH,HEIGHT; usable as an argparse type."""
+    source, _, box = text.partition(":")
+    values = [int(v) for v in box.split(",")]
+    if len(values) != 4 or values[2] <= 0 or values[3] <= 0 or min(values[:2]) < 0:
+        raise ValueError(text)
+    return int(source), Roi(*values)
+
+
+def plan_rois(options, max_sources, frame_width, frame_height):
+    """{source: [Roi, ...]} for every source slot; slots without options get the full frame."""
+    plan = {source: [] for source in range(max_sources)}
+    for source, roi in options:
+        if source not in plan:
+            raise ValueError(f"ROI for source {source}, but there are only {max_sources} source slots")
+        if roi.left + roi.width > frame_width or roi.top + roi.height > frame_height:
+            raise ValueError(f"ROI {tuple(roi)} of source {source} is outside the "
+                             f"{frame_width}x{frame_height} muxer frame")
+        plan[source].append(roi)
+    for source, rois in plan.items():
+        if not rois:
+            rois.append(Roi(0, 0, frame_width, frame_height))
+    return plan
+
+
+def preprocess_config(infer_config_path, plan, batch_size):
+    """nvdspreprocess config text matching the nvinfer config at ``infer_config_path``."""
+    props = read_infer_config(infer_config_path)
+    channels, height, width = (int(v) for v in props.get("infer-dims", "3;544;960").split(";"))
+    tensor_name = props.get("uff-input-blob-name") or DEFAULT_TENSOR_NAME
+    lines = [
+        "[property]",
+        "enable=1",
+        f"target-unique-ids={props.get('gie-unique-id', '1')}",
+        f"network-input-order={props.get('network-input-order', props.get('uff-input-order', '0'))}",
+        "process-on-frame=1",
+        f"unique-id={PREPROCESS_UNIQUE_ID}",
+        f"gpu-id={props.get('gpu-id', '0')}",
+        f"maintain-aspect-ratio={props.get('maintain-aspect-ratio', '0')}",
+        f"symmetric-padding={props.get('symmetric-padding', '0')}",
+        f"processing-width={width}",
+        f"processing-height={height}",
+        "scaling-buf-pool-size=6",
+        "tensor-buf-pool-size=6",
+        f"network-input-shape={batch_size};{channels};{height};{width}",
+        f"network-color-format={props.get('model-color-format', '0')}",
+        "tensor-data-type=0",
+        f"tensor-name={tensor_name}",
+        "scaling-pool-memory-type=0",
+        "scaling-pool-compute-hw=0",
+        "scaling-filter=0",
+        f"custom-lib-path={PREPROCESS_LIB}",
+        "custom-tensor-preparation-function=CustomTensorPreparation",
+        "",
+        "[user-configs]",
+        f"pixel-normalization-factor={props.get('net-scale-factor', '1.0')}",
+    ]
+    if props.get("offsets"):
+        lines.append(f"offsets={props['offsets']}")
+    lines += [
+        "",
+        "[group-0]",
+        "src-ids=" + ";".join(str(source) for source in sorted(plan)),
+        "custom-input-transformation-function=CustomAsyncTransformation",
+        "process-on-roi=1",
+    ]
+    for source, rois in sorted(plan.items()):
+        lines.append(f"roi-params-src-{source}=" + ";".join(str(v) for roi in rois for v in roi))
+    return "\n".join(lines) + "\n"
+
+
+def describe_rois(plan):
+    return ", ".join(f"source {source}: " + " ".join("{}x{}+{}+{}".format(r.width, r.height, r.left, r.top)
+                                                     for r in rois)
+                     for source, rois in sorted(plan.items()))
+
+
+def create_preprocess(infer_config_path, plan):
+    """Write the preprocess config and return (nvdspreprocess element, tensors per batch).
+
+    The caller sets ``input-tensor-meta`` on nvinfer and raises its
+    batch-size to the returned number when it is larger. The config file is
+    removed when the process exits.
+    """
+    batch_size = sum(len(rois) for rois in plan.values())
+    fd, path = tempfile.mkstemp(prefix="ds-preprocess-", suffix=".txt")
+    atexit.register(_remove_config, path)
+    with os.fdopen(fd, "w") as f:
+        f.write(preprocess_config(infer_config_path, plan, batch_size))
+    preprocess = Gst.ElementFactory.make("nvdspreprocess", "preprocess")
+    if not preprocess:
+        return None, batch_size
+    preprocess.set_property("config-file", path)
+    print(f"Preprocess config: {path}")
+    return preprocess, batch_size
+
+
+def _remove_config(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,147 @@
+################################################################################
+# Runtime source management
+# Attach and detach source bins on nvstreammux request pads while the
+# pipeline stays in PLAYING. Only the affected source bin changes state;
+# every other source and everything downstream of the muxer keeps running.
+#
+# All methods must be called from the GLib main loop thread (for example
+# through dsutils.control.ControlServer, which dispatches there).
+################################################################################
+
+import sys
+import time
+
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+
+class SourceManager:
+    """Tracks the source bins linked to an nvstreammux.
+
+    ``make_source_bin(index, uri)`` builds the bin for a new source; the
+    scripts pass their own create_source_bin. Sources occupy streammux pads
+    ``sink_0`` .. ``sink_<max_sources-1>``; the pad index is also the
+    ``source_id`` in the frame metadata.
+    """
+
+    def __init__(self, pipeline, streammux, make_source_bin, max_sources):
+        self.pipeline = pipeline
+        self.streammux = streammux
+        self.make_source_bin = make_source_bin
+        self.max_sources = max_sources
+        self._sources = {}  # index -> (uri, source_bin)
+        self.last_change_ms = None
+
+    def free_index(self):
+        for index in range(self.max_sources):
+            if index not in self._sources:
+                return index
+        return None
+
+    def sources(self):
+        """Return {index: uri} of the attached sources."""
+        return {index: uri for index, (uri, _) in self._sources.items()}
+
+    def source_bin(self, index):
+        entry = self._sources.get(index)
+        return entry[1] if entry else None
+
+    def link_source(self, index, uri):
+        """Add and link a source bin before the pipeline starts."""
+        source_bin = self._attach(index, uri)
+        return source_bin is not None
+
+    def _attach(self, index, uri, make_source_bin=None):
+        source_bin = (make_source_bin or self.make_source_bin)(index, uri)
+        if not source_bin:
+            sys.stderr.write("Unable to create source bin\n")
+            return None
+        self.pipeline.add(source_bin)
+        if not self._link(index, uri, source_bin):
+            self.pipeline.remove(source_bin)
+            return None
+        return source_bin
+
+    def _link(self, index, uri, source_bin):
+        padname = "sink_%u" % index
+        sinkpad = self.streammux.request_pad_simple(padname)
+        if not sinkpad:
+            sys.stderr.write("Unable to get sink pad of streammux\n")
+            return False
+
+        srcpad = source_bin.get_static_pad("src")
+        if not srcpad:
+            sys.stderr.write("Unable to get src pad of source bin\n")
+            self.streammux.release_request_pad(sinkpad)
+            return False
+        srcpad.link(sinkpad)
+        self._sources[index] = (uri, source_bin)
+        return True
+
+    def add_source(self, uri, index=None, make_source_bin=None):
+        """Attach a new source to a free streammux pad of a running pipeline.
+
+        ``make_source_bin`` overrides the bin factory for this source only.
+        Returns the source index.
+        """
+        start = time.monotonic()
+        if index is None:
+            index = self.free_index()
+            if index is None:
+                raise RuntimeError(f"All {self.max_sources} source slots are in use")
+        elif index in self._sources:
+            raise RuntimeError(f"Source {index} is already attached")
+        elif not 0 <= index < self.max_sources:
+            raise RuntimeError(f"Source index {index} out of range 0..{self.max_sources - 1}")
+
+        source_bin = self._attach(index, uri, make_source_bin)
+        if source_bin is None:
+            raise RuntimeError(f"Unable to attach source {uri}")
+        # Bring only the new bin up to the pipeline's state
+        if source_bin.set_state(Gst.State.PLAYING) == Gst.StateChangeReturn.FAILURE:
+            self.remove_source(index)
+            raise RuntimeError(f"Unable to start source {uri}")
+
+        self.last_change_ms = (time.monotonic() - start) * 1000
+        print(f"Added source {index}: {uri} ({self.last_change_ms:.1f} ms)")
+        return index
+
+    def remove_source(self, index):
+        """Stop and detach source ``index``, releasing its streammux pad."""
+        start = time.monotonic()
+        entry = self._sources.pop(index, None)
+        if entry is None:
+            raise RuntimeError(f"No source {index}")
+        uri, source_bin = entry
+
+        state_return = source_bin.set_state(Gst.State.NULL)
+        if state_return == Gst.StateChangeReturn.ASYNC:
+            state_return = source_bin.get_state(Gst.CLOCK_TIME_NONE)[0]
+        if state_return == Gst.StateChangeReturn.FAILURE:
+            sys.stderr.write(f"Unable to stop source bin {index}\n")
+
+        sinkpad = self.streammux.get_static_pad("sink_%u" % index)
+        if sinkpad:
+            # Clear any flushing state the teardown left on the muxer pad
+            # before it is handed out again
+            sinkpad.send_event(Gst.Event.new_flush_stop(False))
+            self.streammux.release_request_pad(sinkpad)
+        self.pipeline.remove(source_bin)
+
+        self.last_change_ms = (time.monotonic() - start) * 1000
+        print(f"Removed source {index}: {uri} ({self.last_change_ms:.1f} ms)")
+        return index
+
+    def replace_source(self, index, uri, source_bin):
+        """Swap the bin on pad ``index`` for ``source_bin``.
+
+        ``source_bin`` must already be in the pipeline and playing, with its
+        src pad blocked until it is linked here, so the muxer pad changes
+        hands without a gap.
+        """
+        if index in self._sources:
+            self.remove_source(index)
+        if not self._link(index, uri, source_bin):
+            raise RuntimeError(f"Unable to link source {uri}")
+        return index
@@ -0,0 +1,322 @@
+################################################################################
+# Source reconnection supervisor
+# Keeps the pipeline running when one RTSP source fails. A source counts as
+# failed when its bin posts an error, sends EOS, or stops delivering buffers
+# for ``stall_timeout`` seconds. Then only that bin is torn down:
+#
+#   1. the bin is removed and a placeholder (black videotestsrc at the
+#      muxer resolution) takes its nvstreammux pad, so batches, inference
+#      and the outputs keep their shape
+#   2. after a backoff (initial_backoff, doubling up to max_backoff) a new
+#      bin is built with the script's create_source_bin, added next to the
+#      placeholder and started with its src pad blocked
+#   3. when the new bin produces data it replaces the placeholder on the
+#      same pad; if it fails or does not produce data within
+#      ``connect_timeout`` it is dropped and the next attempt waits longer
+#
+# Recovery time (failure to first data from the rebuilt bin) is kept per
+# source and exposed through stats(), the control socket and Prometheus.
+#
+# Errors from source bins never reach the scripts' bus_call, so a camera
+# dropout no longer ends the main loop; wrap it with bus_filter(). Like
+# SourceManager, everything runs in the GLib main loop thread.
+################################################################################
+
+import time
+import collections
+
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst, GLib
+
+from dsutils.test_source import create_test_source_bin
+
+SOURCE_BIN_PREFIX = "source-bin-"
+PLACEHOLDER_BIN_PREFIX = "placeholder-bin-"
+
+
+def supervised_uri(uri):
+    """Only network streams are reconnected; files ending is not a failure."""
+    return uri.startswith(("rtsp://", "rtsps://"))
+
+
+class _Slot:
+    __slots__ = ("uri", "state", "bin", "generation", "failures", "reconnects", "backoff",
+                 "failed_at", "attempt_at", "last_buffer", "last_error", "recoveries",
+                 "timer", "block_probe")
+
+    def __init__(self, uri, source_bin, backoff):
+        self.uri = uri
+        self.state = "starting"  # starting, up, down, connecting
+        self.bin = source_bin     # the real bin currently in the pipeline, if any
+        self.generation = 0
+        self.failures = 0
+        self.reconnects = 0
+        self.backoff = backoff
+        self.failed_at = None
+        self.attempt_at = time.monotonic()
+        self.last_buffer = None
+        self.last_error = None
+        self.recoveries = collections.deque(maxlen=32)  # seconds
+        self.timer = None
+        self.block_probe = None
+
+
+class SourceSupervisor:
+    """Rebuilds failed sources of a SourceManager in place."""
+
+    def __init__(self, source_manager, initial_backoff=1.0, max_backoff=30.0,
+                 stall_timeout=5.0, connect_timeout=15.0, placeholder_uri=None):
+        self.manager = source_manager
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.stall_timeout = stall_timeout
+        self.connect_timeout = connect_timeout
+        if placeholder_uri is None:
+            streammux = source_manager.streammux
+            placeholder_uri = (f"videotestsrc://black?width={streammux.get_property('width')}"
+                               f"&height={streammux.get_property('height')}&fps=30")
+        self.placeholder_uri = placeholder_uri
+        self._slots = {}
+        self._timer = None
+
+    # -- setup -------------------------------------------------------------
+
+    def supervise(self, index):
+        """Supervise the source attached on ``index``."""
+        uri = self.manager.sources()[index]
+        slot = _Slot(uri, self.manager.source_bin(index), self.initial_backoff)
+        self._slots[index] = slot
+        self._watch(index, slot)
+
+    def supervise_all(self):
+        for index, uri in self.manager.sources().items():
+            if supervised_uri(uri) and index not in self._slots:
+                self.supervise(index)
+
+    def forget(self, index):
+        """Stop supervising ``index``, e.g. before removing it on purpose."""
+        slot = self._slots.pop(index, None)
+        if slot is None:
+            return
+        slot.generation += 1
+        if slot.timer is not None:
+            GLib.source_remove(slot.timer)
+        if slot.state == "connecting":
+            self._discard(slot.bin)
+        if slot.state in ("down", "connecting"):
+            # The placeholder holds the pad; leave the slot empty
+            self.manager.remove_source(index)
+
+    def add_source(self, uri, index=None):
+        """SourceManager.add_source that also supervises network sources."""
+        index = self.manager.add_source(uri, index)
+        if supervised_uri(uri):
+            self.supervise(index)
+        return index
+
+    def remove_source(self, index):
+        """SourceManager.remove_source that stops supervising first."""
+        supervised = index in self._slots
+        self.forget(index)
+        if not supervised or index in self.manager.sources():
+            self.manager.remove_source(index)
+        return index
+
+    def start(self):
+        self.supervise_all()
+        self._timer = GLib.timeout_add(1000, self._check_stalls)
+
+    def stop(self):
+        if self._timer is not None:
+            GLib.source_remove(self._timer)
+            self._timer = None
+        for slot in self._slots.values():
+            if slot.timer is not None:
+                GLib.source_remove(slot.timer)
+                slot.timer = None
+
+    def bus_filter(self, handler):
+        """Wrap a bus handler so errors from supervised source bins are handled here."""
+        def on_message(bus, message, *user_data):
+            if message.type == Gst.MessageType.ERROR:
+                kind, index = self._owner(message.src)
+                if kind is not None and index in self._slots:
+                    err, _ = message.parse_error()
+                    if kind == SOURCE_BIN_PREFIX:
+                        self._fail(index, None, err.message, self._top_bin(message.src))
+                    return True
+            return handler(bus, message, *user_data)
+        return on_message
+
+    # -- state changes -----------------------------------------------------
+
+    def _watch(self, index, slot):
+        """Probe the real bin's src pad for data and EOS."""
+        pad = slot.bin.get_static_pad("src")
+        generation = slot.generation
+        pad.add_probe(Gst.PadProbeType.BUFFER, self._on_buffer, (index, generation))
+        pad.add_probe(Gst.PadProbeType.EVENT_DOWNSTREAM, self._on_event, (index, generation))
+
+    def _on_buffer(self, pad, info, data):
+        index, generation = data
+        slot = self._slots.get(index)
+        if slot is not None and slot.generation == generation:
+            slot.last_buffer = time.monotonic()
+            if slot.state == "starting":
+                slot.state = "up"
+        return Gst.PadProbeReturn.OK
+
+    def _on_event(self, pad, info, data):
+        if info.get_event().type != Gst.EventType.EOS:
+            return Gst.PadProbeReturn.OK
+        index, generation = data
+        # Keep the EOS away from the muxer; the slot is rebuilt instead
+        GLib.idle_add(self._fail, index, generation, "end of stream", None)
+        return Gst.PadProbeReturn.DROP
+
+    def _fail(self, index, generation, reason, source_bin):
+        slot = self._slots.get(index)
+        if slot is None or (generation is not None and generation != slot.generation):
+            return False
+        if source_bin is not None and source_bin is not slot.bin:
+            return False  # a late message from a bin that is already gone
+        if slot.state == "down":
+            return False
+        now = time.monotonic()
+        slot.generation += 1
+        slot.failures += 1
+        slot.last_error = reason
+        if slot.state in ("starting", "up"):
+            slot.failed_at = now
+            print(f"Source {index} failed ({reason}); switching to placeholder")
+            self.manager.remove_source(index)
+            self.manager.add_source(self.placeholder_uri, index, make_source_bin=self._make_placeholder)
+        else:  # a reconnect attempt failed; the placeholder is still attached
+            print(f"Source {index} reconnect failed ({reason})")
+            self._discard(slot.bin)
+            slot.backoff = min(slot.backoff * 2, self.max_backoff)
+        slot.bin = None
+        slot.state = "down"
+        print(f"Source {index}: retrying in {slot.backoff:.0f}s")
+        slot.timer = GLib.timeout_add(int(slot.backoff * 1000), self._reconnect, index)
+        return False
+
+    def _make_placeholder(self, index, uri):
+        source_bin = create_test_source_bin(index, uri)
+        if source_bin:
+            # The real bin's name stays free for the reconnect attempt
+            source_bin.set_name(PLACEHOLDER_BIN_PREFIX + "%02d" % index)
+        return source_bin
+
+    def _reconnect(self, index):
+        slot = self._slots.get(index)
+        if slot is None:
+            return False
+        slot.timer = None
+        slot.generation += 1
+        slot.attempt_at = time.monotonic()
+        source_bin = self.manager.make_source_bin(index, slot.uri)
+        if not source_bin:
+            slot.state = "connecting"
+            self._fail(index, None, "unable to create source bin", None)
+            return False
+        self.manager.pipeline.add(source_bin)
+        slot.bin = source_bin
+        slot.state = "connecting"
+        pad = source_bin.get_static_pad("src")
+        slot.block_probe = pad.add_probe(Gst.PadProbeType.BLOCK_DOWNSTREAM, self._on_ready,
+                                         (index, slot.generation))
+        pad.add_probe(Gst.PadProbeType.EVENT_DOWNSTREAM, self._on_event, (index, slot.generation))
+        if source_bin.set_state(Gst.State.PLAYING) == Gst.StateChangeReturn.FAILURE:
+            self._fail(index, slot.generation, "unable to start source bin", None)
+        return False
+
+    def _on_ready(self, pad, info, data):
+        # The blocking probe also sees stream-start, caps and segment before
+        # any data; let those through (they stay sticky on the pad) and only
+        # count the source as back on its first buffer
+        if not info.type & (Gst.PadProbeType.BUFFER | Gst.PadProbeType.BUFFER_LIST):
+            return Gst.PadProbeReturn.PASS
+        # Streaming thread: the new bin has data; keep it blocked until the
+        # main loop has swapped it in
+        GLib.idle_add(self._promote, *data)
+        return Gst.PadProbeReturn.OK
+
+    def _promote(self, index, generation):
+        slot = self._slots.get(index)
+        if slot is None or slot.generation != generation or slot.state != "connecting":
+            return False
+        source_bin = slot.bin
+        pad = source_bin.get_static_pad("src")
+        self.manager.replace_source(index, slot.uri, source_bin)
+        slot.generation += 1
+        self._watch(index, slot)
+        pad.remove_probe(slot.block_probe)
+        slot.block_probe = None
+
+        recovery = time.monotonic() - slot.failed_at
+        slot.recoveries.append(recovery)
+        slot.reconnects += 1
+        slot.backoff = self.initial_backoff
+        slot.state = "up"
+        slot.last_buffer = time.monotonic()
+        print(f"Source {index} reconnected after {recovery:.1f}s")
+        return False
+
+    def _discard(self, source_bin):
+        if source_bin is None:
+            return
+        source_bin.set_state(Gst.State.NULL)
+        self.manager.pipeline.remove(source_bin)
+
+    def _check_stalls(self):
+        now = time.monotonic()
+        for index, slot in list(self._slots.items()):
+            if slot.state == "up" and now - slot.last_buffer > self.stall_timeout:
+                self._fail(index, slot.generation, f"no data for {self.stall_timeout:.0f}s", None)
+            elif slot.state in ("starting", "connecting") and now - slot.attempt_at > self.connect_timeout:
+                self._fail(index, slot.generation, f"no data within {self.connect_timeout:.0f}s", None)
+        return True
+
+    # -- lookup ------------------------------------------------------------
+
+    def _top_bin(self, element):
+        """The direct child of the pipeline that contains ``element``."""
+        while element is not None and element.get_parent() is not None \
+                and element.get_parent() is not self.manager.pipeline:
+            element = element.get_parent()
+        return element
+
+    def _owner(self, element):
+        """(prefix, index) of the source or placeholder bin containing ``element``."""
+        top = self._top_bin(element)
+        name = top.get_name() if top is not None else ""
+        for prefix in (SOURCE_BIN_PREFIX, PLACEHOLDER_BIN_PREFIX):
+            if name.startswith(prefix):
+                try:
+                    return prefix, int(name[len(prefix):])
+                except ValueError:
+                    break
+        return None, None
+
+    # -- reporting ---------------------------------------------------------
+
+    def stats(self):
+        """{index: {...}} with state, failures, reconnects and recovery times in seconds."""
+        now = time.monotonic()
+        result = {}
+        for index, slot in sorted(self._slots.items()):
+            down = slot.state in ("down", "connecting")
+            result[index] = {
+                "uri": slot.uri,
+                "state": slot.state,
+                "failures": slot.failures,
+                "reconnects": slot.reconnects,
+                "down_for_s": now - slot.failed_at if down and slot.failed_at else 0.0,
+                "last_recovery_s": slot.recoveries[-1] if slot.recoveries else None,
+                "max_recovery_s": max(slot.recoveries) if slot.recoveries else None,
+                "next_backoff_s": slot.backoff,
+                "last_error": slot.last_error,
+            }
+        return result
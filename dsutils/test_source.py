@@ -0,0 +1,79 @@
+################################################################################
+# Synthetic source bins
+# Stand-ins for create_source_bin() that generate frames with videotestsrc,
+# addressed with URIs of the form
+#
+#   videotestsrc://<pattern>?width=1280&height=720&fps=30
+#
+# so scripts and benchmarks can run without cameras.
+################################################################################
+
+import sys
+from urllib.parse import urlsplit, parse_qs
+
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+TEST_SOURCE_SCHEME = "videotestsrc"
+
+
+def is_test_source_uri(uri):
+    return uri.startswith(TEST_SOURCE_SCHEME + "://")
+
+
+def parse_test_source_uri(uri):
+    """Return (pattern, width, height, fps) from a videotestsrc:// URI."""
+    parts = urlsplit(uri)
+    query = parse_qs(parts.query)
+    pattern = parts.netloc or "smpte"
+    width = int(query.get("width", ["1280"])[0])
+    height = int(query.get("height", ["720"])[0])
+    fps = int(query.get("fps", ["30"])[0])
+    return pattern, width, height, fps
+
+
+def create_test_source_bin(index, uri, nvmm=True):
+    """Create a source bin named like create_source_bin() that plays videotestsrc.
+
+    With ``nvmm`` the output is NV12 in NVMM memory, as nvstreammux expects;
+    otherwise it stays in system memory for software-only pipelines.
+    """
+    pattern, width, height, fps = parse_test_source_uri(uri)
+    bin_name = "source-bin-%02d" % index
+    nbin = Gst.Bin.new(bin_name)
+    if not nbin:
+        sys.stderr.write("Unable to create source bin\n")
+        return None
+
+    src = Gst.ElementFactory.make("videotestsrc", "test-src")
+    caps = Gst.ElementFactory.make("capsfilter", "test-caps")
+    if not src or not caps:
+        sys.stderr.write("Unable to create videotestsrc\n")
+        return None
+    src.set_property("is-live", True)
+    Gst.util_set_object_arg(src, "pattern", pattern)
+    caps.set_property("caps", Gst.Caps.from_string(
+        f"video/x-raw,width={width},height={height},framerate={fps}/1"))
+    elements = [src, caps]
+
+    if nvmm:
+        conv = Gst.ElementFactory.make("nvvideoconvert", "test-conv")
+        nvmm_caps = Gst.ElementFactory.make("capsfilter", "test-nvmm-caps")
+        if not conv or not nvmm_caps:
+            sys.stderr.write("Unable to create nvvideoconvert\n")
+            return None
+        nvmm_caps.set_property("caps", Gst.Caps.from_string(
+            "video/x-raw(memory:NVMM),format=NV12"))
+        elements += [conv, nvmm_caps]
+
+    for element in elements:
+        nbin.add(element)
+    for upstream, downstream in zip(elements, elements[1:]):
+        upstream.link(downstream)
+
+    bin_pad = nbin.add_pad(Gst.GhostPad.new("src", elements[-1].get_static_pad("src")))
+    if not bin_pad:
+        sys.stderr.write("Failed to add ghost pad in source bin\n")
+        return None
+    return nbin
@@ -0,0 +1,463 @@
+################################################################################
+# V4L2 device enumeration
+# Queries capture devices directly with V4L2 ioctls (VIDIOC_QUERYCAP,
+# VIDIOC_ENUM_FMT, VIDIOC_ENUM_FRAMESIZES, VIDIOC_ENUM_FRAMEINTERVALS)
+# instead of running v4l2-ctl and parsing its text, so it works on hosts
+# without v4l-utils and returns structured results.
+#
+# DeviceCache keeps the results per device node and re-reads a node when its
+# device number or change time differs; HotplugWatcher clears the cache when
+# /dev/video* nodes appear or disappear.
+#
+# The ioctl calls go through an ioctl layer object, so dsutils.fake_v4l2 can
+# stand in for real cameras.
+#
+#   python3 -m dsutils.v4l2 [/dev/videoN]
+################################################################################
+
+import os
+import sys
+import glob
+import ctypes
+import fcntl
+import errno
+import select
+import struct
+import threading
+import collections
+from fractions import Fraction
+
+# ioctl request encoding from <asm-generic/ioctl.h>
+_IOC_WRITE = 1
+_IOC_READ = 2
+
+
+def _ioc(direction, nr, size):
+    return (direction << 30) | (size << 16) | (ord("V") << 8) | nr
+
+
+V4L2_BUF_TYPE_VIDEO_CAPTURE = 1
+V4L2_CAP_VIDEO_CAPTURE = 0x00000001
+V4L2_CAP_VIDEO_CAPTURE_MPLANE = 0x00001000
+V4L2_CAP_STREAMING = 0x04000000
+V4L2_CAP_DEVICE_CAPS = 0x80000000
+V4L2_FMT_FLAG_COMPRESSED = 0x0001
+V4L2_FRMSIZE_TYPE_DISCRETE = 1
+V4L2_FRMSIZE_TYPE_CONTINUOUS = 2
+V4L2_FRMSIZE_TYPE_STEPWISE = 3
+V4L2_FRMIVAL_TYPE_DISCRETE = 1
+
+
+class v4l2_capability(ctypes.Structure):
+    _fields_ = [
+        ("driver", ctypes.c_char * 16),
+        ("card", ctypes.c_char * 32),
+        ("bus_info", ctypes.c_char * 32),
+        ("version", ctypes.c_uint32),
+        ("capabilities", ctypes.c_uint32),
+        ("device_caps", ctypes.c_uint32),
+        ("reserved", ctypes.c_uint32 * 3),
+    ]
+
+
+class v4l2_fmtdesc(ctypes.Structure):
+    _fields_ = [
+        ("index", ctypes.c_uint32),
+        ("type", ctypes.c_uint32),
+        ("flags", ctypes.c_uint32),
+        ("description", ctypes.c_char * 32),
+        ("pixelformat", ctypes.c_uint32),
+        ("mbus_code", ctypes.c_uint32),
+        ("reserved", ctypes.c_uint32 * 3),
+    ]
+
+
+class v4l2_frmsize_discrete(ctypes.Structure):
+    _fields_ = [("width", ctypes.c_uint32), ("height", ctypes.c_uint32)]
+
+
+class v4l2_frmsize_stepwise(ctypes.Structure):
+    _fields_ = [
+        ("min_width", ctypes.c_uint32),
+        ("max_width", ctypes.c_uint32),
+        ("step_width", ctypes.c_uint32),
+        ("min_height", ctypes.c_uint32),
+        ("max_height", ctypes.c_uint32),
+        ("step_height", ctypes.c_uint32),
+    ]
+
+
+class _frmsize_union(ctypes.Union):
+    _fields_ = [("discrete", v4l2_frmsize_discrete), ("stepwise", v4l2_frmsize_stepwise)]
+
+
+class v4l2_frmsizeenum(ctypes.Structure):
+    _anonymous_ = ("u",)
+    _fields_ = [
+        ("index", ctypes.c_uint32),
+        ("pixel_format", ctypes.c_uint32),
+        ("type", ctypes.c_uint32),
+        ("u", _frmsize_union),
+        ("reserved", ctypes.c_uint32 * 2),
+    ]
+
+
+class v4l2_fract(ctypes.Structure):
+    _fields_ = [("numerator", ctypes.c_uint32), ("denominator", ctypes.c_uint32)]
+
+
+class v4l2_frmival_stepwise(ctypes.Structure):
+    _fields_ = [("min", v4l2_fract), ("max", v4l2_fract), ("step", v4l2_fract)]
+
+
+class _frmival_union(ctypes.Union):
+    _fields_ = [("discrete", v4l2_fract), ("stepwise", v4l2_frmival_stepwise)]
+
+
+class v4l2_frmivalenum(ctypes.Structure):
+    _anonymous_ = ("u",)
+    _fields_ = [
+        ("index", ctypes.c_uint32),
+        ("pixel_format", ctypes.c_uint32),
+        ("width", ctypes.c_uint32),
+        ("height", ctypes.c_uint32),
+        ("type", ctypes.c_uint32),
+        ("u", _frmival_union),
+        ("reserved", ctypes.c_uint32 * 2),
+    ]
+
+
+VIDIOC_QUERYCAP = _ioc(_IOC_READ, 0, ctypes.sizeof(v4l2_capability))
+VIDIOC_ENUM_FMT = _ioc(_IOC_READ | _IOC_WRITE, 2, ctypes.sizeof(v4l2_fmtdesc))
+VIDIOC_ENUM_FRAMESIZES = _ioc(_IOC_READ | _IOC_WRITE, 74, ctypes.sizeof(v4l2_frmsizeenum))
+VIDIOC_ENUM_FRAMEINTERVALS = _ioc(_IOC_READ | _IOC_WRITE, 75, ctypes.sizeof(v4l2_frmivalenum))
+
+
+def fourcc_to_str(code):
+    return struct.pack("<I", code).decode("ascii", "replace").rstrip("\0 ")
+
+
+def str_to_fourcc(text):
+    return struct.unpack("<I", text.ljust(4).encode("ascii"))[0]
+
+
+DeviceInfo = collections.namedtuple(
+    "DeviceInfo", ["path", "driver", "card", "bus_info", "capabilities", "device_caps", "formats"])
+DeviceInfo.__doc__ = "A V4L2 node; ``formats`` is a list of FormatInfo."
+
+FormatInfo = collections.namedtuple(
+    "FormatInfo", ["fourcc", "description", "compressed", "sizes"])
+FormatInfo.__doc__ = "A pixel format; ``sizes`` is a list of FrameSize."
+
+FrameSize = collections.namedtuple("FrameSize", ["width", "height", "stepwise", "fps"])
+FrameSize.__doc__ = """A frame size and its frame rates (frames/s, highest first).
+
+For stepwise or continuous sizes ``stepwise`` holds
+(min_width, max_width, step_width, min_height, max_height, step_height) and
+width/height are the maximum. Stepwise frame intervals are reported as
+their (max, min) frame rates.
+"""
+
+
+def is_capture_device(info):
+    caps = info.device_caps if info.capabilities & V4L2_CAP_DEVICE_CAPS else info.capabilities
+    return bool(caps & (V4L2_CAP_VIDEO_CAPTURE | V4L2_CAP_VIDEO_CAPTURE_MPLANE))
+
+
+class SystemIoctl:
+    """The real ioctl layer: device nodes under /dev."""
+
+    def list_nodes(self):
+        return sorted(glob.glob("/dev/video*"), key=_node_number)
+
+    def open(self, path):
+        return os.open(path, os.O_RDWR | os.O_NONBLOCK)
+
+    def close(self, fd):
+        os.close(fd)
+
+    def ioctl(self, fd, request, arg):
+        fcntl.ioctl(fd, request, arg, True)
+
+    def signature(self, path):
+        """Changes when the node is replaced by another device."""
+        st = os.stat(path)
+        return (st.st_rdev, st.st_ctime_ns)
+
+
+def _node_number(path):
+    digits = path[len(path.rstrip("0123456789")):]
+    return int(digits) if digits else -1
+
+
+def _enum(io, fd, request, arg):
+    """Yield ``arg`` for index 0, 1, ... until the driver returns EINVAL."""
+    index = 0
+    while True:
+        arg.index = index
+        try:
+            io.ioctl(fd, request, arg)
+        except OSError as e:
+            if e.errno == errno.EINVAL:
+                return
+            raise
+        yield arg
+        index += 1
+
+
+def _frame_rates(io, fd, pixelformat, width, height):
+    ival = v4l2_frmivalenum(pixel_format=pixelformat, width=width, height=height)
+    rates = []
+    for ival in _enum(io, fd, VIDIOC_ENUM_FRAMEINTERVALS, ival):
+        if ival.type == V4L2_FRMIVAL_TYPE_DISCRETE:
+            fract = ival.discrete
+            if fract.numerator:
+                rates.append(float(Fraction(fract.denominator, fract.numerator)))
+        else:
+            low, high = ival.stepwise.min, ival.stepwise.max
+            if low.numerator and high.numerator:
+                rates.extend([float(Fraction(low.denominator, low.numerator)),
+                              float(Fraction(high.denominator, high.numerator))])
+            break
+    return tuple(sorted(set(rates), reverse=True))
+
+
+def _frame_sizes(io, fd, pixelformat):
+    size = v4l2_frmsizeenum(pixel_format=pixelformat)
+    sizes = []
+    for size in _enum(io, fd, VIDIOC_ENUM_FRAMESIZES, size):
+        if size.type == V4L2_FRMSIZE_TYPE_DISCRETE:
+            width, height = size.discrete.width, size.discrete.height
+            sizes.append(FrameSize(width, height, None,
+                                   _frame_rates(io, fd, pixelformat, width, height)))
+        else:
+            sw = size.stepwise
+            stepwise = (sw.min_width, sw.max_width, sw.step_width,
+                        sw.min_height, sw.max_height, sw.step_height)
+            sizes.append(FrameSize(sw.max_width, sw.max_height, stepwise,
+                                   _frame_rates(io, fd, pixelformat, sw.max_width, sw.max_height)))
+            break  # stepwise and continuous sizes have only index 0
+    return sizes
+
+
+def query_device(path, io=None):
+    """Read capabilities and capture formats of one device node.
+
+    Raises OSError when the node cannot be opened or queried.
+    """
+    io = io or SystemIoctl()
+    fd = io.open(path)
+    try:
+        cap = v4l2_capability()
+        io.ioctl(fd, VIDIOC_QUERYCAP, cap)
+        formats = []
+        fmt = v4l2_fmtdesc(type=V4L2_BUF_TYPE_VIDEO_CAPTURE)
+        if (cap.device_caps if cap.capabilities & V4L2_CAP_DEVICE_CAPS
+                else cap.capabilities) & V4L2_CAP_VIDEO_CAPTURE:
+            for fmt in _enum(io, fd, VIDIOC_ENUM_FMT, fmt):
+                formats.append(FormatInfo(
+                    fourcc_to_str(fmt.pixelformat),
+                    fmt.description.decode(errors="replace"),
+                    bool(fmt.flags & V4L2_FMT_FLAG_COMPRESSED),
+                    _frame_sizes(io, fd, fmt.pixelformat)))
+        return DeviceInfo(path, cap.driver.decode(errors="replace"),
+                          cap.card.decode(errors="replace"),
+                          cap.bus_info.decode(errors="replace"),
+                          cap.capabilities, cap.device_caps, formats)
+    finally:
+        io.close(fd)
+
+
+class DeviceCache:
+    """Caches query_device() results per node.
+
+    A cached entry is reused while the node's signature (device number and
+    change time) is unchanged; ``invalidate()`` drops everything, which is
+    what HotplugWatcher calls.
+    """
+
+    def __init__(self, io=None):
+        self.io = io or SystemIoctl()
+        self._lock = threading.Lock()
+        self._entries = {}  # path -> (signature, DeviceInfo or OSError)
+        self.generation = 0  # bumped on every invalidation
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+            self.generation += 1
+
+    def device(self, path):
+        """DeviceInfo for ``path``; raises OSError if it cannot be queried."""
+        try:
+            signature = self.io.signature(path)
+        except OSError:
+            self.invalidate(path)
+            raise
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is None or entry[0] != signature:
+            try:
+                result = query_device(path, self.io)
+            except OSError as e:
+                result = e
+            entry = (signature, result)
+            with self._lock:
+                self._entries[path] = entry
+        if isinstance(entry[1], OSError):
+            raise entry[1]
+        return entry[1]
+
+    def devices(self, capture_only=True):
+        """DeviceInfo of every node that can be queried."""
+        result = []
+        for path in self.io.list_nodes():
+            try:
+                info = self.device(path)
+            except OSError:
+                continue
+            if not capture_only or is_capture_device(info):
+                result.append(info)
+        return result
+
+
+# inotify constants from <sys/inotify.h>
+_IN_ATTRIB = 0x00000004
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class HotplugWatcher:
+    """Invalidates a DeviceCache when video nodes are added or removed.
+
+    Uses inotify on /dev for the system ioctl layer. Other layers, or hosts
+    where inotify is unavailable, are polled every ``interval`` seconds by
+    comparing the node list. ``on_change(paths)`` is called from the watcher
+    thread after each invalidation.
+    """
+
+    def __init__(self, cache, on_change=None, interval=1.0):
+        self.cache = cache
+        self.on_change = on_change
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._inotify_fd = None
+
+    def start(self):
+        if isinstance(self.cache.io, SystemIoctl):
+            self._inotify_fd = self._open_inotify()
+        target = self._watch_inotify if self._inotify_fd is not None else self._watch_poll
+        self._thread = threading.Thread(target=target, name="v4l2-hotplug", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+
+    def _changed(self, paths):
+        self.cache.invalidate()
+        if self.on_change:
+            self.on_change(paths)
+
+    @staticmethod
+    def _open_inotify():
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+            if fd < 0:
+                return None
+            if libc.inotify_add_watch(fd, b"/dev", _IN_CREATE | _IN_DELETE | _IN_ATTRIB) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
+
+    def _watch_inotify(self):
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._inotify_fd], [], [], self.interval)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._inotify_fd, 4096)
+            except BlockingIOError:
+                continue
+            paths = []
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+                offset += length
+                if name.startswith("video"):
+                    paths.append("/dev/" + name)
+            if paths:
+                self._changed(sorted(set(paths)))
+
+    def _watch_poll(self):
+        known = set(self.cache.io.list_nodes())
+        while not self._stop.wait(self.interval):
+            nodes = set(self.cache.io.list_nodes())
+            if nodes != known:
+                changed = sorted(nodes ^ known)
+                known = nodes
+                self._changed(changed)
+
+
+_default_cache = None
+
+
+def default_cache():
+    """Process-wide DeviceCache on the real /dev nodes."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = DeviceCache()
+    return _default_cache
+
+
+def format_device(info):
+    """Text listing of a device's formats, similar to v4l2-ctl --list-formats-ext."""
+    lines = [f"{info.path}: {info.card} ({info.driver}, {info.bus_info})"]
+    for index, fmt in enumerate(info.formats):
+        kind = "compressed" if fmt.compressed else "raw"
+        lines.append(f"  [{index}] '{fmt.fourcc}' ({fmt.description}, {kind})")
+        for size in fmt.sizes:
+            if size.stepwise:
+                min_w, max_w, step_w, min_h, max_h, step_h = size.stepwise
+                label = f"{min_w}x{min_h} - {max_w}x{max_h} step {step_w}x{step_h}"
+            else:
+                label = f"{size.width}x{size.height}"
+            rates = ", ".join(f"{fps:g}" for fps in size.fps)
+            lines.append(f"      {label} @ {rates} fps")
+    return "\n".join(lines)
+
+
+def main(argv):
+    cache = default_cache()
+    if len(argv) > 1:
+        try:
+            infos = [cache.device(argv[1])]
+        except OSError as e:
+            print(f"{argv[1]}: {e}")
+            return 1
+    else:
+        infos = cache.devices()
+    for info in infos:
+        print(format_device(info))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -8,6 +8,7 @@
 
 import sys
 import argparse
+import math
 
 sys.path.append("../")
 from common.bus_call import bus_call
@@ -18,6 +19,28 @@ import gi
 gi.require_version("Gst", "1.0")
 from gi.repository import Gst, GLib
 import datetime
+from dsutils.abr import BitrateController, bitrate_bounds, ensure_sink_queue
+from dsutils.batch_meta import BatchMetaReader
+from dsutils.carry_forward import CARRY_MODES, DetectionCarry
+from dsutils.counting import ObjectCounter
+from dsutils.detection_ring import DEFAULT_PATH as DEFAULT_RING_PATH, DetectionRingWriter, ParquetRollover
+from dsutils.infer_config import load_config_labels
+from dsutils.infer_scheduler import DEFAULT_TARGET_MS, InferenceScheduler, ensure_infer_queue, interval_option
+from dsutils.osd import LabelTable
+from dsutils.control import ControlServer
+from dsutils.ingest import PROFILES as INGEST_PROFILES, IngestMeter, configure_uridecodebin, ingest_profile
+from dsutils.latency import LatencyTracer
+from dsutils.live_control import LiveControl
+from dsutils.metrics import PipelineMetrics, metrics_port
+from dsutils.motion import DEFAULT_THRESHOLD, REFRESH_FRAMES, MotionDetector
+from dsutils.motion_gate import MotionGate, create_gate_converter
+from dsutils.mux_tuner import BatchTimeoutTuner
+from dsutils.profiler import ElementProfiler
+from dsutils.queues import PROFILES, StageQueues, describe_plan, queue_option, queue_properties, stage_plan
+from dsutils.roi import create_preprocess, describe_rois, plan_rois, roi_option
+from dsutils.source_manager import SourceManager
+from dsutils.supervisor import SourceSupervisor
+from dsutils.test_source import create_test_source_bin, is_test_source_uri
 
 # Constants
 PGIE_CLASS_ID_VEHICLE = 0
@@ -27,15 +50,43 @@ PGIE_CLASS_ID_ROADSIGN = 3
 MUXER_OUTPUT_WIDTH = 1920
 MUXER_OUTPUT_HEIGHT = 1080
 MUXER_BATCH_TIMEOUT_USEC = 33000
+TILED_OUTPUT_WIDTH = 1920
+TILED_OUTPUT_HEIGHT = 1080
 OSD_PROCESS_MODE = 0
 OSD_DISPLAY_TEXT = 1
 DEFAULT_BITRATE = 4000000  # 4Mbps
 
+# Class names indexed by class_id, used when the config has no label file
+CLASS_NAMES = {
+    PGIE_CLASS_ID_VEHICLE: "Vehicle",
+    PGIE_CLASS_ID_BICYCLE: "TwoWheeler",
+    PGIE_CLASS_ID_PERSON: "Person",
+    PGIE_CLASS_ID_ROADSIGN: "RoadSign",
+}
+
+# Label text and style table, built from the inference config in main()
+label_table = None
+
+# Per-frame and rolling per-class object counts, created in main().
+# Query it through its methods, e.g. object_counter.window_counts(10, source_id)
+object_counter = None
+
+# Reads each batch's detections into arrays in a single pass
+batch_reader = BatchMetaReader(pyds)
+# Prometheus metrics, set in main() when --metrics-port is given
+pipeline_metrics = None
+# Adaptive inference interval, set in main() with --adaptive-interval
+infer_scheduler = None
+# Skips inference on static batches, set in main() with --motion-gate
+motion_gate = None
+# Fills frames the detector skipped, set in main() with either of the above
+detection_carry = None
+# Detection records for other processes, set in main() with --detection-ring
+detection_ring = None
+
 # pgie_src_pad_buffer_probe will extract metadata received on OSD sink pad
 # and update params for drawing rectangle, object information etc.
 def pgie_src_pad_buffer_probe(pad, info, u_data):
-    frame_number = 0
-    num_rects = 0
     gst_buffer = info.get_buffer()
     if not gst_buffer:
         print("Unable to get GstBuffer ")
@@ -43,67 +94,33 @@ def pgie_src_pad_buffer_probe(pad, info, u_data):
 
     # Retrieve batch metadata from the gst_buffer
     batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
-    l_frame = batch_meta.frame_meta_list
-    while l_frame is not None:
-        try:
-            frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
-        except StopIteration:
-            break
-
-        frame_number = frame_meta.frame_num
-        num_detected_objects = 0
-        l_obj = frame_meta.obj_meta_list
-        while l_obj is not None:
-            try:
-                obj_meta = pyds.NvDsObjectMeta.cast(l_obj.data)
-            except StopIteration:
-                break
-
-            # Update object text metadata with detection info
-            obj_counter = {
-                PGIE_CLASS_ID_VEHICLE: 0,
-                PGIE_CLASS_ID_PERSON: 0,
-                PGIE_CLASS_ID_BICYCLE: 0,
-                PGIE_CLASS_ID_ROADSIGN: 0
-            }
-            obj_counter[obj_meta.class_id] += 1
-            num_detected_objects += 1
-
-            # Get class name from object meta
-            if obj_meta.class_id == PGIE_CLASS_ID_VEHICLE:
-                obj_meta.text_params.display_text = "Vehicle {:.2f}".format(obj_meta.confidence)
-            elif obj_meta.class_id == PGIE_CLASS_ID_PERSON:
-                obj_meta.text_params.display_text = "Person {:.2f}".format(obj_meta.confidence)
-            elif obj_meta.class_id == PGIE_CLASS_ID_BICYCLE:
-                obj_meta.text_params.display_text = "TwoWheeler {:.2f}".format(obj_meta.confidence)
-            elif obj_meta.class_id == PGIE_CLASS_ID_ROADSIGN:
-                obj_meta.text_params.display_text = "RoadSign {:.2f}".format(obj_meta.confidence)
-
-            # Set text font and color
-            obj_meta.text_params.font_params.font_name = "Arial"
-            obj_meta.text_params.font_params.font_size = 14
-            obj_meta.text_params.font_params.font_color.set(1.0, 1.0, 0.0, 1.0)
-            obj_meta.text_params.set_bg_clr = 1
-            obj_meta.text_params.text_bg_clr.set(0.0, 0.0, 0.0, 0.5)
-
-            try:
-                l_obj = l_obj.next
-            except StopIteration:
-                break
-
-        # Print frame stats
-        # print("Frame Number={}, Number of Objects={}".format(frame_number, num_detected_objects))
-        
-        # Display timestamp if enabled
-        if u_data:  # If timestamp display is enabled
-            ts = frame_meta.ntp_timestamp/1000000000
+    detections = batch_reader.read(batch_meta)
+    if infer_scheduler:
+        infer_scheduler.record(detections)
+    if motion_gate:
+        motion_gate.record(detections)
+    # Give frames nvinfer skipped the last detections of their source
+    if detection_carry and detection_carry.fill(batch_meta, detections):
+        detections = batch_reader.read(batch_meta)
+
+    # Update object text metadata with detection info
+    label_table.apply(detections)
+    object_counter.update(detections)
+    if pipeline_metrics:
+        pipeline_metrics.add_detections(detections)
+    if detection_ring:
+        detection_ring.write(detections)
+
+    # Print frame stats
+    # for frame_number, num_detected_objects in zip(detections.frame_number, detections.frame_num_objects):
+    #     print("Frame Number={}, Number of Objects={}".format(frame_number, num_detected_objects))
+
+    # Display timestamp if enabled
+    if u_data:  # If timestamp display is enabled
+        for ntp_timestamp in detections.frame_ntp_timestamp.tolist():
+            ts = ntp_timestamp/1000000000
             print("RTSP Timestamp:", datetime.datetime.utcfromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S'))
 
-        try:
-            l_frame = l_frame.next
-        except StopIteration:
-            break
-
     return Gst.PadProbeReturn.OK
 
 def cb_newpad(decodebin, decoder_src_pad, data):
@@ -134,8 +151,10 @@ def decodebin_child_added(child_proxy, Object, name, user_data):
     #     if name.find("source") != -1:
     #         pyds.configure_source_for_ntp_sync(hash(Object))
 
-def create_source_bin(index, uri):
+def create_source_bin(index, uri, ingest="legacy"):
     print("Creating source bin")
+    if is_test_source_uri(uri):
+        return create_test_source_bin(index, uri)
 
     bin_name = "source-bin-%02d" % index
     print(bin_name)
@@ -151,8 +170,7 @@ def create_source_bin(index, uri):
 
     # Set properties
     uri_decode_bin.set_property("uri", uri)
-    uri_decode_bin.set_property("buffer-size", 4096)  # Increase RTSP buffer
-    uri_decode_bin.set_property("buffer-duration", 500000000)  # 500ms buffer
+    configure_uridecodebin(uri_decode_bin, ingest)  # rtspsrc jitterbuffer, transport, decoder
 
     # Connect signals
     uri_decode_bin.connect("pad-added", cb_newpad, nbin)
@@ -167,11 +185,118 @@ def create_source_bin(index, uri):
         
     return nbin
 
+def create_output_branch(pipeline, index, output_rtsp, args, platform_info):
+    """Create OSD -> encoder -> rtspclientsink for one output.
+
+    Returns the first element of the branch, to be linked from the tiler or
+    from an nvstreamdemux src pad.
+    """
+    # Create queue so each per-stream branch runs in its own thread; a
+    # "convert" stage queue in the threading plan only sets its limits
+    queue = Gst.ElementFactory.make("queue", "queue-%u" % index)
+    if not queue:
+        sys.stderr.write("Unable to create queue\n")
+        return None
+    plan = stage_plan(args.threading, args.queue)
+    if "convert" in plan:
+        for key, value in queue_properties(plan["convert"]).items():
+            Gst.util_set_object_arg(queue, key, str(value))
+
+    # Create video converter for encoder input
+    nvvidconv = Gst.ElementFactory.make("nvvideoconvert", "converter-%u" % index)
+    if not nvvidconv:
+        sys.stderr.write("Unable to create nvvideoconvert\n")
+        return None
+
+    # Create on-screen display
+    nvosd = Gst.ElementFactory.make("nvdsosd", "onscreendisplay-%u" % index)
+    if not nvosd:
+        sys.stderr.write("Unable to create nvdsosd\n")
+        return None
+
+    # Set OSD properties
+    nvosd.set_property("process-mode", OSD_PROCESS_MODE)
+    nvosd.set_property("display-text", OSD_DISPLAY_TEXT)
+
+    # Create video converter for post-OSD processing
+    nvvidconv_postosd = Gst.ElementFactory.make(
+        "nvvideoconvert", "convertor_postosd-%u" % index)
+    if not nvvidconv_postosd:
+        sys.stderr.write(" Unable to create nvvidconv_postosd \n")
+        return None
+
+    # Create capsfilter to set video format
+    capsfilter = Gst.ElementFactory.make("capsfilter", "capsfilter-%u" % index)
+    if not capsfilter:
+        sys.stderr.write("Unable to create capsfilter\n")
+        return None
+    caps = Gst.Caps.from_string("video/x-raw(memory:NVMM), format=I420")
+    capsfilter.set_property("caps", caps)
+
+    # Create encoder based on codec selection
+    if args.codec == "H264":
+        encoder = Gst.ElementFactory.make("nvv4l2h264enc", "encoder-%u" % index)
+        print("Creating H264 Encoder")
+    elif args.codec == "H265":
+        encoder = Gst.ElementFactory.make("nvv4l2h265enc", "encoder-%u" % index)
+        print("Creating H265 Encoder")
+
+    if not encoder:
+        sys.stderr.write("Unable to create encoder\n")
+        return None
+
+    # Set encoder properties
+    encoder.set_property("bitrate", args.bitrate)
+    if platform_info.is_integrated_gpu():
+        encoder.set_property("preset-level", 1)
+        encoder.set_property("insert-sps-pps", 1)
+
+    # Create RTP parser
+    if args.codec == "H264":
+        parser = Gst.ElementFactory.make("h264parse", "h264parser-%u" % index)
+    elif args.codec == "H265":
+        parser = Gst.ElementFactory.make("h265parse", "h265parse-%u" % index)
+
+    if not parser:
+        sys.stderr.write("Unable to create parser\n")
+        return None
+
+    # Create RTSP sink - directly use rtspclientsink without fallback
+    rtsp_sink = Gst.ElementFactory.make("rtspclientsink", "rtsp-sink-%u" % index)
+    if not rtsp_sink:
+        sys.stderr.write("Unable to create rtspclientsink. Make sure gst-rtsp-server is installed.\n")
+        return None
+
+    # Set RTSP sink properties
+    rtsp_sink.set_property("location", output_rtsp)
+
+    # Add all elements to pipeline
+    for element in (queue, nvvidconv, nvosd, nvvidconv_postosd, capsfilter,
+                    encoder, parser, rtsp_sink):
+        pipeline.add(element)
+
+    # Link all elements, with a queue at every boundary in the threading plan
+    stage_queues = StageQueues(pipeline, plan, suffix="-%u" % index)
+    queue.link(nvvidconv) # queue -> nvvideoconvert
+    stage_queues.link(nvvidconv, nvosd, "osd") # nvvideoconvert -> nvdsosd
+    nvosd.link(nvvidconv_postosd) # nvdsosd -> nvvideoconvert
+    nvvidconv_postosd.link(capsfilter) # nvvideoconvert -> capsfilter
+    stage_queues.link(capsfilter, encoder, "encoder") # capsfilter -> nvv4l2h264enc
+    encoder.link(parser) # nvv4l2h264enc -> h264parse
+    stage_queues.link(parser, rtsp_sink, "sink") # h264parse -> rtspclientsink
+
+    print(f"Output {index}: {output_rtsp}")
+    return queue
+
 def main():
     # Parse arguments
     parser = argparse.ArgumentParser(description="RTSP AI to RTSP Processing")
-    parser.add_argument("--input-rtsp", required=True, help="Input RTSP URL")
-    parser.add_argument("--output-rtsp", required=True, help="Output RTSP URL")
+    parser.add_argument("--input-rtsp", required=True, nargs="+",
+                        help="Input RTSP URL(s), one source bin per URL")
+    parser.add_argument("--output-rtsp", required=True, nargs="+",
+                        help="Output RTSP URL; one per input with --output-mode per-stream")
+    parser.add_argument("--output-mode", default="tiled", choices=['tiled', 'per-stream'],
+                        help="Tile all inputs into one output, or stream each input separately")
     parser.add_argument("--config-file", default="dstest1_pgie_config.txt", 
                         help="Path to config file for primary inference")
     parser.add_argument("--gie", default="nvinfer", choices=['nvinfer', 'nvinferserver'],
@@ -179,21 +304,124 @@ def main():
     parser.add_argument("--codec", default="H264", choices=['H264', 'H265'],
                         help="RTSP Streaming Codec")
     parser.add_argument("--bitrate", type=int, default=DEFAULT_BITRATE,
-                        help=f"Encoding bitrate in bits/second (default: {DEFAULT_BITRATE})")
+                        help=f"Encoding bitrate in bits/second, not kbps (default: {DEFAULT_BITRATE})")
+    parser.add_argument("--adaptive-bitrate", type=bitrate_bounds, default=None, metavar="MIN:MAX",
+                        help="Step the encoder bitrate between MIN and MAX kbps (unlike --bitrate, "
+                             "which is in bits/second) from output backpressure (sink queue fill and "
+                             "wait, RTCP loss)")
+    parser.add_argument("--adaptive-interval", type=interval_option, default=None,
+                        metavar="MAX[:TARGET_MS]",
+                        help="Skip up to MAX batches between inferences while inference latency "
+                             f"or the infer queue exceeds the target (default {DEFAULT_TARGET_MS} ms)")
+    parser.add_argument("--motion-gate", type=float, nargs="?", const=DEFAULT_THRESHOLD, default=None,
+                        metavar="FRACTION",
+                        help="Skip inference on batches where less than FRACTION of a downscaled frame "
+                             f"changed since the last inference (default {DEFAULT_THRESHOLD})")
+    parser.add_argument("--roi", type=roi_option, action="append", default=[],
+                        metavar="SOURCE:LEFT,TOP,WIDTH,HEIGHT",
+                        help="Run primary inference on this region of a source only, in "
+                             f"{MUXER_OUTPUT_WIDTH}x{MUXER_OUTPUT_HEIGHT} muxer pixels; repeatable, "
+                             "sources without one use the full frame (nvinfer only)")
+    parser.add_argument("--carry", choices=CARRY_MODES, default="hold",
+                        help="With --adaptive-interval or --motion-gate, how skipped frames reuse the "
+                             "last detections: hold the boxes or extrapolate their motion")
+    parser.add_argument("--detection-ring", nargs="?", const=DEFAULT_RING_PATH, default=None, metavar="PATH",
+                        help="Write every detection as a fixed-width record to a memory-mapped ring "
+                             f"buffer other processes can read (default {DEFAULT_RING_PATH})")
+    parser.add_argument("--detection-export", default=None, metavar="DIR",
+                        help="With --detection-ring, also write the records to Parquet files in DIR "
+                             "from a background thread (needs pyarrow)")
     parser.add_argument("--rtsp-ts", action="store_true", default=False,
                         help="Attach NTP timestamp from RTSP source")
+    parser.add_argument("--max-sources", type=int, default=None,
+                        help="Source slots for runtime add/remove (default: number of inputs)")
+    parser.add_argument("--control-socket", default=None,
+                        help="Unix socket path for runtime control, e.g. /tmp/rtsp_ai.sock")
+    parser.add_argument("--adaptive-mux-timeout", action="store_true", default=False,
+                        help="Tune streammux batched-push-timeout from measured source frame rates")
+    parser.add_argument("--latency-trace", type=float, nargs="?", const=10.0, default=None,
+                        metavar="SECONDS",
+                        help="Trace per-stage latency per source, printing p50/p95/p99 every SECONDS (default 10)")
+    parser.add_argument("--latency-report", default=None,
+                        help="Write the final latency report to this JSON file (with --latency-trace)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve Prometheus metrics on 127.0.0.1:PORT/metrics (or set DS_METRICS_PORT)")
+    parser.add_argument("--profile", nargs="?", const="profile", default=None, metavar="PREFIX",
+                        help="Profile every element; writes PREFIX.txt and PREFIX.dot on exit (default: profile)")
+    parser.add_argument("--no-reconnect", action="store_true", default=False,
+                        help="Quit when an RTSP source fails instead of showing a placeholder "
+                             "and reconnecting it with backoff")
+    parser.add_argument("--ingest-profile", choices=list(INGEST_PROFILES), default=None,
+                        help="RTSP ingest settings: ultra-low-latency, lan, wan, or legacy "
+                             "(500ms buffering, the default; or set DS_INGEST_PROFILE)")
+    parser.add_argument("--ingest-stats", type=float, nargs="?", const=10.0, default=None,
+                        metavar="SECONDS",
+                        help="Print per-source network and decode latency every SECONDS (default 10)")
+    parser.add_argument("--threading", choices=sorted(PROFILES), default="none",
+                        help="Queue placement between stages: latency (encoder only), "
+                             "balanced (inference and encoder), throughput (every stage); default none")
+    parser.add_argument("--queue", type=queue_option, action="append", default=[],
+                        metavar="STAGE[:BUFFERS[:LEAKY]]",
+                        help="Add or override the queue in front of a stage (infer, post-infer, convert, "
+                             "osd, encoder, sink); LEAKY is no, upstream or downstream. Repeatable")
     
     args = parser.parse_args()
+    if args.adaptive_bitrate:
+        # The controller measures backpressure at a queue in front of each sink
+        ensure_sink_queue(args.queue)
+    if args.adaptive_interval:
+        # The scheduler reads the inference backlog from the infer stage queue
+        ensure_infer_queue(args.queue)
+    number_sources = len(args.input_rtsp)
+    max_sources = args.max_sources or number_sources
+    if max_sources < number_sources:
+        parser.error("--max-sources is smaller than the number of --input-rtsp")
+    if args.output_mode == "per-stream" and max_sources != number_sources:
+        parser.error("--max-sources needs --output-mode tiled; per-stream outputs are fixed at start")
+    roi_plan = None
+    if args.roi:
+        if args.gie != "nvinfer":
+            parser.error("--roi needs --gie nvinfer")
+        # nvinfer ignores its interval when it infers on preprocessed tensors
+        if args.adaptive_interval or args.motion_gate is not None:
+            parser.error("--roi cannot be combined with --adaptive-interval or --motion-gate")
+        try:
+            roi_plan = plan_rois(args.roi, max_sources, MUXER_OUTPUT_WIDTH, MUXER_OUTPUT_HEIGHT)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.detection_export and not args.detection_ring:
+        parser.error("--detection-export needs --detection-ring")
+    if args.output_mode == "tiled" and len(args.output_rtsp) != 1:
+        parser.error("--output-mode tiled takes exactly one --output-rtsp")
+    if args.output_mode == "per-stream" and len(args.output_rtsp) != number_sources:
+        parser.error("--output-mode per-stream takes one --output-rtsp per --input-rtsp")
     
     # Print configuration
     print(f"Input RTSP: {args.input_rtsp}")
     print(f"Output RTSP: {args.output_rtsp}")
+    print(f"Output Mode: {args.output_mode}")
     print(f"Inference Engine: {args.gie}")
     print(f"Codec: {args.codec}")
     print(f"Bitrate: {args.bitrate}")
     print(f"Config File: {args.config_file}")
+    try:
+        args.ingest_profile = ingest_profile(args.ingest_profile)
+    except ValueError as e:
+        parser.error(str(e))  # e.g. a mistyped DS_INGEST_PROFILE
+    print(f"Ingest Profile: {args.ingest_profile}")
+    print(f"Stage queues: {describe_plan(stage_plan(args.threading, args.queue))}")
+    if roi_plan:
+        print(f"Inference ROIs: {describe_rois(roi_plan)}")
     # print(f"RTSP Timestamp: {args.rtsp_ts}")
     
+    # Load class names once; the probe only looks up precomputed label text
+    global label_table, object_counter, pipeline_metrics, infer_scheduler, motion_gate, detection_carry
+    global detection_ring
+    fallback_names = [CLASS_NAMES[class_id] for class_id in sorted(CLASS_NAMES)]
+    label_table = LabelTable(load_config_labels(args.config_file, fallback_names))
+    print(f"Class labels: {label_table.class_names}")
+    object_counter = ObjectCounter(max_sources=max_sources, num_classes=len(label_table.class_names))
+
     # Initialize GStreamer
     Gst.init(None)
     
@@ -206,26 +434,35 @@ def main():
         sys.stderr.write("Unable to create Pipeline\n")
         return -1
     
-    # Create source bin for RTSP input
-    source_bin = create_source_bin(0, args.input_rtsp)
-    if not source_bin:
-        sys.stderr.write("Unable to create source bin\n")
-        return -1
-    
     # Create streammux
     streammux = Gst.ElementFactory.make("nvstreammux", "stream-muxer")
     if not streammux:
         sys.stderr.write("Unable to create NvStreamMux\n")
         return -1
-    
-    # Set streammux properties
+    pipeline.add(streammux)
+
+    # Create one source bin per input, each on its own streammux sink pad
+    ingest_meter = IngestMeter(pipeline) if args.ingest_stats is not None else None
+    source_manager = SourceManager(
+        pipeline, streammux,
+        lambda index, uri: create_source_bin(index, uri, args.ingest_profile), max_sources)
+    is_live = False
+    for i, uri in enumerate(args.input_rtsp):
+        if uri.find("rtsp://") == 0 or is_test_source_uri(uri):
+            is_live = True
+        if not source_manager.link_source(i, uri):
+            return -1
+
+    # Set streammux properties; one batch holds one frame of every source slot
     streammux.set_property("width", MUXER_OUTPUT_WIDTH)
     streammux.set_property("height", MUXER_OUTPUT_HEIGHT)
-    streammux.set_property("batch-size", 1)
+    streammux.set_property("batch-size", max_sources)
     streammux.set_property("batched-push-timeout", MUXER_BATCH_TIMEOUT_USEC)
+    if is_live or args.control_socket:
+        streammux.set_property("live-source", 1)
     if args.rtsp_ts:
         streammux.set_property("attach-sys-ts", 0)
-    
+
     # Create primary inference (GIE) element
     if args.gie == "nvinfer":
         pgie = Gst.ElementFactory.make("nvinfer", "primary-inference")
@@ -236,113 +473,85 @@ def main():
     if not pgie:
         sys.stderr.write(f"Unable to create {args.gie} element\n")
         return -1
-    
-    # Create video converter for encoder input
-    nvvidconv = Gst.ElementFactory.make("nvvideoconvert", "converter")
-    if not nvvidconv:
-        sys.stderr.write("Unable to create nvvideoconvert\n")
-        return -1
-    
-    # Create on-screen display
-    nvosd = Gst.ElementFactory.make("nvdsosd", "onscreendisplay")
-    if not nvosd:
-        sys.stderr.write("Unable to create nvdsosd\n")
-        return -1
-    
-    # Set OSD properties
-    nvosd.set_property("process-mode", OSD_PROCESS_MODE)
-    nvosd.set_property("display-text", OSD_DISPLAY_TEXT)
-    
-    
-    # Create video converter for post-OSD processing
-    nvvidconv_postosd = Gst.ElementFactory.make(
-        "nvvideoconvert", "convertor_postosd")
-    if not nvvidconv_postosd:
-        sys.stderr.write(" Unable to create nvvidconv_postosd \n")
 
-
-    # Create capsfilter to set video format
-    capsfilter = Gst.ElementFactory.make("capsfilter", "capsfilter")
-    if not capsfilter:
-        sys.stderr.write("Unable to create capsfilter\n")
-        return -1
-    caps = Gst.Caps.from_string("video/x-raw(memory:NVMM), format=I420")
-    capsfilter.set_property("caps", caps)
-
-    # Create encoder based on codec selection
-    if args.codec == "H264":
-        encoder = Gst.ElementFactory.make("nvv4l2h264enc", "encoder")
-        print("Creating H264 Encoder")
-    elif args.codec == "H265":
-        encoder = Gst.ElementFactory.make("nvv4l2h265enc", "encoder")
-        print("Creating H265 Encoder")
-    
-    if not encoder:
-        sys.stderr.write("Unable to create encoder\n")
-        return -1
-    
-    # Set encoder properties
-    encoder.set_property("bitrate", args.bitrate)
-    if platform_info.is_integrated_gpu():
-        encoder.set_property("preset-level", 1)
-        encoder.set_property("insert-sps-pps", 1)
-    
-    # Create RTP parser
-    if args.codec == "H264":
-        parser = Gst.ElementFactory.make("h264parse", "h264parser")
-    elif args.codec == "H265":
-        parser = Gst.ElementFactory.make("h265parse", "h265parse")
-    
-    if not parser:
-        sys.stderr.write("Unable to create parser\n")
-        return -1
-
-    # Create RTSP sink - directly use rtspclientsink without fallback
-    rtsp_sink = Gst.ElementFactory.make("rtspclientsink", "rtsp-sink")
-    if not rtsp_sink:
-        sys.stderr.write("Unable to create rtspclientsink. Make sure gst-rtsp-server is installed.\n")
-        return -1
-        
-    # Set RTSP sink properties
-    rtsp_sink.set_property("location", args.output_rtsp)
-    
-    # Add all elements to pipeline
-    pipeline.add(source_bin)
-    pipeline.add(streammux)
+    # Match the inference batch size to the number of sources
+    pgie_batch_size = pgie.get_property("batch-size")
+    if pgie_batch_size != max_sources:
+        print(f"WARNING: Overriding infer-config batch-size {pgie_batch_size} "
+              f"with number of sources {max_sources}")
+        pgie.set_property("batch-size", max_sources)
     pipeline.add(pgie)
-    pipeline.add(nvvidconv)
-    pipeline.add(nvosd)
-    pipeline.add(nvvidconv_postosd)
-    pipeline.add(capsfilter)
-    pipeline.add(encoder)
-    pipeline.add(parser)
-    pipeline.add(rtsp_sink)
-
-
-    # Link source to streammux
-    padname = "sink_0"
-    sinkpad = streammux.request_pad_simple(padname)
-    if not sinkpad:
-        sys.stderr.write("Unable to get sink pad of streammux\n")
-        return -1
-    
-    srcpad = source_bin.get_static_pad("src")
-    if not srcpad:
-        sys.stderr.write("Unable to get src pad of source bin\n")
-        return -1
-    
-    srcpad.link(sinkpad)
-    
-    # Link all elements
-    streammux.link(pgie) # nvstreammux -> nvinfer
-    pgie.link(nvvidconv) # nvinfer -> nvdsosd
-    nvvidconv.link(nvosd) # nvdsosd -> nvvideoconvert
-    nvosd.link(nvvidconv_postosd) # nvvideoconvert -> nvvideoconvert
-    nvvidconv_postosd.link(capsfilter) # nvvideoconvert -> capsfilter
-    capsfilter.link(encoder) # capsfilter -> nvv4l2h264enc
-    encoder.link(parser) # nvv4l2h264enc -> h264parse
-    parser.link(rtsp_sink) # h264parse -> rtspclientsink
 
+    # Crop and scale each source's ROIs to the network input ahead of nvinfer,
+    # which then infers on those tensors and maps boxes back to the frame
+    infer_input = pgie
+    if roi_plan:
+        preprocess, roi_batch_size = create_preprocess(args.config_file, roi_plan)
+        if not preprocess:
+            sys.stderr.write("Unable to create nvdspreprocess\n")
+            return -1
+        pgie.set_property("input-tensor-meta", True)
+        if roi_batch_size > pgie.get_property("batch-size"):
+            pgie.set_property("batch-size", roi_batch_size)
+        pipeline.add(preprocess)
+        preprocess.link(pgie) # nvdspreprocess -> nvinfer
+        infer_input = preprocess
+    stage_queues = StageQueues(pipeline, stage_plan(args.threading, args.queue))
+    if args.motion_gate is not None:
+        # The gate reads frames on the CPU: RGBA in memory the CPU can map
+        gate_elements = create_gate_converter(platform_info.is_integrated_gpu())
+        if not gate_elements:
+            sys.stderr.write("Unable to create the motion gate converter\n")
+            return -1
+        gate_convert, gate_caps = gate_elements
+        pipeline.add(gate_convert)
+        pipeline.add(gate_caps)
+        stage_queues.link(streammux, gate_convert, "infer") # nvstreammux -> nvvideoconvert
+        gate_convert.link(gate_caps) # nvvideoconvert -> capsfilter
+        gate_caps.link(infer_input) # capsfilter -> nvdspreprocess / nvinfer
+    else:
+        stage_queues.link(streammux, infer_input, "infer") # nvstreammux -> nvdspreprocess / nvinfer
+
+    if args.output_mode == "tiled":
+        # Composite all sources into one frame and stream it to one output
+        tiler = Gst.ElementFactory.make("nvmultistreamtiler", "nvtiler")
+        if not tiler:
+            sys.stderr.write("Unable to create nvmultistreamtiler\n")
+            return -1
+        tiler_rows = int(math.sqrt(max_sources))
+        tiler_columns = int(math.ceil((1.0 * max_sources) / tiler_rows))
+        tiler.set_property("rows", tiler_rows)
+        tiler.set_property("columns", tiler_columns)
+        tiler.set_property("width", TILED_OUTPUT_WIDTH)
+        tiler.set_property("height", TILED_OUTPUT_HEIGHT)
+        pipeline.add(tiler)
+        stage_queues.link(pgie, tiler, "post-infer") # nvinfer -> nvmultistreamtiler
+
+        branch = create_output_branch(pipeline, 0, args.output_rtsp[0], args, platform_info)
+        if not branch:
+            return -1
+        tiler.link(branch) # nvmultistreamtiler -> nvvideoconvert
+        output_pads = [tiler.get_static_pad("sink")]
+    else:
+        # Split the batch back into streams, each with its own encoder and output
+        output_pads = []
+        demux = Gst.ElementFactory.make("nvstreamdemux", "nvdemux")
+        if not demux:
+            sys.stderr.write("Unable to create nvstreamdemux\n")
+            return -1
+        pipeline.add(demux)
+        stage_queues.link(pgie, demux, "post-infer") # nvinfer -> nvstreamdemux
+
+        for i, output_rtsp in enumerate(args.output_rtsp):
+            branch = create_output_branch(pipeline, i, output_rtsp, args, platform_info)
+            if not branch:
+                return -1
+            demux_srcpad = demux.request_pad_simple("src_%u" % i)
+            if not demux_srcpad:
+                sys.stderr.write("Unable to get src pad of nvstreamdemux\n")
+                return -1
+            demux_srcpad.link(branch.get_static_pad("sink")) # nvstreamdemux -> queue
+            output_pads.append(branch.get_static_pad("src"))
 
     # Add probe to get inference output
     pgie_src_pad = pgie.get_static_pad("src")
@@ -356,8 +565,145 @@ def main():
     loop = GLib.MainLoop()
     bus = pipeline.get_bus()
     bus.add_signal_watch()
-    bus.connect("message", bus_call, loop)
+    # Rebuild failed RTSP sources in place; errors from them no longer end the loop
+    supervisor = None
+    if not args.no_reconnect:
+        supervisor = SourceSupervisor(source_manager)
+        supervisor.start()
+    bus.connect("message", supervisor.bus_filter(bus_call) if supervisor else bus_call, loop)
+
+    # Serve runtime source add/remove requests while the pipeline plays
+    control_server = None
+    live_control = None
+    if args.control_socket:
+        control_server = ControlServer(args.control_socket)
+        if supervisor:
+            control_server.register("add_source", supervisor.add_source)
+            control_server.register("remove_source", supervisor.remove_source)
+            control_server.register("source_health", supervisor.stats)
+        else:
+            control_server.register("add_source", source_manager.add_source)
+            control_server.register("remove_source", source_manager.remove_source)
+        control_server.register("list_sources", source_manager.sources)
+        # Per-class object counts: latest frame, since start and rolling windows
+        control_server.register("counts", lambda: object_counter.snapshot(label_table.class_names))
+        # Live bitrate, output resolution, OSD and inference changes
+        live_control = LiveControl()
+        for i in range(len(args.output_rtsp) if args.output_mode == "per-stream" else 1):
+            live_control.add_encoder(pipeline.get_by_name("encoder-%u" % i),
+                                     pipeline.get_by_name("capsfilter-%u" % i),
+                                     ("video/x-raw(memory:NVMM), format=I420",))
+            live_control.add_osd(pipeline.get_by_name("onscreendisplay-%u" % i))
+        live_control.register(control_server)
+        control_server.start()
+
+    # Adapt each output's encoder bitrate to its uplink, without renegotiation
+    bitrate_controllers = []
+    if args.adaptive_bitrate:
+        for i in range(len(args.output_rtsp) if args.output_mode == "per-stream" else 1):
+            controller = BitrateController(pipeline.get_by_name("encoder-%u" % i),
+                                           pipeline.get_by_name("sink-queue-%u" % i),
+                                           *args.adaptive_bitrate)
+            controller.start()
+            bitrate_controllers.append(controller)
+            if live_control:
+                # set_bitrate retargets the controller instead of fighting it
+                live_control.add_bitrate_controller(controller)
+        if control_server:
+            control_server.register("abr", lambda: [c.stats() for c in bitrate_controllers])
+
+    # Skip inference on batches in which nothing moved
+    if args.motion_gate is not None:
+        motion_gate = MotionGate(pgie, pyds, MotionDetector(args.motion_gate),
+                                 platform_info.is_integrated_gpu())
+        if control_server:
+            control_server.register("motion_gate", motion_gate.stats)
+
+    # Skip inference on more batches while the detector cannot keep up
+    if args.adaptive_interval:
+        infer_scheduler = InferenceScheduler(pgie, *args.adaptive_interval,
+                                             queue=pipeline.get_by_name("infer-queue"), gate=motion_gate)
+        infer_scheduler.start()
+        if control_server:
+            control_server.register("inference_schedule", infer_scheduler.stats)
+
+    if live_control:
+        # The gate or the scheduler owns nvinfer's interval when present
+        live_control.add_inference(pgie, infer_scheduler or motion_gate)
+
+    if motion_gate or infer_scheduler:
+        # Longest run of skipped frames the gate and the interval can produce
+        max_age = 1 + (REFRESH_FRAMES if motion_gate else 0) + (
+            args.adaptive_interval[0] if infer_scheduler else 0)
+        detection_carry = DetectionCarry(pyds, max_age, args.carry, pgie.get_property("unique-id"))
+
+    # Detection records in shared memory, optionally rolled over to Parquet
+    detection_export = None
+    if args.detection_ring:
+        try:
+            detection_ring = DetectionRingWriter(args.detection_ring)
+            if args.detection_export:
+                detection_export = ParquetRollover(args.detection_ring, args.detection_export)
+        except (OSError, RuntimeError) as e:
+            sys.stderr.write(f"Unable to set up detection export: {e}\n")
+            return -1
+        print(f"Detection ring: {args.detection_ring} ({detection_ring.capacity} records)")
+        if detection_export:
+            detection_export.start()
+
+    # Only carry-forward and the ring use boxes; skip reading them otherwise
+    batch_reader.read_bbox = bool(detection_carry or detection_ring)
+
+    # Retune the muxer timeout from the observed frame intervals
+    mux_tuner = None
+    if args.adaptive_mux_timeout:
+        mux_tuner = BatchTimeoutTuner(streammux)
+        mux_tuner.start()
+
+    # Prometheus metrics: per-source fps, drops, detections, encoder bitrate
+    port = metrics_port(args.metrics_port)
+    if port:
+        pipeline_metrics = PipelineMetrics(pipeline, pyds)
+        pipeline_metrics.watch_streammux(streammux)
+        for pad in output_pads:
+            pipeline_metrics.watch_output(pad)
+        for i in range(len(args.output_rtsp) if args.output_mode == "per-stream" else 1):
+            pipeline_metrics.watch_encoder(pipeline.get_by_name("encoder-%u" % i))
+        pipeline_metrics.watch_queues()
+        if supervisor:
+            pipeline_metrics.watch_supervisor(supervisor)
+        if infer_scheduler:
+            pipeline_metrics.watch_inference_scheduler(infer_scheduler)
+        if motion_gate:
+            pipeline_metrics.watch_motion_gate(motion_gate)
+        if detection_carry:
+            pipeline_metrics.watch_detection_carry(detection_carry)
+        pipeline_metrics.watch_object_counter(object_counter, label_table.class_names)
+        bus.connect("message", pipeline_metrics.on_bus_message)
+        pipeline_metrics.serve(port)
+
+    # Opt-in per-stage latency tracing from the muxer inputs to the sinks
+    latency_tracer = None
+    if args.latency_trace is not None:
+        latency_tracer = LatencyTracer(pipeline, pyds, interval=args.latency_trace)
+        latency_tracer.trace_streammux(streammux)
+        latency_tracer.start()
+        if control_server:
+            control_server.register("latency", latency_tracer.snapshot)
     
+    # Opt-in per-element profiling (time inside each element, buffers in flight)
+    profiler = None
+    if args.profile:
+        profiler = ElementProfiler(pipeline)
+        profiler.start()
+        if control_server:
+            control_server.register("profile", profiler.results)
+    
+    if ingest_meter:
+        ingest_meter.start(args.ingest_stats)
+        if control_server:
+            control_server.register("ingest", ingest_meter.snapshot)
+
     # Start pipeline
     print("Starting pipeline\n")
     print(f"\n *** DeepStream: Streaming to RTSP output: {args.output_rtsp} ***\n")
@@ -371,7 +717,32 @@ def main():
         print(f"Error running pipeline: {e}")
     finally:
         # Clean up
+        if control_server:
+            control_server.stop()
+        if supervisor:
+            supervisor.stop()
+        for controller in bitrate_controllers:
+            controller.stop()
+        if infer_scheduler:
+            infer_scheduler.stop()
+        if motion_gate:
+            motion_gate.stop()
+        if mux_tuner:
+            mux_tuner.stop()
+        if latency_tracer:
+            latency_tracer.stop(args.latency_report)
+        if profiler:
+            profiler.stop(args.profile)
+        if ingest_meter:
+            ingest_meter.stop()
+        if pipeline_metrics:
+            pipeline_metrics.stop()
         pipeline.set_state(Gst.State.NULL)
+        if detection_export:
+            detection_export.stop()
+        if detection_ring:
+            print(f"Detection ring: {detection_ring.written} records written")
+            detection_ring.close()
         print("Pipeline stopped")
     
     return 0
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# 檔名: rtsp_fanout.py
+# 功能: 單一 RTSP 來源只接收、解碼一次，以 tee 分流到多個輸出（RTSP、RTMP、本地顯示、錄影、AI 標註）
+# 注意: 推論分支在 nvdsosd 前強制轉成 RGBA。nvdsosd 直接在畫面上繪製，若 nvvideoconvert
+#       直通（輸入輸出格式相同），框會畫在 raw 輸出正在編碼/顯示的同一塊 NVMM 畫面上
+
+import sys
+import argparse
+sys.path.append("../")
+from common.bus_call import bus_call
+from common.platform_info import PlatformInfo
+import gi
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst, GLib
+from dsutils.control import ControlServer
+from dsutils.fanout import OUTPUT_QUEUE_BUFFERS, FanOut, describe_output, parse_output
+from dsutils.ingest import PROFILES as INGEST_PROFILES, configure_uridecodebin, ingest_profile
+from dsutils.live_control import LiveControl
+from dsutils.metrics import PipelineMetrics, metrics_port
+from dsutils.profiler import ElementProfiler
+from dsutils.source_manager import SourceManager
+from dsutils.supervisor import SourceSupervisor
+from dsutils.test_source import create_test_source_bin, is_test_source_uri
+
+
+MUXER_OUTPUT_WIDTH = 1920
+MUXER_OUTPUT_HEIGHT = 1080
+MUXER_BATCH_TIMEOUT_USEC = 10000
+DEFAULT_BITRATE = 2000  # kbps
+OSD_PROCESS_MODE = 0
+OSD_DISPLAY_TEXT = 1
+
+def cb_newpad(decodebin, decoder_src_pad, data):
+    print("In cb_newpad\n")
+    caps = decoder_src_pad.get_current_caps()
+    gststruct = caps.get_structure(0)
+    gstname = gststruct.get_name()
+    source_bin = data
+    features = caps.get_features(0)
+
+    # Need to check if the pad created by the decodebin is for video and not
+    # audio.
+    print("gstname=", gstname)
+    if gstname.find("video") != -1:
+        # Link the decodebin pad only if decodebin has picked nvidia
+        # decoder plugin nvdec_*. We do this by checking if the pad caps contain
+        # NVMM memory features.
+        print("features=", features)
+        if features.contains("memory:NVMM"):
+            # Get the source bin ghost pad
+            bin_ghost_pad = source_bin.get_static_pad("src")
+            if not bin_ghost_pad.set_target(decoder_src_pad):
+                sys.stderr.write(
+                    "Failed to link decoder src pad to source bin ghost pad\n"
+                )
+        else:
+            sys.stderr.write(
+                " Error: Decodebin did not pick nvidia decoder plugin.\n")
+
+
+def decodebin_child_added(child_proxy, Object, name, user_data):
+    print("Decodebin child added:", name, "\n")
+    if name.find("decodebin") != -1:
+        Object.connect("child-added", decodebin_child_added, user_data)
+
+def create_source_bin(index, uri, ingest="legacy"):
+    print("Creating source bin")
+    # videotestsrc:// 測試來源，可在沒有攝影機時執行
+    if is_test_source_uri(uri):
+        return create_test_source_bin(index, uri)
+
+    # Create a source GstBin to abstract this bin's content from the rest of the
+    # pipeline
+    bin_name = "source-bin-%02d" % index
+    print(bin_name)
+    nbin = Gst.Bin.new(bin_name)
+    if not nbin:
+        sys.stderr.write(" Unable to create source bin \n")
+
+    # Source element for reading from the uri.
+    # We will use decodebin and let it figure out the container format of the
+    # stream and the codec and plug the appropriate demux and decode plugins.
+    uri_decode_bin = Gst.ElementFactory.make("uridecodebin", "uri-decode-bin")
+    if not uri_decode_bin:
+        sys.stderr.write(" Unable to create uri decode bin \n")
+    # We set the input uri to the source element
+    uri_decode_bin.set_property("uri", uri)
+    # 依接收設定檔調整 rtspsrc 抖動緩衝、傳輸協定與解碼器緩衝
+    configure_uridecodebin(uri_decode_bin, ingest)
+    # Connect to the "pad-added" signal of the decodebin which generates a
+    # callback once a new pad for raw data has beed created by the decodebin
+    uri_decode_bin.connect("pad-added", cb_newpad, nbin)
+    uri_decode_bin.connect("child-added", decodebin_child_added, nbin)
+
+    # We need to create a ghost pad for the source bin which will act as a proxy
+    # for the video decoder src pad. The ghost pad will not have a target right
+    # now. Once the decode bin creates the video decoder and generates the
+    # cb_newpad callback, we will set the ghost pad target to the video decoder
+    # src pad.
+    Gst.Bin.add(nbin, uri_decode_bin)
+    bin_pad = nbin.add_pad(
+        Gst.GhostPad.new_no_target(
+            "src", Gst.PadDirection.SRC))
+    if not bin_pad:
+        sys.stderr.write(" Failed to add ghost pad in source bin \n")
+        return None
+    return nbin
+
+
+def main():
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="單一 RTSP 來源分流至多個輸出")
+    parser.add_argument("--rtsp-url", required=True, help="RTSP 來源網址，例如 rtsp://192.168.1.123:8554/stream")
+    parser.add_argument("--output", type=parse_output, action="append", required=True, metavar="OUTPUT", help="輸出目標，可重複：rtsp://...、rtmp://...、file:PATH（.mp4/.mkv/.flv/.ts）或 display；加上 infer: 前綴改輸出 AI 標註後的畫面，例如 infer:rtsp://...")
+    parser.add_argument("--bitrate", type=int, default=DEFAULT_BITRATE, help=f"影像位元率 (kbps)，預設 {DEFAULT_BITRATE}")
+    parser.add_argument("--width", type=int, default=MUXER_OUTPUT_WIDTH, help=f"輸出影像寬度，預設 {MUXER_OUTPUT_WIDTH}")
+    parser.add_argument("--height", type=int, default=MUXER_OUTPUT_HEIGHT, help=f"輸出影像高度，預設 {MUXER_OUTPUT_HEIGHT}")
+    parser.add_argument("--output-queue", type=int, default=OUTPUT_QUEUE_BUFFERS, help=f"每個輸出的 queue 長度，滿了丟棄最舊的幀，預設 {OUTPUT_QUEUE_BUFFERS}")
+    parser.add_argument("--config-file", default="dstest1_pgie_config.txt", help="infer: 輸出使用的推論設定檔，預設 dstest1_pgie_config.txt")
+    parser.add_argument("--control-socket", default=None, help="控制用 Unix socket 路徑，可在執行中調整位元率、輸出解析度、OSD 與推論開關")
+    parser.add_argument("--metrics-port", type=int, default=None, help="於 127.0.0.1:PORT/metrics 提供 Prometheus 指標（或設定環境變數 DS_METRICS_PORT）")
+    parser.add_argument("--profile", nargs="?", const="profile", default=None, metavar="PREFIX", help="分析每個元件的處理時間，結束時寫出 PREFIX.txt 與 PREFIX.dot（預設 profile）")
+    parser.add_argument("--no-reconnect", action="store_true", help="來源斷線或結束時直接結束程式（預設會以黑畫面遞補並自動重新連線）")
+    parser.add_argument("--ingest-profile", choices=list(INGEST_PROFILES), default=None, help="RTSP 接收設定檔：ultra-low-latency、lan、wan 或 legacy（原本的 500ms 緩衝，預設；也可設定環境變數 DS_INGEST_PROFILE）")
+
+    args = parser.parse_args()
+
+    print(f"RTSP 來源: {args.rtsp_url}")
+    for spec in args.output:
+        print(f"輸出: {describe_output(spec)}")
+    print(f"設定影像大小: {args.width}x{args.height}, 位元率: {args.bitrate}kbps")
+    try:
+        ingest = ingest_profile(args.ingest_profile)
+    except ValueError as e:
+        parser.error(str(e))  # 例如 DS_INGEST_PROFILE 拼錯
+    print(f"接收設定檔: {ingest}")
+
+    # 初始化 GStreamer
+    Gst.init(None)
+    platform_info = PlatformInfo()
+
+    # 建立管道
+    pipeline = Gst.Pipeline()
+    if not pipeline:
+        sys.stderr.write(" 無法建立管道")
+        return -1
+
+    # 建立串流複用器
+    streammux = Gst.ElementFactory.make("nvstreammux", "Stream-muxer")
+    if not streammux:
+        sys.stderr.write(" 無法建立 NvStreamMux\n")
+        return -1
+    streammux.set_property("width", args.width)
+    streammux.set_property("height", args.height)
+    streammux.set_property("batch-size", 1)  # 只有一個來源
+    streammux.set_property("batched-push-timeout", MUXER_BATCH_TIMEOUT_USEC)
+    streammux.set_property("buffer-pool-size", 8)
+    pipeline.add(streammux)
+
+    # 連接 RTSP 來源到 streammux；只接收、解碼一次
+    print("建立 RTSP 來源")
+    source_manager = SourceManager(
+        pipeline, streammux, lambda index, uri: create_source_bin(index, uri, ingest), 1)
+    if not source_manager.link_source(0, args.rtsp_url):
+        sys.stderr.write("無法建立來源 bin\n")
+        return -1
+
+    # 解碼後的畫面以 tee 分流；每個分支各有一個滿了就丟棄最舊幀的 queue，
+    # 慢的輸出只會自己掉幀，不會卡住其他輸出。同一種畫面的編碼輸出共用一個編碼器
+    pgie = nvosd = None
+    fanout = FanOut(pipeline, args.bitrate, args.output_queue, platform_info.is_integrated_gpu())
+    try:
+        fanout.add_stream("raw", streammux)
+
+        # 有 infer: 輸出時才加入推論分支：nvinfer -> nvvideoconvert -> RGBA capsfilter -> nvdsosd
+        # capsfilter 讓 nvvideoconvert 一定複製到新的 RGBA 畫面，OSD 不會畫到 raw 分支的畫面上
+        if any(spec.stream == "infer" for spec in args.output):
+            pgie = Gst.ElementFactory.make("nvinfer", "primary-inference")
+            nvvidconv_osd = Gst.ElementFactory.make("nvvideoconvert", "convertor-osd")
+            osd_caps = Gst.ElementFactory.make("capsfilter", "osd-caps")
+            nvosd = Gst.ElementFactory.make("nvdsosd", "onscreendisplay")
+            if not pgie or not nvvidconv_osd or not osd_caps or not nvosd:
+                sys.stderr.write(" 無法建立推論元件\n")
+                return -1
+            pgie.set_property("config-file-path", args.config_file)
+            pgie.set_property("batch-size", 1)
+            osd_caps.set_property("caps", Gst.Caps.from_string("video/x-raw(memory:NVMM), format=RGBA"))
+            nvosd.set_property("process-mode", OSD_PROCESS_MODE)
+            nvosd.set_property("display-text", OSD_DISPLAY_TEXT)
+            for element in (pgie, nvvidconv_osd, osd_caps, nvosd):
+                pipeline.add(element)
+            infer_queue = fanout.stream_branch("raw", "infer")
+            if not (infer_queue.link(pgie) and pgie.link(nvvidconv_osd)
+                    and nvvidconv_osd.link(osd_caps) and osd_caps.link(nvosd)):
+                sys.stderr.write(" 無法連接推論元件\n")
+                return -1
+            fanout.add_stream("infer", nvosd)
+
+        for spec in args.output:
+            fanout.add_output(spec)
+    except RuntimeError as e:
+        sys.stderr.write(f" 無法建立輸出: {e}\n")
+        return -1
+
+    for stream, encoder in fanout.encoders.items():
+        print(f"{stream} 畫面使用 {encoder.get_factory().get_name()} 編碼器")
+
+    # 建立事件循環並監聽 GStreamer 訊息
+    loop = GLib.MainLoop()
+    bus = pipeline.get_bus()
+    bus.add_signal_watch()
+    # 來源斷線時以黑畫面遞補並以指數退避重新連線，不結束整個程式
+    supervisor = None
+    if not args.no_reconnect:
+        supervisor = SourceSupervisor(source_manager)
+        supervisor.start()
+    bus.connect("message", supervisor.bus_filter(bus_call) if supervisor else bus_call, loop)
+
+    # 選用：控制 socket，執行中調整所有共用編碼器的位元率與解析度、OSD 與推論開關
+    control_server = None
+    if args.control_socket:
+        control_server = ControlServer(args.control_socket)
+        live_control = LiveControl()
+        for stream, encoder in fanout.encoders.items():
+            live_control.add_encoder(encoder, fanout.scalers[stream], ("video/x-raw(memory:NVMM), format=I420",))
+        if nvosd:
+            live_control.add_osd(nvosd)
+        if pgie:
+            live_control.add_inference(pgie)
+        live_control.register(control_server)
+        if supervisor:
+            control_server.register("source_health", supervisor.stats)
+        control_server.start()
+
+    # 選用：Prometheus 指標（輸入/輸出 fps、掉幀、各編碼器位元率、各輸出 queue 深度）
+    pipeline_metrics = None
+    port = metrics_port(args.metrics_port)
+    if port:
+        pipeline_metrics = PipelineMetrics(pipeline)
+        pipeline_metrics.watch_streammux(streammux)
+        pipeline_metrics.watch_output(streammux.get_static_pad("src"), 0)
+        for encoder in fanout.encoders.values():
+            pipeline_metrics.watch_encoder(encoder)
+        pipeline_metrics.watch_queues()
+        if supervisor:
+            pipeline_metrics.watch_supervisor(supervisor)
+        bus.connect("message", pipeline_metrics.on_bus_message)
+        pipeline_metrics.serve(port)
+
+    # 選用：分析每個元件的處理時間與在途緩衝數
+    profiler = None
+    if args.profile:
+        profiler = ElementProfiler(pipeline)
+        profiler.start()
+
+    # 啟動管道
+    print("開始分流...")
+    pipeline.set_state(Gst.State.PLAYING)
+
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        print("使用者中斷，停止串流...")
+    finally:
+        # 清理
+        if control_server:
+            control_server.stop()
+        if supervisor:
+            supervisor.stop()
+        if profiler:
+            profiler.stop(args.profile)
+        if pipeline_metrics:
+            pipeline_metrics.stop()
+        pipeline.set_state(Gst.State.NULL)
+        print("各輸出因跟不上而丟棄的幀數:")
+        print(fanout.report())
+        print("串流已停止")
+
+if __name__ == "__main__":
+    sys.exit(main())
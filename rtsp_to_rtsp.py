@@ -11,6 +11,20 @@ from ctypes import *
 import gi
 gi.require_version("Gst", "1.0")
 from gi.repository import Gst, GLib
+from dsutils.abr import BitrateController, bitrate_bounds, ensure_sink_queue
+from dsutils.control import ControlServer
+from dsutils.encoder_cache import make_h264_encoder
+from dsutils.ingest import PROFILES as INGEST_PROFILES, IngestMeter, configure_uridecodebin, ingest_profile
+from dsutils.latency import LatencyTracer
+from dsutils.live_control import LiveControl
+from dsutils.metrics import PipelineMetrics, metrics_port
+from dsutils.mux_tuner import BatchTimeoutTuner
+from dsutils.passthrough import PipelineRestarter, create_passthrough_bin, probe_video_codec
+from dsutils.profiler import ElementProfiler
+from dsutils.source_manager import SourceManager
+from dsutils.supervisor import SourceSupervisor
+from dsutils.test_source import create_test_source_bin, is_test_source_uri
+from dsutils.queues import PROFILES, StageQueues, describe_plan, queue_option, stage_plan
 
 
 MUXER_OUTPUT_WIDTH = 1920
@@ -51,8 +65,11 @@ def decodebin_child_added(child_proxy, Object, name, user_data):
     if name.find("decodebin") != -1:
         Object.connect("child-added", decodebin_child_added, user_data)
 
-def create_source_bin(index, uri):
+def create_source_bin(index, uri, ingest="legacy"):
     print("Creating source bin")
+    # videotestsrc:// 測試來源，可在沒有攝影機時執行
+    if is_test_source_uri(uri):
+        return create_test_source_bin(index, uri)
 
     # Create a source GstBin to abstract this bin's content from the rest of the
     # pipeline
@@ -70,8 +87,8 @@ def create_source_bin(index, uri):
         sys.stderr.write(" Unable to create uri decode bin \n")
     # We set the input uri to the source element
     uri_decode_bin.set_property("uri", uri)
-    uri_decode_bin.set_property("buffer-size", 4096)  # 增加 RTSP 緩衝區
-    uri_decode_bin.set_property("buffer-duration", 500000000)  # 500ms 緩衝
+    # 依接收設定檔調整 rtspsrc 抖動緩衝、傳輸協定與解碼器緩衝
+    configure_uridecodebin(uri_decode_bin, ingest)
     # Connect to the "pad-added" signal of the decodebin which generates a
     # callback once a new pad for raw data has beed created by the decodebin
     uri_decode_bin.connect("pad-added", cb_newpad, nbin)
@@ -92,6 +109,85 @@ def create_source_bin(index, uri):
     return nbin
 
 
+PASSTHROUGH_CODECS = ("H264", "H265")
+
+
+def run_passthrough(args, codec, ingest):
+    """直接轉送：rtspsrc -> 解封裝 -> parser -> 輸出，不解碼也不重新編碼"""
+    pipeline = Gst.Pipeline()
+    if not pipeline:
+        sys.stderr.write(" 無法建立管道")
+        return -1
+    ingest_meter = IngestMeter(pipeline) if args.ingest_stats is not None else None
+
+    source = create_passthrough_bin(args.rtsp_url, codec, ingest)
+    if not source:
+        sys.stderr.write(" 無法建立直接轉送來源\n")
+        return -1
+    pipeline.add(source)
+
+    # RTSP串流
+    rtsp_sink = Gst.ElementFactory.make("rtspclientsink", "rtsp_sink")
+    if not rtsp_sink:
+        print("無法建立rtspclientsink元素，可能需要安裝對應的GStreamer外掛")
+        return -1
+    rtsp_sink.set_property("location", args.rtsp_url_o)
+    pipeline.add(rtsp_sink)
+    sink = rtsp_sink
+
+    # 依 --threading/--queue 在 parser 與輸出之間插入 queue
+    plan = stage_plan(args.threading, args.queue)
+    StageQueues(pipeline, plan).link(source, sink, "sink")
+
+    # 建立事件循環並監聽 GStreamer 訊息；沒有 streammux 可遞補黑畫面，
+    # 來源斷線時改為以指數退避重新啟動整個管道
+    loop = GLib.MainLoop()
+    bus = pipeline.get_bus()
+    bus.add_signal_watch()
+    restarter = None if args.no_reconnect else PipelineRestarter(pipeline)
+    bus.connect("message", restarter.bus_filter(bus_call) if restarter else bus_call, loop)
+
+    # 選用：Prometheus 指標（輸出 fps、轉送位元率、queue 深度、管道狀態）
+    pipeline_metrics = None
+    port = metrics_port(args.metrics_port)
+    if port:
+        pipeline_metrics = PipelineMetrics(pipeline)
+        pipeline_metrics.watch_output(source.get_static_pad("src"), 0)
+        pipeline_metrics.watch_encoder(source)
+        pipeline_metrics.watch_queues()
+        bus.connect("message", pipeline_metrics.on_bus_message)
+        pipeline_metrics.serve(port)
+
+    # 選用：分析每個元件的處理時間與在途緩衝數
+    profiler = None
+    if args.profile:
+        profiler = ElementProfiler(pipeline)
+        profiler.start()
+
+    if ingest_meter:
+        ingest_meter.start(args.ingest_stats)
+
+    print("開始直接轉送...")
+    pipeline.set_state(Gst.State.PLAYING)
+
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        print("使用者中斷，停止串流...")
+    finally:
+        if restarter:
+            restarter.stop()
+        if profiler:
+            profiler.stop(args.profile)
+        if ingest_meter:
+            ingest_meter.stop()
+        if pipeline_metrics:
+            pipeline_metrics.stop()
+        pipeline.set_state(Gst.State.NULL)
+        print("串流已停止")
+    return 0
+
+
 def main():
     # Parse command line arguments
     parser = argparse.ArgumentParser(description="將RTSP串流轉換成RTMP串流")
@@ -100,8 +196,24 @@ def main():
     parser.add_argument("--bitrate", type=int, default=DEFAULT_BITRATE, help=f"影像位元率 (kbps)，預設 {DEFAULT_BITRATE}")
     parser.add_argument("--width", type=int, default=MUXER_OUTPUT_WIDTH, help=f"輸出影像寬度，預設 {MUXER_OUTPUT_WIDTH}")
     parser.add_argument("--height", type=int, default=MUXER_OUTPUT_HEIGHT, help=f"輸出影像高度，預設 {MUXER_OUTPUT_HEIGHT}")
+    parser.add_argument("--adaptive-mux-timeout", action="store_true", help="依實測來源幀率自動調整 streammux batched-push-timeout")
+    parser.add_argument("--latency-trace", type=float, nargs="?", const=10.0, default=None, metavar="SECONDS", help="追蹤各階段延遲，每 SECONDS 秒（預設 10）列出 p50/p95/p99")
+    parser.add_argument("--latency-report", default=None, help="結束時將延遲統計寫入此 JSON 檔（需搭配 --latency-trace）")
+    parser.add_argument("--metrics-port", type=int, default=None, help="於 127.0.0.1:PORT/metrics 提供 Prometheus 指標（或設定環境變數 DS_METRICS_PORT）")
+    parser.add_argument("--profile", nargs="?", const="profile", default=None, metavar="PREFIX", help="分析每個元件的處理時間，結束時寫出 PREFIX.txt 與 PREFIX.dot（預設 profile）")
+    parser.add_argument("--no-reconnect", action="store_true", help="來源斷線或結束時直接結束程式（預設會以黑畫面遞補並自動重新連線）")
+    parser.add_argument("--ingest-profile", choices=list(INGEST_PROFILES), default=None, help="RTSP 接收設定檔：ultra-low-latency、lan、wan 或 legacy（原本的 500ms 緩衝，預設；也可設定環境變數 DS_INGEST_PROFILE）")
+    parser.add_argument("--ingest-stats", type=float, nargs="?", const=10.0, default=None, metavar="SECONDS", help="每 SECONDS 秒（預設 10）列出各來源的網路與解碼延遲")
+    parser.add_argument("--adaptive-bitrate", type=bitrate_bounds, default=None, metavar="MIN:MAX", help="依輸出端壅塞程度（queue 填滿率、等待時間、RTCP 丟包）在 MIN 與 MAX kbps 之間自動調整編碼位元率")
+    parser.add_argument("--control-socket", default=None, help="控制用 Unix socket 路徑，例如 /tmp/relay.sock，可在執行中調整位元率與輸出解析度")
+    parser.add_argument("--passthrough", action="store_true", help="來源已是 H.264 或 H.265 時直接轉送，不解碼也不重新編碼（--width/--height/--bitrate 不適用）；無法直接轉送時自動改回轉碼")
+    parser.add_argument("--threading", choices=sorted(PROFILES), default="none", help="執行緒配置：在元件之間插入 queue，latency 以單格 leaky queue 分離編碼器、balanced 分離推論與編碼、throughput 每個階段各一執行緒；預設 none")
+    parser.add_argument("--queue", type=queue_option, action="append", default=[], metavar="STAGE[:BUFFERS[:LEAKY]]", help="在指定階段前加入 queue（convert、encoder、sink），可重複；LEAKY 為 no/upstream/downstream")
     
     args = parser.parse_args()
+    if args.adaptive_bitrate:
+        # 自動位元率需要在輸出元件前放一個 queue 來量測壅塞
+        ensure_sink_queue(args.queue)
     
     rtsp_url = args.rtsp_url
     rtsp_url_o = args.rtsp_url_o
@@ -112,9 +224,23 @@ def main():
     print(f"RTSP 來源: {rtsp_url}")
     print(f"RTSP 目標: {rtsp_url_o}")
     print(f"設定影像大小: {width}x{height}, 位元率: {bitrate}kbps")
+    try:
+        ingest = ingest_profile(args.ingest_profile)
+    except ValueError as e:
+        parser.error(str(e))  # 例如 DS_INGEST_PROFILE 拼錯
+    print(f"接收設定檔: {ingest}")
     
     # 初始化 GStreamer
     Gst.init(None)
+
+    # 選用：依 SDP 判斷來源編碼，可直接轉送時不經過解碼與編碼
+    if args.passthrough:
+        codec, detail = probe_video_codec(rtsp_url, ingest)
+        if codec in PASSTHROUGH_CODECS:
+            print(f"來源編碼為 {codec}，使用直接轉送模式")
+            return run_passthrough(args, codec, ingest)
+        reason = f"來源編碼為 {codec}" if codec else detail
+        print(f"無法直接轉送（{reason}），改用轉碼")
     
     # 建立管道
     pipeline = Gst.Pipeline()
@@ -124,10 +250,7 @@ def main():
     
     # 建立來源
     print("建立 RTSP 來源")
-    source_bin = create_source_bin(0, rtsp_url)
-    if not source_bin:
-        sys.stderr.write("無法建立來源 bin\n")
-        return -1
+    ingest_meter = IngestMeter(pipeline) if args.ingest_stats is not None else None
     
     # 建立串流複用器
     streammux = Gst.ElementFactory.make("nvstreammux", "Stream-muxer")
@@ -148,34 +271,20 @@ def main():
         sys.stderr.write(" 無法建立 nvvideoconvert\n")
         return -1
     
-    # 建立 H264 編碼器
-    encoder = Gst.ElementFactory.make("nvv4l2h264enc", "encoder")
+    # 建立 H264 編碼器：依序嘗試 nvv4l2h264enc (Jetson)、nvh264enc (dGPU)、x264enc (軟體)
+    # 探測結果快取於磁碟，之後啟動直接使用快取中的編碼器
+    encoder = make_h264_encoder("encoder", bitrate)
     if not encoder:
-        print("無法建立 nvv4l2h264enc 元素，嘗試使用 nvh264enc...")
-        encoder = Gst.ElementFactory.make("nvh264enc", "encoder")
-        if not encoder:
-            print("無法建立 nvh264enc 元素，嘗試使用 x264enc...")
-            encoder = Gst.ElementFactory.make("x264enc", "encoder")
-            if not encoder:
-                print("無法建立任何 H264 編碼器，請安裝所需的 GStreamer 外掛")
-                return -1
-    
-    # 設定編碼器參數
-    if encoder.get_factory().get_name() == "nvv4l2h264enc":
-        # nvv4l2h264enc 參數設定 (用於 Jetson)
-        encoder.set_property("bitrate", bitrate * 1000)  # 以 bits/sec 為單位
-    elif encoder.get_factory().get_name() == "nvh264enc":
-        # nvh264enc 參數設定 (用於 dGPU)
-        encoder.set_property("bitrate", bitrate)  # 以 Kbits/sec 為單位
-        encoder.set_property("preset", 1)  # 0=slow, 1=medium, 2=fast
-        encoder.set_property("rc-mode", 1)  # 1=cbr, 2=vbr
-    else:
-        # x264enc 參數設定 (軟體編碼)
-        encoder.set_property("bitrate", bitrate)
-        encoder.set_property("speed-preset", "medium")
-        encoder.set_property("tune", "zerolatency")
-    
+        print("無法建立任何 H264 編碼器，請安裝所需的 GStreamer 外掛")
+        return -1
+
     print(f"使用 {encoder.get_factory().get_name()} 編碼器")
+
+    # 編碼器前的縮放 capsfilter；預設不限制，可經控制 socket 即時改變輸出解析度
+    scaler_caps = Gst.ElementFactory.make("capsfilter", "scaler-caps")
+    if not scaler_caps:
+        sys.stderr.write(" 無法建立 capsfilter\n")
+        return -1
     
     # 建立 H264 parser
     h264parser = Gst.ElementFactory.make("h264parse", "h264parser")
@@ -195,38 +304,101 @@ def main():
 
 
     # 將元件添加到管道中
-    pipeline.add(source_bin)
     pipeline.add(streammux)
     pipeline.add(nvvidconv)
+    pipeline.add(scaler_caps)
     pipeline.add(encoder)
     pipeline.add(h264parser)
     pipeline.add(rtsp_sink)
     
-    # 連接 RTSP 來源到 streammux
-    padname = "sink_0"
-    sinkpad = streammux.request_pad_simple(padname)
-    if not sinkpad:
-        sys.stderr.write(" 無法請求 streammux sink pad\n")
-        return -1
-    
-    srcpad = source_bin.get_static_pad("src")
-    if not srcpad:
-        sys.stderr.write(" 無法取得 source bin src pad\n")
+    # 連接 RTSP 來源到 streammux；由 SourceManager 管理，斷線時只重建來源 bin
+    source_manager = SourceManager(
+        pipeline, streammux, lambda index, uri: create_source_bin(index, uri, ingest), 1)
+    if not source_manager.link_source(0, rtsp_url):
+        sys.stderr.write("無法建立來源 bin\n")
         return -1
     
-    srcpad.link(sinkpad)
-    
-    # 連接剩餘元件
-    streammux.link(nvvidconv)
-    nvvidconv.link(encoder)
+    # 連接剩餘元件，依 --threading/--queue 在階段之間插入 queue
+    plan = stage_plan(args.threading, args.queue)
+    print(f"階段 queue: {describe_plan(plan)}")
+    stage_queues = StageQueues(pipeline, plan)
+    stage_queues.link(streammux, nvvidconv, "convert")
+    nvvidconv.link(scaler_caps)
+    stage_queues.link(scaler_caps, encoder, "encoder")
     encoder.link(h264parser)
-    h264parser.link(rtsp_sink)
+    stage_queues.link(h264parser, rtsp_sink, "sink")
     
     # 建立事件循環並監聽 GStreamer 訊息
     loop = GLib.MainLoop()
     bus = pipeline.get_bus()
     bus.add_signal_watch()
-    bus.connect("message", bus_call, loop)
+    # 來源斷線時以黑畫面遞補並以指數退避重新連線，不結束整個程式
+    supervisor = None
+    if not args.no_reconnect:
+        supervisor = SourceSupervisor(source_manager)
+        supervisor.start()
+    bus.connect("message", supervisor.bus_filter(bus_call) if supervisor else bus_call, loop)
+
+    # 選用：控制 socket，執行中調整位元率與輸出解析度，不需重啟管道
+    control_server = None
+    live_control = None
+    if args.control_socket:
+        control_server = ControlServer(args.control_socket)
+        live_control = LiveControl()
+        # nvvideoconvert 依 capsfilter 縮放；x264enc 需要系統記憶體，因此兩種都允許
+        live_control.add_encoder(encoder, scaler_caps, ("video/x-raw(memory:NVMM)", "video/x-raw"))
+        live_control.register(control_server)
+        if supervisor:
+            control_server.register("source_health", supervisor.stats)
+        control_server.start()
+
+    # 選用：依輸出端壅塞程度自動調整編碼位元率，不重新協商 caps
+    bitrate_controller = None
+    if args.adaptive_bitrate:
+        bitrate_controller = BitrateController(encoder, pipeline.get_by_name("sink-queue"), *args.adaptive_bitrate)
+        bitrate_controller.start()
+        print(f"自動位元率: {args.adaptive_bitrate[0]}-{args.adaptive_bitrate[1]} kbps")
+        if control_server:
+            control_server.register("abr", bitrate_controller.stats)
+        if live_control:
+            # 自動位元率執行時，set_bitrate 改為調整其上限
+            live_control.add_bitrate_controller(bitrate_controller)
+
+    # 依來源實際幀間隔調整 streammux 逾時
+    mux_tuner = None
+    if args.adaptive_mux_timeout:
+        mux_tuner = BatchTimeoutTuner(streammux)
+        mux_tuner.start()
+
+    # 選用：Prometheus 指標（輸入/輸出 fps、掉幀、編碼位元率、管道狀態）
+    pipeline_metrics = None
+    port = metrics_port(args.metrics_port)
+    if port:
+        pipeline_metrics = PipelineMetrics(pipeline)
+        pipeline_metrics.watch_streammux(streammux)
+        pipeline_metrics.watch_output(encoder.get_static_pad("sink"), 0)
+        pipeline_metrics.watch_encoder(encoder)
+        pipeline_metrics.watch_queues()
+        if supervisor:
+            pipeline_metrics.watch_supervisor(supervisor)
+        bus.connect("message", pipeline_metrics.on_bus_message)
+        pipeline_metrics.serve(port)
+
+    # 選用：追蹤從 streammux 輸入到輸出端各階段的延遲
+    latency_tracer = None
+    if args.latency_trace is not None:
+        latency_tracer = LatencyTracer(pipeline, interval=args.latency_trace)
+        latency_tracer.trace_streammux(streammux)
+        latency_tracer.start()
+    
+    # 選用：分析每個元件的處理時間與在途緩衝數
+    profiler = None
+    if args.profile:
+        profiler = ElementProfiler(pipeline)
+        profiler.start()
+    
+    if ingest_meter:
+        ingest_meter.start(args.ingest_stats)
     
     # 啟動管道
     print("開始串流轉換...")
@@ -238,6 +410,22 @@ def main():
         print("使用者中斷，停止串流...")
     finally:
         # 清理
+        if control_server:
+            control_server.stop()
+        if supervisor:
+            supervisor.stop()
+        if bitrate_controller:
+            bitrate_controller.stop()
+        if mux_tuner:
+            mux_tuner.stop()
+        if latency_tracer:
+            latency_tracer.stop(args.latency_report)
+        if profiler:
+            profiler.stop(args.profile)
+        if ingest_meter:
+            ingest_meter.stop()
+        if pipeline_metrics:
+            pipeline_metrics.stop()
         pipeline.set_state(Gst.State.NULL)
         print("串流已停止")
 
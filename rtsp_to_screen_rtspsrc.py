@@ -3,6 +3,8 @@ import sys
 import gi
 gi.require_version('Gst', '1.0')
 from gi.repository import Gst, GLib
+from dsutils.ingest import configure_decoder, configure_rtspsrc, ingest_profile
+from dsutils.metrics import PipelineMetrics, metrics_port
 
 # 初始化GStreamer
 Gst.init(None)
@@ -71,6 +73,14 @@ def main(args):
     src.set_property("buffer-mode", 0)  # Buffer mode: auto
     src.set_property("retry", 10)  # Number of retries before giving up
     src.set_property("timeout", 5000000)  # Timeout in microseconds
+    # DS_INGEST_PROFILE replaces the settings above; legacy keeps them
+    try:
+        ingest = ingest_profile()
+    except ValueError as e:
+        sys.stderr.write(f" {e}\n")
+        return -1
+    if ingest != "legacy":
+        configure_rtspsrc(src, ingest)
     
     # Use more generic depayloader for MPEG4
     depay = Gst.ElementFactory.make("rtpmp4vdepay", "depay")
@@ -93,6 +103,9 @@ def main(args):
             sys.stderr.write(" Unable to create decoder \n")
             return -1
     
+    if ingest != "legacy":
+        configure_decoder(dec, ingest)
+
     # Convert video format
     videoconvert = Gst.ElementFactory.make("videoconvert", "videoconvert")
     if not videoconvert:
@@ -127,6 +140,16 @@ def main(args):
     bus.add_signal_watch()
     loop = GLib.MainLoop()
     bus.connect("message", bus_call, loop)
+
+    # Prometheus metrics when DS_METRICS_PORT is set
+    pipeline_metrics = None
+    port = metrics_port()
+    if port:
+        pipeline_metrics = PipelineMetrics(pipeline)
+        pipeline_metrics.watch_input(dec.get_static_pad("src"), 0)
+        pipeline_metrics.watch_output(sink.get_static_pad("sink"), 0)
+        bus.connect("message", pipeline_metrics.on_bus_message)
+        pipeline_metrics.serve(port)
     
     # Start playing
     pipeline.set_state(Gst.State.PLAYING)
@@ -136,6 +159,9 @@ def main(args):
         loop.run()
     except KeyboardInterrupt:
         print("接收到中斷信號，清理...")
+    finally:
+        if pipeline_metrics:
+            pipeline_metrics.stop()
     
 if __name__ == "__main__":
     sys.exit(main(sys.argv))
\ No newline at end of file
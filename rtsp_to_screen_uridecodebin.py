@@ -8,6 +8,8 @@ from ctypes import *
 import gi
 gi.require_version("Gst", "1.0")
 from gi.repository import Gst, GLib
+from dsutils.ingest import configure_uridecodebin, ingest_profile
+from dsutils.metrics import PipelineMetrics, metrics_port
 
 
 
@@ -50,7 +52,7 @@ def decodebin_child_added(child_proxy, Object, name, user_data):
     if name.find("decodebin") != -1:
         Object.connect("child-added", decodebin_child_added, user_data)
 
-def create_source_bin(index, uri):
+def create_source_bin(index, uri, ingest="legacy"):
     print("Creating source bin")
 
     # Create a source GstBin to abstract this bin's content from the rest of the
@@ -69,8 +71,8 @@ def create_source_bin(index, uri):
         sys.stderr.write(" Unable to create uri decode bin \n")
     # We set the input uri to the source element
     uri_decode_bin.set_property("uri", uri)
-    uri_decode_bin.set_property("buffer-size", 4096)  # 增加 RTSP 緩衝區
-    uri_decode_bin.set_property("buffer-duration", 500000000)  # 500ms 緩衝
+    # 依接收設定檔（環境變數 DS_INGEST_PROFILE）調整 rtspsrc 與解碼器緩衝
+    configure_uridecodebin(uri_decode_bin, ingest)
     # Connect to the "pad-added" signal of the decodebin which generates a
     # callback once a new pad for raw data has beed created by the decodebin
     uri_decode_bin.connect("pad-added", cb_newpad, nbin)
@@ -97,6 +99,11 @@ def main():
     number_sources = len(sources)
 
     platform_info = PlatformInfo()
+    try:
+        ingest = ingest_profile()
+    except ValueError as e:
+        sys.stderr.write(f" {e}\n")
+        return -1
     # Standard GStreamer initialization
     Gst.init(None)
 
@@ -121,7 +128,7 @@ def main():
         uri_name = sources[i]
         if uri_name.find("rtsp://") == 0:
             is_live = True
-        source_bin = create_source_bin(i, uri_name)
+        source_bin = create_source_bin(i, uri_name, ingest)
         if not source_bin:
             sys.stderr.write("Unable to create source bin \n")
         pipeline.add(source_bin)
@@ -166,6 +173,16 @@ def main():
     bus.add_signal_watch()
     bus.connect("message", bus_call, loop)
 
+    # Prometheus metrics when DS_METRICS_PORT is set
+    pipeline_metrics = None
+    port = metrics_port()
+    if port:
+        pipeline_metrics = PipelineMetrics(pipeline)
+        pipeline_metrics.watch_streammux(streammux)
+        pipeline_metrics.watch_output(sink.get_static_pad("sink"), 0)
+        bus.connect("message", pipeline_metrics.on_bus_message)
+        pipeline_metrics.serve(port)
+
     # start play back and listen to events
     print("Starting pipeline \n")
     pipeline.set_state(Gst.State.PLAYING)
@@ -174,6 +191,8 @@ def main():
     except BaseException:
         pass
     # cleanup
+    if pipeline_metrics:
+        pipeline_metrics.stop()
     pipeline.set_state(Gst.State.NULL)
 
 
@@ -7,55 +7,25 @@ import sys
 import gi
 gi.require_version('Gst', '1.0')
 from gi.repository import Gst, GLib
-import subprocess
-import re
+from dsutils import v4l2
+from dsutils.capture import (CpuPerFrame, DeviceReconnector, describe_mode, legacy_mode,
+                              make_capture_elements, select_device_mode)
+from dsutils.encoder_cache import make_h264_encoder
+from dsutils.queues import PROFILES, StageQueues, describe_plan, queue_option, stage_plan
+from dsutils.metrics import PipelineMetrics, metrics_port
 
 def list_all_devices():
-    """列出所有可用的USB攝影機設備，使用v4l2-ctl查詢"""
-    
-    try:
-        # 執行v4l2-ctl --list-devices命令
-        result = subprocess.run(['v4l2-ctl', '--list-devices'], 
-                               stdout=subprocess.PIPE, 
-                               stderr=subprocess.PIPE,
-                               text=True)
-        
-        if result.returncode != 0:
-            print(f"v4l2-ctl命令執行失敗: {result.stderr}")
-            return []
-        
-        # 使用正則表達式找出所有/dev/video開頭的設備路徑
-        devices = re.findall(r'/dev/video\d+', result.stdout)
-        return devices
-    
-    except FileNotFoundError:
-        print("找不到v4l2-ctl工具，請先安裝v4l-utils套件")
-        return []
-    except Exception as e:
-        print(f"查詢設備時出錯: {e}")
-        return []
+    """列出所有可用的USB攝影機設備，直接以V4L2 ioctl查詢"""
+    return [info.path for info in v4l2.default_cache().devices()]
 
 def show_device_capabilities(device):
     """顯示指定設備的詳細資訊"""
     try:
-        # 執行v4l2-ctl --list-formats-ext命令來獲取設備支援的格式資訊
-        result = subprocess.run(['v4l2-ctl', '--device', device, '--list-formats-ext'], 
-                               stdout=subprocess.PIPE, 
-                               stderr=subprocess.PIPE,
-                               text=True)
-        
-        if result.returncode != 0:
-            print(f"無法獲取設備 {device} 的資訊: {result.stderr}")
-            return
-        
-        # 顯示結果
-        print(result.stdout)
-    except FileNotFoundError:
-        print("找不到v4l2-ctl工具，請先安裝v4l-utils套件")
-    except Exception as e:
-        print(f"查詢設備資訊時出錯: {e}")
+        print(v4l2.format_device(v4l2.default_cache().device(device)))
+    except OSError as e:
+        print(f"無法獲取設備 {device} 的資訊: {e}")
 
-def main_pipeline(device, width, height, fps, bitrate, rtmp_url=None):
+def main_pipeline(device, width, height, fps, bitrate, rtmp_url=None, capture_mode="auto", queue_plan=None):
     """建立GStreamer管道"""
     # 初始化GStreamer
     Gst.init(None)
@@ -71,57 +41,29 @@ def main_pipeline(device, width, height, fps, bitrate, rtmp_url=None):
     source.set_property("device", device)
     print(f"使用設備: {device}")
     
-    # 設定格式為YUY2
-    capsfilter1 = Gst.ElementFactory.make("capsfilter", "capsfilter1")
-    if not capsfilter1:
-        print("無法建立capsfilter元素，可能需要安裝對應的GStreamer外掛")
+    # 依攝影機列舉出的格式選擇擷取模式，盡量避免使用 CPU videoconvert
+    if capture_mode == "legacy":
+        mode = legacy_mode(width, height, fps)
+    else:
+        mode = select_device_mode(device, width, height, fps)
+    print(f"擷取模式 {describe_mode(mode)}")
+    capture_elements = make_capture_elements(mode)
+    if not capture_elements:
+        print("無法建立擷取模式所需的元素，可能需要安裝對應的GStreamer外掛")
         return None
-    caps1 = Gst.Caps.from_string(f"video/x-raw,width={width},height={height},framerate={fps}/1")
-    
-    capsfilter1.set_property("caps", caps1)
-    print(f"設定影像格式: {width}x{height}, {fps}fps")
-
-    vidconvsrc = Gst.ElementFactory.make("videoconvert", "convertor_src1")
-    if not vidconvsrc:
-        sys.stderr.write(" Unable to create videoconvert \n")
 
-    
     # NVIDIA影像轉換器
     nvvidconv = Gst.ElementFactory.make("nvvideoconvert", "nvvidconv")
     if not nvvidconv:
         print("無法建立nvvidconv元素，可能需要安裝對應的GStreamer外掛")
         return None
     
-    # 嘗試使用NVIDIA硬體H264編碼器 (優先順序)
-    # 1. nvv4l2h264enc - NVIDIA V4L2 based hardware encoder for Jetson
-    # 2. nvh264enc - NVIDIA GPU based encoder for dGPU platforms
-    # 3. x264enc - Software encoder as fallback
-    encoder = Gst.ElementFactory.make("nvv4l2h264enc", "encoder")
+    # 建立 H264 編碼器：依序嘗試 nvv4l2h264enc (Jetson)、nvh264enc (dGPU)、x264enc (軟體)
+    # 探測結果快取於磁碟，之後啟動直接使用快取中的編碼器
+    encoder = make_h264_encoder("encoder", bitrate)
     if not encoder:
-        print("無法建立nvv4l2h264enc元素，嘗試使用nvh264enc...")
-        encoder = Gst.ElementFactory.make("nvh264enc", "encoder")
-        if not encoder:
-            print("無法建立nvh264enc元素，嘗試使用x264enc...")
-            encoder = Gst.ElementFactory.make("x264enc", "encoder")
-            if not encoder:
-                print("無法建立任何H264編碼器，請安裝所需的GStreamer外掛")
-                return None
-    
-    # 設定編碼器參數 (根據不同編碼器調整參數)
-    if encoder.get_factory().get_name() == "nvv4l2h264enc":
-        # nvv4l2h264enc 參數設定 (用於 Jetson)
-        encoder.set_property("bitrate", bitrate * 1000)  # 以 Kbits/sec 為單位
-    elif encoder.get_factory().get_name() == "nvh264enc":
-        # nvh264enc 參數設定 (用於 dGPU)
-        encoder.set_property("bitrate", bitrate)  # 以 Kbits/sec 為單位
-        encoder.set_property("preset", 1)  # 0=slow, 1=medium, 2=fast
-        encoder.set_property("rc-mode", 1)  # 1=cbr, 2=vbr
-    else:
-        # x264enc 參數設定 (軟體編碼)
-        encoder.set_property("bitrate", bitrate)
-        encoder.set_property("speed-preset", "medium")
-        encoder.set_property("tune", "zerolatency")
-
+        print("無法建立任何 H264 編碼器，請安裝所需的 GStreamer 外掛")
+        return None
 
     print(f"使用 {encoder.get_factory().get_name()} 編碼器")
     
@@ -145,8 +87,8 @@ def main_pipeline(device, width, height, fps, bitrate, rtmp_url=None):
 
     # 將元素加入管道
     pipeline.add(source)  # v4l2src
-    pipeline.add(capsfilter1)  # capsfilter
-    pipeline.add(vidconvsrc)  # videoconvert
+    for element in capture_elements:
+        pipeline.add(element)
     pipeline.add(nvvidconv)  # nvvideoconvert
     pipeline.add(encoder)  # nvv4l2h264enc
     pipeline.add(h264parser)  # h264parse
@@ -156,14 +98,19 @@ def main_pipeline(device, width, height, fps, bitrate, rtmp_url=None):
     pipeline.add(rtmp_sink)  # rtmpsink
 
     # 連接元素
-    source.link(capsfilter1)
-    capsfilter1.link(vidconvsrc)
-    vidconvsrc.link(nvvidconv)
-    nvvidconv.link(encoder)
+    # queue_plan（--threading/--queue）決定在哪些階段之間插入 queue
+    stage_queues = StageQueues(pipeline, queue_plan or {})
+    print(f"階段 queue: {describe_plan(queue_plan or {})}")
+    upstream = source
+    for element in capture_elements:
+        upstream.link(element)
+        upstream = element
+    stage_queues.link(upstream, nvvidconv, "convert")
+    stage_queues.link(nvvidconv, encoder, "encoder")
     encoder.link(h264parser)
 
     # RTMP串流
-    h264parser.link(flvmux)
+    stage_queues.link(h264parser, flvmux, "sink")
     flvmux.link(rtmp_sink)
 
     
@@ -189,7 +136,17 @@ def main():
     parser.add_argument('--height', type=int, default=480, help="影像高度")
     parser.add_argument('--fps', type=int, default=30, help="影像幀率")
     parser.add_argument('--bitrate', type=int, default=2000, help="H264編碼比特率")
-
+    parser.add_argument('--hotplug', action='store_true',
+                        help="攝影機拔除時停止管道，重新插上後自動恢復擷取")
+    parser.add_argument('--capture-mode', choices=['auto', 'legacy'], default='auto',
+                        help="擷取模式：auto 依攝影機支援格式自動選擇（MJPEG 硬體解碼或 nvvideoconvert 可直接接受的格式），legacy 固定 video/x-raw 並經過 CPU videoconvert")
+    parser.add_argument('--threading', choices=sorted(PROFILES), default='none',
+                        help="執行緒配置：在元件之間插入 queue，latency 以單格 leaky queue 分離編碼器、balanced 分離推論與編碼、throughput 每個階段各一執行緒；預設 none")
+    parser.add_argument('--queue', type=queue_option, action='append', default=[], metavar='STAGE[:BUFFERS[:LEAKY]]',
+                        help="在指定階段前加入 queue（convert、encoder、sink），可重複；LEAKY 為 no/upstream/downstream")
+
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="於 127.0.0.1:PORT/metrics 提供 Prometheus 指標（或設定環境變數 DS_METRICS_PORT）")
     # 如果沒有參數，顯示說明
     if len(sys.argv) == 1:
         parser.print_help()
@@ -229,13 +186,35 @@ def main():
     
     if args.rtmp:
         # rtmp的實作
-        pipeline = main_pipeline(args.device, args.width, args.height, args.fps, args.bitrate, rtmp_url=args.rtmp_url)
+        pipeline = main_pipeline(args.device, args.width, args.height, args.fps, args.bitrate, rtmp_url=args.rtmp_url, capture_mode=args.capture_mode, queue_plan=stage_plan(args.threading, args.queue))
         if not pipeline:
             print("無法建立管道")
             return
         
+        # 選用：Prometheus 指標（擷取/輸出 fps、掉幀、編碼位元率、管道狀態）
+        pipeline_metrics = None
+        port = metrics_port(args.metrics_port)
+        if port:
+            pipeline_metrics = PipelineMetrics(pipeline)
+            pipeline_metrics.watch_input(pipeline.get_by_name("source").get_static_pad("src"), 0)
+            encoder = pipeline.get_by_name("encoder")
+            pipeline_metrics.watch_output(encoder.get_static_pad("sink"), 0)
+            pipeline_metrics.watch_encoder(encoder)
+            bus = pipeline.get_bus()
+            bus.add_signal_watch()
+            bus.connect("message", pipeline_metrics.on_bus_message)
+            pipeline_metrics.serve(port)
+
         # 啟動管道
         pipeline.set_state(Gst.State.PLAYING)
+        # 每 5 秒回報每幀耗用的 CPU 時間
+        cpu_meter = CpuPerFrame(pipeline.get_by_name("nvvidconv").get_static_pad("sink"))
+        cpu_meter.start()
+        # 選用：攝影機拔除時停止管道，重新插上後恢復
+        reconnector = None
+        if args.hotplug:
+            reconnector = DeviceReconnector(pipeline, args.device)
+            reconnector.start()
         print("開始rtmp串流...")
         # 等待結束
         try:
@@ -244,6 +223,11 @@ def main():
         except KeyboardInterrupt:
             print("停止rtmp串流...")
         finally:
+            cpu_meter.stop()
+            if reconnector:
+                reconnector.stop()
+            if pipeline_metrics:
+                pipeline_metrics.stop()
             pipeline.set_state(Gst.State.NULL)
             print("管道已停止")
     else:
@@ -7,55 +7,24 @@ import sys  # 導入系統功能模塊
 import gi  # 導入GNOME物件內省庫
 gi.require_version('Gst', '1.0')  # 設定需要的GStreamer版本
 from gi.repository import Gst, GLib  # 導入GStreamer和GLib庫
-import subprocess  # 導入子進程執行模塊
-import re  # 導入正則表達式處理模塊
+from dsutils import v4l2  # 導入V4L2設備查詢模組
+from dsutils.capture import CpuPerFrame, DeviceReconnector, describe_mode, legacy_mode, make_capture_elements, select_device_mode  # 導入擷取模式、CPU量測與熱插拔工具
+from dsutils.encoder_cache import make_h264_encoder  # 導入H264編碼器建立函數
+from dsutils.queues import PROFILES, StageQueues, describe_plan, queue_option, stage_plan  # 導入階段queue配置工具
+from dsutils.metrics import PipelineMetrics, metrics_port  # 導入Prometheus指標模組
 
-def list_all_devices():  # 定義函數用於列出所有設備
-    """列出所有可用的USB攝影機設備，使用v4l2-ctl查詢"""
-    
-    try:  # 嘗試執行命令
-        # 執行v4l2-ctl --list-devices命令
-        result = subprocess.run(['v4l2-ctl', '--list-devices'],  # 執行外部命令列出設備
-                               stdout=subprocess.PIPE,  # 捕獲標準輸出
-                               stderr=subprocess.PIPE,  # 捕獲標準錯誤
-                               text=True)  # 以文字方式返回結果
-        
-        if result.returncode != 0:  # 如果命令執行失敗
-            print(f"v4l2-ctl命令執行失敗: {result.stderr}")  # 輸出錯誤訊息
-            return []  # 返回空列表
-        
-        # 使用正則表達式找出所有/dev/video開頭的設備路徑
-        devices = re.findall(r'/dev/video\d+', result.stdout)  # 使用正則表達式搜尋所有視訊設備
-        return devices  # 返回找到的設備列表
-    
-    except FileNotFoundError:  # 捕獲找不到檔案的錯誤
-        print("找不到v4l2-ctl工具，請先安裝v4l-utils套件")  # 提示安裝必要工具
-        return []  # 返回空列表
-    except Exception as e:  # 捕獲其他所有錯誤
-        print(f"查詢設備時出錯: {e}")  # 輸出錯誤訊息
-        return []  # 返回空列表
+def list_all_devices():  # 定義列出設備的函數
+    """列出所有可用的USB攝影機設備，直接以V4L2 ioctl查詢"""
+    return [info.path for info in v4l2.default_cache().devices()]  # 返回所有設備路徑
 
-def show_device_capabilities(device):  # 定義函數顯示設備能力
+def show_device_capabilities(device):  # 定義顯示設備詳情的函數
     """顯示指定設備的詳細資訊"""
-    try:  # 嘗試執行命令
-        # 執行v4l2-ctl --list-formats-ext命令來獲取設備支援的格式資訊
-        result = subprocess.run(['v4l2-ctl', '--device', device, '--list-formats-ext'],  # 執行外部命令列出設備格式
-                               stdout=subprocess.PIPE,  # 捕獲標準輸出
-                               stderr=subprocess.PIPE,  # 捕獲標準錯誤
-                               text=True)  # 以文字方式返回結果
-        
-        if result.returncode != 0:  # 如果命令執行失敗
-            print(f"無法獲取設備 {device} 的資訊: {result.stderr}")  # 輸出錯誤訊息
-            return  # 函數返回
-        
-        # 顯示結果
-        print(result.stdout)  # 輸出設備支援的格式信息
-    except FileNotFoundError:  # 捕獲找不到檔案的錯誤
-        print("找不到v4l2-ctl工具，請先安裝v4l-utils套件")  # 提示安裝必要工具
-    except Exception as e:  # 捕獲其他所有錯誤
-        print(f"查詢設備資訊時出錯: {e}")  # 輸出錯誤訊息
+    try:  # 嘗試執行
+        print(v4l2.format_device(v4l2.default_cache().device(device)))  # 打印設備支援的格式
+    except OSError as e:  # 捕獲設備查詢錯誤
+        print(f"無法獲取設備 {device} 的資訊: {e}")  # 打印錯誤信息
 
-def main_pipeline(device, width, height, fps, bitrate, rtsp_url=None):  # 定義主要媒體處理管道函數
+def main_pipeline(device, width, height, fps, bitrate, rtsp_url=None, capture_mode="auto", queue_plan=None):  # 定義主要媒體處理管道函數
     """建立GStreamer管道"""
     # 初始化GStreamer
     Gst.init(None)  # 初始化GStreamer函式庫
@@ -71,59 +40,31 @@ def main_pipeline(device, width, height, fps, bitrate, rtsp_url=None):  # 定義
     source.set_property("device", device)  # 設定視訊裝置路徑
     print(f"使用設備: {device}")  # 輸出所使用的設備
     
-    # 設定格式為YUY2
-    capsfilter1 = Gst.ElementFactory.make("capsfilter", "capsfilter1")  # 創建格式過濾器元素
-    if not capsfilter1:  # 如果元素創建失敗
-        print("無法建立capsfilter元素，可能需要安裝對應的GStreamer外掛")  # 輸出錯誤訊息
-        return None  # 返回空值
-    caps1 = Gst.Caps.from_string(f"video/x-raw,width={width},height={height},framerate={fps}/1")  # 創建視訊格式設定
-    
-    capsfilter1.set_property("caps", caps1)  # 設定過濾器的格式屬性
-    print(f"設定影像格式: {width}x{height}, {fps}fps")  # 輸出影像格式設定
-
-    vidconvsrc = Gst.ElementFactory.make("videoconvert", "convertor_src1")  # 創建視訊轉換元素
-    if not vidconvsrc:  # 如果元素創建失敗
-        sys.stderr.write(" Unable to create videoconvert \n")  # 輸出錯誤訊息
+    # 依攝影機列舉出的格式選擇擷取模式，盡量避免使用 CPU videoconvert
+    if capture_mode == "legacy":  # 如果指定舊版擷取模式
+        mode = legacy_mode(width, height, fps)  # 使用固定video/x-raw加videoconvert的模式
+    else:  # 否則
+        mode = select_device_mode(device, width, height, fps)  # 依攝影機支援的格式選擇模式
+    print(f"擷取模式 {describe_mode(mode)}")  # 打印所選的擷取模式
+    capture_elements = make_capture_elements(mode)  # 建立擷取模式所需的元素
+    if not capture_elements:  # 如果創建失敗
+        print("無法建立擷取模式所需的元素，可能需要安裝對應的GStreamer外掛")  # 提示需要安裝插件
+        return None  # 返回None表示失敗
 
-    
     # NVIDIA影像轉換器
     nvvidconv = Gst.ElementFactory.make("nvvideoconvert", "nvvidconv")  # 創建NVIDIA視訊轉換元素
     if not nvvidconv:  # 如果元素創建失敗
         print("無法建立nvvidconv元素，可能需要安裝對應的GStreamer外掛")  # 輸出錯誤訊息
         return None  # 返回空值
     
-    # 嘗試使用NVIDIA硬體H264編碼器 (優先順序)
-    # 1. nvv4l2h264enc - NVIDIA V4L2 based hardware encoder for Jetson
-    # 2. nvh264enc - NVIDIA GPU based encoder for dGPU platforms
-    # 3. x264enc - Software encoder as fallback
-    encoder = Gst.ElementFactory.make("nvv4l2h264enc", "encoder")  # 嘗試創建NVIDIA V4L2 H264編碼器
-    if not encoder:  # 如果元素創建失敗
-        print("無法建立nvv4l2h264enc元素，嘗試使用nvh264enc...")  # 輸出錯誤訊息
-        encoder = Gst.ElementFactory.make("nvh264enc", "encoder")  # 嘗試創建NVIDIA GPU H264編碼器
-        if not encoder:  # 如果元素創建失敗
-            print("無法建立nvh264enc元素，嘗試使用x264enc...")  # 輸出錯誤訊息
-            encoder = Gst.ElementFactory.make("x264enc", "encoder")  # 嘗試創建軟體H264編碼器
-            if not encoder:  # 如果元素創建失敗
-                print("無法建立任何H264編碼器，請安裝所需的GStreamer外掛")  # 輸出錯誤訊息
-                return None  # 返回空值
-    
-    # 設定編碼器參數 (根據不同編碼器調整參數)
-    if encoder.get_factory().get_name() == "nvv4l2h264enc":  # 如果使用NVIDIA V4L2編碼器
-        # nvv4l2h264enc 參數設定 (用於 Jetson)
-        encoder.set_property("bitrate", bitrate * 1000)  # 設定比特率，單位為bits/sec
-    elif encoder.get_factory().get_name() == "nvh264enc":  # 如果使用NVIDIA GPU編碼器
-        # nvh264enc 參數設定 (用於 dGPU)
-        encoder.set_property("bitrate", bitrate)  # 設定比特率，單位為Kbits/sec
-        encoder.set_property("preset", 1)  # 設定預設值，0=慢，1=中，2=快
-        encoder.set_property("rc-mode", 1)  # 設定速率控制模式，1=cbr，2=vbr
-    else:  # 如果使用軟體編碼器
-        # x264enc 參數設定 (軟體編碼)
-        encoder.set_property("bitrate", bitrate)  # 設定比特率
-        encoder.set_property("speed-preset", "medium")  # 設定速度預設為中
-        encoder.set_property("tune", "zerolatency")  # 設定為零延遲優先調整
-
-
-    print(f"使用 {encoder.get_factory().get_name()} 編碼器")  # 輸出所使用的編碼器名稱
+    # 建立 H264 編碼器：依序嘗試 nvv4l2h264enc (Jetson)、nvh264enc (dGPU)、x264enc (軟體)
+    # 探測結果快取於磁碟，之後啟動直接使用快取中的編碼器
+    encoder = make_h264_encoder("encoder", bitrate)  # 建立H264編碼器
+    if not encoder:  # 如果創建失敗
+        print("無法建立任何 H264 編碼器，請安裝所需的 GStreamer 外掛")  # 提示需要安裝插件
+        return None  # 返回None表示失敗
+
+    print(f"使用 {encoder.get_factory().get_name()} 編碼器")  # 打印使用的編碼器
     
     
 
@@ -141,8 +82,8 @@ def main_pipeline(device, width, height, fps, bitrate, rtsp_url=None):  # 定義
 
     # 將元素加入管道
     pipeline.add(source)  # 加入視訊來源元素到管道
-    pipeline.add(capsfilter1)  # 加入格式過濾器元素到管道
-    pipeline.add(vidconvsrc)  # 加入視訊轉換元素到管道
+    for element in capture_elements:  # 遍歷每個擷取元素
+        pipeline.add(element)  # 添加擷取元素到管道
     pipeline.add(nvvidconv)  # 加入NVIDIA視訊轉換元素到管道
     pipeline.add(encoder)  # 加入編碼器元素到管道
     pipeline.add(h264parser)  # 加入H264解析器元素到管道
@@ -151,14 +92,19 @@ def main_pipeline(device, width, height, fps, bitrate, rtsp_url=None):  # 定義
     pipeline.add(rtsp_sink)  # 加入RTSP客戶端輸出元素到管道
 
     # 連接元素
-    source.link(capsfilter1)  # 連接視訊來源到格式過濾器
-    capsfilter1.link(vidconvsrc)  # 連接格式過濾器到視訊轉換
-    vidconvsrc.link(nvvidconv)  # 連接視訊轉換到NVIDIA視訊轉換
-    nvvidconv.link(encoder)  # 連接NVIDIA視訊轉換到編碼器
+    # queue_plan（--threading/--queue）決定在哪些階段之間插入 queue
+    stage_queues = StageQueues(pipeline, queue_plan or {})  # 依執行緒配置插入queue的連接工具
+    print(f"階段 queue: {describe_plan(queue_plan or {})}")  # 輸出插入的queue
+    upstream = source  # 從視頻源開始連接
+    for element in capture_elements:  # 遍歷每個擷取元素
+        upstream.link(element)  # 連接上一個元素到此擷取元素
+        upstream = element  # 記錄目前最後一個元素
+    stage_queues.link(upstream, nvvidconv, "convert")  # 連接擷取元素到NVIDIA視訊轉換
+    stage_queues.link(nvvidconv, encoder, "encoder")  # 連接NVIDIA視訊轉換到編碼器
     encoder.link(h264parser)  # 連接編碼器到H264解析器
 
     # RTSP串流
-    h264parser.link(rtsp_sink)  # 連接H264解析器到RTSP客戶端輸出
+    stage_queues.link(h264parser, rtsp_sink, "sink")  # 連接H264解析器到RTSP客戶端輸出
     # src_pad = h264parser.get_static_pad("src")  # 獲取H264解析器的輸出埠
     # if not src_pad:  # 如果獲取輸出埠失敗
     #     print("無法獲取h264parse的src pad")  # 輸出錯誤訊息
@@ -197,7 +143,12 @@ def main():  # 定義主函數
     parser.add_argument('--height', type=int, default=480, help="影像高度")  # 添加高度設定的參數
     parser.add_argument('--fps', type=int, default=30, help="影像幀率")  # 添加幀率設定的參數
     parser.add_argument('--bitrate', type=int, default=2000, help="H264編碼比特率")  # 添加比特率設定的參數
+    parser.add_argument('--hotplug', action='store_true', help="攝影機拔除時停止管道，重新插上後自動恢復擷取")  # 添加熱插拔參數
+    parser.add_argument('--capture-mode', choices=['auto', 'legacy'], default='auto', help="擷取模式：auto 依攝影機支援格式自動選擇（MJPEG 硬體解碼或 nvvideoconvert 可直接接受的格式），legacy 固定 video/x-raw 並經過 CPU videoconvert")  # 添加擷取模式參數
+    parser.add_argument('--threading', choices=sorted(PROFILES), default='none', help="執行緒配置：在元件之間插入 queue，latency 以單格 leaky queue 分離編碼器、balanced 分離推論與編碼、throughput 每個階段各一執行緒；預設 none")  # 添加執行緒配置參數
+    parser.add_argument('--queue', type=queue_option, action='append', default=[], metavar='STAGE[:BUFFERS[:LEAKY]]', help="在指定階段前加入 queue（convert、encoder、sink），可重複；LEAKY 為 no/upstream/downstream")  # 添加階段queue參數
 
+    parser.add_argument('--metrics-port', type=int, default=None, help="於 127.0.0.1:PORT/metrics 提供 Prometheus 指標（或設定環境變數 DS_METRICS_PORT）")  # 添加指標埠參數
     # 如果沒有參數，顯示說明
     if len(sys.argv) == 1:  # 如果命令行參數只有程式名稱
         parser.print_help()  # 顯示幫助訊息
@@ -237,13 +188,35 @@ def main():  # 定義主函數
     
     if args.rtsp:  # 如果用戶要求RTSP轉換
         # RTSP的實作
-        pipeline = main_pipeline(args.device, args.width, args.height, args.fps, args.bitrate, rtsp_url=args.rtsp_url)  # 建立媒體處理管道
+        pipeline = main_pipeline(args.device, args.width, args.height, args.fps, args.bitrate, rtsp_url=args.rtsp_url, capture_mode=args.capture_mode, queue_plan=stage_plan(args.threading, args.queue))  # 建立媒體處理管道
         if not pipeline:  # 如果管道建立失敗
             print("無法建立管道")  # 輸出錯誤訊息
             return  # 函數返回
         
+        # 選用：Prometheus 指標（擷取/輸出 fps、掉幀、編碼位元率、管道狀態）
+        pipeline_metrics = None  # 預設不提供指標
+        port = metrics_port(args.metrics_port)  # 取得指標埠（參數或環境變數）
+        if port:  # 如果指定了指標埠
+            pipeline_metrics = PipelineMetrics(pipeline)  # 創建指標收集對象
+            pipeline_metrics.watch_input(pipeline.get_by_name("source").get_static_pad("src"), 0)  # 計算輸入幀數
+            encoder = pipeline.get_by_name("encoder")  # 取得編碼器元素
+            pipeline_metrics.watch_output(encoder.get_static_pad("sink"), 0)  # 計算輸出幀數
+            pipeline_metrics.watch_encoder(encoder)  # 計算編碼輸出位元率
+            bus = pipeline.get_bus()  # 取得管道的訊息匯流排
+            bus.add_signal_watch()  # 啟用匯流排訊號
+            bus.connect("message", pipeline_metrics.on_bus_message)  # 記錄匯流排訊息
+            pipeline_metrics.serve(port)  # 啟動指標HTTP服務
+
         # 啟動管道
         pipeline.set_state(Gst.State.PLAYING)  # 設定管道開始執行
+        # 每 5 秒回報每幀耗用的 CPU 時間
+        cpu_meter = CpuPerFrame(pipeline.get_by_name("nvvidconv").get_static_pad("sink"))  # 創建每幀CPU時間量測
+        cpu_meter.start()  # 開始量測
+        # 選用：攝影機拔除時停止管道，重新插上後恢復
+        reconnector = None  # 預設不處理熱插拔
+        if args.hotplug:  # 如果啟用熱插拔
+            reconnector = DeviceReconnector(pipeline, args.device)  # 創建熱插拔處理對象
+            reconnector.start()  # 開始監看設備
         print("開始RTSP串流...")  # 輸出開始串流訊息
         # 等待結束
         try:  # 嘗試執行
@@ -252,6 +225,11 @@ def main():  # 定義主函數
         except KeyboardInterrupt:  # 捕獲鍵盤中斷
             print("停止RTSP串流...")  # 輸出停止串流訊息
         finally:  # 最終執行
+            cpu_meter.stop()  # 停止量測
+            if reconnector:  # 如果有熱插拔處理
+                reconnector.stop()  # 停止監看設備
+            if pipeline_metrics:  # 如果有提供指標
+                pipeline_metrics.stop()  # 停止指標服務
             pipeline.set_state(Gst.State.NULL)  # 設定管道停止
             print("管道已停止")  # 輸出管道停止訊息
     else:  # 如果不是RTSP也不是其他已知操作
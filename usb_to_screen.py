@@ -6,56 +6,24 @@ import argparse  # 導入命令行參數處理模組
 import sys  # 導入系統模組
 import gi  # 導入GObject Introspection模組
 gi.require_version('Gst', '1.0')  # 指定使用GStreamer 1.0版本
-from gi.repository import Gst  # 從gi.repository導入GStreamer
-import subprocess  # 導入子進程模組用於執行系統命令
-import re  # 導入正則表達式模組
+from gi.repository import GLib, Gst  # 從gi.repository導入GStreamer與GLib
+from dsutils import v4l2  # 導入V4L2設備查詢模組
+from dsutils.capture import DeviceReconnector, describe_mode, legacy_mode, make_capture_elements, select_device_mode  # 導入擷取模式與熱插拔工具
+from dsutils.encoder_cache import make_h264_encoder  # 導入H264編碼器建立函數
+from dsutils.queues import PROFILES, StageQueues, describe_plan, queue_option, stage_plan  # 導入階段queue配置工具
 
-def list_all_devices():  # 定義列出所有可用USB攝影機設備的函數
-    """列出所有可用的USB攝影機設備，使用v4l2-ctl查詢"""  # 函數說明文檔
-    
-    try:  # 嘗試執行以下代碼
-        # 執行v4l2-ctl --list-devices命令
-        result = subprocess.run(['v4l2-ctl', '--list-devices'],  # 執行v4l2-ctl命令列出設備
-                               stdout=subprocess.PIPE,  # 捕獲標準輸出
-                               stderr=subprocess.PIPE,  # 捕獲標準錯誤
-                               text=True)  # 以文本形式返回結果
-        
-        if result.returncode != 0:  # 如果命令執行失敗
-            print(f"v4l2-ctl命令執行失敗: {result.stderr}")  # 打印錯誤信息
-            return []  # 返回空列表
-        
-        # 使用正則表達式找出所有/dev/video開頭的設備路徑
-        devices = re.findall(r'/dev/video\d+', result.stdout)  # 用正則表達式匹配設備路徑
-        return devices  # 返回找到的設備列表
-    
-    except FileNotFoundError:  # 如果找不到v4l2-ctl工具
-        print("找不到v4l2-ctl工具，請先安裝v4l-utils套件")  # 提示安裝必要工具
-        return []  # 返回空列表
-    except Exception as e:  # 捕獲其他所有異常
-        print(f"查詢設備時出錯: {e}")  # 打印錯誤信息
-        return []  # 返回空列表
-
-def show_device_capabilities(device):  # 定義顯示設備詳細信息的函數
+def list_all_devices():  # 定義列出設備的函數
+    """列出所有可用的USB攝影機設備，直接以V4L2 ioctl查詢"""  # 函數說明文檔
+    return [info.path for info in v4l2.default_cache().devices()]  # 返回所有設備路徑
+
+def show_device_capabilities(device):  # 定義顯示設備詳情的函數
     """顯示指定設備的詳細資訊"""  # 函數說明文檔
-    try:  # 嘗試執行以下代碼
-        # 執行v4l2-ctl --list-formats-ext命令來獲取設備支援的格式資訊
-        result = subprocess.run(['v4l2-ctl', '--device', device, '--list-formats-ext'],  # 執行命令獲取設備支持的格式
-                               stdout=subprocess.PIPE,  # 捕獲標準輸出
-                               stderr=subprocess.PIPE,  # 捕獲標準錯誤
-                               text=True)  # 以文本形式返回結果
-        
-        if result.returncode != 0:  # 如果命令執行失敗
-            print(f"無法獲取設備 {device} 的資訊: {result.stderr}")  # 打印錯誤信息
-            return  # 結束函數
-        
-        # 顯示結果
-        print(result.stdout)  # 打印設備支持的格式信息
-    except FileNotFoundError:  # 如果找不到v4l2-ctl工具
-        print("找不到v4l2-ctl工具，請先安裝v4l-utils套件")  # 提示安裝必要工具
-    except Exception as e:  # 捕獲其他所有異常
-        print(f"查詢設備資訊時出錯: {e}")  # 打印錯誤信息
-
-def main_pipeline(device, width, height, fps, bitrate, rtsp_url=None):  # 定義創建GStreamer管道的主函數
+    try:  # 嘗試執行
+        print(v4l2.format_device(v4l2.default_cache().device(device)))  # 打印設備支援的格式
+    except OSError as e:  # 捕獲設備查詢錯誤
+        print(f"無法獲取設備 {device} 的資訊: {e}")  # 打印錯誤信息
+
+def main_pipeline(device, width, height, fps, bitrate, rtsp_url=None, capture_mode="auto", queue_plan=None):  # 定義創建GStreamer管道的主函數
     """建立GStreamer管道"""  # 函數說明文檔
     # 初始化GStreamer
     Gst.init(None)  # 初始化GStreamer庫
@@ -71,59 +39,31 @@ def main_pipeline(device, width, height, fps, bitrate, rtsp_url=None):  # 定義
     source.set_property("device", device)  # 設置攝像頭設備路徑
     print(f"使用設備: {device}")  # 打印使用的設備信息
     
-    # 設定格式為YUY2
-    capsfilter1 = Gst.ElementFactory.make("capsfilter", "capsfilter1")  # 創建格式過濾器元素
-    if not capsfilter1:  # 如果創建失敗
-        print("無法建立capsfilter元素，可能需要安裝對應的GStreamer外掛")  # 提示需要安裝插件
+    # 依攝影機列舉出的格式選擇擷取模式，盡量避免使用 CPU videoconvert
+    if capture_mode == "legacy":  # 如果指定舊版擷取模式
+        mode = legacy_mode(width, height, fps)  # 使用固定video/x-raw加videoconvert的模式
+    else:  # 否則
+        mode = select_device_mode(device, width, height, fps)  # 依攝影機支援的格式選擇模式
+    print(f"擷取模式 {describe_mode(mode)}")  # 打印所選的擷取模式
+    capture_elements = make_capture_elements(mode)  # 建立擷取模式所需的元素
+    if not capture_elements:  # 如果創建失敗
+        print("無法建立擷取模式所需的元素，可能需要安裝對應的GStreamer外掛")  # 提示需要安裝插件
         return None  # 返回None表示失敗
-    caps1 = Gst.Caps.from_string(f"video/x-raw,width={width},height={height},framerate={fps}/1")  # 創建視頻格式描述
-    
-    capsfilter1.set_property("caps", caps1)  # 設置格式過濾器屬性
-    print(f"設定影像格式: {width}x{height}, {fps}fps")  # 打印設置的視頻格式信息
 
-    vidconvsrc = Gst.ElementFactory.make("videoconvert", "convertor_src1")  # 創建視頻格式轉換元素
-    if not vidconvsrc:  # 如果創建失敗
-        sys.stderr.write(" Unable to create videoconvert \n")  # 輸出錯誤信息
-
-    
     # NVIDIA影像轉換器
     nvvidconv = Gst.ElementFactory.make("nvvideoconvert", "nvvidconv")  # 創建NVIDIA視頻格式轉換元素
     if not nvvidconv:  # 如果創建失敗
         print("無法建立nvvidconv元素，可能需要安裝對應的GStreamer外掛")  # 提示需要安裝插件
         return None  # 返回None表示失敗
     
-    # 嘗試使用NVIDIA硬體H264編碼器 (優先順序)
-    # 1. nvv4l2h264enc - NVIDIA V4L2 based hardware encoder for Jetson
-    # 2. nvh264enc - NVIDIA GPU based encoder for dGPU platforms
-    # 3. x264enc - Software encoder as fallback
-    encoder = Gst.ElementFactory.make("nvv4l2h264enc", "encoder")  # 嘗試創建NVIDIA V4L2 H264編碼器
+    # 建立 H264 編碼器：依序嘗試 nvv4l2h264enc (Jetson)、nvh264enc (dGPU)、x264enc (軟體)
+    # 探測結果快取於磁碟，之後啟動直接使用快取中的編碼器
+    encoder = make_h264_encoder("encoder", bitrate)  # 建立H264編碼器
     if not encoder:  # 如果創建失敗
-        print("無法建立nvv4l2h264enc元素，嘗試使用nvh264enc...")  # 提示嘗試使用替代編碼器
-        encoder = Gst.ElementFactory.make("nvh264enc", "encoder")  # 嘗試創建NVIDIA GPU H264編碼器
-        if not encoder:  # 如果創建失敗
-            print("無法建立nvh264enc元素，嘗試使用x264enc...")  # 提示嘗試使用軟件編碼器
-            encoder = Gst.ElementFactory.make("x264enc", "encoder")  # 嘗試創建軟件H264編碼器
-            if not encoder:  # 如果創建失敗
-                print("無法建立任何H264編碼器，請安裝所需的GStreamer外掛")  # 提示需要安裝插件
-                return None  # 返回None表示失敗
-    
-    # 設定編碼器參數 (根據不同編碼器調整參數)
-    if encoder.get_factory().get_name() == "nvv4l2h264enc":  # 如果是NVIDIA V4L2編碼器
-        # nvv4l2h264enc 參數設定 (用於 Jetson)
-        encoder.set_property("bitrate", bitrate * 1000)  # 設置比特率，單位為比特/秒
-    elif encoder.get_factory().get_name() == "nvh264enc":  # 如果是NVIDIA GPU編碼器
-        # nvh264enc 參數設定 (用於 dGPU)
-        encoder.set_property("bitrate", bitrate)  # 設置比特率，單位為千比特/秒
-        encoder.set_property("preset", 1)  # 設置預設值：0=慢，1=中，2=快
-        encoder.set_property("rc-mode", 1)  # 設置碼率控制模式：1=固定碼率，2=可變碼率
-    else:  # 如果是軟件編碼器
-        # x264enc 參數設定 (軟體編碼)
-        encoder.set_property("bitrate", bitrate)  # 設置比特率
-        encoder.set_property("speed-preset", "medium")  # 設置速度預設為中等
-        encoder.set_property("tune", "zerolatency")  # 設置優化為零延遲模式
-
-
-    print(f"使用 {encoder.get_factory().get_name()} 編碼器")  # 打印使用的編碼器名稱
+        print("無法建立任何 H264 編碼器，請安裝所需的 GStreamer 外掛")  # 提示需要安裝插件
+        return None  # 返回None表示失敗
+
+    print(f"使用 {encoder.get_factory().get_name()} 編碼器")  # 打印使用的編碼器
 
     decodebin = Gst.ElementFactory.make("decodebin", "decoder")  # 創建解碼器元素
     if not decodebin:  # 如果創建失敗
@@ -142,8 +82,8 @@ def main_pipeline(device, width, height, fps, bitrate, rtsp_url=None):  # 定義
     
     # 將元素加入管道
     pipeline.add(source)  # 添加視頻源元素到管道
-    pipeline.add(capsfilter1)  # 添加格式過濾器到管道
-    pipeline.add(vidconvsrc)  # 添加視頻格式轉換器到管道
+    for element in capture_elements:  # 遍歷每個擷取元素
+        pipeline.add(element)  # 添加擷取元素到管道
     pipeline.add(nvvidconv)  # 添加NVIDIA視頻格式轉換器到管道
     pipeline.add(encoder)  # 添加編碼器到管道
     pipeline.add(decodebin)  # 添加解碼器到管道
@@ -151,10 +91,15 @@ def main_pipeline(device, width, height, fps, bitrate, rtsp_url=None):  # 定義
     pipeline.add(sink)  # 添加視頻輸出元素到管道
     
     # 連接元素
-    source.link(capsfilter1)  # 連接視頻源到格式過濾器
-    capsfilter1.link(vidconvsrc)  # 連接格式過濾器到視頻格式轉換器
-    vidconvsrc.link(nvvidconv)  # 連接視頻格式轉換器到NVIDIA視頻格式轉換器
-    nvvidconv.link(encoder)  # 連接NVIDIA視頻格式轉換器到編碼器
+    # queue_plan（--threading/--queue）決定在哪些階段之間插入 queue
+    stage_queues = StageQueues(pipeline, queue_plan or {})  # 依執行緒配置插入queue的連接工具
+    print(f"階段 queue: {describe_plan(queue_plan or {})}")  # 輸出插入的queue
+    upstream = source  # 從視頻源開始連接
+    for element in capture_elements:  # 遍歷每個擷取元素
+        upstream.link(element)  # 連接上一個元素到此擷取元素
+        upstream = element  # 記錄目前最後一個元素
+    stage_queues.link(upstream, nvvidconv, "convert")  # 連接擷取元素到NVIDIA視訊轉換
+    stage_queues.link(nvvidconv, encoder, "encoder")  # 連接NVIDIA視頻格式轉換器到編碼器
     encoder.link(decodebin)  # 連接編碼器到解碼器
     
     # 處理動態連接
@@ -180,6 +125,10 @@ def main():  # 定義主函數
     parser.add_argument('--height', type=int, default=480, help="影像高度")  # 添加影像高度參數
     parser.add_argument('--fps', type=int, default=30, help="影像幀率")  # 添加影像幀率參數
     parser.add_argument('--bitrate', type=int, default=2000, help="H264編碼比特率")  # 添加比特率參數
+    parser.add_argument('--hotplug', action='store_true', help="攝影機拔除時停止管道，重新插上後自動恢復擷取（程式會持續執行到 Ctrl+C）")  # 添加熱插拔參數
+    parser.add_argument('--capture-mode', choices=['auto', 'legacy'], default='auto', help="擷取模式：auto 依攝影機支援格式自動選擇（MJPEG 硬體解碼或 nvvideoconvert 可直接接受的格式），legacy 固定 video/x-raw 並經過 CPU videoconvert")  # 添加擷取模式參數
+    parser.add_argument('--threading', choices=sorted(PROFILES), default='none', help="執行緒配置：在元件之間插入 queue，latency 以單格 leaky queue 分離編碼器、balanced 分離推論與編碼、throughput 每個階段各一執行緒；預設 none")  # 添加執行緒配置參數
+    parser.add_argument('--queue', type=queue_option, action='append', default=[], metavar='STAGE[:BUFFERS[:LEAKY]]', help="在指定階段前加入 queue（convert、encoder），可重複；LEAKY 為 no/upstream/downstream")  # 添加階段queue參數
 
     # 如果沒有參數，顯示說明
     if len(sys.argv) == 1:  # 如果命令行參數只有程式名稱
@@ -218,13 +167,23 @@ def main():  # 定義主函數
         print("使用 -h 或 --help 參數查看完整說明")  # 提示查看幫助
         return  # 結束程式
     
-    pipeline = main_pipeline(args.device, args.width, args.height, args.fps, args.bitrate)  # 創建並設置GStreamer管道
+    pipeline = main_pipeline(args.device, args.width, args.height, args.fps, args.bitrate, capture_mode=args.capture_mode, queue_plan=stage_plan(args.threading, args.queue))  # 創建並設置GStreamer管道
     if not pipeline:  # 如果管道創建失敗
         print("無法建立管道")  # 打印錯誤提示
         return  # 結束程式
     # 啟動管道
     pipeline.set_state(Gst.State.PLAYING)  # 設置管道狀態為播放
     print("開始本地顯示...")  # 打印開始顯示的提示
+    if args.hotplug:  # 選用：攝影機拔除後重新插上時自動恢復
+        reconnector = DeviceReconnector(pipeline, args.device)  # 創建熱插拔處理對象
+        reconnector.start()  # 開始監看設備
+        try:  # 嘗試執行
+            GLib.MainLoop().run()  # 執行主迴圈直到中斷
+        except KeyboardInterrupt:  # 捕獲Ctrl+C
+            print("停止本地顯示...")  # 打印停止提示
+        finally:  # 無論如何都執行
+            reconnector.stop()  # 停止監看設備
+            pipeline.set_state(Gst.State.NULL)  # 設置管道狀態為停止
 
     
 if __name__ == "__main__":  # 如果此腳本是直接運行的